@@ -0,0 +1,226 @@
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from .cambios import RUTA_CAMBIOS
+from .config import settings
+from .metricas import metricas
+from .plazos import plazo_restante
+
+METODOS_SEGUROS = ("GET", "HEAD", "OPTIONS")
+
+# Menor número, mayor prioridad al liberarse plazas del límite global
+PRIORIDADES = {"admin": 0, "auth": 1, "publica": 2}
+
+# Lecturas reservadas a administradores (relativas a API_V1_STR); el resto son del catálogo
+LECTURAS_ADMIN = ("/usuarios", "/productos/analitica", "/productos/export", "/registros/export",
+                  "/registros-ingreso/archivo", "/registros-ingreso/export")
+
+# Rutas de cualquier usuario que no son de administración aunque escriban (relativas a API_V1_STR)
+RUTAS_CLIENTE = ("/usuarios/me", "/productos/reservar")
+
+# Peso de la última petición en la media móvil del tiempo de servicio
+ALFA_SERVICIO = 0.1
+
+
+class _Clase:
+    def __init__(self, nombre: str, limite: int, max_cola: int) -> None:
+        self.nombre = nombre
+        self.limite = limite
+        self.max_cola = max_cola
+        self.prioridad = PRIORIDADES[nombre]
+        self.en_curso = 0
+        self.cola: Deque[asyncio.Future] = deque()
+        self.servicio_medio = 0.0
+
+
+def clasificar(metodo: str, ruta: str) -> Optional[str]:
+    """
+    Clase de admisión de una petición, o None si está exenta: las rutas fuera de la API
+    (salud, métricas, JWKS, documentación) nunca esperan ni se rechazan, y el flujo de
+    cambios tampoco, porque la conexión dura horas sin retener una conexión del pool.
+
+    - `auth`: login, refresco y registro (bcrypt y escrituras de tokens),
+    - `admin`: escrituras y lecturas reservadas a administradores,
+    - `publica`: lecturas del catálogo, reservas de stock y el perfil propio.
+
+    Solo cuentan la ruta y el método: las cabeceras las elige el cliente, y con ellas
+    cualquiera podría pasar a la clase de mayor prioridad sin ser administrador.
+    """
+    if not ruta.startswith(settings.API_V1_STR) or ruta == RUTA_CAMBIOS:
+        return None
+    relativa = ruta[len(settings.API_V1_STR):]
+    if relativa.startswith("/auth"):
+        return "auth"
+    if relativa in RUTAS_CLIENTE or relativa.endswith("/reservar"):
+        return "publica"
+    if metodo not in METODOS_SEGUROS or relativa.startswith(LECTURAS_ADMIN):
+        return "admin"
+    return "publica"
+
+
+class ControlAdmision:
+    """
+    Limita las peticiones simultáneas por clase de ruta y en total.
+
+    Cada petición en curso retiene una conexión del pool y, en login, un hilo con bcrypt:
+    admitir más de las que se pueden atender solo alarga la cola hasta que los clientes
+    abandonan. Las que no caben esperan en una cola acotada por clase, en orden de llegada,
+    y el límite global se reparte por prioridad (admin, auth, publica), así que una avalancha
+    de lecturas del catálogo no deja sin servicio a la administración. Una petición se
+    rechaza de inmediato si su cola está llena o si, según el tiempo de servicio medio de
+    su clase, no sería atendida dentro de la espera máxima.
+
+    Todo el estado se modifica desde el event loop, sin locks.
+    """
+
+    def __init__(self, limite_global: int, limites: Dict[str, int], max_cola: Dict[str, int],
+                 espera_max: float) -> None:
+        self.limite_global = limite_global
+        self.espera_max = espera_max
+        self.en_curso = 0
+        self.clases: Dict[str, _Clase] = {
+            nombre: _Clase(nombre, limites[nombre], max_cola[nombre]) for nombre in PRIORIDADES
+        }
+        self._por_prioridad: List[_Clase] = sorted(self.clases.values(), key=lambda c: c.prioridad)
+
+        self.admitidas = metricas.contador("admision_admitidas_total", "Peticiones admitidas por clase")
+        self.rechazadas = metricas.contador("admision_rechazadas_total", "Peticiones rechazadas con 503 por clase y motivo")
+        self.espera = metricas.contador("admision_espera_segundos_total", "Tiempo total en cola de las peticiones admitidas")
+        metricas.medidor("admision_en_curso", "Peticiones en curso por clase",
+                         lambda: {(("clase", c.nombre),): c.en_curso for c in self.clases.values()})
+        metricas.medidor("admision_en_cola", "Peticiones esperando admisión por clase",
+                         lambda: {(("clase", c.nombre),): len(c.cola) for c in self.clases.values()})
+        metricas.medidor("admision_servicio_medio_segundos", "Media móvil del tiempo de servicio por clase",
+                         lambda: {(("clase", c.nombre),): c.servicio_medio for c in self.clases.values()})
+
+    def espera_estimada(self, clase: _Clase) -> float:
+        """Segundos que tardaría en admitirse una petición que llega ahora a la cola."""
+        return (len(clase.cola) + 1) * clase.servicio_medio / clase.limite
+
+    async def adquirir(self, nombre: str) -> Optional[str]:
+        """
+        Espera una plaza. Devuelve None si se admite o el motivo del rechazo.
+
+        La espera no supera ADMISION_ESPERA_MAX ni lo que quede del plazo de la petición.
+        """
+        clase = self.clases[nombre]
+        if not clase.cola and clase.en_curso < clase.limite and self.en_curso < self.limite_global:
+            self._ocupar(clase)
+            self.admitidas.inc(clase=nombre)
+            return None
+
+        if len(clase.cola) >= clase.max_cola:
+            self.rechazadas.inc(clase=nombre, motivo="cola_llena")
+            return "cola_llena"
+        restante = plazo_restante()
+        espera_max = self.espera_max if restante is None else min(self.espera_max, restante)
+        if self.espera_estimada(clase) > espera_max:
+            self.rechazadas.inc(clase=nombre, motivo="plazo")
+            return "plazo"
+
+        inicio = time.monotonic()
+        turno = asyncio.get_running_loop().create_future()
+        clase.cola.append(turno)
+        try:
+            await asyncio.wait_for(turno, espera_max)
+        except asyncio.TimeoutError:
+            self.rechazadas.inc(clase=nombre, motivo="plazo")
+            self._abandonar(clase, turno)
+            return "plazo"
+        except BaseException:
+            # Cliente desconectado o cancelación: liberar la plaza si ya se había concedido
+            self._abandonar(clase, turno)
+            raise
+
+        self.admitidas.inc(clase=nombre)
+        self.espera.inc(time.monotonic() - inicio, clase=nombre)
+        return None
+
+    def liberar(self, nombre: str, duracion: float) -> None:
+        clase = self.clases[nombre]
+        clase.en_curso -= 1
+        self.en_curso -= 1
+        clase.servicio_medio += ALFA_SERVICIO * (duracion - clase.servicio_medio)
+        self._despachar()
+
+    def retry_after(self, nombre: str) -> int:
+        return max(1, math.ceil(self.espera_estimada(self.clases[nombre])))
+
+    def _ocupar(self, clase: _Clase) -> None:
+        clase.en_curso += 1
+        self.en_curso += 1
+
+    def _abandonar(self, clase: _Clase, turno: asyncio.Future) -> None:
+        if turno.done() and not turno.cancelled():
+            # La plaza se concedió justo cuando vencía la espera
+            self.liberar(clase.nombre, clase.servicio_medio)
+            return
+        turno.cancel()
+        try:
+            clase.cola.remove(turno)
+        except ValueError:
+            pass
+
+    def _despachar(self) -> None:
+        """Concede plazas libres a las peticiones en espera, por prioridad y orden de llegada."""
+        for clase in self._por_prioridad:
+            while clase.cola and clase.en_curso < clase.limite and self.en_curso < self.limite_global:
+                turno = clase.cola.popleft()
+                if turno.done():
+                    continue
+                self._ocupar(clase)
+                turno.set_result(None)
+
+
+control_admision = ControlAdmision(
+    settings.ADMISION_LIMITE_GLOBAL,
+    settings.ADMISION_LIMITES,
+    settings.ADMISION_MAX_COLA,
+    settings.ADMISION_ESPERA_MAX,
+)
+
+
+class MiddlewareAdmision:
+    """Middleware ASGI que aplica `ControlAdmision` y responde 503 con Retry-After al rechazar."""
+
+    def __init__(self, app, control: ControlAdmision = control_admision) -> None:
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        clase = clasificar(scope["method"], scope["path"])
+        if clase is None:
+            await self.app(scope, receive, send)
+            return
+
+        motivo = await self.control.adquirir(clase)
+        if motivo is not None:
+            await self._rechazar(send, clase)
+            return
+
+        inicio = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.control.liberar(clase, time.monotonic() - inicio)
+
+    async def _rechazar(self, send, clase: str) -> None:
+        cuerpo = json.dumps({"detail": "Servicio saturado, inténtelo de nuevo más tarde"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(cuerpo)).encode()),
+                (b"retry-after", str(self.control.retry_after(clase)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": cuerpo})
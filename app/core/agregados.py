@@ -0,0 +1,136 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models.registroingreso import RegistroIngreso as RegistroIngresoModel
+from ..models.registroingreso import RegistroIngresoArchivo as RegistroIngresoArchivoModel
+from ..models.registroingreso import RegistroIngresoResumen as ResumenModel
+
+# Granularidades mantenidas en la tabla de resumen y duración de cada bucket
+GRANULARIDADES = {
+    "minuto": timedelta(minutes=1),
+    "hora": timedelta(hours=1),
+    "dia": timedelta(days=1),
+}
+
+Deltas = Dict[Tuple[str, datetime], List[int]]
+
+
+def normalizar_fecha(fecha: Optional[datetime]) -> Optional[datetime]:
+    """Convierte fechas con zona horaria a UTC sin zona, el formato en que se almacenan."""
+    if fecha is not None and fecha.tzinfo is not None:
+        return fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha
+
+
+def truncar(fecha: datetime, granularidad: str) -> datetime:
+    """Devuelve el inicio del bucket de la granularidad indicada que contiene la fecha."""
+    fecha = normalizar_fecha(fecha).replace(second=0, microsecond=0)
+    if granularidad in ("hora", "dia"):
+        fecha = fecha.replace(minute=0)
+    if granularidad == "dia":
+        fecha = fecha.replace(hour=0)
+    return fecha
+
+
+def calcular_deltas(filas: Iterable[Tuple[Optional[datetime], Optional[int]]], signo: int = 1,
+                    deltas: Optional[Deltas] = None) -> Deltas:
+    """Acumula (total, suma_cantidad) por bucket para filas (fecha_ingreso, cantidad)."""
+    deltas = deltas if deltas is not None else defaultdict(lambda: [0, 0])
+    for fecha, cantidad in filas:
+        if fecha is None:
+            continue
+        for granularidad in GRANULARIDADES:
+            acumulado = deltas[(granularidad, truncar(fecha, granularidad))]
+            acumulado[0] += signo
+            acumulado[1] += signo * (cantidad or 0)
+    return deltas
+
+
+def aplicar_deltas(db: Session, deltas: Deltas) -> None:
+    """
+    Aplica los deltas sobre la tabla de resumen dentro de la transacción del llamador.
+
+    Cada bucket se actualiza con `total = total + n` (sin leer antes la fila) y solo se
+    inserta si aún no existía, de modo que un lote de miles de eventos en el mismo minuto
+    se traduce en tres sentencias. El INSERT va en un savepoint: si otra transacción (otro
+    worker o un alta individual) insertó el mismo bucket entre medias, la restricción única
+    lo rechaza, se deshace solo el savepoint y se repite el UPDATE. Los buckets que se
+    quedan sin registros se borran.
+    """
+    for (granularidad, inicio), (total, suma_cantidad) in deltas.items():
+        if not total and not suma_cantidad:
+            continue
+
+        if _sumar(db, granularidad, inicio, total, suma_cantidad) == 0:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(ResumenModel).values(
+                        granularidad=granularidad, inicio=inicio, total=total, suma_cantidad=suma_cantidad
+                    ))
+            except IntegrityError:
+                _sumar(db, granularidad, inicio, total, suma_cantidad)
+
+        if total < 0:
+            db.execute(
+                delete(ResumenModel)
+                .where(ResumenModel.granularidad == granularidad, ResumenModel.inicio == inicio,
+                       ResumenModel.total == 0)
+            )
+
+
+def _sumar(db: Session, granularidad: str, inicio: datetime, total: int, suma_cantidad: int) -> int:
+    """Suma los deltas al bucket si existe; devuelve las filas actualizadas (0 o 1)."""
+    return db.execute(
+        update(ResumenModel)
+        .where(ResumenModel.granularidad == granularidad, ResumenModel.inicio == inicio)
+        .values(total=ResumenModel.total + total,
+                suma_cantidad=ResumenModel.suma_cantidad + suma_cantidad)
+    ).rowcount
+
+
+def consultar_agregados(db: Session, granularidad: str, desde: datetime, hasta: datetime) -> List[ResumenModel]:
+    """Lee los buckets del rango [desde, hasta); el coste depende del número de buckets, no de eventos."""
+    return db.execute(
+        select(ResumenModel)
+        .where(ResumenModel.granularidad == granularidad,
+               ResumenModel.total > 0,
+               ResumenModel.inicio >= truncar(desde, granularidad),
+               ResumenModel.inicio < normalizar_fecha(hasta))
+        .order_by(ResumenModel.inicio)
+    ).scalars().all()
+
+
+def reconstruir_resumen(db: Session, tamano_lote: int = 10000) -> int:
+    """
+    Recalcula la tabla de resumen a partir de los registros de ingreso existentes, también
+    los archivados.
+
+    Recorre solo las columnas (fecha_ingreso, cantidad) en bloques, sin cargar objetos ORM.
+    Devuelve el número de registros procesados.
+    """
+    deltas: Deltas = defaultdict(lambda: [0, 0])
+    procesados = 0
+    for modelo in (RegistroIngresoModel, RegistroIngresoArchivoModel):
+        filas = db.execute(
+            select(modelo.fecha_ingreso, modelo.cantidad)
+            .where(modelo.fecha_ingreso.is_not(None))
+            .execution_options(yield_per=tamano_lote)
+        )
+        for bloque in filas.partitions():
+            calcular_deltas(bloque, deltas=deltas)
+            procesados += len(bloque)
+
+    db.execute(delete(ResumenModel))
+    if deltas:
+        db.execute(insert(ResumenModel), [
+            {"granularidad": granularidad, "inicio": inicio, "total": total, "suma_cantidad": suma}
+            for (granularidad, inicio), (total, suma) in deltas.items()
+        ])
+    db.commit()
+
+    return procesados
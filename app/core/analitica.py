@@ -0,0 +1,316 @@
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import false, func
+from sqlalchemy.orm import Session
+
+from .cambios import difusor_cambios
+from .config import settings
+from .database import SessionLocal
+from .hilos import HiloDeFondo
+from .metricas import metricas
+from ..exceptions import BadRequestException, ServiceUnavailableException
+from ..models.cambio import CambioCatalogo
+from ..models.producto import Producto as ProductoModel
+
+# NumPy es opcional: sin él, la analítica de productos responde 400
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+COLUMNAS = ("id", "precio", "stock", "disponible", "categoria")
+
+
+def _clave(categoria, precio):
+    # (categoria_id, precio) en un solo entero con el mismo orden: los dos son enteros de 32 bits
+    return (categoria << 32) + (precio + 2 ** 31)
+
+
+class _Columnas:
+    """
+    Columnas de todos los productos ordenadas por (categoria_id, precio), inmutables.
+
+    El orden deja los productos de cada categoría contiguos y con el precio ya ordenado, así
+    que los percentiles se leen por posición. `clave` guarda el orden en un solo entero para
+    insertar productos en su sitio con una búsqueda binaria, sin reordenar.
+    """
+    __slots__ = COLUMNAS + ("clave", "categorias", "inicios", "cuentas")
+
+    def __init__(self, id_, precio, stock, disponible, categoria, clave) -> None:
+        # Columnas ya ordenadas por `clave`
+        self.id, self.precio, self.stock, self.disponible, self.categoria = id_, precio, stock, disponible, categoria
+        self.clave = clave
+        self.inicios = np.flatnonzero(np.diff(categoria, prepend=categoria[:1] - 1)) if len(categoria) else categoria
+        self.categorias = categoria[self.inicios]
+        self.cuentas = np.diff(self.inicios, append=len(categoria))
+
+    @classmethod
+    def ordenar(cls, id_, precio, stock, disponible, categoria) -> "_Columnas":
+        clave = _clave(categoria, precio)
+        orden = np.argsort(clave, kind="stable")
+        return cls(id_[orden], precio[orden], stock[orden], disponible[orden], categoria[orden], clave[orden])
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    def posiciones(self, ids):
+        """Posiciones de los productos de `ids` que están en las columnas."""
+        return np.flatnonzero(np.isin(self.id, ids))
+
+    def reemplazar(self, quitar, id_, precio, stock, disponible, categoria) -> "_Columnas":
+        """Copia sin las filas de las posiciones `quitar` y con las nuevas insertadas en su sitio."""
+        conservar = np.ones(len(self), dtype=bool)
+        conservar[quitar] = False
+        clave = _clave(categoria, precio)
+        orden = np.argsort(clave, kind="stable")
+        restantes = self.clave[conservar]
+        destino = np.searchsorted(restantes, clave[orden], side="right")
+        nuevas = (id_, precio, stock, disponible, categoria)
+        return _Columnas(*(np.insert(getattr(self, nombre)[conservar], destino, nueva[orden])
+                           for nombre, nueva in zip(COLUMNAS, nuevas)),
+                         np.insert(restantes, destino, clave[orden]))
+
+    def con_existencias(self, stock, disponible) -> "_Columnas":
+        """Copia con otro stock y disponibilidad y el mismo orden."""
+        copia = object.__new__(_Columnas)
+        for nombre in self.__slots__:
+            setattr(copia, nombre, getattr(self, nombre))
+        copia.stock, copia.disponible = stock, disponible
+        return copia
+
+
+class AnaliticaProductos(HiloDeFondo):
+    """
+    Estadísticas de precio y stock por categoría calculadas sobre columnas de NumPy.
+
+    Cada worker guarda `precio`, `stock`, `disponible` y `categoria_id` de todos los productos
+    en arrays (unos 40 MB por millón de productos) y calcula los percentiles, histogramas y
+    tasas de rotura de stock de todas las categorías con operaciones vectorizadas, sin
+    consultar la base de datos.
+
+    Las columnas se sustituyen enteras, así que una consulta nunca ve un estado a medias.
+    Se mantienen al día como las categorías en memoria:
+    - las escrituras de productos de cualquier worker llegan por la tabla de cambios del
+      catálogo y un hilo las aplica en bloque; si solo cambian stock o disponibilidad (las
+      reservas) basta con copiar esas dos columnas, y si no los productos cambiados se
+      quitan y se insertan de nuevo en su sitio,
+    - cada ANALITICA_INTERVALO se releen de la base para recoger escrituras hechas fuera de la API.
+    Aplicar un cambio ya incluido en la lectura no altera nada, así que los que llegan durante
+    una relectura se vuelven a aplicar después.
+    """
+
+    nombre_hilo = "analitica-productos"
+
+    def __init__(self, intervalo: float, session_factory: Callable[[], Session] = SessionLocal) -> None:
+        super().__init__()
+        self.intervalo = intervalo
+        self._session_factory = session_factory
+
+        self._columnas: Optional[_Columnas] = None
+        # id de producto -> datos tras su último cambio (None si se eliminó), pendientes de aplicar
+        self._pendientes: Dict[int, Optional[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+        self.actualizaciones = metricas.contador(
+            "analitica_actualizaciones_total",
+            "Actualizaciones de las columnas de productos por tipo (recarga, existencias, reordenacion)"
+        )
+        metricas.medidor("analitica_productos", "Productos en las columnas de la analítica de este worker",
+                         lambda: {(): len(self._columnas)} if self._columnas is not None else {})
+
+    def iniciar(self) -> None:
+        """Arranca el hilo que carga las columnas y aplica los cambios. Sin NumPy no hace nada."""
+        if np is None:
+            print("ADVERTENCIA: NumPy no está instalado; GET /productos/analitica no estará disponible")
+            return
+        super().iniciar()
+
+    def al_leer_cambios(self, cambios: List[CambioCatalogo]) -> None:
+        """Oyente del difusor de cambios: encola los cambios de productos para el hilo."""
+        if not self.en_marcha:
+            return
+        productos = [cambio for cambio in cambios if cambio.entidad == "producto"]
+        if not productos:
+            return
+        with self._lock:
+            for cambio in productos:
+                self._pendientes[cambio.entidad_id] = json.loads(cambio.datos) if cambio.datos else None
+        self._aviso.set()
+
+    def recargar(self) -> None:
+        """Lee las columnas de todos los productos y sustituye las de memoria."""
+        db = self._session_factory()
+        try:
+            filas = db.query(
+                ProductoModel.id, ProductoModel.precio, func.coalesce(ProductoModel.stock, 0),
+                func.coalesce(ProductoModel.disponible, false()), func.coalesce(ProductoModel.categoria_id, 0),
+            ).all()
+        finally:
+            db.close()
+
+        self._columnas = _Columnas.ordenar(*_arrays(list(zip(*filas)) or [()] * len(COLUMNAS)))
+        self.actualizaciones.inc(tipo="recarga")
+
+    def aplicar_pendientes(self) -> None:
+        """Aplica en bloque los cambios de productos recibidos desde la última vez."""
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+        actual = self._columnas
+        if not pendientes or actual is None:
+            return
+
+        posiciones = actual.posiciones(np.fromiter(pendientes, dtype=np.int64, count=len(pendientes)))
+        cambiados = [pendientes[producto_id] for producto_id in actual.id[posiciones].tolist()]
+
+        # Solo stock o disponibilidad: el orden no cambia y basta con copiar dos columnas
+        if len(cambiados) == len(pendientes) and all(datos is not None for datos in cambiados):
+            id_, precio, stock, disponible, categoria = _arrays(_filas(cambiados))
+            if (actual.precio[posiciones] == precio).all() and (actual.categoria[posiciones] == categoria).all():
+                nuevo_stock, nueva_disponibilidad = actual.stock.copy(), actual.disponible.copy()
+                nuevo_stock[posiciones], nueva_disponibilidad[posiciones] = stock, disponible
+                self._columnas = actual.con_existencias(nuevo_stock, nueva_disponibilidad)
+                self.actualizaciones.inc(tipo="existencias")
+                return
+
+        # Altas, bajas o cambios de precio o categoría: se quitan las filas afectadas y se
+        # insertan sus nuevas versiones en su sitio
+        nuevos = [datos for datos in pendientes.values() if datos is not None]
+        self._columnas = actual.reemplazar(posiciones, *_arrays(_filas(nuevos)))
+        self.actualizaciones.inc(tipo="reordenacion")
+
+    def calcular(self, percentiles: Sequence[float], intervalos: int,
+                 categoria_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Estadísticas de todos los productos y de cada categoría (o solo de `categoria_id`).
+
+        Los percentiles de precio se interpolan linealmente, como `numpy.percentile`. Los
+        histogramas de todas las categorías comparten `intervalos` tramos iguales entre el
+        precio mínimo y el máximo del conjunto, así que se pueden comparar entre sí; cada
+        tramo incluye su límite inferior y el último también el superior.
+        """
+        if np is None:
+            raise BadRequestException("La analítica de productos requiere NumPy, que no está instalado en el servidor")
+        columnas = self._columnas
+        if columnas is None:
+            raise ServiceUnavailableException("La analítica de productos se está cargando", retry_after=5)
+
+        categorias, inicios, cuentas = columnas.categorias, columnas.inicios, columnas.cuentas
+        tramo = slice(0, len(columnas))
+        if categoria_id is not None:
+            i = int(np.searchsorted(categorias, categoria_id))
+            grupos = slice(i, i + 1) if i < len(categorias) and categorias[i] == categoria_id else slice(0, 0)
+            categorias, inicios, cuentas = categorias[grupos], inicios[grupos], cuentas[grupos]
+            inicio = int(inicios[0]) if len(inicios) else 0
+            tramo = slice(inicio, inicio + int(cuentas.sum()))
+            inicios = inicios - inicio
+
+        precio = columnas.precio[tramo]
+        if len(precio) == 0:
+            return {"productos": 0, "limites_histograma": [], "total": None, "categorias": []}
+        stock = columnas.stock[tramo]
+        finales = inicios + cuentas - 1
+        # Límites del histograma sobre todos los productos, también al pedir una sola categoría
+        minimo = int(columnas.precio[columnas.inicios].min())
+        maximo = int(columnas.precio[columnas.inicios + columnas.cuentas - 1].max())
+
+        # Cada categoría es un tramo contiguo: las sumas por categoría son sumas por tramos
+        suma_precio = np.add.reduceat(precio, inicios)
+        stock_total = np.add.reduceat(stock, inicios)
+        sin_stock = np.add.reduceat(stock <= 0, inicios, dtype=np.int64)
+        disponibles = np.add.reduceat(columnas.disponible[tramo], inicios, dtype=np.int64)
+        percentiles_grupo = _percentiles_ordenados(precio, inicios, cuentas, np.asarray(percentiles) / 100)
+
+        # Histogramas: el precio está ordenado dentro de cada categoría, así que basta con buscar
+        # en `clave` el primer producto de cada categoría que alcanza cada límite entero
+        rango = maximo - minimo
+        umbrales = minimo + (np.arange(1, intervalos) * rango + intervalos - 1) // intervalos
+        posiciones = np.searchsorted(columnas.clave[tramo], _clave(categorias[:, None], umbrales[None, :]))
+        histogramas = np.diff(np.column_stack([inicios, posiciones, finales + 1]), axis=1)
+
+        nombres = [f"p{valor:g}" for valor in percentiles]
+        total = _estadisticas(
+            None, len(precio), int(suma_precio.sum()) / len(precio),
+            int(precio[inicios].min()), int(precio[finales].max()),
+            np.percentile(precio, percentiles).tolist(), histogramas.sum(axis=0).tolist(),
+            int(stock_total.sum()), int(sin_stock.sum()), int(disponibles.sum()), nombres,
+        )
+        return {
+            "productos": len(precio),
+            "limites_histograma": (minimo + np.arange(intervalos + 1) * rango / intervalos).tolist(),
+            "total": total,
+            "categorias": [
+                _estadisticas(*fila, nombres)
+                for fila in zip(categorias.tolist(), cuentas.tolist(), (suma_precio / cuentas).tolist(),
+                                precio[inicios].tolist(), precio[finales].tolist(), percentiles_grupo.tolist(),
+                                histogramas.tolist(), stock_total.tolist(), sin_stock.tolist(), disponibles.tolist())
+            ],
+        }
+
+    def _ejecutar(self) -> None:
+        while not self._evento_detener.is_set():
+            try:
+                self.recargar()
+                break
+            except Exception as e:
+                print(f"ERROR al cargar la analítica de productos: {str(e)}")
+                self._evento_detener.wait(self.intervalo)
+
+        # La relectura periódica no se aplaza aunque lleguen cambios continuamente
+        proxima_recarga = time.monotonic() + self.intervalo
+        while not self._evento_detener.is_set():
+            self._aviso.wait(max(0.0, proxima_recarga - time.monotonic()))
+            self._aviso.clear()
+            if self._evento_detener.is_set():
+                break
+
+            try:
+                if time.monotonic() >= proxima_recarga:
+                    proxima_recarga = time.monotonic() + self.intervalo
+                    self.recargar()
+                self.aplicar_pendientes()
+            except Exception as e:
+                print(f"ERROR al actualizar la analítica de productos: {str(e)}")
+
+
+def _filas(productos: List[Dict[str, Any]]) -> List[List[Any]]:
+    """Columnas (en el orden de COLUMNAS) de los datos de productos de la tabla de cambios."""
+    return [[producto[campo] for producto in productos]
+            for campo in ("id", "precio", "stock", "disponible", "categoria_id")]
+
+
+def _arrays(valores: Sequence[Sequence[Any]]) -> List[Any]:
+    tipos = (np.int64, np.int64, np.int64, bool, np.int64)
+    return [np.array(columna, dtype=tipo) for columna, tipo in zip(valores, tipos)]
+
+
+def _percentiles_ordenados(valores, inicios, cuentas, q):
+    """Percentiles (interpolación lineal) de grupos contiguos ya ordenados: una fila por grupo."""
+    posicion = inicios[:, None] + q[None, :] * (cuentas[:, None] - 1)
+    abajo = np.floor(posicion).astype(np.int64)
+    arriba = np.minimum(abajo + 1, (inicios + cuentas - 1)[:, None])
+    fraccion = posicion - abajo
+    return valores[abajo] + (valores[arriba] - valores[abajo]) * fraccion
+
+
+def _estadisticas(categoria_id, productos, precio_medio, precio_min, precio_max, percentiles, histograma,
+                  stock_total, sin_stock, disponibles, nombres) -> Dict[str, Any]:
+    return {
+        "categoria_id": categoria_id,
+        "productos": productos,
+        "precio_medio": precio_medio,
+        "precio_min": precio_min,
+        "precio_max": precio_max,
+        "percentiles_precio": dict(zip(nombres, percentiles)),
+        "histograma_precio": histograma,
+        "stock_total": stock_total,
+        "sin_stock": sin_stock,
+        "tasa_sin_stock": sin_stock / productos,
+        "disponibles": disponibles,
+    }
+
+
+analitica_productos = AnaliticaProductos(intervalo=settings.ANALITICA_INTERVALO)
+difusor_cambios.al_leer(analitica_productos.al_leer_cambios)
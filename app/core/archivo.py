@@ -0,0 +1,148 @@
+import heapq
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import SessionLocal
+from .hilos import HiloDeFondo
+from .metricas import metricas
+from .totales import totales_listados
+from ..models.registroingreso import RegistroIngreso as RegistroIngresoModel
+from ..models.registroingreso import RegistroIngresoArchivo as RegistroIngresoArchivoModel
+
+
+class ArchivadorIngresos(HiloDeFondo):
+    """
+    Mueve los registros de ingreso antiguos a `registrosdeingreso_archivo` en lotes pequeños.
+
+    Cada lote es una transacción corta: toma del índice (fecha_ingreso, id) los ids de los
+    ARCHIVO_LOTE registros más antiguos anteriores al límite, los borra de la tabla principal
+    recibiendo sus filas (DELETE ... RETURNING, OUTPUT en SQL Server) e inserta esas filas en
+    el archivo. El bloqueo de escritura dura lo que un lote y no la pasada entera, y dos
+    workers que archiven a la vez no pueden mover una fila dos veces: el segundo ya no la
+    encuentra. Entre lotes espera ARCHIVO_PAUSA para dejar paso a la ingesta.
+
+    La tabla de resumen no cambia: los agregados siguen incluyendo los registros archivados.
+    """
+
+    nombre_hilo = "archivador-ingresos"
+    espera_detener = 30.0  # Se detiene al terminar el lote en curso
+
+    def __init__(self, edad_dias: int, tamano_lote: int, pausa: float, intervalo: float,
+                 session_factory: Callable[[], Session] = SessionLocal) -> None:
+        super().__init__()
+        self.edad_dias = edad_dias
+        self.tamano_lote = tamano_lote
+        self.pausa = pausa
+        self.intervalo = intervalo
+        self._session_factory = session_factory
+
+        self.ultima_pasada: Optional[Dict[str, Any]] = None
+
+        self.archivados = metricas.contador(
+            "archivo_filas_total", "Registros de ingreso movidos a la tabla de archivo"
+        )
+        metricas.medidor("archivo_filas_por_segundo", "Registros movidos por segundo en la última pasada del archivador",
+                         lambda: {(): self.ultima_pasada["filas_por_segundo"]} if self.ultima_pasada else {})
+
+    def archivar(self, limite: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Mueve al archivo todos los registros con fecha de ingreso anterior a `limite` (por
+        defecto, hace ARCHIVO_EDAD_DIAS días). Devuelve el resumen de la pasada.
+        """
+        if limite is None:
+            limite = datetime.utcnow() - timedelta(days=self.edad_dias)
+
+        inicio = datetime.utcnow()
+        t = time.perf_counter()
+        filas = lotes = 0
+        lote_max = 0.0
+        while not self._evento_detener.is_set():
+            t_lote = time.perf_counter()
+            movidas = self._mover_lote(limite)
+            if movidas:
+                lote_max = max(lote_max, time.perf_counter() - t_lote)
+                filas += movidas
+                lotes += 1
+                self.archivados.inc(movidas)
+            if movidas < self.tamano_lote:
+                break
+            self._evento_detener.wait(self.pausa)
+
+        segundos = time.perf_counter() - t
+        self.ultima_pasada = {
+            "limite": limite,
+            "inicio": inicio,
+            "filas": filas,
+            "lotes": lotes,
+            "segundos": segundos,
+            "filas_por_segundo": filas / segundos if segundos else 0.0,
+            "lote_max_ms": lote_max * 1000,
+        }
+        return self.ultima_pasada
+
+    def _mover_lote(self, limite: datetime) -> int:
+        tabla = RegistroIngresoModel.__table__
+        # Ids del lote leídos del índice (fecha_ingreso, id) y borrados por clave primaria: un
+        # rango `fecha_ingreso < límite` acotado con OR recorrería el índice hasta el límite
+        lote = (select(tabla.c.id).where(tabla.c.fecha_ingreso < limite)
+                .order_by(tabla.c.fecha_ingreso, tabla.c.id).limit(self.tamano_lote))
+        db = self._session_factory()
+        try:
+            conexion = db.connection()
+            filas = conexion.execute(
+                delete(tabla).where(tabla.c.id.in_(lote.scalar_subquery())).returning(*tabla.c)
+            ).mappings().all()
+            if filas:
+                conexion.execute(insert(RegistroIngresoArchivoModel.__table__), [dict(fila) for fila in filas])
+                totales_listados.anotar(db, tabla.name, -len(filas))
+                totales_listados.anotar(db, RegistroIngresoArchivoModel.__tablename__, len(filas))
+            db.commit()
+            return len(filas)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _ejecutar(self) -> None:
+        while not self._evento_detener.is_set():
+            try:
+                pasada = self.archivar()
+                if pasada["filas"]:
+                    print(f"Archivados {pasada['filas']} registros de ingreso en {pasada['segundos']:.1f} s "
+                          f"({pasada['filas_por_segundo']:.0f} filas/s)")
+            except Exception as e:
+                print(f"ERROR al archivar registros de ingreso: {str(e)}")
+            self._evento_detener.wait(self.intervalo)
+
+
+def leer_con_archivo(db: Session, condiciones: Callable[[Any], List[Any]], por_fecha: bool,
+                     skip: int, limit: int) -> List[Any]:
+    """
+    Página de registros de ingreso tomada de la tabla principal y del archivo a la vez.
+
+    Cada tabla devuelve sus primeras `skip + limit` filas en el orden del listado (por id, o
+    por (fecha_ingreso, id) con `por_fecha`) usando su propio índice, y las dos secuencias
+    se mezclan en memoria. `condiciones` recibe el modelo y devuelve sus filtros.
+    """
+    filas = []
+    for modelo in (RegistroIngresoModel, RegistroIngresoArchivoModel):
+        orden = (modelo.fecha_ingreso, modelo.id) if por_fecha else (modelo.id,)
+        filas.append(db.query(modelo).filter(*condiciones(modelo)).order_by(*orden).limit(skip + limit).all())
+
+    clave = (lambda registro: (registro.fecha_ingreso, registro.id)) if por_fecha else (lambda registro: registro.id)
+    return list(islice(heapq.merge(*filas, key=clave), skip, skip + limit))
+
+
+archivador_ingresos = ArchivadorIngresos(
+    edad_dias=settings.ARCHIVO_EDAD_DIAS,
+    tamano_lote=settings.ARCHIVO_LOTE,
+    pausa=settings.ARCHIVO_PAUSA,
+    intervalo=settings.ARCHIVO_INTERVALO,
+)
@@ -0,0 +1,378 @@
+import asyncio
+import json
+import time
+from bisect import bisect_right
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, inspect
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from .database import SessionLocal
+from .hilos import HiloDeFondo
+from .metricas import metricas
+from ..models.cambio import CambioCatalogo
+
+RUTA_CAMBIOS = f"{settings.API_V1_STR}/productos/cambios"
+
+# (id, evento SSE ya codificado): cada evento se codifica una vez y se comparte entre flujos
+Evento = Tuple[int, bytes]
+
+# Milisegundos que el navegador espera antes de reconectar (campo `retry` de SSE)
+RECONEXION_MS = 3000
+
+# Funciones que reciben (entidad, entidad_id, id del cambio) al confirmarse un cambio en este proceso
+_oyentes_confirmados: List[Callable[[str, int, int], None]] = []
+
+LATIDO = b": latido\n\n"
+# El cliente no puede reanudar sin perder eventos: debe recargar el catálogo completo
+REINICIO = b"event: reinicio\ndata: {}\n\n"
+
+
+def datos_producto(producto) -> Dict[str, Any]:
+    return {
+        "id": producto.id,
+        "nombre": producto.nombre,
+        "descripcion": producto.descripcion,
+        "precio": producto.precio,
+        "disponible": producto.disponible,
+        "stock": producto.stock,
+        "categoria_id": producto.categoria_id,
+    }
+
+
+def datos_categoria(categoria) -> Dict[str, Any]:
+    return {"id": categoria.id, "nombre": categoria.nombre}
+
+
+def registrar_cambio(db: Session, entidad: str, entidad_id: int, operacion: str,
+                     datos: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Añade el cambio a la sesión para que se confirme en la misma transacción que la escritura.
+
+    Tras el commit, llamar a `difusor_cambios.notificar()` para difundirlo sin esperar al
+    siguiente intervalo de lectura.
+    """
+    cambio = CambioCatalogo(
+        entidad=entidad,
+        entidad_id=entidad_id,
+        operacion=operacion,
+        datos=json.dumps(datos, separators=(",", ":")) if datos is not None else None,
+    )
+    db.add(cambio)
+    db.info.setdefault("cambios_catalogo", []).append((entidad, entidad_id, cambio))
+
+
+def al_confirmar(oyente: Callable[[str, int, int], None]) -> None:
+    """
+    Registra una función a la que se pasa (entidad, entidad_id, id del cambio) en cuanto se
+    confirma un cambio registrado en este proceso, antes de que lo lea el difusor.
+    """
+    _oyentes_confirmados.append(oyente)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _tras_commit(session: Session) -> None:
+    # En un lote transaccional cada commit solo libera un savepoint: se avisa al confirmar el lote
+    if session.info.get("diferir_cambios"):
+        return
+    avisar_confirmados(session)
+
+
+def avisar_confirmados(session: Session) -> None:
+    """Pasa a los oyentes de `al_confirmar` los cambios registrados en la sesión ya confirmados."""
+    for entidad, entidad_id, cambio in session.info.pop("cambios_catalogo", ()):
+        # Tras el commit los atributos están expirados; la identidad se conserva sin consultar
+        cambio_id = inspect(cambio).identity[0]
+        for oyente in _oyentes_confirmados:
+            try:
+                oyente(entidad, entidad_id, cambio_id)
+            except Exception as e:
+                print(f"ERROR en un oyente de cambios confirmados: {str(e)}")
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _tras_rollback(session: Session) -> None:
+    session.info.pop("cambios_catalogo", None)
+
+
+def codificar(cambio: CambioCatalogo) -> bytes:
+    datos = cambio.datos if cambio.datos is not None else "null"
+    cuerpo = f'{{"operacion":"{cambio.operacion}","id":{cambio.entidad_id},"datos":{datos}}}'
+    return f"id: {cambio.id}\nevent: {cambio.entidad}\ndata: {cuerpo}\n\n".encode()
+
+
+class DifusorCambios(HiloDeFondo):
+    """
+    Difunde los cambios del catálogo a los flujos SSE abiertos en este proceso.
+
+    Un único hilo por worker lee la tabla de cambios cada CAMBIOS_INTERVALO (o en cuanto
+    un endpoint de este proceso avisa con `notificar`), así que el coste en la base de
+    datos no depende del número de suscriptores ni de workers. Los eventos nuevos se
+    codifican una vez y se guardan en un buffer en memoria; cada suscriptor solo mantiene
+    el id del último evento enviado y espera un futuro compartido que se resuelve con cada
+    lote de cambios o latido. Un suscriptor que reanuda con un id anterior al buffer se
+    sirve desde la tabla y, si tampoco está allí, recibe un evento `reinicio`.
+
+    En SQL Server los ids de transacciones concurrentes pueden confirmarse fuera de orden, así
+    que un id que falta puede ser de una transacción aún abierta. El lector solo avanza hasta
+    el primer hueco: los cambios posteriores se vuelven a leer en cada pasada y se entregan
+    cuando el hueco se llena o, si pasan `espera_hueco` segundos, se da por deshecho (el id se
+    consumió sin confirmarse) y se salta.
+    """
+
+    # Segundos entre purgas de la tabla de cambios
+    PURGA_CADA = 300.0
+
+    nombre_hilo = "difusor-cambios"
+
+    def __init__(self, intervalo: float, latido: float, tamano_buffer: int, max_reanudar: int,
+                 retencion: int, espera_hueco: float,
+                 session_factory: Callable[[], Session] = SessionLocal) -> None:
+        super().__init__()
+        self.intervalo = intervalo
+        self.latido = latido
+        self.tamano_buffer = tamano_buffer
+        self.max_reanudar = max_reanudar
+        self.retencion = retencion
+        self.espera_hueco = espera_hueco
+        self._session_factory = session_factory
+
+        # Estado del event loop
+        self._ids: List[int] = []
+        self._eventos: List[Evento] = []
+        self._base = 0  # Los eventos con id mayor que este están en el buffer
+        self._despertar: Optional[asyncio.Future] = None
+        self._cerrado = True
+        self.suscriptores = 0
+
+        # Estado del hilo lector
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._leido = 0
+        self._hueco: Optional[int] = None  # Primer id que falta tras `_leido` y desde cuándo
+        self._hueco_desde = 0.0
+        self._oyentes: List[Callable[[List[CambioCatalogo]], None]] = []
+        self._sondeos: List[Callable[[], None]] = []
+
+        self.difundidos = metricas.contador("cambios_eventos_total", "Cambios del catálogo difundidos")
+        self.huecos_saltados = metricas.contador(
+            "cambios_huecos_saltados_total", "Ids de la tabla de cambios saltados tras CAMBIOS_ESPERA_HUECO sin confirmarse"
+        )
+        metricas.medidor("cambios_suscriptores", "Flujos de cambios abiertos", lambda: {(): self.suscriptores})
+
+    def _preparar(self) -> None:
+        # `iniciar` se llama desde el event loop (ciclo de vida de la aplicación)
+        self._loop = asyncio.get_running_loop()
+        self._despertar = self._loop.create_future()
+        self._cerrado = False
+        self._leido = self._base = self._ultimo_id()
+        self._ids, self._eventos = [], []
+
+    def detener(self, timeout: Optional[float] = None) -> None:
+        """Detiene el hilo lector y termina los flujos abiertos."""
+        super().detener(timeout)
+        self._cerrado = True
+        if self._despertar is not None:
+            self._avisar(False)
+
+    def notificar(self) -> None:
+        """Adelanta la siguiente lectura tras confirmar un cambio en este proceso."""
+        self._aviso.set()
+
+    @property
+    def leido(self) -> int:
+        """Id del último cambio entregado a los oyentes; todos los anteriores también se entregaron."""
+        return self._leido
+
+    def al_leer(self, oyente: Callable[[List[CambioCatalogo]], None]) -> None:
+        """
+        Registra una función a la que el hilo lector pasa cada lote de cambios nuevos.
+
+        Se ejecuta en el hilo lector, así que debe ser breve y no bloquear; sirve para que
+        otras cachés del proceso se enteren de los cambios hechos en cualquier worker.
+        """
+        self._oyentes.append(oyente)
+
+    def en_cada_lectura(self, funcion: Callable[[], None]) -> None:
+        """
+        Registra una función que el hilo lector llama en cada pasada, haya cambios o no.
+
+        Sirve para leer otras tablas compartidas entre workers con la misma cadencia
+        (CAMBIOS_INTERVALO) sin un hilo más por tabla; como `al_leer`, debe ser breve.
+        """
+        self._sondeos.append(funcion)
+
+    async def suscribir(self, desde: Optional[int]) -> AsyncIterator[bytes]:
+        """
+        Flujo SSE con los cambios posteriores al id `desde` (o los nuevos si es None).
+
+        Envía un latido (comentario SSE) cada CAMBIOS_LATIDO para que los proxies no cierren
+        la conexión y para detectar clientes desconectados.
+        """
+        self.suscriptores += 1
+        try:
+            yield f"retry: {RECONEXION_MS}\n\n".encode()
+
+            cursor = self._ultimo() if desde is None else desde
+            if cursor < self._base:
+                pendientes = await run_in_threadpool(self._reanudar, cursor)
+                if pendientes is None:
+                    yield REINICIO
+                    cursor = self._ultimo()
+                elif pendientes:
+                    yield b"".join(evento for _, evento in pendientes)
+                    cursor = pendientes[-1][0]
+
+            while not self._cerrado:
+                despertar = self._despertar
+                if cursor < self._base:
+                    # El buffer avanzó más rápido de lo que este cliente consume
+                    yield REINICIO
+                    cursor = self._ultimo()
+                    continue
+
+                lote = self._eventos[bisect_right(self._ids, cursor):]
+                if lote:
+                    yield b"".join(evento for _, evento in lote)
+                    cursor = lote[-1][0]
+                    continue
+
+                if await asyncio.shield(despertar):
+                    yield LATIDO
+        finally:
+            self.suscriptores -= 1
+
+    def _ultimo(self) -> int:
+        return self._ids[-1] if self._ids else self._base
+
+    def _publicar(self, eventos: List[Evento]) -> None:
+        self._ids.extend(id_evento for id_evento, _ in eventos)
+        self._eventos.extend(eventos)
+        if len(self._ids) > 2 * self.tamano_buffer:
+            # Recortar de golpe para que el coste se amortice entre muchas publicaciones
+            self._base = self._ids[-self.tamano_buffer - 1]
+            del self._ids[:-self.tamano_buffer]
+            del self._eventos[:-self.tamano_buffer]
+        self.difundidos.inc(len(eventos))
+        self._avisar(False)
+
+    def _avisar(self, latido: bool) -> None:
+        despertar, self._despertar = self._despertar, self._loop.create_future()
+        despertar.set_result(latido)
+
+    def _ejecutar(self) -> None:
+        proximo_latido = time.monotonic() + self.latido
+        proxima_purga = time.monotonic() + self.PURGA_CADA
+        while not self._evento_detener.is_set():
+            self._aviso.wait(min(self.intervalo, max(0.0, proximo_latido - time.monotonic())))
+            self._aviso.clear()
+            if self._evento_detener.is_set():
+                break
+
+            try:
+                leidos = self._leer_cambios(self._leido, self.tamano_buffer)
+            except Exception as e:
+                print(f"ERROR al leer la tabla de cambios del catálogo: {str(e)}")
+                leidos = []
+            cambios = self._sin_huecos(leidos)
+            if cambios:
+                for oyente in self._oyentes:
+                    try:
+                        oyente(cambios)
+                    except Exception as e:
+                        print(f"ERROR en un oyente de la tabla de cambios: {str(e)}")
+                # Después de los oyentes: quien vea `leido` avanzado sabe que sus cachés ya lo reflejan
+                self._leido = cambios[-1].id
+                self._loop.call_soon_threadsafe(self._publicar, [(cambio.id, codificar(cambio)) for cambio in cambios])
+                if len(leidos) == self.tamano_buffer and len(cambios) == len(leidos):
+                    self._aviso.set()
+            for sondeo in self._sondeos:
+                try:
+                    sondeo()
+                except Exception as e:
+                    print(f"ERROR en una lectura periódica del difusor de cambios: {str(e)}")
+
+            ahora = time.monotonic()
+            if ahora >= proximo_latido:
+                self._loop.call_soon_threadsafe(self._avisar, True)
+                proximo_latido = ahora + self.latido
+            if ahora >= proxima_purga:
+                self._purgar()
+                proxima_purga = ahora + self.PURGA_CADA
+
+    def _sin_huecos(self, cambios: List[CambioCatalogo]) -> List[CambioCatalogo]:
+        """Cambios leídos tras `_leido` hasta el primer id que falta y aún puede confirmarse."""
+        esperado = self._leido + 1
+        for i, cambio in enumerate(cambios):
+            if cambio.id != esperado:
+                ahora = time.monotonic()
+                if self._hueco != esperado:
+                    self._hueco, self._hueco_desde = esperado, ahora
+                if ahora - self._hueco_desde < self.espera_hueco:
+                    return cambios[:i]
+                self.huecos_saltados.inc(cambio.id - esperado)
+            esperado = cambio.id + 1
+        return cambios
+
+    def _ultimo_id(self) -> int:
+        db = self._session_factory()
+        try:
+            return db.query(func.max(CambioCatalogo.id)).scalar() or 0
+        finally:
+            db.close()
+
+    def _leer_cambios(self, desde: int, limite: int, hasta: Optional[int] = None) -> List[CambioCatalogo]:
+        db = self._session_factory()
+        try:
+            consulta = db.query(CambioCatalogo).filter(CambioCatalogo.id > desde)
+            if hasta is not None:
+                consulta = consulta.filter(CambioCatalogo.id <= hasta)
+            return (
+                consulta
+                .order_by(CambioCatalogo.id)
+                .limit(limite)
+                .all()
+            )
+        finally:
+            db.close()
+
+    def _leer(self, desde: int, limite: int) -> List[Evento]:
+        # Solo hasta lo ya entregado: lo posterior puede tener huecos y llegará por el buffer
+        return [(cambio.id, codificar(cambio)) for cambio in self._leer_cambios(desde, limite, self._leido)]
+
+    def _reanudar(self, desde: int) -> Optional[List[Evento]]:
+        """Eventos posteriores a `desde` guardados en la tabla, o None si ya se purgaron o son demasiados."""
+        db = self._session_factory()
+        try:
+            mas_antiguo = db.query(func.min(CambioCatalogo.id)).scalar()
+            if mas_antiguo is not None and desde < mas_antiguo - 1:
+                return None
+        finally:
+            db.close()
+
+        eventos = self._leer(desde, self.max_reanudar + 1)
+        if len(eventos) > self.max_reanudar:
+            return None
+        return eventos
+
+    def _purgar(self) -> None:
+        db = self._session_factory()
+        try:
+            db.execute(delete(CambioCatalogo).where(CambioCatalogo.id <= self._leido - self.retencion))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"ERROR al purgar la tabla de cambios del catálogo: {str(e)}")
+        finally:
+            db.close()
+
+
+difusor_cambios = DifusorCambios(
+    intervalo=settings.CAMBIOS_INTERVALO,
+    latido=settings.CAMBIOS_LATIDO,
+    tamano_buffer=settings.CAMBIOS_BUFFER,
+    max_reanudar=settings.CAMBIOS_MAX_REANUDAR,
+    retencion=settings.CAMBIOS_RETENCION,
+    espera_hueco=settings.CAMBIOS_ESPERA_HUECO,
+)
@@ -0,0 +1,182 @@
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .cambios import difusor_cambios
+from .config import settings
+from .database import SessionLocal
+from .hilos import HiloDeFondo
+from .metricas import metricas
+from ..models.cambio import CambioCatalogo
+from ..models.categoria import Categoria as CategoriaModel
+from ..schemas.categoria import Categoria
+
+# (filas, id máximo, suma de versiones): cambia con cada alta, baja o modificación
+Huella = Tuple[int, int, int]
+
+
+class CatalogoCategorias(HiloDeFondo):
+    """
+    Copia completa de la tabla de categorías en memoria, una por worker.
+
+    Valida el `categoria_id` de los productos y aporta la categoría anidada de sus respuestas
+    sin consultar la base de datos. Los mapas se sustituyen enteros en cada cambio, así que
+    una lectura nunca ve un estado a medias y no necesita bloqueo.
+
+    Se mantiene al día por tres vías:
+    - las escrituras de este proceso la actualizan en cuanto se confirman (`guardar`, `eliminar`),
+    - las de otros workers llegan por la tabla de cambios del catálogo, que el difusor de
+      cambios ya lee cada CAMBIOS_INTERVALO, y provocan una recarga,
+    - cada CATEGORIAS_INTERVALO se compara la huella de la tabla (filas, id máximo y suma de
+      versiones) para detectar escrituras hechas fuera de la API.
+    """
+
+    nombre_hilo = "catalogo-categorias"
+
+    def __init__(self, intervalo: float, session_factory: Callable[[], Session] = SessionLocal) -> None:
+        super().__init__()
+        self.intervalo = intervalo
+        self._session_factory = session_factory
+
+        self._por_id: Dict[int, Categoria] = {}
+        self._por_nombre: Dict[str, int] = {}
+        self._huella: Optional[Huella] = None
+        # Se incrementa con cada escritura local: una recarga que la solape se descarta y se repite
+        self._generacion = 0
+        self._lock = threading.Lock()
+
+        self.recargas = metricas.contador(
+            "categorias_recargas_total", "Recargas de las categorías en memoria por motivo (inicio, cambio, huella)"
+        )
+        self.consultas_fallidas = metricas.contador(
+            "categorias_fallos_total", "Categorías no encontradas en memoria que hubo que buscar en la base de datos"
+        )
+        metricas.medidor("categorias_en_memoria", "Categorías en la copia en memoria",
+                         lambda: {(): len(self._por_id)})
+
+    def _preparar(self) -> None:
+        # Las categorías se cargan antes de atender peticiones
+        self.recargar("inicio")
+
+    def obtener(self, categoria_id: int) -> Optional[Categoria]:
+        """Categoría en memoria, o None si no existe (o aún no ha llegado a este worker)."""
+        return self._por_id.get(categoria_id)
+
+    def id_por_nombre(self, nombre: str) -> Optional[int]:
+        return self._por_nombre.get(nombre)
+
+    def existe(self, db: Session, categoria_id: int) -> bool:
+        """
+        Comprueba que la categoría existe, normalmente sin consultar la base de datos.
+
+        Si no está en memoria se busca en la base antes de rechazarla: puede haberse creado
+        en otro worker hace menos de CAMBIOS_INTERVALO. En ese caso se adelanta la recarga.
+        """
+        if categoria_id in self._por_id:
+            return True
+
+        self.consultas_fallidas.inc()
+        if db.query(CategoriaModel.id).filter(CategoriaModel.id == categoria_id).first() is None:
+            return False
+        self.notificar()
+        return True
+
+    def guardar(self, db_categoria: CategoriaModel) -> None:
+        """Refleja una categoría creada o modificada en este proceso, tras el commit."""
+        categoria = Categoria.model_validate(db_categoria)
+        with self._lock:
+            por_id = dict(self._por_id)
+            por_nombre = dict(self._por_nombre)
+            anterior = por_id.get(categoria.id)
+            if anterior is not None and anterior.version > categoria.version:
+                return  # Otra escritura más reciente ya se reflejó
+            if anterior is not None and por_nombre.get(anterior.nombre) == categoria.id:
+                del por_nombre[anterior.nombre]
+            por_id[categoria.id] = categoria
+            por_nombre[categoria.nombre] = categoria.id
+            self._publicar(por_id, por_nombre)
+
+    def eliminar(self, categoria_id: int) -> None:
+        """Quita una categoría eliminada en este proceso, tras el commit."""
+        with self._lock:
+            por_id = dict(self._por_id)
+            por_nombre = dict(self._por_nombre)
+            anterior = por_id.pop(categoria_id, None)
+            if anterior is not None and por_nombre.get(anterior.nombre) == categoria_id:
+                del por_nombre[anterior.nombre]
+            self._publicar(por_id, por_nombre)
+
+    def notificar(self) -> None:
+        """Pide una recarga al hilo de comprobación."""
+        self._aviso.set()
+
+    def recargar(self, motivo: str) -> bool:
+        """
+        Lee la tabla completa y sustituye la copia en memoria.
+
+        Devuelve False (y pide otra recarga) si una escritura local se confirmó durante la
+        lectura: la copia leída podría no incluirla.
+        """
+        generacion = self._generacion
+        db = self._session_factory()
+        try:
+            huella = self._huella_actual(db)
+            categorias = [Categoria.model_validate(fila) for fila in db.query(CategoriaModel).all()]
+        finally:
+            db.close()
+
+        with self._lock:
+            if generacion != self._generacion:
+                self._aviso.set()
+                return False
+            self._por_id = {categoria.id: categoria for categoria in categorias}
+            self._por_nombre = {categoria.nombre: categoria.id for categoria in categorias}
+            self._huella = huella
+        self.recargas.inc(motivo=motivo)
+        return True
+
+    def al_leer_cambios(self, cambios: List[CambioCatalogo]) -> None:
+        """Oyente del difusor de cambios: recarga si alguno afecta a una categoría."""
+        if any(cambio.entidad == "categoria" for cambio in cambios):
+            self._aviso.set()
+
+    def _publicar(self, por_id: Dict[int, Categoria], por_nombre: Dict[str, int]) -> None:
+        # Llamar con el lock tomado
+        self._por_id, self._por_nombre = por_id, por_nombre
+        self._huella = None  # La próxima comprobación la recalcula y, si no coincide, recarga
+        self._generacion += 1
+
+    @staticmethod
+    def _huella_actual(db: Session) -> Huella:
+        filas, maximo, versiones = db.query(
+            func.count(CategoriaModel.id), func.max(CategoriaModel.id), func.sum(CategoriaModel.version)
+        ).one()
+        return filas, maximo or 0, versiones or 0
+
+    def _ejecutar(self) -> None:
+        while not self._evento_detener.is_set():
+            avisado = self._aviso.wait(self.intervalo)
+            self._aviso.clear()
+            if self._evento_detener.is_set():
+                break
+
+            try:
+                if avisado:
+                    self.recargar("cambio")
+                    continue
+
+                db = self._session_factory()
+                try:
+                    huella = self._huella_actual(db)
+                finally:
+                    db.close()
+                if huella != self._huella:
+                    self.recargar("huella")
+            except Exception as e:
+                print(f"ERROR al actualizar las categorías en memoria: {str(e)}")
+
+
+catalogo_categorias = CatalogoCategorias(intervalo=settings.CATEGORIAS_INTERVALO)
+difusor_cambios.al_leer(catalogo_categorias.al_leer_cambios)
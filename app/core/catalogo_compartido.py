@@ -0,0 +1,206 @@
+import mmap
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .cambios import al_confirmar, difusor_cambios
+from .config import settings
+from .database import SessionLocal
+from .instantanea import InstantaneaCatalogo, instantanea_catalogo
+from .metricas import metricas
+from .tienda_productos import TiendaProductos
+from ..models.cambio import CambioCatalogo
+
+try:
+    import fcntl
+except ImportError:  # Windows: la actualización del contador no se serializa entre workers
+    fcntl = None
+
+
+class UltimoCambio:
+    """
+    Id del último cambio del catálogo confirmado por cualquier worker de la máquina.
+
+    Son 8 bytes en un fichero mapeado por todos los workers: quien confirma un cambio lo
+    anota (con un bloqueo de fichero, porque es leer y escribir el máximo) y cualquiera lo
+    lee sin bloqueo. Así un worker sabe, sin consultar la base, si hay cambios que su
+    difusor aún no ha leído.
+    """
+
+    def __init__(self, ruta: str) -> None:
+        self.ruta = ruta
+        self._fichero = None
+        self._valor: Optional[memoryview] = None
+
+    def abrir(self, maximo: int) -> None:
+        """Mapea el fichero (creándolo si falta). Un valor mayor que `maximo` (base recreada) se corrige."""
+        descriptor = os.open(self.ruta, os.O_RDWR | os.O_CREAT, 0o644)
+        self._fichero = os.fdopen(descriptor, "r+b")
+        if os.fstat(descriptor).st_size < 8:
+            self._fichero.write(b"\0" * 8)
+            self._fichero.flush()
+        self._valor = memoryview(mmap.mmap(descriptor, 8)).cast("q")
+        with self._bloqueo():
+            if self._valor[0] > maximo:
+                self._valor[0] = maximo
+
+    def leer(self) -> int:
+        return self._valor[0] if self._valor is not None else 0
+
+    def anotar(self, cambio_id: int) -> None:
+        if self._valor is None:
+            return
+        with self._bloqueo():
+            if cambio_id > self._valor[0]:
+                self._valor[0] = cambio_id
+
+    @contextmanager
+    def _bloqueo(self):
+        if fcntl is not None:
+            fcntl.flock(self._fichero, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._fichero, fcntl.LOCK_UN)
+
+
+class CatalogoCompartido:
+    """
+    Productos leídos del fichero mapeado en memoria que genera la instantánea del catálogo.
+
+    Un solo proceso (el que genera la instantánea) escribe el fichero y todos los workers lo
+    mapean: hay una copia en memoria por máquina en lugar de una por worker, y un worker
+    recién arrancado la tiene lista sin consultar la base. Las lecturas no toman bloqueos.
+
+    El fichero refleja los cambios del catálogo hasta el id `hasta_cambio` del manifiesto y
+    todos los anteriores (el difusor de quien lo genera ya los había leído, sin huecos).
+    Los productos con cambios posteriores (confirmados en este proceso o leídos de la tabla
+    de cambios, escritos en cualquier worker) se marcan y se leen de la base hasta que llega
+    un fichero que los incluye. Mientras otro worker haya confirmado un cambio que el difusor
+    de este aún no ha leído (`UltimoCambio`), todas las lecturas van a la base, así que una
+    lectura posterior a una escritura la ve aunque la atienda otro worker. Entre máquinas
+    distintas el desfase es de hasta CAMBIOS_INTERVALO, como en las categorías en memoria.
+    Un fichero anterior al arranque del worker no se usa: los cambios que no incluye no se
+    sabrían.
+    """
+
+    def __init__(self, fuente: InstantaneaCatalogo, activo: bool,
+                 session_factory: Callable[[], Session] = SessionLocal) -> None:
+        self.activo = activo
+        self._fuente = fuente
+        self._session_factory = session_factory
+
+        self._tienda: Optional[TiendaProductos] = None
+        self._version: Optional[str] = None
+        self._hasta_cambio = 0
+        self._minimo_hasta: Optional[int] = None  # Cambio más reciente al arrancar el worker
+        # id de producto -> id del último cambio que el fichero aún no incluye
+        self._sucios: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.ultimo_cambio = UltimoCambio(os.path.join(fuente.directorio, "ultimo_cambio"))
+
+        self.lecturas = metricas.contador(
+            "catalogo_compartido_lecturas_total", "Lecturas de productos por origen (compartido, base)"
+        )
+        metricas.medidor("catalogo_compartido_pendientes", "Productos cambiados que aún no están en el fichero compartido",
+                         lambda: {(): len(self._sucios)})
+
+    def iniciar(self) -> None:
+        """Fija el primer cambio que debe incluir un fichero. Llamar después de iniciar el difusor de cambios."""
+        if not self.activo:
+            return
+        db = self._session_factory()
+        try:
+            minimo_hasta = db.query(func.max(CambioCatalogo.id)).scalar() or 0
+        finally:
+            db.close()
+        os.makedirs(self._fuente.directorio, exist_ok=True)
+        self.ultimo_cambio.abrir(minimo_hasta)
+        self._minimo_hasta = minimo_hasta
+
+    def confirmado(self, entidad: str, entidad_id: int, cambio_id: int) -> None:
+        """Oyente de los cambios confirmados en este proceso: avisa a los demás workers y marca el producto."""
+        self.ultimo_cambio.anotar(cambio_id)
+        self.marcar(entidad, entidad_id, cambio_id)
+
+    def marcar(self, entidad: str, entidad_id: int, cambio_id: int) -> None:
+        """Anota que el producto cambió en `cambio_id`: se leerá de la base hasta que el fichero lo incluya."""
+        if entidad != "producto":
+            return
+        with self._lock:
+            if cambio_id > self._hasta_cambio and self._sucios.get(entidad_id, 0) < cambio_id:
+                self._sucios[entidad_id] = cambio_id
+
+    def al_leer_cambios(self, cambios: List[CambioCatalogo]) -> None:
+        """Oyente del difusor de cambios: marca los productos cambiados en cualquier worker."""
+        for cambio in cambios:
+            self.marcar(cambio.entidad, cambio.entidad_id, cambio.id)
+
+    def obtener(self, producto_id: int) -> Optional[Dict[str, Any]]:
+        """Columnas del producto, o None si hay que leerlo de la base (no está en el fichero o cambió después)."""
+        tienda = self._actual()
+        if tienda is None or producto_id in self._sucios:
+            self.lecturas.inc(origen="base")
+            return None
+
+        i = tienda.posicion(producto_id)
+        if i is None:
+            # Puede haberse creado en otro worker hace un momento: que decida la base
+            self.lecturas.inc(origen="base")
+            return None
+        self.lecturas.inc(origen="compartido")
+        return tienda.fila(i)
+
+    def pagina(self, skip: int, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Página de productos por id, o None si algún cambio pendiente puede alterarla."""
+        tienda = self._actual()
+        if tienda is None:
+            self.lecturas.inc(origen="base")
+            return None
+
+        fin = min(skip + limit, len(tienda))
+        sucios = self._sucios
+        if sucios:
+            # Las altas tienen ids mayores que los del fichero y solo afectan a la última página;
+            # una baja o una modificación con id anterior al último de la página la desplaza o la cambia
+            if fin < skip + limit or min(sucios) <= tienda.id_en(fin - 1):
+                self.lecturas.inc(origen="base")
+                return None
+        self.lecturas.inc(origen="compartido")
+        return [tienda.fila(i) for i in range(skip, fin)]
+
+    def _actual(self) -> Optional[TiendaProductos]:
+        if not self.activo or self._minimo_hasta is None:
+            return None
+        if self.ultimo_cambio.leer() > difusor_cambios.leido:
+            # Otro worker confirmó cambios que aún no se han marcado aquí
+            difusor_cambios.notificar()
+            return None
+
+        manifiesto = self._fuente.vigente()
+        if manifiesto is None or "tienda" not in manifiesto or manifiesto["hasta_cambio"] < self._minimo_hasta:
+            return None
+        if manifiesto["version"] != self._version:
+            try:
+                tienda = TiendaProductos(self._fuente.ruta(manifiesto["tienda"]))
+            except (OSError, ValueError) as e:
+                print(f"ADVERTENCIA: No se pudo abrir el fichero de productos compartidos: {str(e)}")
+                return None
+            with self._lock:
+                # El fichero anterior se cierra solo cuando ninguna lectura en curso lo usa
+                self._tienda, self._version = tienda, manifiesto["version"]
+                self._hasta_cambio = manifiesto["hasta_cambio"]
+                self._sucios = {producto_id: cambio_id for producto_id, cambio_id in self._sucios.items()
+                                if cambio_id > self._hasta_cambio}
+        return self._tienda
+
+
+# Instancia única por proceso; lee los ficheros que escribe la instantánea del catálogo
+catalogo_compartido = CatalogoCompartido(instantanea_catalogo, activo=settings.CATALOGO_COMPARTIDO_ACTIVO)
+difusor_cambios.al_leer(catalogo_compartido.al_leer_cambios)
+al_confirmar(catalogo_compartido.confirmado)
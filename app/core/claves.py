@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwk
+from jose.backends.base import Key
+
+from .config import settings
+
+# Curva elíptica asociada a cada algoritmo ES*
+CURVAS_EC = {"ES256": ec.SECP256R1, "ES384": ec.SECP384R1, "ES512": ec.SECP521R1}
+
+
+def es_asimetrico(algoritmo: str) -> bool:
+    """Indica si el algoritmo firma con clave privada y verifica con clave pública."""
+    return algoritmo.startswith(("RS", "ES"))
+
+
+class ConjuntoClaves:
+    """
+    Conjunto de claves asimétricas para firmar y verificar tokens JWT, identificadas por `kid`.
+
+    Las claves se cargan de un directorio con un fichero PEM por clave (el nombre del fichero
+    sin extensión es el `kid`). Las claves privadas pueden firmar; las públicas solo verifican,
+    lo que permite retirar una clave de firma y seguir aceptando sus tokens hasta que expiren.
+    Las claves se construyen una única vez: firmar y verificar no vuelven a parsear PEM.
+    """
+
+    def __init__(self, algoritmo: str) -> None:
+        self.algoritmo = algoritmo
+        self.kid_activo: Optional[str] = None
+        self._privadas: Dict[str, Key] = {}
+        self._publicas: Dict[str, Key] = {}
+        self._jwks_json: bytes = b'{"keys":[]}'
+        self._jwks_etag: str = ""
+
+    def agregar(self, kid: str, pem: bytes) -> None:
+        """Añade una clave PEM (privada o pública) al conjunto."""
+        if b"PRIVATE KEY" in pem:
+            privada = jwk.construct(pem, self.algoritmo)
+            self._privadas[kid] = privada
+            self._publicas[kid] = privada.public_key()
+        else:
+            self._publicas[kid] = jwk.construct(pem, self.algoritmo)
+        self._actualizar_jwks()
+
+    def generar_efimera(self, kid: str = "efimera") -> None:
+        """Genera una clave en memoria (solo desarrollo: cada proceso tendrá una clave distinta)."""
+        if self.algoritmo.startswith("ES"):
+            privada = ec.generate_private_key(CURVAS_EC[self.algoritmo]())
+        else:
+            privada = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+        self.agregar(kid, privada.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ))
+
+    def clave_firma(self) -> Tuple[str, Key]:
+        """Devuelve (kid, clave privada) de la clave activa de firma."""
+        kid = self.kid_activo or max(self._privadas)
+        return kid, self._privadas[kid]
+
+    def clave_verificacion(self, kid: Optional[str]) -> Optional[Key]:
+        """Devuelve la clave pública del `kid` indicado, o None si no se conoce."""
+        if kid is None and len(self._publicas) == 1:
+            return next(iter(self._publicas.values()))
+        return self._publicas.get(kid)
+
+    @property
+    def kids(self) -> List[str]:
+        return sorted(self._publicas)
+
+    def jwks(self) -> Tuple[bytes, str]:
+        """Devuelve el JWKS serializado y su ETag (precalculados al cambiar las claves)."""
+        return self._jwks_json, self._jwks_etag
+
+    def _actualizar_jwks(self) -> None:
+        claves = []
+        for kid in self.kids:
+            clave = self._publicas[kid].to_dict()
+            clave.update({"kid": kid, "use": "sig", "alg": self.algoritmo})
+            claves.append(clave)
+
+        self._jwks_json = json.dumps({"keys": claves}, separators=(",", ":"), sort_keys=True).encode()
+        self._jwks_etag = '"' + hashlib.sha256(self._jwks_json).hexdigest()[:32] + '"'
+
+    @classmethod
+    def desde_configuracion(cls, algoritmo: str, directorio: Optional[str], kid_activo: Optional[str],
+                            permitir_efimera: bool = False) -> "ConjuntoClaves":
+        conjunto = cls(algoritmo)
+        if not es_asimetrico(algoritmo):
+            return conjunto
+
+        if directorio and os.path.isdir(directorio):
+            for nombre in sorted(os.listdir(directorio)):
+                if nombre.endswith(".pem"):
+                    with open(os.path.join(directorio, nombre), "rb") as f:
+                        conjunto.agregar(nombre[:-4], f.read())
+
+        if not conjunto._privadas:
+            # Con una clave por proceso, cada worker rechazaría los tokens firmados por los demás
+            if not permitir_efimera:
+                raise ValueError(f"No hay claves privadas para {algoritmo} en JWT_CLAVES_DIR "
+                                 "(JWT_CLAVE_EFIMERA=True genera una temporal, solo para desarrollo)")
+            print(f"ADVERTENCIA: No hay claves privadas para {algoritmo} en JWT_CLAVES_DIR. "
+                  "Se genera una clave efímera; los tokens no serán válidos entre procesos ni reinicios")
+            conjunto.generar_efimera()
+
+        if kid_activo:
+            if kid_activo not in conjunto._privadas:
+                raise ValueError(f"JWT_KID_ACTIVO '{kid_activo}' no corresponde a ninguna clave privada")
+            conjunto.kid_activo = kid_activo
+
+        return conjunto
+
+
+conjunto_claves = ConjuntoClaves.desde_configuracion(
+    settings.ALGORITHM, settings.JWT_CLAVES_DIR, settings.JWT_KID_ACTIVO, settings.JWT_CLAVE_EFIMERA
+)
@@ -0,0 +1,131 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from .cambios import RUTA_CAMBIOS
+from .config import settings
+from .metricas import metricas
+from .plazos import plazo_restante
+
+Mensajes = List[Dict[str, Any]]
+
+
+def clave_peticion(scope) -> Optional[Tuple[str, str, bytes]]:
+    """
+    Clave normalizada de una lectura coalescible, o None si la petición no lo es.
+
+    Solo se agrupan GET anónimos de las rutas configuradas: con `Authorization` la
+    respuesta puede depender del usuario. Los parámetros se ordenan para que
+    `?limit=10&skip=0` y `?skip=0&limit=10` compartan resultado, y se incluye
+    `Accept-Encoding` porque cambia el cuerpo de la respuesta. El flujo de cambios no
+    termina, así que nunca se agrupa.
+    """
+    if scope["type"] != "http" or scope["method"] != "GET":
+        return None
+    if not scope["path"].startswith(tuple(settings.COALESCENCIA_RUTAS)) or scope["path"] == RUTA_CAMBIOS:
+        return None
+
+    codificacion = b""
+    for nombre, valor in scope["headers"]:
+        if nombre == b"authorization":
+            return None
+        if nombre == b"accept-encoding":
+            codificacion = valor
+
+    consulta = urlencode(sorted(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)))
+    return scope["path"], consulta, codificacion
+
+
+class MiddlewareCoalescencia:
+    """
+    Agrupa lecturas idénticas y simultáneas en una sola ejecución (single-flight).
+
+    La primera petición de una clave (líder) ejecuta la aplicación y envía su respuesta
+    mientras la guarda; las que llegan con la misma clave antes de que termine esperan y
+    reciben una copia, sin pasar por el control de admisión ni tocar la base de datos.
+    Solo se comparten las respuestas 2xx: un 429 del límite de tasa del líder, un 503 o
+    un 504 dependen de esa petición, no del recurso. Si la respuesta no es 2xx, supera
+    COALESCENCIA_MAX_BYTES (o es un flujo que no termina) o el líder falla, o la espera
+    supera COALESCENCIA_ESPERA_MAX, cada petición en espera se ejecuta por su cuenta. El
+    estado es local al proceso: cada worker agrupa las suyas.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self._en_vuelo: Dict[Tuple[str, str, bytes], asyncio.Future] = {}
+        self.peticiones = metricas.contador(
+            "coalescencia_peticiones_total",
+            "Lecturas coalescibles por resultado (lider, compartida, espera_agotada, sin_compartir)"
+        )
+        metricas.medidor("coalescencia_claves_en_vuelo", "Claves con una ejecución en curso",
+                         lambda: {(): len(self._en_vuelo)})
+
+    async def __call__(self, scope, receive, send) -> None:
+        clave = clave_peticion(scope)
+        if clave is None:
+            await self.app(scope, receive, send)
+            return
+
+        pendiente = self._en_vuelo.get(clave)
+        if pendiente is not None:
+            mensajes = await self._esperar(pendiente)
+            if mensajes is not None:
+                self.peticiones.inc(resultado="compartida")
+                await self._reenviar(mensajes, send)
+                return
+            await self.app(scope, receive, send)
+            return
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_vuelo[clave] = futuro
+        self.peticiones.inc(resultado="lider")
+        guardados: Optional[Mensajes] = []
+        tamano = 0
+
+        async def enviar_y_guardar(mensaje) -> None:
+            nonlocal guardados, tamano
+            if mensaje["type"] == "http.response.start" and not 200 <= mensaje["status"] < 300:
+                guardados = None
+                self._resolver(clave, futuro, None)
+            if guardados is not None:
+                tamano += len(mensaje.get("body", b""))
+                if tamano > settings.COALESCENCIA_MAX_BYTES:
+                    guardados = None
+                else:
+                    guardados.append(mensaje)
+                if mensaje["type"] == "http.response.body" and not mensaje.get("more_body", False):
+                    self._resolver(clave, futuro, guardados)
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar_y_guardar)
+        finally:
+            # Error, desconexión o respuesta demasiado grande: los que esperan se ejecutan por su cuenta
+            self._resolver(clave, futuro, None)
+
+    async def _esperar(self, futuro: asyncio.Future) -> Optional[Mensajes]:
+        espera = settings.COALESCENCIA_ESPERA_MAX
+        restante = plazo_restante()
+        if restante is not None:
+            espera = min(espera, max(restante, 0))
+        try:
+            mensajes = await asyncio.wait_for(asyncio.shield(futuro), espera)
+        except asyncio.TimeoutError:
+            self.peticiones.inc(resultado="espera_agotada")
+            return None
+        if mensajes is None:
+            self.peticiones.inc(resultado="sin_compartir")
+        return mensajes
+
+    def _resolver(self, clave, futuro: asyncio.Future, mensajes: Optional[Mensajes]) -> None:
+        if self._en_vuelo.get(clave) is futuro:
+            del self._en_vuelo[clave]
+        if not futuro.done():
+            futuro.set_result(mensajes)
+
+    @staticmethod
+    async def _reenviar(mensajes: Mensajes, send) -> None:
+        for mensaje in mensajes:
+            if mensaje["type"] == "http.response.start":
+                mensaje = dict(mensaje, headers=list(mensaje["headers"]) + [(b"x-coalescida", b"1")])
+            await send(mensaje)
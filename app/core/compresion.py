@@ -0,0 +1,309 @@
+import gzip
+import hashlib
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional, Protocol, Tuple, TypeVar
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .config import settings
+from .metricas import metricas
+
+
+T = TypeVar("T")
+
+
+class CompresorFlujo(Protocol):
+    """Compresión incremental: cada bloque se vacía para que el cliente lo reciba sin esperar al resto."""
+
+    def bloque(self, datos: bytes) -> bytes: ...
+
+    def fin(self) -> bytes: ...
+
+
+class Codec(NamedTuple):
+    comprimir: Callable[[bytes, int], bytes]
+    flujo: Callable[[int], CompresorFlujo]
+
+
+class _FlujoGzip:
+    def __init__(self, nivel: int) -> None:
+        self._compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)  # 31: cabecera gzip
+
+    def bloque(self, datos: bytes) -> bytes:
+        return self._compresor.compress(datos) + self._compresor.flush(zlib.Z_SYNC_FLUSH)
+
+    def fin(self) -> bytes:
+        return self._compresor.flush(zlib.Z_FINISH)
+
+
+# gzip siempre está disponible; brotli y zstandard son dependencias opcionales
+CODECS: Dict[str, Codec] = {
+    "gzip": Codec(lambda datos, nivel: gzip.compress(datos, nivel, mtime=0), _FlujoGzip),
+}
+
+try:
+    import brotli
+
+    class _FlujoBrotli:
+        def __init__(self, nivel: int) -> None:
+            self._compresor = brotli.Compressor(quality=nivel)
+
+        def bloque(self, datos: bytes) -> bytes:
+            return self._compresor.process(datos) + self._compresor.flush()
+
+        def fin(self) -> bytes:
+            return self._compresor.finish()
+
+    CODECS["br"] = Codec(lambda datos, nivel: brotli.compress(datos, quality=nivel), _FlujoBrotli)
+except ImportError:
+    pass
+
+try:
+    import zstandard
+
+    class _FlujoZstd:
+        def __init__(self, nivel: int) -> None:
+            self._compresor = zstandard.ZstdCompressor(level=nivel).compressobj()
+
+        def bloque(self, datos: bytes) -> bytes:
+            return self._compresor.compress(datos) + self._compresor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+        def fin(self) -> bytes:
+            return self._compresor.flush()
+
+    CODECS["zstd"] = Codec(lambda datos, nivel: zstandard.ZstdCompressor(level=nivel).compress(datos), _FlujoZstd)
+except ImportError:
+    pass
+
+
+def elegir_codificacion(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Codificación para la cabecera `Accept-Encoding`, o None si el cliente no acepta ninguna.
+
+    Se respetan los valores `q` del cliente; a igualdad, manda el orden de COMPRESION_PREFERENCIA.
+    """
+    if not accept_encoding:
+        return None
+
+    pesos: Dict[str, float] = {}
+    for parte in accept_encoding.split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        peso = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                peso = float(parametros[2:])
+            except ValueError:
+                continue
+        pesos[nombre.strip().lower()] = peso
+
+    candidatas = []
+    for orden, nombre in enumerate(settings.COMPRESION_PREFERENCIA):
+        if nombre not in CODECS:
+            continue
+        peso = pesos.get(nombre, pesos.get("*", 0.0))
+        if peso > 0:
+            candidatas.append((-peso, orden, nombre))
+    return min(candidatas)[2] if candidatas else None
+
+
+async def comprimir_sin_bloquear(funcion: Callable[[], T], tamano: int) -> T:
+    """
+    Ejecuta una compresión de `tamano` bytes de entrada. A partir de COMPRESION_HILO_MINIMO va
+    al pool de hilos: comprimir una página grande con br o zstd tarda milisegundos y, en el
+    event loop, detendría todas las conexiones del worker mientras tanto.
+    """
+    if tamano < settings.COMPRESION_HILO_MINIMO:
+        return funcion()
+    return await run_in_threadpool(funcion)
+
+
+def _comprimible(cabeceras: MutableHeaders) -> bool:
+    tipo = cabeceras.get("content-type", "").split(";")[0].strip().lower()
+    return tipo in settings.COMPRESION_TIPOS and "content-encoding" not in cabeceras
+
+
+class CacheComprimidos:
+    """
+    Cuerpos ya comprimidos, indexados por el resumen del original.
+
+    Calcular un BLAKE2 del cuerpo cuesta mucho menos que comprimirlo, así que una página que
+    se sirve igual muchas veces (el catálogo entre dos cambios, las claves JWKS) se comprime
+    una vez por codificación. Se descartan las entradas menos usadas al superar el tamaño, y
+    los cuerpos que ocuparían más de 1/16 de la caché no se guardan.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entradas: "OrderedDict[Tuple[str, bytes], bytes]" = OrderedDict()
+        self.bytes = 0
+
+    async def obtener(self, codificacion: str, cuerpo: bytes) -> Tuple[bytes, bool]:
+        """Cuerpo comprimido y si venía de la caché. La caché solo se modifica desde el event loop."""
+        clave = (codificacion, hashlib.blake2b(cuerpo, digest_size=16).digest())
+        comprimido = self._entradas.get(clave)
+        if comprimido is not None:
+            self._entradas.move_to_end(clave)
+            return comprimido, True
+
+        comprimir = CODECS[codificacion].comprimir
+        comprimido = await comprimir_sin_bloquear(
+            lambda: comprimir(cuerpo, settings.COMPRESION_NIVELES[codificacion]), len(cuerpo)
+        )
+        if clave not in self._entradas and len(comprimido) <= self.max_bytes // 16:
+            self._entradas[clave] = comprimido
+            self.bytes += len(comprimido)
+            while self.bytes > self.max_bytes:
+                _, descartado = self._entradas.popitem(last=False)
+                self.bytes -= len(descartado)
+        return comprimido, False
+
+
+class MiddlewareCompresion:
+    """
+    Comprime las respuestas según `Accept-Encoding` (gzip y, si están instalados, br y zstd).
+
+    Solo se comprimen los tipos de COMPRESION_TIPOS a partir de COMPRESION_MINIMO bytes; los
+    flujos SSE quedan fuera a propósito: cada evento se codifica una vez para todos los
+    suscriptores y comprimirlo por conexión anularía ese ahorro. Las respuestas de un solo
+    bloque pasan por la caché de comprimidos; las que llegan en varios bloques (exportaciones,
+    NDJSON) se comprimen al vuelo, vaciando el compresor tras cada bloque para que el cliente
+    reciba cada uno sin esperar al siguiente. Los cuerpos y bloques de COMPRESION_HILO_MINIMO
+    bytes o más se comprimen en el pool de hilos para no detener el event loop. Las respuestas
+    que ya traen `Content-Encoding` (p. ej. contenido precomprimido) se envían tal cual.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self.cache = CacheComprimidos(settings.COMPRESION_CACHE_BYTES)
+        self.respuestas = metricas.contador(
+            "compresion_respuestas_total", "Respuestas comprimidas por codificación y origen (comprimida, cache, flujo)"
+        )
+        self.bytes_entrada = metricas.contador("compresion_bytes_entrada_total", "Bytes antes de comprimir")
+        self.bytes_salida = metricas.contador("compresion_bytes_salida_total", "Bytes enviados tras comprimir")
+        metricas.medidor("compresion_cache_bytes", "Bytes en la caché de respuestas comprimidas",
+                         lambda: {(): self.cache.bytes})
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        codificacion = None
+        for nombre, valor in scope["headers"]:
+            if nombre == b"accept-encoding":
+                codificacion = elegir_codificacion(valor.decode("latin-1"))
+                break
+        if codificacion is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio: Optional[dict] = None
+        flujo: Optional[CompresorFlujo] = None
+        sin_comprimir = False
+        # Primer bloque retenido: las respuestas que atraviesan un BaseHTTPMiddleware llegan como
+        # un bloque seguido de otro vacío, y deben tratarse como respuestas de un solo bloque
+        retenido: Optional[bytes] = None
+
+        async def enviar_bloque(cuerpo: bytes, mas: bool) -> None:
+            if mas:
+                salida = await comprimir_sin_bloquear(lambda: flujo.bloque(cuerpo), len(cuerpo))
+            else:
+                salida = await comprimir_sin_bloquear(lambda: flujo.bloque(cuerpo) + flujo.fin(), len(cuerpo))
+            self.bytes_entrada.inc(len(cuerpo))
+            self.bytes_salida.inc(len(salida))
+            await send({"type": "http.response.body", "body": salida, "more_body": mas})
+
+        async def enviar(mensaje) -> None:
+            nonlocal inicio, flujo, sin_comprimir, retenido
+            if sin_comprimir:
+                await send(mensaje)
+                return
+            if mensaje["type"] == "http.response.start":
+                inicio = mensaje
+                return
+            if mensaje["type"] != "http.response.body":
+                # p. ej. http.response.pathsend: el servidor envía el fichero tal cual
+                await send(inicio)
+                await send(mensaje)
+                sin_comprimir = True
+                return
+
+            cuerpo = mensaje.get("body", b"")
+            mas = mensaje.get("more_body", False)
+
+            if flujo is not None:
+                await enviar_bloque(cuerpo, mas)
+                return
+
+            cabeceras = MutableHeaders(scope=inicio)
+            if retenido is None:
+                longitud = cabeceras.get("content-length")
+                pequena = len(cuerpo) < settings.COMPRESION_MINIMO if not mas else (
+                    longitud is not None and int(longitud) < settings.COMPRESION_MINIMO)
+                if inicio["status"] in (204, 304) or pequena or not _comprimible(cabeceras):
+                    sin_comprimir = True
+                    await send(inicio)
+                    await send(mensaje)
+                    return
+
+                cabeceras["Content-Encoding"] = codificacion
+                cabeceras.add_vary_header("Accept-Encoding")
+                etag = cabeceras.get("etag")
+                if etag is not None and not etag.startswith("W/"):
+                    # El cuerpo ya no es idéntico byte a byte al de la representación sin comprimir
+                    cabeceras["ETag"] = f"W/{etag}"
+
+                if mas:
+                    retenido = cuerpo
+                    return
+            else:
+                if mas:
+                    # Flujo de verdad: se comprime al vuelo desde el bloque retenido
+                    flujo = CODECS[codificacion].flujo(settings.COMPRESION_NIVELES[codificacion])
+                    del cabeceras["content-length"]
+                    self.respuestas.inc(codificacion=codificacion, origen="flujo")
+                    await send(inicio)
+                    await enviar_bloque(retenido, True)
+                    await enviar_bloque(cuerpo, True)
+                    return
+                cuerpo = retenido + cuerpo
+
+            comprimido, de_cache = await self.cache.obtener(codificacion, cuerpo)
+            cabeceras["Content-Length"] = str(len(comprimido))
+            self.respuestas.inc(codificacion=codificacion, origen="cache" if de_cache else "comprimida")
+            self.bytes_entrada.inc(len(cuerpo))
+            self.bytes_salida.inc(len(comprimido))
+            await send(inicio)
+            await send({"type": "http.response.body", "body": comprimido})
+
+        await self.app(scope, receive, enviar)
+
+
+class ContenidoPrecomprimido:
+    """
+    Contenido estático comprimido una sola vez, con el nivel máximo, en cada codificación disponible.
+
+    Para páginas que no cambian (la página de bienvenida): cada petición elige la versión
+    adecuada a su `Accept-Encoding` sin comprimir nada.
+    """
+
+    NIVEL_MAXIMO = {"gzip": 9, "br": 11, "zstd": 19}
+
+    def __init__(self, contenido: str, media_type: str) -> None:
+        self.media_type = media_type
+        self.versiones: Dict[Optional[str], bytes] = {None: contenido.encode("utf-8")}
+        for nombre, codec in CODECS.items():
+            self.versiones[nombre] = codec.comprimir(self.versiones[None], self.NIVEL_MAXIMO[nombre])
+
+    def respuesta(self, request: Request) -> Response:
+        codificacion = elegir_codificacion(request.headers.get("accept-encoding"))
+        headers = {"Vary": "Accept-Encoding"}
+        if codificacion is not None:
+            headers["Content-Encoding"] = codificacion
+        return Response(content=self.versiones[codificacion], media_type=self.media_type, headers=headers)
+
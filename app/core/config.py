@@ -21,11 +21,30 @@ class Settings(BaseSettings):
     DB_NAME: str
     DB_TRUSTED_CONNECTION: bool = False
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
 
     # Seguridad
     SECRET_KEY: str
-    ALGORITHM: str = "HS256"
+    ALGORITHM: str = "HS256"  # HS256 (secreto compartido) o RS256/ES256 (par de claves)
+    JWT_CLAVES_DIR: Optional[str] = None  # Directorio con claves PEM (<kid>.pem) para RS*/ES*
+    JWT_KID_ACTIVO: Optional[str] = None  # kid que firma; por defecto la última clave privada por nombre
+    JWT_CLAVE_EFIMERA: bool = False  # Solo desarrollo: sin claves privadas, generar una temporal por proceso
+    JWKS_CACHE_SEGUNDOS: int = 3600
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    # Autorizar con los claims is_active/is_admin del token sin consultar la base de datos
+    TOKEN_SIN_ESTADO: bool = False
+    ULTIMO_LOGIN_INTERVALO_FLUSH: float = 5.0  # Segundos entre escrituras agrupadas de último login
+
+    # Bloqueo de logins tras fallos repetidos, antes de consultar la base y de bcrypt (429 mientras dura)
+    LOGIN_BLOQUEO_ACTIVO: bool = True
+    LOGIN_FALLOS_USUARIO: int = 5          # Fallos por nombre de usuario en LOGIN_VENTANA que lo bloquean
+    LOGIN_FALLOS_IP: int = 20              # Fallos por IP en LOGIN_VENTANA que la bloquean
+    LOGIN_VENTANA: float = 900.0           # Segundos de la ventana deslizante de fallos
+    LOGIN_BLOQUEO_INICIAL: float = 1.0     # Segundos del primer bloqueo; se dobla con cada fallo siguiente
+    LOGIN_BLOQUEO_MAXIMO: float = 900.0    # Segundos máximos de un bloqueo
+    LOGIN_SEGUIMIENTO_MAX: int = 100000    # Usuarios e IPs con fallos recientes que se recuerdan por worker
 
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = ["*"]
@@ -33,6 +52,106 @@ class Settings(BaseSettings):
     # Límites y paginación
     DEFAULT_LIMIT: int = 100
     MAX_LIMIT: int = 1000
+    LIMITE_TASA_ACTIVO: bool = True  # Desactivar solo en pruebas de carga locales (todo llega desde una IP)
+
+    # Control de admisión: peticiones simultáneas por clase de ruta y cola de espera acotada.
+    # El límite global debe quedar por debajo de DB_POOL_SIZE + DB_MAX_OVERFLOW, ya que cada
+    # petición en curso retiene una conexión; el resto queda para los escritores de fondo.
+    ADMISION_ACTIVA: bool = True
+    ADMISION_LIMITE_GLOBAL: int = 12
+    ADMISION_LIMITES: Dict[str, int] = {"admin": 6, "auth": 4, "publica": 8}
+    ADMISION_MAX_COLA: Dict[str, int] = {"admin": 50, "auth": 50, "publica": 200}
+    ADMISION_ESPERA_MAX: float = 2.0  # Segundos máximos en cola antes de responder 503
+
+    # Coalescencia de lecturas anónimas idénticas y simultáneas (una ejecución por clave)
+    COALESCENCIA_ACTIVA: bool = True
+    COALESCENCIA_RUTAS: List[str] = ["/api/v1/productos", "/api/v1/categorias"]
+    COALESCENCIA_ESPERA_MAX: float = 5.0     # Segundos que una petición espera el resultado del líder
+    COALESCENCIA_MAX_BYTES: int = 1048576    # Respuestas mayores no se comparten
+
+    # Claves de idempotencia (cabecera Idempotency-Key) en las altas que los clientes reintentan
+    IDEMPOTENCIA_ACTIVA: bool = True
+    IDEMPOTENCIA_RUTAS: List[str] = ["/api/v1/productos", "/api/v1/registros", "/api/v1/auth/registro"]
+    IDEMPOTENCIA_ALMACEN: str = "memoria"        # memoria (por worker) o base (tabla claves_idempotencia)
+    IDEMPOTENCIA_TTL: float = 86400.0            # Segundos que se conserva la respuesta de una clave
+    IDEMPOTENCIA_MEMORIA_BYTES: int = 16777216   # Tamaño máximo del almacén en memoria
+    IDEMPOTENCIA_MAX_BYTES: int = 65536          # Respuestas mayores no se guardan
+    IDEMPOTENCIA_ESPERA_MAX: float = 10.0        # Segundos que un duplicado espera a la ejecución en curso
+
+    # Compresión de respuestas: gzip siempre; br y zstd si están instalados brotli y zstandard
+    COMPRESION_ACTIVA: bool = True
+    COMPRESION_PREFERENCIA: List[str] = ["zstd", "br", "gzip"]  # A igualdad de q del cliente
+    COMPRESION_NIVELES: Dict[str, int] = {"gzip": 6, "br": 4, "zstd": 3}
+    COMPRESION_MINIMO: int = 1024            # Bytes; por debajo no compensa
+    COMPRESION_TIPOS: List[str] = [
+        "application/json", "application/x-ndjson", "text/html", "text/plain", "text/csv",
+        "application/javascript", "text/css", "image/svg+xml",
+    ]
+    COMPRESION_CACHE_BYTES: int = 16777216   # Respuestas ya comprimidas que se reutilizan
+    COMPRESION_HILO_MINIMO: int = 65536      # Bytes; desde aquí se comprime en el pool de hilos, fuera del event loop
+
+    # Flujo de cambios del catálogo (SSE en /api/v1/productos/cambios)
+    CAMBIOS_INTERVALO: float = 1.0      # Segundos entre lecturas de la tabla de cambios (cambios de otros workers)
+    CAMBIOS_LATIDO: float = 15.0        # Segundos entre latidos enviados a los flujos abiertos
+    CAMBIOS_BUFFER: int = 1000          # Eventos recientes en memoria para reanudar sin consultar la tabla
+    CAMBIOS_MAX_REANUDAR: int = 1000    # Eventos máximos reenviados desde la tabla al reanudar
+    CAMBIOS_RETENCION: int = 100000     # Registros que se conservan en la tabla de cambios
+    CAMBIOS_ESPERA_HUECO: float = 10.0  # Segundos que se espera un id intermedio sin confirmar antes de saltarlo
+
+    # Categorías en memoria (una copia por worker, actualizada con la tabla de cambios)
+    CATEGORIAS_INTERVALO: float = 5.0   # Segundos entre comprobaciones de escrituras hechas fuera de la API
+
+    # Analítica de productos en memoria (GET /api/v1/productos/analitica, requiere `pip install numpy`)
+    ANALITICA_INTERVALO: float = 600.0  # Segundos entre relecturas completas (escrituras hechas fuera de la API)
+
+    # Totales de los listados (parámetro `total`, cabecera X-Total-Count)
+    TOTALES_INTERVALO: float = 30.0     # Segundos entre recálculos de los totales en caché (escrituras de otros workers)
+    TOTALES_CACHE_MAX: int = 1000       # Totales en caché por worker (uno por tabla y filtros)
+
+    # Instantánea del catálogo completo (GET /api/v1/catalogo/snapshot), generada en segundo plano
+    INSTANTANEA_GENERAR: bool = True       # Desactivar en instancias que solo la sirven desde un directorio compartido
+    INSTANTANEA_DIR: str = "instantaneas"  # Compartido por todos los workers de la instancia
+    INSTANTANEA_INTERVALO: float = 300.0   # Segundos entre comprobaciones de escrituras hechas fuera de la API
+    INSTANTANEA_ESPERA_MINIMA: float = 10.0  # Segundos mínimos entre dos generaciones (agrupa ráfagas de cambios)
+    INSTANTANEA_NIVELES: Dict[str, int] = {"gzip": 9, "br": 9, "zstd": 9}  # Se comprime una vez por versión
+    # Leer productos por id y por páginas del fichero mapeado en memoria que genera la instantánea
+    CATALOGO_COMPARTIDO_ACTIVO: bool = True
+
+    # Plazo de cada petición de la API, aplicado como timeout de las sentencias SQL (504 al vencer).
+    # El cliente puede pedir otro con la cabecera X-Plazo-Ms, acotado a [PLAZO_MINIMO, PLAZO_MAXIMO].
+    PLAZO_POR_DEFECTO: float = 10.0
+    PLAZO_MINIMO: float = 0.05
+    PLAZO_MAXIMO: float = 30.0
+    PLAZOS_POR_RUTA: Dict[str, float] = {
+        "/api/v1/auth": 5.0,
+        "/api/v1/registros-ingreso/agregados/reconstruir": 600.0,
+        "/api/v1/batch": 30.0,
+        "/api/v1/productos/export": 600.0,
+        "/api/v1/registros/export": 600.0,
+        "/api/v1/registros-ingreso/export": 600.0,
+    }
+
+    # Exportación en columnas (GET /<recurso>/export?format=arrow|parquet, requiere `pip install pyarrow`)
+    EXPORTACION_LOTE: int = 50000          # Filas por consulta y por RecordBatch / grupo de filas
+
+    # Peticiones por lotes (POST /api/v1/batch)
+    LOTE_MAX_OPERACIONES: int = 100
+
+    # Ingesta de registros de ingreso (cola en memoria + escritor por lotes)
+    INGESTA_MAX_COLA: int = 50000          # Registros pendientes antes de rechazar con 503
+    INGESTA_TAMANO_LOTE: int = 1000        # Registros por INSERT en lote
+    INGESTA_INTERVALO_FLUSH: float = 0.5   # Segundos máximos antes de escribir un lote incompleto
+    INGESTA_MAX_POR_SOLICITUD: int = 10000
+    INGESTA_MAX_BYTES: int = 16777216      # Tamaño máximo del cuerpo de una solicitud de ingesta
+    INGESTA_MAX_LINEA: int = 65536         # Bytes máximos de una línea NDJSON
+    AGREGADOS_MAX_INTERVALOS: int = 10000  # Intervalos máximos por consulta de agregados
+
+    # Archivo de registros de ingreso antiguos (tabla registrosdeingreso_archivo)
+    ARCHIVO_ACTIVO: bool = False           # Mover en segundo plano los registros anteriores a ARCHIVO_EDAD_DIAS
+    ARCHIVO_EDAD_DIAS: int = 90            # Antigüedad (por fecha de ingreso) a partir de la que se archivan
+    ARCHIVO_LOTE: int = 1000               # Filas movidas por transacción; acota lo que dura cada bloqueo
+    ARCHIVO_PAUSA: float = 0.05            # Segundos entre lotes, para dejar paso a las demás escrituras
+    ARCHIVO_INTERVALO: float = 3600.0      # Segundos entre pasadas del archivador
 
     class Config:
         env_file = ".env"
@@ -40,6 +159,10 @@ class Settings(BaseSettings):
     def __init__(self, **values: Any):
         super().__init__(**values)
 
+        # Si se indica una URI explícita (p. ej. SQLite para pruebas locales) se respeta tal cual
+        if self.SQLALCHEMY_DATABASE_URI:
+            return
+
         # Lista de posibles drivers ODBC para SQL Server
         odbc_drivers = [
             "ODBC Driver 18 for SQL Server",
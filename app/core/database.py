@@ -1,15 +1,32 @@
+from contextvars import ContextVar
+from typing import Optional
+
 from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.engine import Engine
 from .config import settings
+from .plazos import (
+    SQLITE_INSTRUCCIONES_POR_COMPROBACION, interrumpir_sqlite_si_vencido, plazo_vencido, timeout_sentencia
+)
+from ..exceptions import GatewayTimeoutException
+
+# Opciones específicas según el motor de base de datos
+engine_options = {}
+if settings.SQLALCHEMY_DATABASE_URI.startswith("mssql"):
+    engine_options["fast_executemany"] = True  # INSERT por lotes en un solo viaje con pyodbc
+elif settings.SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
+    engine_options["connect_args"] = {"check_same_thread": False}  # Sesiones usadas desde hilos de fondo
 
 # Crear el motor de base de datos
 engine = create_engine(
     settings.SQLALCHEMY_DATABASE_URI,
     pool_pre_ping=True,  # Detecta conexiones desconectadas
     pool_recycle=3600,   # Recicla conexiones después de una hora
-    echo=settings.DEBUG  # Mostrar consultas SQL en modo debug
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    echo=settings.DEBUG,  # Mostrar consultas SQL en modo debug
+    **engine_options
 )
 
 # Crear la sesión
@@ -18,8 +35,17 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Base para los modelos
 Base = declarative_base()
 
+# Sesión compartida por las operaciones de una petición por lotes (POST /batch); None fuera de ella
+sesion_lote: ContextVar[Optional[Session]] = ContextVar("sesion_lote", default=None)
+
+
 # Función para obtener la sesión de la BD
 def get_db():
+    db = sesion_lote.get()
+    if db is not None:
+        # La abre y la cierra el lote
+        yield db
+        return
     db = SessionLocal()
     try:
         yield db
@@ -30,6 +56,39 @@ def get_db():
 @event.listens_for(Engine, "connect")
 def set_mssql_options(dbapi_connection, connection_record):
     # Configurar opciones específicas de SQL Server si es necesario
+    if engine.dialect.name != "mssql":
+        return
     cursor = dbapi_connection.cursor()
     cursor.execute("SET NOCOUNT ON")  # Evita mensajes de recuento de filas
-    cursor.close()
\ No newline at end of file
+    cursor.close()
+
+
+# Plazo de la petición en curso como timeout de cada sentencia
+@event.listens_for(engine, "connect")
+def set_sqlite_progress_handler(dbapi_connection, connection_record):
+    # SQLite no tiene timeout de sentencia: el manejador de progreso la interrumpe al vencer el plazo
+    if engine.dialect.name == "sqlite":
+        dbapi_connection.set_progress_handler(interrumpir_sqlite_si_vencido, SQLITE_INSTRUCCIONES_POR_COMPROBACION)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def apply_request_deadline(conn, cursor, statement, parameters, context, executemany):
+    if plazo_vencido():
+        raise GatewayTimeoutException()
+
+
+if engine.dialect.name == "mssql":
+    class ContextoConPlazo(engine.dialect.execution_ctx_cls):
+        """
+        Contexto de ejecución de SQL Server que aplica el plazo de la petición a cada sentencia.
+
+        pyodbc solo tiene timeout de conexión y lo copia en el cursor al crearlo, así que se fija
+        justo antes de crear el cursor de cada sentencia: cambiarlo después no afecta a la que se
+        va a ejecutar. Al superarlo, pyodbc cancela la consulta en el servidor (0 = sin límite).
+        """
+
+        def create_cursor(self):
+            self._dbapi_connection.dbapi_connection.timeout = timeout_sentencia()
+            return super().create_cursor()
+
+    engine.dialect.execution_ctx_cls = ContextoConPlazo
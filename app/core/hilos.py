@@ -0,0 +1,51 @@
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class HiloDeFondo(ABC):
+    """
+    Servicio con un hilo propio, con una instancia por proceso que se inicia y se detiene con el
+    ciclo de vida de la aplicación.
+
+    Las subclases implementan `_ejecutar`, que debe volver en cuanto `_evento_detener` esté
+    activo, y pueden esperar en `_aviso` para que otro hilo las despierte antes de tiempo.
+    `_preparar` se ejecuta en `iniciar`, antes de arrancar el hilo.
+    """
+
+    nombre_hilo = "hilo-de-fondo"
+    espera_detener = 10.0  # Segundos que `detener` espera por defecto a que termine el hilo
+
+    def __init__(self) -> None:
+        self._aviso = threading.Event()
+        self._evento_detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    @property
+    def en_marcha(self) -> bool:
+        return self._hilo is not None
+
+    def iniciar(self) -> None:
+        """Arranca el hilo si no está en marcha."""
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+
+        self._preparar()
+        self._evento_detener.clear()
+        self._hilo = threading.Thread(target=self._ejecutar, name=self.nombre_hilo, daemon=True)
+        self._hilo.start()
+
+    def detener(self, timeout: Optional[float] = None) -> None:
+        """Pide al hilo que termine y espera como mucho `timeout` segundos (`espera_detener` por defecto)."""
+        self._evento_detener.set()
+        self._aviso.set()
+        if self._hilo is not None:
+            self._hilo.join(self.espera_detener if timeout is None else timeout)
+            self._hilo = None
+
+    def _preparar(self) -> None:
+        pass
+
+    @abstractmethod
+    def _ejecutar(self) -> None:
+        """Cuerpo del hilo."""
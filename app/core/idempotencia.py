@@ -0,0 +1,412 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from .database import SessionLocal
+from .metricas import metricas
+from .plazos import plazo_restante
+from ..models.idempotencia import ClaveIdempotencia
+
+CABECERA_CLAVE = b"idempotency-key"
+CABECERA_REPETIDA = (b"idempotent-replayed", b"true")
+LONGITUD_MAXIMA_CLAVE = 255
+
+# Resultados de `reservar`
+NUEVA = "nueva"          # Nadie la ha usado (o caducó): ejecutar y guardar la respuesta
+GUARDADA = "guardada"    # Hay una respuesta guardada: repetirla
+EN_CURSO = "en_curso"    # Otro worker la está ejecutando: esperar
+
+# Una ejecución en curso más antigua que esto se da por perdida (worker caído) y se repite
+EN_CURSO_MAX = 2 * settings.PLAZO_MAXIMO
+
+# Respuestas que no se guardan: el reintento debe volver a ejecutarse (fallos transitorios,
+# credenciales caducadas o rechazos del control de admisión y del límite de tasa)
+ESTADOS_NO_GUARDADOS = (401, 403, 408, 425, 429)
+
+# Segundos entre borrados de claves caducadas en la tabla
+PURGA_INTERVALO = 60.0
+
+
+class RespuestaGuardada(NamedTuple):
+    huella: str
+    status: int
+    cabeceras: List[Tuple[bytes, bytes]]
+    cuerpo: bytes
+
+
+def clave_idempotencia(scope) -> Optional[Tuple[str, str]]:
+    """
+    (clave interna, clave del cliente) de una petición idempotente, o None si no lo es.
+
+    Solo cuentan los POST a las rutas de IDEMPOTENCIA_RUTAS que traen `Idempotency-Key`.
+    La clave interna incluye método, ruta y la cabecera `Authorization` completa: una clave
+    solo la repite quien presentó las mismas credenciales, porque la respuesta guardada se
+    devuelve sin volver a comprobarlas. Reintentar con otro token ejecuta de nuevo la petición.
+    """
+    if scope["type"] != "http" or scope["method"] != "POST":
+        return None
+    ruta = scope["path"].rstrip("/")
+    if ruta not in settings.IDEMPOTENCIA_RUTAS:
+        return None
+
+    clave = autorizacion = None
+    for nombre, valor in scope["headers"]:
+        if nombre == CABECERA_CLAVE:
+            clave = valor
+        elif nombre == b"authorization":
+            autorizacion = valor
+    if clave is None:
+        return None
+
+    resumen = hashlib.sha256()
+    for parte in (scope["method"].encode(), ruta.encode(), autorizacion or b"", clave):
+        resumen.update(parte + b"\0")
+    return resumen.hexdigest(), clave.decode("latin-1")
+
+
+class AlmacenMemoria:
+    """
+    Respuestas guardadas en memoria del proceso, acotadas en bytes y con caducidad.
+
+    Las claves caducan en el orden en que se guardan (el TTL es el mismo para todas), así que
+    basta un OrderedDict: al superar el tamaño o al caducar se descartan las más antiguas.
+    Cada worker tiene las suyas; con varios workers un reintento que llega a otro worker se
+    ejecuta de nuevo (usar el almacén `base` si eso importa).
+    """
+    bloqueante = False
+
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entradas: "OrderedDict[str, Tuple[float, RespuestaGuardada]]" = OrderedDict()
+        self.bytes = 0
+        self.descartadas = metricas.contador(
+            "idempotencia_descartadas_total", "Respuestas descartadas del almacén en memoria antes de caducar"
+        )
+
+    def reservar(self, clave: str, huella: str) -> Tuple[str, Optional[RespuestaGuardada]]:
+        self._purgar(time.monotonic())
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return NUEVA, None
+        return GUARDADA, entrada[1]
+
+    def guardar(self, clave: str, respuesta: RespuestaGuardada) -> None:
+        if clave in self._entradas:
+            self._quitar(clave)
+        self._entradas[clave] = (time.monotonic() + self.ttl, respuesta)
+        self.bytes += len(respuesta.cuerpo)
+        while self.bytes > self.max_bytes:
+            self._quitar(next(iter(self._entradas)))
+            self.descartadas.inc()
+
+    def liberar(self, clave: str) -> None:
+        pass  # Solo se guarda al terminar: no hay nada que liberar
+
+    def _purgar(self, ahora: float) -> None:
+        while self._entradas:
+            clave, (caduca, _) = next(iter(self._entradas.items()))
+            if caduca > ahora:
+                break
+            self._quitar(clave)
+
+    def _quitar(self, clave: str) -> None:
+        _, respuesta = self._entradas.pop(clave)
+        self.bytes -= len(respuesta.cuerpo)
+
+
+class AlmacenBase:
+    """
+    Respuestas guardadas en la tabla `claves_idempotencia`, compartidas por todos los workers.
+
+    La primera petición inserta la fila sin respuesta (en curso); la clave primaria garantiza
+    que solo una la inserta. Las demás ven la fila: si ya tiene respuesta la repiten y, si no,
+    esperan. Una fila en curso más antigua que EN_CURSO_MAX o caducada se reutiliza con un
+    UPDATE condicionado a su fecha de creación, que solo gana una petición.
+    """
+    bloqueante = True
+
+    def __init__(self, ttl: float, session_factory: Callable[[], Session] = SessionLocal) -> None:
+        self.ttl = ttl
+        self._session_factory = session_factory
+        self._ultima_purga = 0.0
+        self._lock = threading.Lock()
+
+    def reservar(self, clave: str, huella: str) -> Tuple[str, Optional[RespuestaGuardada]]:
+        db = self._session_factory()
+        try:
+            ahora = datetime.utcnow()
+            self._purgar_si_toca(db, ahora)
+            db.add(ClaveIdempotencia(clave=clave, huella=huella, creada=ahora,
+                                     caduca=ahora + timedelta(seconds=self.ttl)))
+            try:
+                db.commit()
+                return NUEVA, None
+            except IntegrityError:
+                db.rollback()
+
+            fila = db.get(ClaveIdempotencia, clave)
+            if fila is None:
+                return EN_CURSO, None  # Se liberó entre medias: la siguiente consulta la reserva
+            caducada = fila.caduca.replace(tzinfo=None) <= ahora
+            perdida = fila.status is None and fila.creada.replace(tzinfo=None) <= ahora - timedelta(seconds=EN_CURSO_MAX)
+            if caducada or perdida:
+                resultado = db.execute(
+                    update(ClaveIdempotencia)
+                    .where(ClaveIdempotencia.clave == clave, ClaveIdempotencia.creada == fila.creada)
+                    .values(huella=huella, status=None, cabeceras=None, cuerpo=None, creada=ahora,
+                            caduca=ahora + timedelta(seconds=self.ttl))
+                )
+                db.commit()
+                return (NUEVA, None) if resultado.rowcount == 1 else (EN_CURSO, None)
+            if fila.status is None:
+                return EN_CURSO, None
+            cabeceras = [(nombre.encode("latin-1"), valor.encode("latin-1"))
+                         for nombre, valor in json.loads(fila.cabeceras)]
+            return GUARDADA, RespuestaGuardada(fila.huella, fila.status, cabeceras, fila.cuerpo)
+        finally:
+            db.close()
+
+    def guardar(self, clave: str, respuesta: RespuestaGuardada) -> None:
+        cabeceras = json.dumps([[nombre.decode("latin-1"), valor.decode("latin-1")]
+                                for nombre, valor in respuesta.cabeceras])
+        db = self._session_factory()
+        try:
+            db.execute(
+                update(ClaveIdempotencia)
+                .where(ClaveIdempotencia.clave == clave)
+                .values(status=respuesta.status, cabeceras=cabeceras, cuerpo=respuesta.cuerpo)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def liberar(self, clave: str) -> None:
+        """Borra la reserva de una ejecución cuya respuesta no se guarda: el reintento se ejecutará."""
+        db = self._session_factory()
+        try:
+            db.execute(delete(ClaveIdempotencia).where(ClaveIdempotencia.clave == clave,
+                                                       ClaveIdempotencia.status.is_(None)))
+            db.commit()
+        finally:
+            db.close()
+
+    def _purgar_si_toca(self, db: Session, ahora: datetime) -> None:
+        with self._lock:
+            if time.monotonic() - self._ultima_purga < PURGA_INTERVALO:
+                return
+            self._ultima_purga = time.monotonic()
+        db.execute(delete(ClaveIdempotencia).where(ClaveIdempotencia.caduca <= ahora))
+        db.commit()
+
+
+def crear_almacen(nombre: str):
+    if nombre == "memoria":
+        return AlmacenMemoria(settings.IDEMPOTENCIA_MEMORIA_BYTES, settings.IDEMPOTENCIA_TTL)
+    if nombre == "base":
+        return AlmacenBase(settings.IDEMPOTENCIA_TTL)
+    raise ValueError(f"IDEMPOTENCIA_ALMACEN no válido: {nombre} (memoria o base)")
+
+
+class MiddlewareIdempotencia:
+    """
+    Ejecuta una sola vez las altas que llegan con la misma `Idempotency-Key`.
+
+    La primera petición de una clave se ejecuta y su respuesta (estado, cabeceras y cuerpo)
+    se guarda durante IDEMPOTENCIA_TTL; los reintentos reciben esa respuesta con la cabecera
+    `Idempotent-Replayed: true` sin ejecutar el endpoint, ni pasar por el control de admisión
+    ni por bcrypt. Los duplicados que llegan mientras la primera está en curso la esperan (en
+    el mismo worker, sin consultar el almacén) hasta IDEMPOTENCIA_ESPERA_MAX; si vence, 409.
+    Reutilizar una clave con otro cuerpo es un error del cliente: 422.
+
+    No se guardan los errores 5xx ni los de ESTADOS_NO_GUARDADOS, ni las respuestas mayores
+    que IDEMPOTENCIA_MAX_BYTES: en esos casos la clave queda libre y el reintento se ejecuta.
+    Las respuestas se generan sin comprimir (se quita `Accept-Encoding`) para que cualquier
+    reintento pueda recibirlas; son altas pequeñas, por debajo de COMPRESION_MINIMO.
+    """
+
+    def __init__(self, app, almacen=None) -> None:
+        self.app = app
+        self.almacen = almacen if almacen is not None else crear_almacen(settings.IDEMPOTENCIA_ALMACEN)
+        self._en_vuelo: Dict[str, asyncio.Future] = {}
+        self.peticiones = metricas.contador(
+            "idempotencia_peticiones_total",
+            "Peticiones con Idempotency-Key por resultado (ejecutada, repetida, esperada, en_curso, conflicto, no_guardada)"
+        )
+        metricas.medidor("idempotencia_claves_en_vuelo", "Claves con una ejecución en curso en este worker",
+                         lambda: {(): len(self._en_vuelo)})
+
+    async def __call__(self, scope, receive, send) -> None:
+        claves = clave_idempotencia(scope)
+        if claves is None:
+            await self.app(scope, receive, send)
+            return
+        clave, clave_cliente = claves
+        if not clave_cliente or len(clave_cliente) > LONGITUD_MAXIMA_CLAVE:
+            await self._responder(send, 400, f"Idempotency-Key debe tener entre 1 y {LONGITUD_MAXIMA_CLAVE} caracteres")
+            return
+
+        cuerpo, receive = await self._leer_cuerpo(receive)
+        huella = hashlib.sha256(cuerpo).hexdigest()
+
+        # Si la primera termina sin guardar su respuesta, otro duplicado puede haber tomado el relevo
+        while (pendiente := self._en_vuelo.get(clave)) is not None:
+            guardada = await self._esperar_local(pendiente)
+            if guardada is not None:
+                await self._repetir(guardada, huella, send, "esperada")
+                return
+            if not pendiente.done():
+                # La espera venció y la primera sigue en curso
+                self.peticiones.inc(resultado="en_curso")
+                await self._responder(send, 409, "Hay una petición con la misma Idempotency-Key en curso",
+                                      retry_after=1)
+                return
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_vuelo[clave] = futuro
+        estado: Optional[str] = None
+        guardada: Optional[RespuestaGuardada] = None
+        try:
+            estado, guardada = await self._reservar(clave, huella)
+            if estado == GUARDADA:
+                await self._repetir(guardada, huella, send, "repetida")
+                return
+            if estado == EN_CURSO:
+                self.peticiones.inc(resultado="en_curso")
+                await self._responder(send, 409, "Hay una petición con la misma Idempotency-Key en curso",
+                                      retry_after=1)
+                return
+            guardada = await self._ejecutar(scope, receive, send, huella)
+            if guardada is None:
+                self.peticiones.inc(resultado="no_guardada")
+                await self._llamar(self.almacen.liberar, clave)
+            else:
+                self.peticiones.inc(resultado="ejecutada")
+                await self._llamar(self.almacen.guardar, clave, guardada)
+        except BaseException:
+            guardada = None
+            if estado == NUEVA:
+                await asyncio.shield(self._llamar(self.almacen.liberar, clave))
+            raise
+        finally:
+            # Los duplicados que esperan en este worker reciben la respuesta o se ejecutan por su cuenta
+            if self._en_vuelo.get(clave) is futuro:
+                del self._en_vuelo[clave]
+            if not futuro.done():
+                futuro.set_result(guardada)
+
+    async def _reservar(self, clave: str, huella: str) -> Tuple[str, Optional[RespuestaGuardada]]:
+        """Reserva la clave; si otro worker la está ejecutando, consulta de nuevo hasta que termine."""
+        espera = self._espera_maxima()
+        limite = time.monotonic() + espera
+        intervalo = 0.05
+        while True:
+            estado, guardada = await self._llamar(self.almacen.reservar, clave, huella)
+            if estado != EN_CURSO or time.monotonic() + intervalo > limite:
+                return estado, guardada
+            await asyncio.sleep(intervalo)
+            intervalo = min(intervalo * 2, 0.5)
+
+    async def _ejecutar(self, scope, receive, send, huella: str) -> Optional[RespuestaGuardada]:
+        """Ejecuta la petición sin `Accept-Encoding` y devuelve su respuesta si se puede guardar."""
+        scope = dict(scope, headers=[(nombre, valor) for nombre, valor in scope["headers"]
+                                     if nombre != b"accept-encoding"])
+        inicio: Optional[dict] = None
+        bloques: Optional[List[bytes]] = []
+        tamano = 0
+        completa = False
+
+        async def enviar_y_guardar(mensaje) -> None:
+            nonlocal inicio, bloques, tamano, completa
+            if mensaje["type"] == "http.response.start":
+                inicio = mensaje
+            elif mensaje["type"] == "http.response.body" and bloques is not None:
+                tamano += len(mensaje.get("body", b""))
+                if tamano > settings.IDEMPOTENCIA_MAX_BYTES:
+                    bloques = None
+                else:
+                    bloques.append(mensaje.get("body", b""))
+                    completa = not mensaje.get("more_body", False)
+            await send(mensaje)
+
+        await self.app(scope, receive, enviar_y_guardar)
+
+        if inicio is None or bloques is None or not completa:
+            return None
+        if inicio["status"] >= 500 or inicio["status"] in ESTADOS_NO_GUARDADOS:
+            return None
+        return RespuestaGuardada(huella, inicio["status"], list(inicio.get("headers", [])), b"".join(bloques))
+
+    async def _esperar_local(self, futuro: asyncio.Future) -> Optional[RespuestaGuardada]:
+        try:
+            return await asyncio.wait_for(asyncio.shield(futuro), self._espera_maxima())
+        except asyncio.TimeoutError:
+            return None
+
+    async def _repetir(self, guardada: RespuestaGuardada, huella: str, send, resultado: str) -> None:
+        if guardada.huella != huella:
+            self.peticiones.inc(resultado="conflicto")
+            await self._responder(send, 422, "La Idempotency-Key ya se usó con otra petición")
+            return
+        self.peticiones.inc(resultado=resultado)
+        await send({"type": "http.response.start", "status": guardada.status,
+                    "headers": guardada.cabeceras + [CABECERA_REPETIDA]})
+        await send({"type": "http.response.body", "body": guardada.cuerpo})
+
+    async def _llamar(self, funcion, *args):
+        if self.almacen.bloqueante:
+            return await run_in_threadpool(funcion, *args)
+        return funcion(*args)
+
+    @staticmethod
+    def _espera_maxima() -> float:
+        restante = plazo_restante()
+        if restante is None:
+            return settings.IDEMPOTENCIA_ESPERA_MAX
+        return min(settings.IDEMPOTENCIA_ESPERA_MAX, max(restante, 0))
+
+    @staticmethod
+    async def _leer_cuerpo(receive) -> Tuple[bytes, Callable]:
+        """Lee el cuerpo completo para calcular su huella y devuelve un `receive` que lo entrega de nuevo."""
+        partes = []
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] != "http.request":
+                break
+            partes.append(mensaje.get("body", b""))
+            if not mensaje.get("more_body", False):
+                break
+        cuerpo = b"".join(partes)
+        entregado = False
+
+        async def receive_repetido():
+            nonlocal entregado
+            if not entregado:
+                entregado = True
+                return {"type": "http.request", "body": cuerpo, "more_body": False}
+            return await receive()
+
+        return cuerpo, receive_repetido
+
+    @staticmethod
+    async def _responder(send, status: int, detalle: str, retry_after: Optional[int] = None) -> None:
+        cuerpo = json.dumps({"detail": detalle}).encode()
+        cabeceras = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(cuerpo)).encode()),
+        ]
+        if retry_after is not None:
+            cabeceras.append((b"retry-after", str(retry_after).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": cabeceras})
+        await send({"type": "http.response.body", "body": cuerpo})
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from .agregados import aplicar_deltas, calcular_deltas
+from .config import settings
+from .database import SessionLocal
+from .hilos import HiloDeFondo
+from ..models.registroingreso import RegistroIngreso as RegistroIngresoModel
+
+
+class EscritorIngresos(HiloDeFondo):
+    """
+    Cola acotada en memoria con un hilo escritor que persiste registros de ingreso por lotes.
+
+    Los lotes se escriben con un único INSERT multi-fila cuando se alcanza el tamaño de lote
+    o cuando vence el intervalo de flush. Si la cola no tiene espacio para un lote completo,
+    el lote se rechaza entero para que el cliente reintente (back-pressure).
+    """
+
+    nombre_hilo = "escritor-ingresos"
+    espera_detener = 30.0
+
+    def __init__(
+            self,
+            max_cola: int,
+            tamano_lote: int,
+            intervalo_flush: float,
+            session_factory: Callable[[], Session] = SessionLocal
+    ) -> None:
+        super().__init__()
+        self.max_cola = max_cola
+        self.tamano_lote = tamano_lote
+        self.intervalo_flush = intervalo_flush
+        self._session_factory = session_factory
+        self._pendientes: Deque[Dict[str, Any]] = deque()
+        self._condicion = threading.Condition()
+        self._detener = False
+        self.estadisticas = {"encolados": 0, "escritos": 0, "rechazados": 0, "lotes": 0, "errores": 0}
+
+    @property
+    def en_cola(self) -> int:
+        return len(self._pendientes)
+
+    def encolar(self, filas: List[Dict[str, Any]]) -> bool:
+        """Encola todas las filas o ninguna. Devuelve False si la cola está llena."""
+        with self._condicion:
+            if len(self._pendientes) + len(filas) > self.max_cola:
+                self.estadisticas["rechazados"] += len(filas)
+                return False
+
+            self._pendientes.extend(filas)
+            self.estadisticas["encolados"] += len(filas)
+            if len(self._pendientes) >= self.tamano_lote:
+                self._condicion.notify()
+
+        return True
+
+    def _preparar(self) -> None:
+        self._detener = False
+
+    def detener(self, timeout: Optional[float] = None) -> None:
+        """Escribe lo pendiente y detiene el hilo escritor."""
+        with self._condicion:
+            self._detener = True
+            self._condicion.notify()
+
+        super().detener(timeout)
+
+    def _siguiente_lote(self) -> List[Dict[str, Any]]:
+        with self._condicion:
+            limite = time.monotonic() + self.intervalo_flush
+            while len(self._pendientes) < self.tamano_lote and not self._detener:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._condicion.wait(restante)
+
+            n = min(len(self._pendientes), self.tamano_lote)
+            return [self._pendientes.popleft() for _ in range(n)]
+
+    def _escribir(self, lote: List[Dict[str, Any]]) -> bool:
+        db = self._session_factory()
+        try:
+            db.execute(insert(RegistroIngresoModel), lote)
+            # Mantener los totales por minuto/hora/día en la misma transacción del lote
+            aplicar_deltas(db, calcular_deltas((fila["fecha_ingreso"], fila["cantidad"]) for fila in lote))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"ERROR al escribir lote de {len(lote)} registros de ingreso: {str(e)}")
+            return False
+        finally:
+            db.close()
+
+        self.estadisticas["escritos"] += len(lote)
+        self.estadisticas["lotes"] += 1
+        return True
+
+    def _ejecutar(self) -> None:
+        fallos_consecutivos = 0
+        while True:
+            lote = self._siguiente_lote()
+            if not lote:
+                if self._detener:
+                    return
+                continue
+
+            if self._escribir(lote):
+                fallos_consecutivos = 0
+                continue
+
+            # Devolver el lote al frente de la cola para no perderlo y reintentar con espera creciente
+            self.estadisticas["errores"] += 1
+            fallos_consecutivos += 1
+            with self._condicion:
+                self._pendientes.extendleft(reversed(lote))
+            if self._detener and fallos_consecutivos > 3:
+                print(f"ADVERTENCIA: Se descartan {self.en_cola} registros de ingreso pendientes al detener")
+                return
+            time.sleep(min(0.1 * 2 ** fallos_consecutivos, 5.0))
+
+
+escritor_ingresos = EscritorIngresos(
+    max_cola=settings.INGESTA_MAX_COLA,
+    tamano_lote=settings.INGESTA_TAMANO_LOTE,
+    intervalo_flush=settings.INGESTA_INTERVALO_FLUSH,
+)
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .cambios import difusor_cambios
+from .compresion import CODECS
+from .config import settings
+from .database import SessionLocal
+from .hilos import HiloDeFondo
+from .metricas import metricas
+from .proyeccion import Proyeccion, valor_json
+from .tienda_productos import serializar_productos
+from ..models.cambio import CambioCatalogo
+from ..models.categoria import Categoria as CategoriaModel
+from ..models.producto import Producto as ProductoModel
+from ..schemas.categoria import Categoria
+from ..schemas.producto import Producto
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre workers, cada uno puede generar la suya
+    fcntl = None
+
+MANIFIESTO = "manifiesto.json"
+PREFIJO = "catalogo-"
+EXTENSIONES = {"gzip": ".gz", "br": ".br", "zstd": ".zst"}
+
+
+def _json(datos: Dict[str, Any]) -> bytes:
+    return json.dumps(datos, default=valor_json, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# formato -> (tipo de contenido, extensión, serializador); msgpack es una dependencia opcional
+FORMATOS: Dict[str, Tuple[str, str, Callable[[Dict[str, Any]], bytes]]] = {
+    "json": ("application/json", ".json", _json),
+}
+
+try:
+    import msgpack
+
+    FORMATOS["msgpack"] = ("application/msgpack", ".msgpack",
+                           lambda datos: msgpack.packb(datos, default=valor_json, use_bin_type=True))
+except ImportError:
+    pass
+
+# (filas, id máximo y suma de versiones de categorías y de productos)
+Huella = Tuple[int, int, int, int, int, int]
+
+
+class InstantaneaCatalogo(HiloDeFondo):
+    """
+    Catálogo completo (categorías y productos) generado en segundo plano y servido como fichero.
+
+    Un hilo por worker vuelve a generarlo cuando el difusor de cambios lee un cambio del
+    catálogo (como mucho una vez cada INSTANTANEA_ESPERA_MINIMA, para agrupar ráfagas de
+    escrituras) y cada INSTANTANEA_INTERVALO comprueba la huella de las tablas para detectar
+    escrituras hechas fuera de la API. Cada generación se escribe en INSTANTANEA_DIR en JSON
+    y, si está instalado msgpack, en binario, ya comprimida con cada codificación disponible.
+    Los ficheros llevan en el nombre el resumen del contenido y se escriben con un fichero
+    temporal y `os.replace`; el manifiesto que apunta a ellos se sustituye el último, así que
+    un lector nunca ve una instantánea a medias.
+
+    Los workers comparten el directorio: un bloqueo de fichero hace que solo uno genere cada
+    versión y el resto la adopta al ver en el manifiesto la misma huella. Las peticiones leen
+    el manifiesto del disco (solo si cambió desde la última vez), de modo que todos los
+    workers sirven la versión más reciente aunque la haya generado otro.
+    """
+
+    nombre_hilo = "instantanea-catalogo"
+    espera_detener = 30.0  # Una generación en curso termina antes
+
+    def __init__(self, directorio: str, intervalo: float, espera_minima: float, niveles: Dict[str, int],
+                 session_factory: Callable[[], Session] = SessionLocal) -> None:
+        super().__init__()
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self.espera_minima = espera_minima
+        self.niveles = niveles
+        self._session_factory = session_factory
+
+        self._categorias = Proyeccion(CategoriaModel, Categoria)
+        self._productos = Proyeccion(ProductoModel, Producto)
+
+        self._manifiesto: Optional[Dict[str, Any]] = None
+        self._firma: Optional[Tuple[int, int]] = None  # (mtime_ns, tamaño) del manifiesto leído
+        self._ultima_generacion = 0.0
+
+        self.generaciones = metricas.contador(
+            "instantanea_generaciones_total", "Instantáneas del catálogo generadas por motivo (inicio, cambio, huella)"
+        )
+        self.duracion = 0.0
+        metricas.medidor("instantanea_generacion_segundos", "Duración de la última generación de la instantánea",
+                         lambda: {(): self.duracion})
+
+    def _preparar(self) -> None:
+        # La primera instantánea la genera el hilo, sin bloquear el arranque
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def notificar(self) -> None:
+        """Pide una nueva generación."""
+        self._aviso.set()
+
+    def al_leer_cambios(self, cambios: List[CambioCatalogo]) -> None:
+        """Oyente del difusor de cambios: cualquier cambio de productos o categorías invalida la instantánea."""
+        if cambios:
+            self._aviso.set()
+
+    def vigente(self) -> Optional[Dict[str, Any]]:
+        """
+        Manifiesto de la instantánea más reciente del directorio, o None si aún no hay ninguna.
+
+        Cuesta un `stat` por llamada: el manifiesto solo se vuelve a leer si ha cambiado.
+        """
+        ruta = os.path.join(self.directorio, MANIFIESTO)
+        try:
+            estado = os.stat(ruta)
+            firma = (estado.st_mtime_ns, estado.st_size)
+            if firma != self._firma:
+                with open(ruta, "rb") as fichero:
+                    self._manifiesto = json.loads(fichero.read())
+                self._firma = firma
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"ADVERTENCIA: No se pudo leer el manifiesto de la instantánea: {str(e)}")
+        return self._manifiesto
+
+    def ruta(self, nombre: str) -> str:
+        return os.path.join(self.directorio, nombre)
+
+    def actualizar(self, motivo: str) -> bool:
+        """Genera una instantánea si la huella de las tablas no coincide con la vigente. Devuelve si se generó."""
+        db = self._session_factory()
+        try:
+            huella = self._huella_actual(db)
+        finally:
+            db.close()
+        if self._huella_vigente() == huella:
+            return False
+
+        with self._bloqueo():
+            # Otro worker puede haberla generado mientras se esperaba el bloqueo
+            if self._huella_vigente() == huella:
+                return False
+            self.generar(motivo)
+        return True
+
+    def generar(self, motivo: str) -> Dict[str, Any]:
+        """Lee el catálogo, escribe sus ficheros y publica el manifiesto que apunta a ellos."""
+        inicio = time.perf_counter()
+        db = self._session_factory()
+        try:
+            # Huella y filas en la misma transacción, para que describan el mismo estado. El último
+            # cambio se lee antes que las filas: estas incluyen, como mínimo, hasta ese cambio. Con el
+            # difusor en marcha es el último sin huecos por debajo: el máximo de la tabla puede tener
+            # por debajo ids aún sin confirmar, que las filas no incluirían
+            if difusor_cambios.en_marcha:
+                hasta_cambio = difusor_cambios.leido
+            else:
+                hasta_cambio = db.query(func.max(CambioCatalogo.id)).scalar() or 0
+            huella = self._huella_actual(db)
+            datos = {
+                "categorias": [dict(fila._mapping) for fila in
+                               self._categorias.consulta(db, None, None).order_by(CategoriaModel.id)],
+                "productos": [dict(fila._mapping) for fila in
+                              self._productos.consulta(db, None, None).order_by(ProductoModel.id)],
+            }
+        finally:
+            db.close()
+
+        # La versión es el resumen del contenido: dos workers que generen el mismo catálogo coinciden
+        version = hashlib.blake2b(_json(datos), digest_size=16).hexdigest()
+        datos = {"version": version, **datos}
+
+        archivos: Dict[str, Dict[str, str]] = {}
+        for formato, (_, extension, serializar) in FORMATOS.items():
+            cuerpo = serializar(datos)
+            nombre = f"{PREFIJO}{version}{extension}"
+            archivos[formato] = {"identity": nombre}
+            self._escribir(nombre, cuerpo)
+            for codificacion, codec in CODECS.items():
+                comprimido = codec.comprimir(cuerpo, self.niveles.get(codificacion, settings.COMPRESION_NIVELES[codificacion]))
+                if len(comprimido) < len(cuerpo):
+                    archivos[formato][codificacion] = nombre + EXTENSIONES[codificacion]
+                    self._escribir(archivos[formato][codificacion], comprimido)
+
+        # Productos en columnas de ancho fijo para mapearlos en memoria (ver catalogo_compartido)
+        tienda = f"{PREFIJO}{version}.productos"
+        self._escribir(tienda, serializar_productos(datos["productos"]))
+
+        anterior = self.vigente()
+        manifiesto = {
+            "version": version,
+            "huella": list(huella),
+            "generado": time.time(),
+            "categorias": len(datos["categorias"]),
+            "productos": len(datos["productos"]),
+            "archivos": archivos,
+            "tienda": tienda,
+            "hasta_cambio": hasta_cambio,
+        }
+        self._escribir(MANIFIESTO, json.dumps(manifiesto).encode("utf-8"), reemplazar=True)
+        self._purgar(manifiesto, anterior)
+
+        self.duracion = time.perf_counter() - inicio
+        self._ultima_generacion = time.monotonic()
+        self.generaciones.inc(motivo=motivo)
+        return manifiesto
+
+    def _huella_vigente(self) -> Optional[Huella]:
+        manifiesto = self.vigente()
+        return tuple(manifiesto["huella"]) if manifiesto is not None else None
+
+    @staticmethod
+    def _huella_actual(db: Session) -> Huella:
+        huella = []
+        for modelo in (CategoriaModel, ProductoModel):
+            filas, maximo, versiones = db.query(
+                func.count(modelo.id), func.max(modelo.id), func.sum(modelo.version)
+            ).one()
+            huella += [filas, maximo or 0, versiones or 0]
+        return tuple(huella)
+
+    @contextmanager
+    def _bloqueo(self):
+        """Bloqueo exclusivo entre workers mientras se genera (sin efecto si el sistema no tiene fcntl)."""
+        with open(os.path.join(self.directorio, ".generando"), "a") as fichero:
+            if fcntl is not None:
+                fcntl.flock(fichero, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fichero, fcntl.LOCK_UN)
+
+    def _escribir(self, nombre: str, datos: bytes, reemplazar: bool = False) -> None:
+        ruta = os.path.join(self.directorio, nombre)
+        if not reemplazar and os.path.exists(ruta):
+            return  # Mismo nombre, mismo contenido
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as fichero:
+            fichero.write(datos)
+        os.replace(temporal, ruta)
+
+    def _purgar(self, actual: Dict[str, Any], anterior: Optional[Dict[str, Any]]) -> None:
+        """Borra los ficheros de generaciones antiguas; los de la anterior se conservan para las descargas en curso."""
+        conservar = set()
+        for manifiesto in (actual, anterior):
+            if manifiesto is not None:
+                for variantes in manifiesto["archivos"].values():
+                    conservar.update(variantes.values())
+                conservar.add(manifiesto.get("tienda"))
+
+        for nombre in os.listdir(self.directorio):
+            if nombre.startswith(PREFIJO) and nombre not in conservar and not nombre.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(self.directorio, nombre))
+                except OSError:
+                    pass
+
+    def _ejecutar(self) -> None:
+        try:
+            self.actualizar("inicio")
+        except Exception as e:
+            print(f"ERROR al generar la instantánea del catálogo: {str(e)}")
+
+        while not self._evento_detener.is_set():
+            avisado = self._aviso.wait(self.intervalo)
+            self._aviso.clear()
+            if self._evento_detener.is_set():
+                break
+
+            if avisado:
+                # Agrupa las ráfagas de cambios: los que lleguen durante la espera entran en la misma generación
+                espera = self.espera_minima - (time.monotonic() - self._ultima_generacion)
+                if espera > 0 and self._evento_detener.wait(espera):
+                    break
+                self._aviso.clear()
+
+            try:
+                self.actualizar("cambio" if avisado else "huella")
+            except Exception as e:
+                print(f"ERROR al generar la instantánea del catálogo: {str(e)}")
+
+
+instantanea_catalogo = InstantaneaCatalogo(
+    directorio=settings.INSTANTANEA_DIR,
+    intervalo=settings.INSTANTANEA_INTERVALO,
+    espera_minima=settings.INSTANTANEA_ESPERA_MINIMA,
+    niveles=settings.INSTANTANEA_NIVELES,
+)
+difusor_cambios.al_leer(instantanea_catalogo.al_leer_cambios)
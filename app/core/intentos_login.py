@@ -0,0 +1,130 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Optional, Tuple
+
+from .config import settings
+from .metricas import metricas
+from ..exceptions import TooManyRequestsException
+
+
+class _Seguimiento:
+    """Fallos recientes de un usuario o una IP y su bloqueo en curso."""
+    __slots__ = ("fallos", "bloqueos", "hasta")
+
+    def __init__(self, umbral: int) -> None:
+        # Basta con los últimos `umbral` fallos para saber si hay `umbral` dentro de la ventana
+        self.fallos: Deque[float] = deque(maxlen=umbral)
+        self.bloqueos = 0
+        self.hasta = 0.0
+
+
+class BloqueoLogin:
+    """
+    Bloqueo de logins por nombre de usuario y por IP tras fallos repetidos.
+
+    Cuenta los fallos de cada usuario y cada IP en una ventana deslizante de `ventana`
+    segundos. Al llegar al umbral se bloquea durante `bloqueo_inicial` segundos, y cada fallo
+    siguiente dentro de la ventana vuelve a bloquear con el doble de tiempo, hasta
+    `bloqueo_maximo`; sin fallos durante una ventana, el siguiente bloqueo vuelve a empezar
+    por `bloqueo_inicial`. Un login correcto borra los fallos de su usuario (no los de la IP,
+    para que una cuenta propia no sirva para reiniciarlos).
+
+    `comprobar` se llama antes de buscar el usuario y de verificar la contraseña, así que un
+    intento bloqueado cuesta una búsqueda en un diccionario en lugar de un SELECT y bcrypt.
+    Como mucho se recuerdan `max_entradas` usuarios e IPs; al superarlo se olvida el que
+    lleva más tiempo sin fallar. Los fallos son locales a cada proceso: con varios workers,
+    cada uno cuenta los intentos que atiende.
+    """
+
+    def __init__(self, fallos_usuario: int, fallos_ip: int, ventana: float, bloqueo_inicial: float,
+                 bloqueo_maximo: float, max_entradas: int, activo: bool = True) -> None:
+        self.umbrales = {"usuario": fallos_usuario, "ip": fallos_ip}
+        self.ventana = ventana
+        self.bloqueo_inicial = bloqueo_inicial
+        self.bloqueo_maximo = bloqueo_maximo
+        self.max_entradas = max_entradas
+        self.activo = activo
+        self._entradas: "OrderedDict[Tuple[str, str], _Seguimiento]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.fallos = metricas.contador("login_fallos_total", "Logins fallidos por usuario o contraseña incorrectos")
+        self.bloqueos = metricas.contador("login_bloqueos_total", "Bloqueos de login iniciados por tipo (usuario, ip)")
+        self.rechazados = metricas.contador(
+            "login_rechazados_total", "Logins rechazados con 429 sin consultar la base ni bcrypt, por tipo (usuario, ip)"
+        )
+        metricas.medidor("login_seguimiento", "Usuarios e IPs con fallos de login recientes en este worker",
+                         lambda: {(): len(self._entradas)})
+
+    @staticmethod
+    def _claves(username: str, ip: Optional[str]):
+        # Sin distinguir mayúsculas: la intercalación de la base puede no hacerlo
+        yield "usuario", username.lower()
+        if ip:
+            yield "ip", ip
+
+    def espera(self, username: str, ip: Optional[str]) -> Tuple[float, Optional[str]]:
+        """Segundos de bloqueo pendientes para el usuario o la IP (el mayor) y qué está bloqueado."""
+        ahora = time.monotonic()
+        espera, tipo = 0.0, None
+        for clave in self._claves(username, ip):
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada.hasta - ahora > espera:
+                espera, tipo = entrada.hasta - ahora, clave[0]
+        return espera, tipo
+
+    def comprobar(self, username: str, ip: Optional[str]) -> None:
+        """Responde 429 con Retry-After si el usuario o la IP están bloqueados."""
+        if not self.activo:
+            return
+        espera, tipo = self.espera(username, ip)
+        if tipo is not None:
+            self.rechazados.inc(tipo=tipo)
+            raise TooManyRequestsException(
+                "Demasiados intentos de login fallidos; vuelve a intentarlo más tarde",
+                retry_after=math.ceil(espera),
+            )
+
+    def registrar_fallo(self, username: str, ip: Optional[str]) -> None:
+        if not self.activo:
+            return
+        self.fallos.inc()
+        ahora = time.monotonic()
+        with self._lock:
+            for clave in self._claves(username, ip):
+                entrada = self._entradas.pop(clave, None) or _Seguimiento(self.umbrales[clave[0]])
+                self._entradas[clave] = entrada  # Al final: la más reciente en fallar
+
+                while entrada.fallos and entrada.fallos[0] <= ahora - self.ventana:
+                    entrada.fallos.popleft()
+                if not entrada.fallos:
+                    entrada.bloqueos = 0
+                entrada.fallos.append(ahora)
+
+                if len(entrada.fallos) == entrada.fallos.maxlen:
+                    duracion = self.bloqueo_inicial * 2 ** min(entrada.bloqueos, 32)
+                    entrada.hasta = ahora + min(duracion, self.bloqueo_maximo)
+                    entrada.bloqueos += 1
+                    self.bloqueos.inc(tipo=clave[0])
+
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def registrar_exito(self, username: str) -> None:
+        if not self.activo:
+            return
+        with self._lock:
+            self._entradas.pop(("usuario", username.lower()), None)
+
+
+# Instancia única por proceso, como la lista de revocación
+bloqueo_login = BloqueoLogin(
+    fallos_usuario=settings.LOGIN_FALLOS_USUARIO,
+    fallos_ip=settings.LOGIN_FALLOS_IP,
+    ventana=settings.LOGIN_VENTANA,
+    bloqueo_inicial=settings.LOGIN_BLOQUEO_INICIAL,
+    bloqueo_maximo=settings.LOGIN_BLOQUEO_MAXIMO,
+    max_entradas=settings.LOGIN_SEGUIMIENTO_MAX,
+    activo=settings.LOGIN_BLOQUEO_ACTIVO,
+)
@@ -0,0 +1,204 @@
+import json
+import re
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from sqlalchemy.orm import Session
+from starlette.exceptions import HTTPException
+from starlette.routing import Match
+
+from .cambios import RUTA_CAMBIOS, avisar_confirmados, difusor_cambios
+from .config import settings
+from .database import SessionLocal, engine
+from .totales import totales_listados
+
+RUTA_LOTE = f"{settings.API_V1_STR}/batch"
+
+# Rutas que no se ejecutan dentro de un lote: el propio lote, el flujo de cambios (no termina) y las
+# que escriben o leen fuera de la sesión del lote, así que deshacerlo no las desharía (la ingesta
+# encola para el escritor en segundo plano; las exportaciones leen con su sesión mientras envían)
+RUTAS_FUERA_DE_LOTE = (RUTA_LOTE, RUTA_CAMBIOS) + tuple(f"{settings.API_V1_STR}{ruta}" for ruta in (
+    "/registros-ingreso/ingesta", "/productos/export", "/registros/export", "/registros-ingreso/export",
+))
+
+# Referencia a la respuesta de una operación anterior: "$<índice>.<campo>[.<campo>...]" como
+# valor del cuerpo, o "{$<índice>.<campo>}" dentro de la ruta
+_CAMINO = r"\$(\d+)((?:\.\w+)+)"
+REFERENCIA_VALOR = re.compile(rf"^{_CAMINO}$")
+REFERENCIA_RUTA = re.compile(rf"\{{{_CAMINO}\}}")
+
+# Cabeceras de la petición por lotes que heredan sus operaciones
+CABECERAS_HEREDADAS = (b"authorization", b"user-agent", b"x-forwarded-for")
+
+# Cabeceras de cada respuesta que se devuelven en su resultado
+CABECERAS_RESULTADO = ("etag", "location", "retry-after")
+
+
+class ReferenciaInvalida(Exception):
+    pass
+
+
+def _valor_referido(cuerpos: List[Any], indice: str, campos: str) -> Any:
+    i = int(indice)
+    if i >= len(cuerpos):
+        raise ReferenciaInvalida(f"${i} se refiere a una operación posterior")
+    valor = cuerpos[i]
+    if valor is None:
+        raise ReferenciaInvalida(f"La operación {i} no devolvió una respuesta correcta")
+    for campo in campos.split(".")[1:]:
+        if isinstance(valor, list) and campo.isdigit() and int(campo) < len(valor):
+            valor = valor[int(campo)]
+        elif isinstance(valor, dict) and campo in valor:
+            valor = valor[campo]
+        else:
+            raise ReferenciaInvalida(f"La respuesta de la operación {i} no tiene {campos[1:]}")
+    return valor
+
+
+def resolver_referencias(valor: Any, cuerpos: List[Any]) -> Any:
+    """Sustituye en el cuerpo los valores "$N.campo" por el campo de la respuesta N (correcta)."""
+    if isinstance(valor, str):
+        coincidencia = REFERENCIA_VALOR.match(valor)
+        return _valor_referido(cuerpos, *coincidencia.groups()) if coincidencia else valor
+    if isinstance(valor, dict):
+        return {clave: resolver_referencias(v, cuerpos) for clave, v in valor.items()}
+    if isinstance(valor, list):
+        return [resolver_referencias(v, cuerpos) for v in valor]
+    return valor
+
+
+def resolver_ruta(ruta: str, cuerpos: List[Any]) -> str:
+    return REFERENCIA_RUTA.sub(lambda m: quote(str(_valor_referido(cuerpos, *m.groups())), safe=""), ruta)
+
+
+@contextmanager
+def sesion_de_lote(transaccion: bool) -> Iterator[Session]:
+    """
+    Sesión compartida por las operaciones de un lote.
+
+    Con `transaccion`, la sesión trabaja dentro de una transacción de una conexión propia y
+    cada `commit()` de los endpoints solo libera un savepoint: nada es visible fuera hasta
+    `confirmar_lote`, y al salir sin confirmar se deshace todo. Los avisos de cambios del
+    catálogo y las correcciones de los totales en caché se retienen hasta confirmar.
+    """
+    if not transaccion:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+        return
+
+    conexion = engine.connect()
+    externa = conexion.begin()
+    if engine.dialect.name == "sqlite":
+        # pysqlite no emite BEGIN hasta la primera escritura y el primer SAVEPOINT abriría
+        # (y su RELEASE confirmaría) la transacción; se abre explícitamente
+        conexion.exec_driver_sql("BEGIN")
+    db = SessionLocal(bind=conexion, join_transaction_mode="create_savepoint")
+    db.info["diferir_cambios"] = True
+    db.info["transaccion_lote"] = externa
+    try:
+        yield db
+    finally:
+        db.close()
+        if externa.is_active:
+            externa.rollback()
+        conexion.close()
+
+
+def confirmar_lote(db: Session) -> None:
+    """Confirma la transacción de un lote y difunde los cambios del catálogo que contenía."""
+    db.info.pop("transaccion_lote").commit()
+    db.info["diferir_cambios"] = False
+    avisar_confirmados(db)
+    totales_listados.aplicar(db)
+    difusor_cambios.notificar()
+
+
+def deshacer_operacion(db: Session) -> None:
+    """Descarta lo pendiente en la sesión tras una operación fallida de un lote sin transacción."""
+    if "transaccion_lote" not in db.info:
+        db.rollback()
+
+
+async def ejecutar_operacion(app, scope_lote, receive, metodo: str, ruta: str, cuerpo: Any,
+                             cabeceras: Dict[str, str]) -> Tuple[int, Dict[str, str], Any]:
+    """
+    Ejecuta una operación con el router de la aplicación, sin pasar por los middlewares.
+
+    La operación es una petición ASGI con el método, la ruta y el cuerpo indicados y las
+    cabeceras de CABECERAS_HEREDADAS de la petición por lotes, así que se valida, se
+    autoriza y responde exactamente como si llegara sola. Devuelve (status, cabeceras de
+    CABECERAS_RESULTADO, cuerpo decodificado).
+    """
+    ruta, _, consulta = f"{settings.API_V1_STR}/{ruta.lstrip('/')}".partition("?")
+    if ruta.rstrip("/") in RUTAS_FUERA_DE_LOTE:
+        return 400, {}, {"detail": "Esta ruta no se puede usar dentro de un lote"}
+
+    contenido = b"" if cuerpo is None else json.dumps(cuerpo).encode()
+    lista_cabeceras = [(nombre, valor) for nombre, valor in scope_lote["headers"] if nombre in CABECERAS_HEREDADAS]
+    lista_cabeceras += [(nombre.lower().encode("latin-1"), valor.encode("latin-1")) for nombre, valor in cabeceras.items()]
+    if cuerpo is not None:
+        lista_cabeceras += [(b"content-type", b"application/json"), (b"content-length", str(len(contenido)).encode())]
+
+    entregado = False
+
+    async def recibir():
+        nonlocal entregado
+        if not entregado:
+            entregado = True
+            return {"type": "http.request", "body": contenido, "more_body": False}
+        # Solo queda esperar la desconexión del cliente del lote
+        return await receive()
+
+    inicio: Dict[str, Any] = {}
+    partes: List[bytes] = []
+
+    async def enviar(mensaje) -> None:
+        if mensaje["type"] == "http.response.start":
+            inicio.update(mensaje)
+        elif mensaje["type"] == "http.response.body":
+            partes.append(mensaje.get("body", b""))
+
+    # Como el router de la aplicación, pero una ruta que solo difiere en la barra final se
+    # ejecuta en lugar de responder con una redirección
+    parcial: Optional[Tuple[Any, Dict]] = None
+    for candidata in dict.fromkeys((ruta, ruta[:-1] if ruta.endswith("/") else ruta + "/")):
+        scope = dict(scope_lote, method=metodo, path=candidata, raw_path=candidata.encode(),
+                     query_string=consulta.encode("latin-1"), headers=lista_cabeceras)
+        for route in app.router.routes:
+            coincidencia, hijo = route.matches(scope)
+            if coincidencia == Match.FULL:
+                await route.handle(dict(scope, **hijo), recibir, enviar)
+                return _resultado(inicio, partes)
+            if coincidencia == Match.PARTIAL and parcial is None:
+                parcial = (route, dict(scope, **hijo))
+    if parcial is not None:
+        # Ruta existente con otro método: la propia ruta lo rechaza con 405
+        try:
+            await parcial[0].handle(parcial[1], recibir, enviar)
+        except HTTPException as e:
+            return e.status_code, {}, {"detail": e.detail}
+        return _resultado(inicio, partes)
+    return 404, {}, {"detail": "Not Found"}
+
+
+def _resultado(inicio: Dict[str, Any], partes: List[bytes]) -> Tuple[int, Dict[str, str], Any]:
+    cabeceras = {}
+    tipo = ""
+    for nombre, valor in inicio.get("headers", []):
+        nombre = nombre.decode("latin-1").lower()
+        if nombre in CABECERAS_RESULTADO:
+            cabeceras[nombre] = valor.decode("latin-1")
+        elif nombre == "content-type":
+            tipo = valor.decode("latin-1")
+    contenido = b"".join(partes)
+    if not contenido:
+        cuerpo = None
+    elif tipo.startswith("application/json"):
+        cuerpo = json.loads(contenido)
+    else:
+        cuerpo = contenido.decode("utf-8", errors="replace")
+    return inicio.get("status", 500), cabeceras, cuerpo
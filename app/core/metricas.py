@@ -0,0 +1,78 @@
+import threading
+from typing import Callable, Dict, List, Tuple
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+
+def _formatear_etiquetas(etiquetas: Etiquetas) -> str:
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{clave}="{valor}"' for clave, valor in etiquetas) + "}"
+
+
+class Contador:
+    """Contador monótono con etiquetas."""
+
+    def __init__(self, nombre: str, ayuda: str) -> None:
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._valores: Dict[Etiquetas, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor: float = 1, **etiquetas: str) -> None:
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def valor(self, **etiquetas: str) -> float:
+        return self._valores.get(tuple(sorted(etiquetas.items())), 0)
+
+    def muestras(self) -> Dict[Etiquetas, float]:
+        with self._lock:
+            return dict(self._valores)
+
+
+class Medidor:
+    """Valor instantáneo que se lee al exportar (p. ej. la longitud de una cola)."""
+
+    def __init__(self, nombre: str, ayuda: str, funcion: Callable[[], Dict[Etiquetas, float]]) -> None:
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._funcion = funcion
+
+    def muestras(self) -> Dict[Etiquetas, float]:
+        return self._funcion()
+
+
+class RegistroMetricas:
+    """
+    Registro de métricas del proceso, exportadas en el formato de texto de Prometheus.
+
+    Sin dependencias externas: los contadores se actualizan en memoria y los medidores se
+    calculan al exportar. Con varios workers, cada proceso expone sus propias métricas.
+    """
+
+    def __init__(self) -> None:
+        self._metricas: Dict[str, object] = {}
+
+    def contador(self, nombre: str, ayuda: str) -> Contador:
+        if nombre not in self._metricas:
+            self._metricas[nombre] = Contador(nombre, ayuda)
+        return self._metricas[nombre]
+
+    def medidor(self, nombre: str, ayuda: str, funcion: Callable[[], Dict[Etiquetas, float]]) -> Medidor:
+        self._metricas[nombre] = Medidor(nombre, ayuda, funcion)
+        return self._metricas[nombre]
+
+    def exportar(self) -> str:
+        lineas: List[str] = []
+        for nombre, metrica in sorted(self._metricas.items()):
+            tipo = "counter" if isinstance(metrica, Contador) else "gauge"
+            lineas.append(f"# HELP {nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for etiquetas, valor in sorted(metrica.muestras().items()):
+                lineas.append(f"{nombre}{_formatear_etiquetas(etiquetas)} {valor:g}")
+        return "\n".join(lineas) + "\n"
+
+
+metricas = RegistroMetricas()
@@ -0,0 +1,93 @@
+import math
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from .config import settings
+
+# Instante (time.monotonic) en que vence la petición en curso; None fuera de una petición
+_vencimiento: ContextVar[Optional[float]] = ContextVar("vencimiento_peticion", default=None)
+
+CABECERA_PLAZO = b"x-plazo-ms"
+
+# Instrucciones de la máquina virtual de SQLite entre comprobaciones del plazo
+SQLITE_INSTRUCCIONES_POR_COMPROBACION = 10000
+
+
+def plazo_de_ruta(ruta: str) -> float:
+    """Plazo configurado para la ruta: el del prefijo más largo de PLAZOS_POR_RUTA o el de por defecto."""
+    mejor, plazo = -1, settings.PLAZO_POR_DEFECTO
+    for prefijo, segundos in settings.PLAZOS_POR_RUTA.items():
+        if ruta.startswith(prefijo) and len(prefijo) > mejor:
+            mejor, plazo = len(prefijo), segundos
+    return plazo
+
+
+def calcular_plazo(ruta: str, cabecera: Optional[bytes]) -> float:
+    """
+    Segundos de plazo de una petición.
+
+    El cliente puede pedir otro plazo con `X-Plazo-Ms`, que se acota a
+    [PLAZO_MINIMO, PLAZO_MAXIMO]; un valor no numérico se ignora.
+    """
+    if cabecera:
+        try:
+            return min(max(int(cabecera) / 1000, settings.PLAZO_MINIMO), settings.PLAZO_MAXIMO)
+        except ValueError:
+            pass
+    return plazo_de_ruta(ruta)
+
+
+def plazo_restante() -> Optional[float]:
+    """Segundos que le quedan a la petición en curso, o None si no hay plazo (p. ej. hilos de fondo)."""
+    vencimiento = _vencimiento.get()
+    if vencimiento is None:
+        return None
+    return vencimiento - time.monotonic()
+
+
+def plazo_vencido() -> bool:
+    restante = plazo_restante()
+    return restante is not None and restante <= 0
+
+
+def interrumpir_sqlite_si_vencido() -> int:
+    """Manejador de progreso de SQLite: un valor distinto de cero aborta la sentencia en curso."""
+    return 1 if plazo_vencido() else 0
+
+
+def timeout_sentencia() -> int:
+    """
+    Timeout en segundos enteros para el driver (pyodbc), 0 si no hay plazo.
+
+    Redondea hacia arriba con un mínimo de 1 s, porque 0 significa sin límite.
+    """
+    restante = plazo_restante()
+    if restante is None:
+        return 0
+    return max(1, math.ceil(restante))
+
+
+class MiddlewarePlazos:
+    """
+    Middleware ASGI que fija el plazo de cada petición de la API.
+
+    El plazo cuenta desde la llegada, así que incluye la espera en el control de admisión.
+    Las sentencias SQL se ejecutan con el tiempo restante como timeout (ver
+    `app.core.database`) y, si vence, la petición termina con 504 y la conexión vuelve al pool.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(settings.API_V1_STR):
+            await self.app(scope, receive, send)
+            return
+
+        cabecera = next((valor for nombre, valor in scope["headers"] if nombre == CABECERA_PLAZO), None)
+        token = _vencimiento.set(time.monotonic() + calcular_plazo(scope["path"], cabecera))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _vencimiento.reset(token)
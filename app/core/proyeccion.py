@@ -0,0 +1,99 @@
+import json
+from datetime import date, datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from fastapi import Response
+from sqlalchemy.orm import Query, Session
+
+from ..exceptions import BadRequestException
+
+
+class Expansion(NamedTuple):
+    modelo: Any           # Modelo relacionado
+    condicion: Any        # Condición del LEFT JOIN
+    esquema: Any          # Esquema de respuesta del objeto anidado
+
+
+def _columnas(modelo, esquema) -> Dict[str, Any]:
+    """Columnas del modelo que el esquema de respuesta expone, en el orden del esquema."""
+    return {nombre: getattr(modelo, nombre) for nombre in esquema.model_fields if nombre in modelo.__table__.c}
+
+
+def valor_json(valor: Any) -> Any:
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+class Proyeccion:
+    """
+    Listados con selección de campos (`?fields=id,nombre`) y expansión de relaciones
+    (`?expand=categoria`).
+
+    La consulta pide solo las columnas solicitadas y solo hace el JOIN de las relaciones
+    expandidas; las filas se serializan directamente a JSON, sin instanciar objetos del ORM
+    ni validar con Pydantic. Los campos permitidos son los del esquema de respuesta, de modo
+    que nunca se expone una columna que el listado completo no devolvería.
+    """
+
+    def __init__(self, modelo, esquema, expansiones: Optional[Dict[str, Expansion]] = None) -> None:
+        self.modelo = modelo
+        self.columnas = _columnas(modelo, esquema)
+        self.expansiones = {
+            nombre: (expansion, _columnas(expansion.modelo, expansion.esquema))
+            for nombre, expansion in (expansiones or {}).items()
+        }
+
+    @staticmethod
+    def _lista(valor: Optional[str]) -> List[str]:
+        return [nombre.strip() for nombre in (valor or "").split(",") if nombre.strip()]
+
+    def consulta(self, db: Session, fields: Optional[str], expand: Optional[str]) -> Query:
+        """Consulta con las columnas pedidas (todas si `fields` no se indica) y los JOIN de `expand`."""
+        campos = self._lista(fields) or list(self.columnas)
+        desconocidos = [nombre for nombre in campos if nombre not in self.columnas]
+        if desconocidos:
+            raise BadRequestException(f"Campos no válidos: {', '.join(desconocidos)}. "
+                                      f"Disponibles: {', '.join(self.columnas)}")
+
+        relaciones = self._lista(expand)
+        desconocidas = [nombre for nombre in relaciones if nombre not in self.expansiones]
+        if desconocidas:
+            disponibles = ", ".join(self.expansiones) or "ninguna"
+            raise BadRequestException(f"Expansiones no válidas: {', '.join(desconocidas)}. Disponibles: {disponibles}")
+
+        seleccion = [self.columnas[nombre].label(nombre) for nombre in dict.fromkeys(campos)]
+        for relacion in dict.fromkeys(relaciones):
+            _, columnas = self.expansiones[relacion]
+            seleccion += [columna.label(f"{relacion}__{nombre}") for nombre, columna in columnas.items()]
+
+        query = db.query(*seleccion)
+        for relacion in dict.fromkeys(relaciones):
+            expansion, _ = self.expansiones[relacion]
+            query = query.outerjoin(expansion.modelo, expansion.condicion)
+        return query
+
+    @staticmethod
+    def respuesta(filas) -> Response:
+        """Serializa las filas de `consulta` a JSON, anidando las relaciones expandidas."""
+        resultado = []
+        for fila in filas:
+            objeto: Dict[str, Any] = {}
+            for clave, valor in fila._mapping.items():
+                relacion, _, campo = clave.partition("__")
+                if not campo:
+                    objeto[clave] = valor
+                    continue
+                anidado = objeto.setdefault(relacion, {})
+                if anidado is not None:
+                    anidado[campo] = valor
+            # Un LEFT JOIN sin coincidencia deja todas las columnas a NULL: el objeto no existe
+            for relacion, anidado in objeto.items():
+                if isinstance(anidado, dict) and all(valor is None for valor in anidado.values()):
+                    objeto[relacion] = None
+            resultado.append(objeto)
+
+        return Response(
+            content=json.dumps(resultado, default=valor_json, ensure_ascii=False, separators=(",", ":")),
+            media_type="application/json",
+        )
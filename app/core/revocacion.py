@@ -0,0 +1,109 @@
+import math
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from .cambios import difusor_cambios
+from .config import settings
+from .database import SessionLocal
+from ..models.revocacion import RevocacionToken
+
+
+class ListaRevocacion:
+    """
+    Lista de revocación de tokens de acceso en memoria, consultada en O(1).
+
+    Guarda identificadores de token (jti) revocados y, por usuario, el instante a partir
+    del cual los tokens emitidos antes dejan de ser válidos (cambio de permisos, de
+    contraseña, desactivación o eliminación). Las entradas se descartan cuando ya no
+    puede existir ningún token de acceso vigente al que afecten.
+
+    Cada revocación se aplica en memoria al momento y, si se pasa la sesión, se guarda en la
+    tabla `revocaciones_token` en la misma transacción que la escritura que la causa. El hilo
+    lector de la tabla de cambios llama a `sincronizar` en cada pasada, así que el resto de
+    workers la aplican en menos de CAMBIOS_INTERVALO.
+    """
+
+    # Segundos que se vuelven a leer hacia atrás en cada sincronización: una revocación que
+    # se confirma después de otra más reciente no se pierde (aplicarla dos veces no cambia nada)
+    SOLAPE_SEGUNDOS = 30
+
+    def __init__(self, vigencia_segundos: int, session_factory: Callable[[], Session] = SessionLocal) -> None:
+        self.vigencia_segundos = vigencia_segundos
+        self._session_factory = session_factory
+        self._tokens: Dict[str, float] = {}
+        self._usuarios: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._proxima_purga = time.time() + vigencia_segundos
+        self._leido_hasta = 0  # revocado_en de la revocación más reciente leída de la tabla
+        self._proxima_purga_tabla = 0.0
+
+    def revocar_token(self, jti: str, exp: Optional[float] = None, db: Optional[Session] = None) -> None:
+        """Revoca un token concreto hasta su expiración."""
+        exp = exp if exp is not None else time.time() + self.vigencia_segundos
+        with self._lock:
+            self._tokens[jti] = exp
+            self._purgar()
+        if db is not None:
+            db.add(RevocacionToken(jti=jti, revocado_en=int(time.time()), caduca=math.ceil(exp)))
+
+    def revocar_usuario(self, username: str, db: Optional[Session] = None) -> None:
+        """Invalida todos los tokens del usuario emitidos antes de este instante."""
+        ahora = int(time.time())
+        with self._lock:
+            self._usuarios[username] = max(self._usuarios.get(username, 0), ahora)
+            self._purgar()
+        if db is not None:
+            db.add(RevocacionToken(username=username, revocado_en=ahora, caduca=ahora + self.vigencia_segundos))
+
+    def esta_revocado(self, username: str, jti: Optional[str], iat: Optional[int]) -> bool:
+        if jti is not None and jti in self._tokens:
+            return True
+
+        # iat y revocado_en en segundos enteros: un token emitido en el mismo segundo que la
+        # revocación sigue siendo válido, para no rechazar el que se obtiene justo después
+        revocado_en = self._usuarios.get(username)
+        return revocado_en is not None and (iat is None or iat < revocado_en)
+
+    def sincronizar(self) -> None:
+        """Aplica las revocaciones guardadas en la tabla por cualquier worker desde la última lectura."""
+        ahora = time.time()
+        db = self._session_factory()
+        try:
+            filas = (
+                db.query(RevocacionToken.jti, RevocacionToken.username,
+                         RevocacionToken.revocado_en, RevocacionToken.caduca)
+                .filter(RevocacionToken.revocado_en >= self._leido_hasta - self.SOLAPE_SEGUNDOS,
+                        RevocacionToken.caduca > ahora)
+                .all()
+            )
+            if ahora >= self._proxima_purga_tabla:
+                db.query(RevocacionToken).filter(RevocacionToken.caduca <= ahora).delete(synchronize_session=False)
+                db.commit()
+                self._proxima_purga_tabla = ahora + self.vigencia_segundos
+        finally:
+            db.close()
+
+        with self._lock:
+            for jti, username, revocado_en, caduca in filas:
+                if jti is not None:
+                    self._tokens[jti] = caduca
+                if username is not None:
+                    self._usuarios[username] = max(self._usuarios.get(username, 0), revocado_en)
+                self._leido_hasta = max(self._leido_hasta, revocado_en)
+            self._purgar()
+
+    def _purgar(self) -> None:
+        ahora = time.time()
+        if ahora < self._proxima_purga:
+            return
+
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp > ahora}
+        self._usuarios = {u: t for u, t in self._usuarios.items() if t + self.vigencia_segundos > ahora}
+        self._proxima_purga = ahora + self.vigencia_segundos
+
+
+lista_revocacion = ListaRevocacion(vigencia_segundos=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+difusor_cambios.en_cada_lectura(lista_revocacion.sincronizar)
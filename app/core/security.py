@@ -1,5 +1,9 @@
+from contextvars import ContextVar
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple, Union
+import hashlib
+import secrets
+import uuid
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends
@@ -7,9 +11,11 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from ..exceptions import UnauthorizedException, ForbiddenException
 from ..models import Usuario
-from ..schemas import TokenData
+from ..schemas import TokenData, UsuarioToken
 from ..core.database import get_db
 from ..core.config import settings
+from ..core.revocacion import lista_revocacion
+from ..core.claves import conjunto_claves, es_asimetrico
 
 # Configuración de seguridad para contraseñas
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -31,39 +37,103 @@ def get_password_hash(password: str) -> str:
 def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
     """Crea un token JWT con los datos proporcionados."""
     to_encode = data.copy()
+    now = datetime.utcnow()
 
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        expire = now + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+
+    # jti identifica el token en la lista de revocación; iat permite revocar por usuario
+    to_encode.update({"exp": expire, "iat": now, "jti": uuid.uuid4().hex})
+
+    if es_asimetrico(settings.ALGORITHM):
+        kid, clave = conjunto_claves.clave_firma()
+        return jwt.encode(to_encode, clave, algorithm=settings.ALGORITHM, headers={"kid": kid})
 
-    to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
     return encoded_jwt
 
 
+def _verification_key(token: str):
+    """Clave para verificar el token: el secreto compartido o la clave pública de su `kid`."""
+    if not es_asimetrico(settings.ALGORITHM):
+        return settings.SECRET_KEY
+
+    clave = conjunto_claves.clave_verificacion(jwt.get_unverified_header(token).get("kid"))
+    if clave is None:
+        raise UnauthorizedException("Token firmado con una clave desconocida")
+    return clave
+
+
+def user_token_claims(user: Usuario) -> Dict[str, Any]:
+    """Claims del token de acceso que permiten autorizar sin consultar la base de datos."""
+    return {
+        "sub": user.username,
+        "uid": user.id,
+        "is_active": bool(user.is_active),
+        "is_admin": bool(user.is_admin),
+    }
+
+
+def create_refresh_token() -> Tuple[str, str]:
+    """Genera un token de refresco aleatorio. Devuelve (token, hash a almacenar)."""
+    token = secrets.token_urlsafe(32)
+    return token, hash_refresh_token(token)
+
+
+def hash_refresh_token(token: str) -> str:
+    """
+    Hash SHA-256 del token de refresco.
+
+    El token tiene 256 bits aleatorios, así que no necesita un hash lento como bcrypt:
+    validar un refresco cuesta un hash rápido y una búsqueda por índice.
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
 def decode_token(token: str) -> TokenData:
     """Decodifica un token JWT y devuelve los datos del token."""
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = jwt.decode(token, _verification_key(token), algorithms=[settings.ALGORITHM])
         username: str = payload.get("sub")
         exp: datetime = datetime.fromtimestamp(payload.get("exp"))
 
         if username is None:
             raise UnauthorizedException("Token inválido")
 
-        token_data = TokenData(username=username, exp=exp)
-        return token_data
+        token_data = TokenData(
+            username=username,
+            exp=exp,
+            uid=payload.get("uid"),
+            is_active=payload.get("is_active"),
+            is_admin=payload.get("is_admin"),
+            jti=payload.get("jti"),
+            iat=payload.get("iat"),
+        )
     except JWTError:
         raise UnauthorizedException("Token inválido o expirado")
 
+    if lista_revocacion.esta_revocado(token_data.username, token_data.jti, token_data.iat):
+        raise UnauthorizedException("Token revocado")
+
+    return token_data
+
+
+# Usuarios ya autenticados (token -> usuario) durante una petición por lotes; None fuera de ella.
+# Las operaciones del lote no vuelven a decodificar el token ni a consultar el usuario.
+usuarios_lote: ContextVar[Optional[Dict[str, Usuario]]] = ContextVar("usuarios_lote", default=None)
+
 
 async def get_current_user(
         token: str = Depends(oauth2_scheme),
         db: Session = Depends(get_db)
 ) -> Usuario:
     """Obtiene el usuario actual basado en el token JWT."""
+    autenticados = usuarios_lote.get()
+    if autenticados is not None and token in autenticados:
+        return autenticados[token]
     try:
         token_data = decode_token(token)
         user = db.query(Usuario).filter(Usuario.username == token_data.username).first()
@@ -71,15 +141,48 @@ async def get_current_user(
         if user is None:
             raise UnauthorizedException("Usuario no encontrado")
 
+        if autenticados is not None:
+            autenticados[token] = user
         return user
     except JWTError:
         raise UnauthorizedException("Token inválido o expirado")
 
 
+async def _get_token_or_db_user(token: str, db: Session) -> Union[Usuario, UsuarioToken]:
+    """
+    En modo sin estado, construye el usuario con los claims del token sin acceder a la
+    base de datos. Los tokens sin claims de permisos (emitidos antes) se validan contra la BD.
+    """
+    autenticados = usuarios_lote.get()
+    if settings.TOKEN_SIN_ESTADO and not (autenticados and token in autenticados):
+        token_data = decode_token(token)
+        if None not in (token_data.uid, token_data.is_active, token_data.is_admin):
+            return UsuarioToken(
+                id=token_data.uid,
+                username=token_data.username,
+                is_active=token_data.is_active,
+                is_admin=token_data.is_admin,
+            )
+
+    return await get_current_user(token, db)
+
+
 async def get_current_active_user(
+        token: str = Depends(oauth2_scheme),
+        db: Session = Depends(get_db)
+) -> Union[Usuario, UsuarioToken]:
+    """Verifica que el usuario actual esté activo."""
+    current_user = await _get_token_or_db_user(token, db)
+    if not current_user.is_active:
+        raise ForbiddenException("Usuario inactivo")
+
+    return current_user
+
+
+async def get_current_active_db_user(
         current_user: Usuario = Depends(get_current_user)
 ) -> Usuario:
-    """Verifica que el usuario actual esté activo."""
+    """Como get_current_active_user, pero siempre devuelve el usuario cargado de la base de datos."""
     if not current_user.is_active:
         raise ForbiddenException("Usuario inactivo")
 
@@ -87,10 +190,10 @@ async def get_current_active_user(
 
 
 async def get_current_admin_user(
-        current_user: Usuario = Depends(get_current_active_user)
-) -> Usuario:
+        current_user: Union[Usuario, UsuarioToken] = Depends(get_current_active_user)
+) -> Union[Usuario, UsuarioToken]:
     """Verifica que el usuario actual tenga permisos de administrador."""
     if not current_user.is_admin:
         raise ForbiddenException("Acceso denegado: se requieren privilegios de administrador")
 
-    return current_user
\ No newline at end of file
+    return current_user
@@ -0,0 +1,146 @@
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MAGIA = b"CATPRD01"
+CABECERA = struct.Struct("<8sqq")  # magia, filas, secciones
+SECCION = struct.Struct("<qq")      # desplazamiento, longitud
+NULO_ENTERO = -(2 ** 63)
+NULO_BOOLEANO = 2
+
+# Columnas de la tabla de productos en el orden del fichero: q = entero de 64 bits,
+# ? = booleano (un byte), s = texto UTF-8 (desplazamientos + nulos + montón de bytes)
+COLUMNAS: Tuple[Tuple[str, str], ...] = (
+    ("id", "q"),
+    ("nombre", "s"),
+    ("descripcion", "s"),
+    ("precio", "q"),
+    ("disponible", "?"),
+    ("stock", "q"),
+    ("categoria_id", "q"),
+    ("fecha_creacion", "s"),
+    ("version", "q"),
+)
+
+
+def _texto(valor: Any) -> Optional[bytes]:
+    if valor is None:
+        return None
+    if hasattr(valor, "isoformat"):
+        valor = valor.isoformat()
+    return str(valor).encode("utf-8")
+
+
+def serializar_productos(productos: List[Dict[str, Any]]) -> bytes:
+    """
+    Productos (ordenados por id) en el formato de columnas de ancho fijo que lee `TiendaProductos`.
+
+    Cada columna es un arreglo contiguo; los textos son un arreglo de desplazamientos, otro
+    de nulos y el montón con los bytes. La cabecera indica dónde empieza cada sección, que
+    se alinea a 8 bytes para poder leer los enteros directamente del fichero mapeado.
+    """
+    secciones: List[bytes] = []
+    for nombre, tipo in COLUMNAS:
+        valores = [producto[nombre] for producto in productos]
+        if tipo == "q":
+            secciones.append(array("q", [NULO_ENTERO if v is None else int(v) for v in valores]).tobytes())
+        elif tipo == "?":
+            secciones.append(bytes(NULO_BOOLEANO if v is None else int(v) for v in valores))
+        else:
+            desplazamientos = array("q", [0])
+            nulos = bytearray(len(valores))
+            monton = bytearray()
+            for i, valor in enumerate(valores):
+                codificado = _texto(valor)
+                if codificado is None:
+                    nulos[i] = 1
+                else:
+                    monton += codificado
+                desplazamientos.append(len(monton))
+            secciones += [desplazamientos.tobytes(), bytes(nulos), bytes(monton)]
+
+    inicio = CABECERA.size + SECCION.size * len(secciones)
+    indice = bytearray(CABECERA.pack(MAGIA, len(productos), len(secciones)))
+    cuerpo = bytearray()
+    for seccion in secciones:
+        relleno = -(inicio + len(cuerpo)) % 8
+        cuerpo += b"\0" * relleno
+        indice += SECCION.pack(inicio + len(cuerpo), len(seccion))
+        cuerpo += seccion
+    return bytes(indice + cuerpo)
+
+
+class TiendaProductos:
+    """
+    Lectura de un fichero de `serializar_productos` mapeado en memoria.
+
+    El sistema operativo comparte las páginas del fichero entre todos los procesos que lo
+    mapean, así que N workers ocupan una sola copia. El fichero no cambia nunca (cada
+    versión es un fichero nuevo), y las lecturas no necesitan bloqueo: una búsqueda por id
+    es una búsqueda binaria sobre la columna de ids, y cada campo se lee en su posición.
+    """
+
+    def __init__(self, ruta: str) -> None:
+        with open(ruta, "rb") as fichero:
+            self._mmap = mmap.mmap(fichero.fileno(), 0, access=mmap.ACCESS_READ)
+        vista = memoryview(self._mmap)
+
+        magia, self.filas, total = CABECERA.unpack_from(vista, 0)
+        if magia != MAGIA:
+            raise ValueError(f"{ruta} no es un fichero de productos compartidos")
+        secciones = [
+            vista[desplazamiento:desplazamiento + longitud]
+            for desplazamiento, longitud in (SECCION.unpack_from(vista, CABECERA.size + SECCION.size * i)
+                                             for i in range(total))
+        ]
+
+        self._lectores: List[Tuple[str, Callable[[int], Any]]] = []
+        for nombre, tipo in COLUMNAS:
+            if tipo == "q":
+                columna = secciones.pop(0).cast("q")
+                if nombre == "id":
+                    self._ids = columna
+                self._lectores.append((nombre, self._entero(columna)))
+            elif tipo == "?":
+                self._lectores.append((nombre, self._booleano(secciones.pop(0))))
+            else:
+                desplazamientos, nulos, monton = secciones.pop(0).cast("q"), secciones.pop(0), secciones.pop(0)
+                self._lectores.append((nombre, self._texto(desplazamientos, nulos, monton)))
+
+    @staticmethod
+    def _entero(columna: memoryview) -> Callable[[int], Optional[int]]:
+        def leer(i: int) -> Optional[int]:
+            valor = columna[i]
+            return None if valor == NULO_ENTERO else valor
+        return leer
+
+    @staticmethod
+    def _booleano(columna: memoryview) -> Callable[[int], Optional[bool]]:
+        def leer(i: int) -> Optional[bool]:
+            valor = columna[i]
+            return None if valor == NULO_BOOLEANO else bool(valor)
+        return leer
+
+    @staticmethod
+    def _texto(desplazamientos: memoryview, nulos: memoryview, monton: memoryview) -> Callable[[int], Optional[str]]:
+        def leer(i: int) -> Optional[str]:
+            if nulos[i]:
+                return None
+            return str(monton[desplazamientos[i]:desplazamientos[i + 1]], "utf-8")
+        return leer
+
+    def __len__(self) -> int:
+        return self.filas
+
+    def fila(self, i: int) -> Dict[str, Any]:
+        return {nombre: leer(i) for nombre, leer in self._lectores}
+
+    def posicion(self, producto_id: int) -> Optional[int]:
+        """Posición del producto en el fichero, o None si no está."""
+        i = bisect_left(self._ids, producto_id)
+        return i if i < self.filas and self._ids[i] == producto_id else None
+
+    def id_en(self, i: int) -> int:
+        return self._ids[i]
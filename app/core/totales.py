@@ -0,0 +1,250 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Literal, Optional, Tuple
+
+from fastapi import Query, Response
+from sqlalchemy import event, func, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import ORMExecuteState, Session
+from sqlalchemy.sql import Select
+
+from .config import settings
+from .database import SessionLocal
+from .hilos import HiloDeFondo
+from .metricas import metricas
+
+ModoTotal = Literal["exacto", "cache", "aproximado"]
+
+# De más a menos preciso
+MODOS = ("exacto", "cache", "aproximado")
+
+# (tabla, filtros): un total en caché por cada combinación de filtros de un listado
+Clave = Tuple[str, Tuple[Hashable, ...]]
+
+
+def modo_total(
+        total: Optional[ModoTotal] = Query(
+            None, description="Añade el total en X-Total-Count: exacto, cache o aproximado"
+        )
+) -> Optional[str]:
+    """Dependencia: modo del total pedido en el parámetro `total`, o None si no se pide."""
+    return total
+
+
+class _Entrada:
+    __slots__ = ("consulta", "total", "leida")
+
+    def __init__(self, consulta: Select, total: int) -> None:
+        self.consulta = consulta
+        self.total = total
+        self.leida = False  # Leída desde el último recálculo; las que no se leen se descartan
+
+
+class TotalesListados(HiloDeFondo):
+    """
+    Totales de los listados paginados para la cabecera `X-Total-Count`, en tres modos:
+
+    - `exacto`: un COUNT con los mismos filtros que el listado en cada petición.
+    - `cache`: el mismo COUNT guardado en memoria, uno por worker. Las altas y bajas de este
+      proceso lo corrigen al confirmarse (sin filtros se suman; con filtros se descarta y se
+      recalcula en la siguiente petición), y un hilo de fondo recalcula cada TOTALES_INTERVALO
+      los totales leídos desde el recálculo anterior, así que las escrituras de otros workers
+      o hechas fuera de la API tardan como mucho ese intervalo en reflejarse.
+    - `aproximado`: el número de filas que el motor guarda en sus metadatos (`sys.partitions`
+      en SQL Server, `sqlite_stat1` en SQLite, actualizada por ANALYZE), sin recorrer la tabla.
+      Con filtros, o si el motor no tiene el dato, se sirve el modo `cache`.
+
+    La cabecera `X-Total-Count-Modo` indica el modo con el que se calculó el total.
+    """
+
+    nombre_hilo = "totales-listados"
+
+    def __init__(self, intervalo: float, maximo: int, session_factory: Callable[[], Session] = SessionLocal) -> None:
+        super().__init__()
+        self.intervalo = intervalo
+        self.maximo = maximo
+        self._session_factory = session_factory
+
+        self._entradas: "OrderedDict[Clave, _Entrada]" = OrderedDict()
+        # Se incrementa con cada escritura confirmada en la tabla: un recálculo que la solape se descarta
+        self._generaciones: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        self.calculados = metricas.contador(
+            "totales_calculados_total", "COUNT ejecutados para X-Total-Count por motivo (exacto, cache, recalculo)"
+        )
+        metricas.medidor("totales_en_cache", "Totales de listados en la caché de este worker",
+                         lambda: {(): len(self._entradas)})
+
+    def poner(self, response: Response, db: Session, modo: Optional[str], modelo, *condiciones,
+              filtros: Tuple[Hashable, ...] = ()) -> None:
+        """
+        Añade a la respuesta el total de filas de `modelo` que cumplen `condiciones`.
+
+        `filtros` identifica las condiciones en la caché (p. ej. los valores de los parámetros
+        que las generan). No hace nada si `modo` es None.
+        """
+        if modo is None:
+            return
+        self.escribir(response, self.obtener(db, modo, modelo, *condiciones, filtros=filtros))
+
+    @staticmethod
+    def escribir(response: Response, *resultados: Tuple[int, str]) -> None:
+        """Pone en la respuesta la suma de uno o varios resultados de `obtener`, con el modo menos preciso."""
+        response.headers["X-Total-Count"] = str(sum(total for total, _ in resultados))
+        response.headers["X-Total-Count-Modo"] = max((modo for _, modo in resultados), key=MODOS.index)
+
+    def obtener(self, db: Session, modo: str, modelo, *condiciones,
+                filtros: Tuple[Hashable, ...] = ()) -> Tuple[int, str]:
+        """Devuelve (total, modo con el que se calculó)."""
+        tabla = modelo.__table__.name
+        if modo == "aproximado" and not condiciones:
+            total = self._aproximado(db, tabla)
+            if total is not None:
+                return total, "aproximado"
+
+        consulta = select(func.count()).select_from(modelo).where(*condiciones)
+        if modo == "exacto":
+            self.calculados.inc(motivo="exacto")
+            return db.execute(consulta).scalar_one(), "exacto"
+
+        clave = (tabla, filtros)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                entrada.leida = True
+                self._entradas.move_to_end(clave)
+                return entrada.total, "cache"
+            generacion = self._generaciones.get(tabla, 0)
+
+        self.calculados.inc(motivo="cache")
+        total = db.execute(consulta).scalar_one()
+        with self._lock:
+            if self._generaciones.get(tabla, 0) == generacion:
+                self._entradas[clave] = _Entrada(consulta, total)
+                while len(self._entradas) > self.maximo:
+                    self._entradas.popitem(last=False)
+        return total, "cache"
+
+    def aplicar(self, session: Session) -> None:
+        """Corrige los totales en caché con las altas y bajas confirmadas de la sesión."""
+        cambios: Dict[str, Optional[int]] = session.info.pop("totales", None)
+        if not cambios:
+            return
+        with self._lock:
+            for tabla, diferencia in cambios.items():
+                self._generaciones[tabla] = self._generaciones.get(tabla, 0) + 1
+            for clave in [clave for clave in self._entradas if clave[0] in cambios]:
+                diferencia = cambios[clave[0]]
+                if clave[1] == () and diferencia is not None:
+                    self._entradas[clave].total += diferencia
+                else:
+                    del self._entradas[clave]
+
+    @staticmethod
+    def anotar(session: Session, tabla: str, diferencia: Optional[int]) -> None:
+        """
+        Anota en la sesión las filas añadidas (o quitadas, en negativo) a una tabla hasta el
+        commit; None si el número es desconocido. Cualquier anotación descarta al confirmarse
+        los totales de la tabla con filtros.
+        """
+        cambios = session.info.setdefault("totales", {})
+        anterior = cambios.get(tabla, 0)
+        cambios[tabla] = None if anterior is None or diferencia is None else anterior + diferencia
+
+    @staticmethod
+    def _aproximado(db: Session, tabla: str) -> Optional[int]:
+        dialecto = db.get_bind().dialect.name
+        try:
+            if dialecto == "mssql":
+                total = db.execute(text(
+                    "SELECT SUM(rows) FROM sys.partitions WHERE object_id = OBJECT_ID(:tabla) AND index_id IN (0, 1)"
+                ), {"tabla": tabla}).scalar()
+                return int(total) if total is not None else None
+            if dialecto == "sqlite":
+                # La primera cifra de `stat` es el número de filas de la tabla (o del índice) en el último ANALYZE
+                filas = db.execute(text("SELECT stat FROM sqlite_stat1 WHERE tbl = :tabla"), {"tabla": tabla}).scalars()
+                totales = [int(stat.split()[0]) for stat in filas if stat]
+                return max(totales) if totales else None
+        except DBAPIError:
+            return None  # Sin permisos sobre las vistas del sistema, o sin ANALYZE previo
+        return None
+
+    def _recalcular(self) -> None:
+        with self._lock:
+            pendientes: List[Tuple[Clave, Select, int]] = []
+            for clave, entrada in list(self._entradas.items()):
+                if not entrada.leida:
+                    del self._entradas[clave]
+                    continue
+                pendientes.append((clave, entrada.consulta, self._generaciones.get(clave[0], 0)))
+
+        if not pendientes:
+            return
+        db = self._session_factory()
+        try:
+            for clave, consulta, generacion in pendientes:
+                if self._evento_detener.is_set():
+                    return
+                total = db.execute(consulta).scalar_one()
+                db.rollback()  # Cada COUNT ve los datos confirmados hasta ese momento
+                self.calculados.inc(motivo="recalculo")
+                with self._lock:
+                    entrada = self._entradas.get(clave)
+                    if entrada is not None and self._generaciones.get(clave[0], 0) == generacion:
+                        entrada.total = total
+                        entrada.leida = False
+        finally:
+            db.close()
+
+    def _ejecutar(self) -> None:
+        while not self._evento_detener.wait(self.intervalo):
+            try:
+                self._recalcular()
+            except Exception as e:
+                print(f"ERROR al recalcular los totales de los listados: {str(e)}")
+
+
+totales_listados = TotalesListados(intervalo=settings.TOTALES_INTERVALO, maximo=settings.TOTALES_CACHE_MAX)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _tras_flush(session: Session, flush_context) -> None:
+    # Durante after_flush `new`, `dirty` y `deleted` aún tienen el estado previo al flush
+    for objeto in session.new:
+        totales_listados.anotar(session, objeto.__table__.name, 1)
+    for objeto in session.deleted:
+        totales_listados.anotar(session, objeto.__table__.name, -1)
+    for objeto in session.dirty:
+        # Una modificación no cambia el total de la tabla, pero sí puede cambiar el de un filtro
+        totales_listados.anotar(session, objeto.__table__.name, 0)
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _tras_ejecutar(orm_execute_state: ORMExecuteState):
+    # INSERT y DELETE masivos (p. ej. la ingesta por lotes), fuera del flush del ORM
+    if not (orm_execute_state.is_insert or orm_execute_state.is_delete):
+        return None
+    resultado = orm_execute_state.invoke_statement()
+    if orm_execute_state.is_insert:
+        # El INSERT por lotes del ORM no informa de las filas: una por parámetro
+        parametros = orm_execute_state.parameters
+        filas = len(parametros) if isinstance(parametros, list) else 1 if parametros else None
+    else:
+        filas = getattr(resultado, "rowcount", -1)
+        filas = -filas if filas >= 0 else None
+    totales_listados.anotar(orm_execute_state.session, orm_execute_state.statement.table.name, filas)
+    return resultado
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _tras_commit(session: Session) -> None:
+    # En un lote transaccional cada commit solo libera un savepoint: se aplica al confirmar el lote
+    if session.info.get("diferir_cambios"):
+        return
+    totales_listados.aplicar(session)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _tras_rollback(session: Session) -> None:
+    session.info.pop("totales", None)
@@ -0,0 +1,88 @@
+import threading
+from datetime import datetime
+from typing import Callable, Dict
+
+from sqlalchemy import case, update
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import SessionLocal
+from .hilos import HiloDeFondo
+from ..models.usuario import Usuario as UsuarioModel
+
+
+class RegistradorUltimoLogin(HiloDeFondo):
+    """
+    Acumula el último login de cada usuario en memoria y lo escribe en segundo plano.
+
+    Varios logins del mismo usuario entre dos escrituras se reducen al más reciente, y
+    cada escritura actualiza a todos los usuarios pendientes con un único UPDATE ... CASE.
+    Si la escritura falla, los valores vuelven a quedar pendientes (al menos una vez).
+    """
+
+    # Usuarios por sentencia (SQL Server admite como máximo 2100 parámetros)
+    USUARIOS_POR_UPDATE = 500
+
+    nombre_hilo = "ultimo-login"
+
+    def __init__(self, intervalo_flush: float, session_factory: Callable[[], Session] = SessionLocal) -> None:
+        super().__init__()
+        self.intervalo_flush = intervalo_flush
+        self._session_factory = session_factory
+        self._pendientes: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self.estadisticas = {"registrados": 0, "escritos": 0, "updates": 0, "errores": 0}
+
+    def registrar(self, usuario_id: int, fecha: datetime) -> None:
+        """Anota el login sin acceder a la base de datos."""
+        with self._lock:
+            anterior = self._pendientes.get(usuario_id)
+            if anterior is None or fecha > anterior:
+                self._pendientes[usuario_id] = fecha
+            self.estadisticas["registrados"] += 1
+
+    def flush(self) -> int:
+        """Escribe todos los logins pendientes. Devuelve el número de usuarios actualizados."""
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+
+        if not pendientes:
+            return 0
+
+        db = self._session_factory()
+        try:
+            ids = list(pendientes)
+            for i in range(0, len(ids), self.USUARIOS_POR_UPDATE):
+                bloque = {usuario_id: pendientes[usuario_id] for usuario_id in ids[i:i + self.USUARIOS_POR_UPDATE]}
+                db.execute(
+                    update(UsuarioModel)
+                    .where(UsuarioModel.id.in_(bloque))
+                    .values(ultimo_login=case(bloque, value=UsuarioModel.id))
+                    .execution_options(synchronize_session=False)
+                )
+                self.estadisticas["updates"] += 1
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.estadisticas["errores"] += 1
+            print(f"ERROR al actualizar último_login de {len(pendientes)} usuarios: {str(e)}")
+            # Reincorporar los pendientes sin pisar logins más recientes
+            with self._lock:
+                for usuario_id, fecha in pendientes.items():
+                    actual = self._pendientes.get(usuario_id)
+                    if actual is None or fecha > actual:
+                        self._pendientes[usuario_id] = fecha
+            return 0
+        finally:
+            db.close()
+
+        self.estadisticas["escritos"] += len(pendientes)
+        return len(pendientes)
+
+    def _ejecutar(self) -> None:
+        while not self._evento_detener.wait(self.intervalo_flush):
+            self.flush()
+        self.flush()
+
+
+registrador_ultimo_login = RegistradorUltimoLogin(intervalo_flush=settings.ULTIMO_LOGIN_INTERVALO_FLUSH)
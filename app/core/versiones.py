@@ -0,0 +1,67 @@
+from typing import Optional, Set
+
+from fastapi import Header
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from ..exceptions import PreconditionFailedException
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def versiones_if_match(if_match: Optional[str] = Header(None)) -> Optional[Set[int]]:
+    """
+    Dependencia: versiones aceptadas por la cabecera `If-Match`, o None si no se exige ninguna.
+
+    Acepta ETags fuertes o débiles (`"3"`, `W/"3"`) separados por comas; `*` equivale a no
+    exigir versión. Un valor que no corresponde a ninguna versión produce un conjunto vacío
+    y, por tanto, 412.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+
+    versiones = set()
+    for valor in if_match.split(","):
+        valor = valor.strip()
+        if valor.startswith("W/"):
+            valor = valor[2:]
+        valor = valor.strip('"')
+        if valor.isdigit():
+            versiones.add(int(valor))
+    return versiones
+
+
+def comprobar_version(db_objeto, versiones: Optional[Set[int]]) -> None:
+    """Responde 412 si la versión leída no es una de las exigidas por `If-Match`."""
+    if versiones is not None and db_objeto.version not in versiones:
+        raise PreconditionFailedException()
+
+
+def incrementar_version(db: Session, db_objeto, versiones: Optional[Set[int]]) -> None:
+    """
+    Incrementa la versión de `db_objeto` en la misma transacción que sus cambios (antes del commit).
+
+    Sin `If-Match` gana la última escritura: el UPDATE del ORM incluye `version = version + 1`.
+    Con `If-Match`, un `UPDATE ... SET version = version + 1 WHERE id = ? AND version = ?`
+    con la versión leída reserva la fila antes de escribir los cambios; si otra petición la
+    modificó después de la lectura no actualiza ninguna fila y se responde 412.
+    """
+    modelo = type(db_objeto)
+    if versiones is None:
+        db_objeto.version = modelo.version + 1
+        return
+
+    leida = db_objeto.version
+    actualizadas = db.execute(
+        update(modelo)
+        .where(modelo.id == db_objeto.id, modelo.version == leida)
+        .values(version=leida + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if actualizadas != 1:
+        raise PreconditionFailedException()
+    # Ya escrita: el UPDATE del ORM solo lleva los demás campos
+    set_committed_value(db_objeto, "version", leida + 1)
@@ -4,7 +4,11 @@ from .http_exceptions import (
     NotFoundException,
     BadRequestException,
     ConflictException,
-    InternalServerErrorException
+    InternalServerErrorException,
+    ServiceUnavailableException,
+    TooManyRequestsException,
+    GatewayTimeoutException,
+    PreconditionFailedException
 )
 from .handlers import setup_exception_handlers
 
@@ -15,5 +19,9 @@ __all__ = [
     "BadRequestException",
     "ConflictException",
     "InternalServerErrorException",
+    "ServiceUnavailableException",
+    "TooManyRequestsException",
+    "GatewayTimeoutException",
+    "PreconditionFailedException",
     "setup_exception_handlers"
 ]
\ No newline at end of file
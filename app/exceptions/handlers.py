@@ -6,6 +6,8 @@ from pydantic import ValidationError
 import traceback
 from typing import Union, Dict, Any
 
+from ..core.plazos import plazo_vencido
+
 
 def setup_exception_handlers(app: FastAPI, debug: bool = False) -> None:
     """Configura los manejadores de excepciones para la aplicación."""
@@ -24,6 +26,12 @@ def setup_exception_handlers(app: FastAPI, debug: bool = False) -> None:
 
         status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
 
+        # La sentencia se canceló (o no obtuvo conexión) porque venció el plazo de la petición
+        if plazo_vencido():
+            error_response["detail"] = "Plazo de la solicitud agotado"
+            error_response["type"] = "timeout"
+            status_code = status.HTTP_504_GATEWAY_TIMEOUT
+
         # Manejar específicamente errores de integridad
         if isinstance(exc, IntegrityError):
             error_response["detail"] = "Violación de restricción de integridad"
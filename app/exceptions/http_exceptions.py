@@ -51,4 +51,34 @@ class InternalServerErrorException(BaseHTTPException):
         super().__init__(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=detail,
-        )
\ No newline at end of file
+        )
+
+class ServiceUnavailableException(BaseHTTPException):
+    def __init__(self, detail: str = "Servicio temporalmente no disponible", retry_after: int = 1) -> None:
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+class TooManyRequestsException(BaseHTTPException):
+    def __init__(self, detail: str = "Demasiadas solicitudes", retry_after: int = 1) -> None:
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+class GatewayTimeoutException(BaseHTTPException):
+    def __init__(self, detail: str = "Plazo de la solicitud agotado") -> None:
+        super().__init__(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=detail,
+        )
+
+class PreconditionFailedException(BaseHTTPException):
+    def __init__(self, detail: str = "El recurso ha sido modificado por otra petición") -> None:
+        super().__init__(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=detail,
+        )
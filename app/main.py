@@ -1,24 +1,42 @@
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.exceptions import RequestValidationError
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+from contextlib import asynccontextmanager
 import time
 from typing import Dict, Any
 
 from .core.config import settings  # Nota el punto antes de core
 from .core.database import engine
 from .models import Base
+from .core.admision import MiddlewareAdmision
+from .core.analitica import analitica_productos
+from .core.archivo import archivador_ingresos
+from .core.cambios import difusor_cambios
+from .core.catalogo_categorias import catalogo_categorias
+from .core.catalogo_compartido import catalogo_compartido
+from .core.claves import conjunto_claves
+from .core.coalescencia import MiddlewareCoalescencia
+from .core.compresion import ContenidoPrecomprimido, MiddlewareCompresion
+from .core.idempotencia import MiddlewareIdempotencia
+from .core.ingesta import escritor_ingresos
+from .core.instantanea import instantanea_catalogo
+from .core.metricas import metricas
+from .core.plazos import MiddlewarePlazos
+from .core.revocacion import lista_revocacion
+from .core.totales import totales_listados
+from .core.ultimo_login import registrador_ultimo_login
 from .exceptions import setup_exception_handlers
-from .routers import auth, usuarios, categorias, productos, registros
+from .routers import auth, usuarios, categorias, productos, registros, registrosdeingreso, catalogo, lotes
 
 # Inicialización de la base de datos
 Base.metadata.create_all(bind=engine)
 
 # Limiter para rate limiting
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_remote_address, enabled=settings.LIMITE_TASA_ACTIVO)
 
 # Descripción de la API
 descripcion_api = """
@@ -40,24 +58,42 @@ Esta API permite gestionar productos y categorías con una autenticación segura
 * Las operaciones de administración requieren privilegios de administrador
 """
 
+
+# Ciclo de vida: tareas de fondo que viven mientras la aplicación está en marcha
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    escritor_ingresos.iniciar()
+    registrador_ultimo_login.iniciar()
+    catalogo_categorias.iniciar()
+    lista_revocacion.sincronizar()
+    difusor_cambios.iniciar()
+    catalogo_compartido.iniciar()
+    if settings.INSTANTANEA_GENERAR:
+        instantanea_catalogo.iniciar()
+    totales_listados.iniciar()
+    analitica_productos.iniciar()
+    if settings.ARCHIVO_ACTIVO:
+        archivador_ingresos.iniciar()
+    yield
+    archivador_ingresos.detener()
+    analitica_productos.detener()
+    totales_listados.detener()
+    instantanea_catalogo.detener()
+    difusor_cambios.detener()
+    catalogo_categorias.detener()
+    registrador_ultimo_login.detener()
+    escritor_ingresos.detener()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version="1.0.0",
     description=descripcion_api,
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
-# Configuración de CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[str(origin) for origin in settings.BACKEND_CORS_ORIGINS],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
 # Middleware para logging y medición de rendimiento
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
@@ -68,6 +104,41 @@ async def add_process_time_header(request: Request, call_next):
     return response
 
 
+# Compresión dentro del control de admisión (su CPU ocupa una plaza) y de la coalescencia
+# (las peticiones agrupadas reciben el cuerpo ya comprimido del líder)
+if settings.COMPRESION_ACTIVA:
+    app.add_middleware(MiddlewareCompresion)
+
+# Control de admisión: bajo sobrecarga, rechaza pronto con 503 en lugar de encolar sin límite.
+# Rodea a la compresión y a la aplicación, así que rechazar no ejecuta nada de ellas; los
+# middlewares añadidos después (plazos, coalescencia, idempotencia, CORS) quedan por fuera.
+if settings.ADMISION_ACTIVA:
+    app.add_middleware(MiddlewareAdmision)
+
+# Reintentos de altas con la misma Idempotency-Key: se repite la respuesta guardada sin ocupar
+# una plaza del control de admisión; los duplicados simultáneos esperan fuera de él
+if settings.IDEMPOTENCIA_ACTIVA:
+    app.add_middleware(MiddlewareIdempotencia)
+
+# Lecturas idénticas simultáneas se resuelven con una sola ejecución, antes del control de admisión
+if settings.COALESCENCIA_ACTIVA:
+    app.add_middleware(MiddlewareCoalescencia)
+
+# Plazo por petición; envuelve al control de admisión para que la espera en cola cuente en el plazo
+app.add_middleware(MiddlewarePlazos)
+
+# Configuración de CORS. Se añade el último para ser el middleware más externo: las respuestas
+# que no llegan a la aplicación (503 de admisión, 504 de plazo, respuestas repetidas de la
+# idempotencia y la coalescencia) también llevan las cabeceras CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[str(origin) for origin in settings.BACKEND_CORS_ORIGINS],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
 # Configurar manejadores de excepciones
 setup_exception_handlers(app, debug=settings.DEBUG)
 
@@ -103,14 +174,13 @@ app.include_router(usuarios.router)
 app.include_router(categorias.router)
 app.include_router(productos.router)
 app.include_router(registros.router)
-#app.include_router(registrosdeingreso.router)
+app.include_router(registrosdeingreso.router)
+app.include_router(catalogo.router)
+app.include_router(lotes.router)
 
 
-# Página de bienvenida en la ruta principal
-@app.get("/", response_class=HTMLResponse)
-@limiter.limit("10/minute")
-async def root(request: Request):
-    html_content = """
+# Página de bienvenida en la ruta principal: no cambia, así que se comprime una vez al arrancar
+PAGINA_INICIO = """
     <!DOCTYPE html>
     <html>
         <head>
@@ -235,7 +305,13 @@ async def root(request: Request):
         </body>
     </html>
     """
-    return html_content
+pagina_inicio = ContenidoPrecomprimido(PAGINA_INICIO, "text/html; charset=utf-8")
+
+
+@app.get("/", response_class=HTMLResponse)
+@limiter.limit("10/minute")
+async def root(request: Request):
+    return pagina_inicio.respuesta(request)
 
 
 # Endpoint para verificar estado de la API
@@ -252,6 +328,36 @@ async def health_check(request: Request) -> Dict[str, Any]:
     }
 
 
+# Métricas del proceso en formato de texto de Prometheus
+@app.get("/metricas", tags=["sistema"], response_class=PlainTextResponse)
+async def exportar_metricas() -> PlainTextResponse:
+    """
+    Expone las métricas del proceso (control de admisión, colas) para Prometheus.
+    """
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4")
+
+
+# Claves públicas para que otros servicios verifiquen los tokens sin conocer el secreto de firma
+@app.get("/.well-known/jwks.json", tags=["sistema"])
+async def jwks(request: Request) -> Response:
+    """
+    Publica las claves públicas de verificación de tokens (JWKS).
+
+    Con HS256 la lista está vacía. Incluye también las claves retiradas que aún pueden
+    verificar tokens vigentes. Admite `If-None-Match` para revalidar la caché.
+    """
+    contenido, etag = conjunto_claves.jwks()
+    headers = {
+        "Cache-Control": f"public, max-age={settings.JWKS_CACHE_SEGUNDOS}",
+        "ETag": etag,
+    }
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content=contenido, media_type="application/json", headers=headers)
+
+
 # Si se ejecuta directamente
 if __name__ == "__main__":
     import uvicorn
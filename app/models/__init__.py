@@ -3,6 +3,12 @@ from .usuario import Usuario
 from .categoria import Categoria
 from .producto import Producto
 from .registro import Registro
+from .registroingreso import RegistroIngreso, RegistroIngresoArchivo, RegistroIngresoResumen
+from .tokenrefresco import TokenRefresco
+from .cambio import CambioCatalogo
+from .idempotencia import ClaveIdempotencia
+from .revocacion import RevocacionToken
 from ..core.database import Base
 
-__all__ = ["Usuario", "Categoria", "Producto", "Registro", "Base"]
\ No newline at end of file
+__all__ = ["Usuario", "Categoria", "Producto", "Registro", "RegistroIngreso", "RegistroIngresoArchivo",
+           "RegistroIngresoResumen", "TokenRefresco", "CambioCatalogo", "ClaveIdempotencia", "RevocacionToken", "Base"]
\ No newline at end of file
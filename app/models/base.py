@@ -4,4 +4,10 @@ from ..core.database import Base
 
 class BaseModel:
     id = Column(Integer, primary_key=True, index=True)
-    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class VersionadoModel:
+    # Versión de la fila para control de concurrencia optimista: cada PUT la incrementa y, con
+    # If-Match, solo escribe si no ha cambiado desde la lectura (ver app.core.versiones)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, String, Integer, Text
+from .base import BaseModel
+from ..core.database import Base
+
+
+class CambioCatalogo(Base, BaseModel):
+    """Registro de cambios de productos y categorías; el id es el número de secuencia del flujo SSE."""
+    __tablename__ = "cambios_catalogo"
+
+    entidad = Column(String(20), nullable=False)      # producto | categoria
+    entidad_id = Column(Integer, nullable=False)
+    operacion = Column(String(20), nullable=False)    # crear | actualizar | eliminar
+    datos = Column(Text, nullable=True)               # JSON compacto del recurso tras el cambio
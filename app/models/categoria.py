@@ -1,9 +1,9 @@
 from sqlalchemy import Column, String
 from sqlalchemy.orm import relationship
-from .base import BaseModel
+from .base import BaseModel, VersionadoModel
 from ..core.database import Base
 
-class Categoria(Base, BaseModel):
+class Categoria(Base, BaseModel, VersionadoModel):
     __tablename__ = "categorias"
 
     nombre = Column(String(50), nullable=False, unique=True)
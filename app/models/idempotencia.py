@@ -0,0 +1,17 @@
+# app/models/idempotencia.py
+from sqlalchemy import Column, String, Integer, Text, LargeBinary, DateTime
+from ..core.database import Base
+
+
+class ClaveIdempotencia(Base):
+    """Respuesta guardada de una petición con `Idempotency-Key` (almacén compartido entre workers)."""
+    __tablename__ = "claves_idempotencia"
+
+    # SHA-256 de método, ruta, credenciales y clave del cliente
+    clave = Column(String(64), primary_key=True)
+    huella = Column(String(64), nullable=False)       # SHA-256 del cuerpo de la petición
+    status = Column(Integer, nullable=True)           # NULL mientras la primera ejecución está en curso
+    cabeceras = Column(Text, nullable=True)           # JSON [[nombre, valor], ...]
+    cuerpo = Column(LargeBinary, nullable=True)
+    creada = Column(DateTime(timezone=True), nullable=False)
+    caduca = Column(DateTime(timezone=True), nullable=False, index=True)
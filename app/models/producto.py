@@ -1,9 +1,9 @@
 from sqlalchemy import Column, String, Integer, Boolean, ForeignKey
 from sqlalchemy.orm import relationship
-from .base import BaseModel
+from .base import BaseModel, VersionadoModel
 from ..core.database import Base
 
-class Producto(Base, BaseModel):
+class Producto(Base, BaseModel, VersionadoModel):
     __tablename__ = "productos"
 
     nombre = Column(String(100), nullable=False, index=True)
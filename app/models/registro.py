@@ -1,9 +1,9 @@
 # app/models/registro.py
 from sqlalchemy import Column, String, Integer
-from .base import BaseModel
+from .base import BaseModel, VersionadoModel
 from ..core.database import Base
 
-class Registro(Base, BaseModel):
+class Registro(Base, BaseModel, VersionadoModel):
     __tablename__ = "registros"
 
     documento = Column(Integer, nullable=False)
@@ -1,5 +1,5 @@
 # app/models/registroingreso.py
-from sqlalchemy import Column, String, Integer, DateTime
+from sqlalchemy import Column, String, Integer, DateTime, Index, UniqueConstraint
 from .base import BaseModel
 from ..core.database import Base
 
@@ -12,4 +12,41 @@ class RegistroIngreso(Base, BaseModel):
     nombre = Column(String(100), nullable=False)
     descripcion = Column(String(500), nullable=True)
     cantidad = Column(Integer, default=0)
-    fecha_ingreso = Column(DateTime(timezone=True), nullable=True)
\ No newline at end of file
+    fecha_ingreso = Column(DateTime(timezone=True), nullable=True)
+
+    # Índice compuesto para consultas por rango de fechas y paginación por (fecha_ingreso, id)
+    __table_args__ = (
+        Index("ix_registrosdeingreso_fecha_ingreso_id", "fecha_ingreso", "id"),
+    )
+
+
+class RegistroIngresoArchivo(Base, BaseModel):
+    """
+    Registros de ingreso anteriores a ARCHIVO_EDAD_DIAS, movidos desde `registrosdeingreso`.
+
+    Mismas columnas y mismos ids que en la tabla principal; las filas archivadas solo se leen.
+    """
+    __tablename__ = "registrosdeingreso_archivo"
+
+    nombre = Column(String(100), nullable=False)
+    descripcion = Column(String(500), nullable=True)
+    cantidad = Column(Integer, default=0)
+    fecha_ingreso = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_registrosdeingreso_archivo_fecha_ingreso_id", "fecha_ingreso", "id"),
+    )
+
+
+class RegistroIngresoResumen(Base, BaseModel):
+    """Totales pre-agregados de registros de ingreso por minuto, hora y día."""
+    __tablename__ = "registrosdeingreso_resumen"
+
+    granularidad = Column(String(10), nullable=False)
+    inicio = Column(DateTime, nullable=False)
+    total = Column(Integer, nullable=False, default=0)
+    suma_cantidad = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("granularidad", "inicio", name="uq_registrosdeingreso_resumen_bucket"),
+    )
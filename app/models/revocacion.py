@@ -0,0 +1,14 @@
+# app/models/revocacion.py
+from sqlalchemy import Column, String, Integer
+from ..core.database import Base
+
+
+class RevocacionToken(Base):
+    """Revocación de un token de acceso (jti) o de los tokens de un usuario, compartida entre workers."""
+    __tablename__ = "revocaciones_token"
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String(32), nullable=True)           # Token concreto (cierre de sesión)
+    username = Column(String(50), nullable=True)      # Todos los tokens del usuario emitidos antes de revocado_en
+    revocado_en = Column(Integer, nullable=False, index=True)  # Segundos desde la época
+    caduca = Column(Integer, nullable=False, index=True)       # Cuando ya no queda ningún token al que afecte
@@ -0,0 +1,14 @@
+# app/models/tokenrefresco.py
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey
+from .base import BaseModel
+from ..core.database import Base
+
+
+class TokenRefresco(Base, BaseModel):
+    __tablename__ = "tokens_refresco"
+
+    usuario_id = Column(Integer, ForeignKey("usuarios.id", ondelete="CASCADE"), nullable=False, index=True)
+    # Solo se guarda el hash SHA-256 del token; el valor en claro lo conoce únicamente el cliente
+    token_hash = Column(String(64), nullable=False, unique=True, index=True)
+    expira = Column(DateTime(timezone=True), nullable=False)
+    revocado = Column(Boolean, default=False, nullable=False)
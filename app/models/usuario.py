@@ -1,10 +1,10 @@
 from sqlalchemy import Column, String, Boolean, DateTime
 from sqlalchemy.orm import relationship
-from .base import BaseModel
+from .base import BaseModel, VersionadoModel
 from ..core.database import Base
 
 
-class Usuario(Base, BaseModel):
+class Usuario(Base, BaseModel, VersionadoModel):
     __tablename__ = "usuarios"
 
     email = Column(String(100), unique=True, index=True, nullable=False)
@@ -16,5 +16,8 @@ class Usuario(Base, BaseModel):
     is_admin = Column(Boolean, default=False)
     ultimo_login = Column(DateTime(timezone=True), nullable=True)
 
+    # Tokens de refresco emitidos al usuario (se eliminan junto con él)
+    tokens_refresco = relationship("TokenRefresco", cascade="all, delete-orphan", passive_deletes=True)
+
     # Relación con otros modelos si es necesario
     # productos = relationship("Producto", back_populates="usuario")
\ No newline at end of file
@@ -4,14 +4,21 @@ from .usuarios import router as usuarios_router
 from .categorias import router as categorias_router
 from .productos import router as productos_router
 from .registros import router as registros_router
+from .registrosdeingreso import router as registrosdeingreso_router
+from .catalogo import router as catalogo_router
+from .lotes import router as lotes_router
 
 # Exportar los routers para que sean fácilmente importables
-router = [auth_router, usuarios_router, categorias_router, productos_router, registros_router]
+router = [auth_router, usuarios_router, categorias_router, productos_router, registros_router,
+          registrosdeingreso_router, catalogo_router, lotes_router]
 
 __all__ = [
     "auth",
     "usuarios",
     "categorias",
     "productos",
-    "registros"
+    "registros",
+    "registrosdeingreso",
+    "catalogo",
+    "lotes"
 ]
\ No newline at end of file
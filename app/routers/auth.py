@@ -1,5 +1,7 @@
 from fastapi import APIRouter, Depends, status, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import false
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from slowapi import Limiter
@@ -8,18 +10,27 @@ from slowapi.util import get_remote_address
 from ..core.database import get_db
 from ..core.config import settings
 from ..core.security import (
+    oauth2_scheme,
     verify_password,
     get_password_hash,
-    create_access_token
+    create_access_token,
+    create_refresh_token,
+    hash_refresh_token,
+    decode_token,
+    user_token_claims
 )
+from ..core.intentos_login import bloqueo_login
+from ..core.revocacion import lista_revocacion
+from ..core.ultimo_login import registrador_ultimo_login
 from ..schemas.usuario import UsuarioCreate, Usuario
-from ..schemas.token import Token
+from ..schemas.token import Token, RefreshTokenRequest
 from ..models.usuario import Usuario as UsuarioModel
+from ..models.tokenrefresco import TokenRefresco as TokenRefrescoModel
 from ..exceptions import UnauthorizedException, BadRequestException
 from ..utils.validators import validate_password_strength, validate_username
 
 # Limiter para rate limiting
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_remote_address, enabled=settings.LIMITE_TASA_ACTIVO)
 
 router = APIRouter(
     prefix=f"{settings.API_V1_STR}/auth",
@@ -27,6 +38,32 @@ router = APIRouter(
 )
 
 
+def _emitir_tokens(db: Session, user: UsuarioModel) -> dict:
+    """Genera un token de acceso con los permisos del usuario y un token de refresco nuevo."""
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data=user_token_claims(user),
+        expires_delta=access_token_expires
+    )
+
+    # Guardar solo el hash del token de refresco
+    refresh_token, refresh_hash = create_refresh_token()
+    refresh_expires_at = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    db.add(TokenRefrescoModel(usuario_id=user.id, token_hash=refresh_hash, expira=refresh_expires_at))
+    db.commit()
+
+    # Calcular tiempo de expiración para incluirlo en la respuesta
+    expires_at = datetime.utcnow() + access_token_expires
+
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_at": expires_at,
+        "refresh_token": refresh_token,
+        "refresh_expires_at": refresh_expires_at
+    }
+
+
 @router.post("/login", response_model=Token)
 @limiter.limit("5/minute")
 async def login_for_access_token(
@@ -41,54 +78,106 @@ async def login_for_access_token(
     - **password**: Contraseña
 
     Retorna un token JWT que debe ser utilizado en el encabezado de autorización
-    para acceder a endpoints protegidos.
+    para acceder a endpoints protegidos. Tras varios fallos seguidos del mismo usuario
+    o de la misma IP responde 429 durante un tiempo creciente, sin comprobar la contraseña.
     """
     # Validar datos de entrada
     if not form_data.username or not form_data.password:
         raise BadRequestException("El nombre de usuario y la contraseña son obligatorios")
 
-    # Buscar usuario
+    # Rechazar usuarios e IPs bloqueados antes de consultar la base y de bcrypt
+    ip = get_remote_address(request)
+    bloqueo_login.comprobar(form_data.username, ip)
+
+    # Buscar usuario y liberar la conexión durante bcrypt (solo se reabre para guardar el token de refresco)
     user = db.query(UsuarioModel).filter(UsuarioModel.username == form_data.username).first()
+    db.close()
 
-    # Verificar usuario y contraseña
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    # Verificar usuario y contraseña (bcrypt en el pool de hilos para no bloquear el event loop)
+    if not user or not await run_in_threadpool(verify_password, form_data.password, user.hashed_password):
+        bloqueo_login.registrar_fallo(form_data.username, ip)
         raise UnauthorizedException("Usuario o contraseña incorrectos")
+    bloqueo_login.registrar_exito(form_data.username)
 
     # Verificar si el usuario está activo
     if not user.is_active:
         raise UnauthorizedException("Usuario inactivo")
 
-    # Generar token
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username},
-        expires_delta=access_token_expires
+    # Actualizar último login de forma diferida (se agrupa con otros logins en un único UPDATE)
+    registrador_ultimo_login.registrar(user.id, datetime.utcnow())
+
+    return _emitir_tokens(db, user)
+
+
+@router.post("/refresh", response_model=Token)
+@limiter.limit("30/minute")
+async def refrescar_token(
+        request: Request,
+        datos: RefreshTokenRequest,
+        db: Session = Depends(get_db)
+):
+    """
+    Emite un nuevo token de acceso a partir de un token de refresco, sin contraseña.
+
+    El token de refresco es de un solo uso: se revoca y se devuelve uno nuevo (rotación).
+    Si se presenta un token ya revocado, se revocan todos los tokens de refresco del
+    usuario, ya que indica que el token pudo ser robado.
+    """
+    resultado = (
+        db.query(TokenRefrescoModel, UsuarioModel)
+        .join(UsuarioModel, UsuarioModel.id == TokenRefrescoModel.usuario_id)
+        .filter(TokenRefrescoModel.token_hash == hash_refresh_token(datos.refresh_token))
+        .first()
     )
+    if resultado is None:
+        raise UnauthorizedException("Token de refresco inválido")
+
+    db_token, user = resultado
+
+    if not db_token.revocado:
+        if db_token.expira.replace(tzinfo=None) <= datetime.utcnow():
+            raise UnauthorizedException("Token de refresco expirado")
+
+        if not user.is_active:
+            raise UnauthorizedException("Usuario inactivo")
+
+        # Rotación: el token presentado deja de ser válido. El UPDATE es condicional para que,
+        # de dos refrescos simultáneos con el mismo token, solo uno lo revoque y obtenga tokens
+        revocados = db.query(TokenRefrescoModel).filter(
+            TokenRefrescoModel.token_hash == db_token.token_hash,
+            TokenRefrescoModel.revocado == false()
+        ).update({"revocado": True}, synchronize_session=False)
+        if revocados == 1:
+            return _emitir_tokens(db, user)
+
+    # Token ya usado (o usado a la vez por otra petición): se revocan todas las sesiones
+    db.query(TokenRefrescoModel).filter(
+        TokenRefrescoModel.usuario_id == user.id
+    ).update({"revocado": True}, synchronize_session=False)
+    lista_revocacion.revocar_usuario(user.username, db)
+    db.commit()
+    raise UnauthorizedException("Token de refresco reutilizado; se han revocado las sesiones del usuario")
 
-    try:
-        # Actualizar último login
-        db_user = db.query(UsuarioModel).filter(UsuarioModel.id == user.id).first()
-        if db_user:
-            db_user.ultimo_login = datetime.utcnow()
-            db.commit()
-        else:
-            # Si no se encuentra el usuario (esto no debería ocurrir normalmente)
-            # pero simplemente continuamos sin actualizar último_login
-            db.rollback()
-            print(f"ADVERTENCIA: No se pudo actualizar último_login porque el usuario con ID {user.id} no existe.")
-    except Exception as e:
-        db.rollback()
-        print(f"ERROR al actualizar último_login: {str(e)}")
-        # Continuar a pesar del error en la actualización de último_login
 
-    # Calcular tiempo de expiración para incluirlo en la respuesta
-    expires_at = datetime.utcnow() + access_token_expires
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def cerrar_sesion(
+        datos: RefreshTokenRequest,
+        token: str = Depends(oauth2_scheme),
+        db: Session = Depends(get_db)
+):
+    """
+    Cierra la sesión: revoca el token de refresco indicado y el token de acceso actual.
+    """
+    token_data = decode_token(token)
+    if token_data.jti:
+        lista_revocacion.revocar_token(token_data.jti, token_data.exp.timestamp(), db)
+
+    db.query(TokenRefrescoModel).filter(
+        TokenRefrescoModel.token_hash == hash_refresh_token(datos.refresh_token),
+        TokenRefrescoModel.usuario_id == token_data.uid
+    ).update({"revocado": True}, synchronize_session=False)
+    db.commit()
 
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "expires_at": expires_at
-    }
 
 @router.post("/registro", response_model=Usuario, status_code=status.HTTP_201_CREATED)
 @limiter.limit("3/minute")
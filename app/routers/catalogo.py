@@ -0,0 +1,75 @@
+from fastapi import APIRouter, Query, Request, Response, status
+from fastapi.responses import FileResponse
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+from ..core.compresion import elegir_codificacion
+from ..core.config import settings
+from ..core.instantanea import FORMATOS, instantanea_catalogo
+from ..exceptions import BadRequestException, ServiceUnavailableException
+
+# Limiter para rate limiting
+limiter = Limiter(key_func=get_remote_address, enabled=settings.LIMITE_TASA_ACTIVO)
+
+router = APIRouter(
+    prefix=f"{settings.API_V1_STR}/catalogo",
+    tags=["catálogo"]
+)
+
+
+def _coincide(if_none_match: str, etiqueta: str) -> bool:
+    """Comparación débil de `If-None-Match` (RFC 9110): se ignora el prefijo W/."""
+    valores = [valor.strip() for valor in if_none_match.split(",")]
+    return "*" in valores or etiqueta.removeprefix("W/") in (valor.removeprefix("W/") for valor in valores)
+
+
+@router.get("/snapshot", response_class=FileResponse)
+@limiter.limit("60/minute")
+async def instantanea(
+        request: Request,
+        formato: str = Query("json", description="json o, si está disponible, msgpack")
+):
+    """
+    Catálogo completo (categorías y productos) en un solo fichero.
+
+    Se genera en segundo plano tras cada cambio del catálogo, así que puede ir unos segundos
+    por detrás de los listados. La respuesta es
+    `{"version": ..., "categorias": [...], "productos": [...]}` con los mismos campos que los
+    listados; la categoría de cada producto se indica solo con `categoria_id`. Se sirve ya
+    comprimida según `Accept-Encoding`. Usar `If-None-Match` con el ETag recibido para
+    descargarla solo cuando cambie.
+    """
+    if formato not in FORMATOS:
+        raise BadRequestException(f"Formato no válido: {formato}. Disponibles: {', '.join(FORMATOS)}")
+
+    manifiesto = instantanea_catalogo.vigente()
+    if manifiesto is None or formato not in manifiesto["archivos"]:
+        raise ServiceUnavailableException("La instantánea del catálogo aún no está disponible", retry_after=5)
+
+    # Débil: las variantes comprimidas comparten ETag
+    etiqueta = f'W/"{manifiesto["version"]}-{formato}"'
+    headers = {
+        "ETag": etiqueta,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+        "X-Catalogo-Version": manifiesto["version"],
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and _coincide(if_none_match, etiqueta):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    variantes = manifiesto["archivos"][formato]
+    codificacion = elegir_codificacion(request.headers.get("accept-encoding"))
+    if codificacion is not None and codificacion in variantes:
+        headers["Content-Encoding"] = codificacion
+    else:
+        codificacion = "identity"
+
+    # FileResponse envía el fichero por bloques sin cargarlo en memoria, o con
+    # http.response.pathsend (sendfile) si el servidor ASGI lo admite
+    return FileResponse(
+        instantanea_catalogo.ruta(variantes[codificacion]),
+        media_type=FORMATOS[formato][0],
+        headers=headers,
+    )
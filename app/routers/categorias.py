@@ -1,24 +1,31 @@
-from fastapi import APIRouter, Depends, Query, Request
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Set
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
+from ..core.cambios import datos_categoria, difusor_cambios, registrar_cambio
+from ..core.catalogo_categorias import catalogo_categorias
 from ..core.database import get_db
 from ..core.config import settings
+from ..core.proyeccion import Proyeccion
 from ..core.security import get_current_admin_user
+from ..core.totales import modo_total, totales_listados
+from ..core.versiones import comprobar_version, etag, incrementar_version, versiones_if_match
 from ..schemas.categoria import Categoria, CategoriaCreate, CategoriaUpdate
 from ..models.categoria import Categoria as CategoriaModel
 from ..exceptions import NotFoundException, BadRequestException, ConflictException
 
 # Limiter para rate limiting
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_remote_address, enabled=settings.LIMITE_TASA_ACTIVO)
 
 router = APIRouter(
     prefix=f"{settings.API_V1_STR}/categorias",
     tags=["categorías"]
 )
 
+proyeccion_categorias = Proyeccion(CategoriaModel, Categoria)
+
 
 @router.post("/", response_model=Categoria, status_code=201)
 async def crear_categoria(
@@ -39,8 +46,12 @@ async def crear_categoria(
     # Crear categoría
     db_categoria = CategoriaModel(nombre=categoria.nombre)
     db.add(db_categoria)
+    db.flush()
+    registrar_cambio(db, "categoria", db_categoria.id, "crear", datos_categoria(db_categoria))
     db.commit()
+    difusor_cambios.notificar()
     db.refresh(db_categoria)
+    catalogo_categorias.guardar(db_categoria)
 
     return db_categoria
 
@@ -49,16 +60,27 @@ async def crear_categoria(
 @limiter.limit("30/minute")
 async def leer_categorias(
         request: Request,
+        response: Response,
         skip: int = Query(0, ge=0),
         limit: int = Query(settings.DEFAULT_LIMIT, le=settings.MAX_LIMIT),
+        fields: Optional[str] = Query(None, description="Campos a devolver separados por comas, p. ej. id,nombre"),
+        total: Optional[str] = Depends(modo_total),
         db: Session = Depends(get_db)
 ):
     """
     Obtiene la lista de categorías.
 
     Este endpoint es público y permite obtener todas las categorías.
-    Soporta paginación con los parámetros skip y limit.
+    Soporta paginación con los parámetros skip y limit, y `fields` para consultar
+    solo algunas columnas. Con `total` (exacto, cache o aproximado) la cabecera
+    `X-Total-Count` trae el número de categorías.
     """
+    totales_listados.poner(response, db, total, CategoriaModel)
+
+    if fields is not None:
+        query = proyeccion_categorias.consulta(db, fields, None)
+        return Proyeccion.respuesta(query.order_by(CategoriaModel.id).offset(skip).limit(limit).all())
+
     categorias = db.query(CategoriaModel).order_by(CategoriaModel.id).offset(skip).limit(limit).all()
     return categorias
 
@@ -66,6 +88,7 @@ async def leer_categorias(
 @router.get("/{categoria_id}", response_model=Categoria)
 async def leer_categoria(
         categoria_id: int,
+        response: Response,
         db: Session = Depends(get_db)
 ):
     """
@@ -78,6 +101,7 @@ async def leer_categoria(
     if db_categoria is None:
         raise NotFoundException("Categoría no encontrada")
 
+    response.headers["ETag"] = etag(db_categoria.version)
     return db_categoria
 
 
@@ -85,6 +109,8 @@ async def leer_categoria(
 async def actualizar_categoria(
         categoria_id: int,
         categoria: CategoriaUpdate,
+        response: Response,
+        versiones: Optional[Set[int]] = Depends(versiones_if_match),
         db: Session = Depends(get_db),
         current_user=Depends(get_current_admin_user)
 ):
@@ -92,11 +118,14 @@ async def actualizar_categoria(
     Actualiza una categoría existente (solo administradores).
 
     - **nombre**: Nuevo nombre de la categoría (2-50 caracteres)
+
+    Con `If-Match` solo se actualiza si la versión no ha cambiado; si no, responde 412.
     """
     # Verificar si la categoría existe
     db_categoria = db.query(CategoriaModel).filter(CategoriaModel.id == categoria_id).first()
     if db_categoria is None:
         raise NotFoundException("Categoría no encontrada")
+    comprobar_version(db_categoria, versiones)
 
     # Verificar si el nuevo nombre ya existe en otra categoría
     if categoria.nombre and categoria.nombre != db_categoria.nombre:
@@ -108,9 +137,14 @@ async def actualizar_categoria(
     if categoria.nombre:
         db_categoria.nombre = categoria.nombre
 
+    incrementar_version(db, db_categoria, versiones)
+    registrar_cambio(db, "categoria", categoria_id, "actualizar", datos_categoria(db_categoria))
     db.commit()
+    difusor_cambios.notificar()
     db.refresh(db_categoria)
+    catalogo_categorias.guardar(db_categoria)
 
+    response.headers["ETag"] = etag(db_categoria.version)
     return db_categoria
 
 
@@ -130,7 +164,13 @@ async def eliminar_categoria(
     if db_categoria is None:
         raise NotFoundException("Categoría no encontrada")
 
+    # Los productos de la categoría se borran en cascada: cada uno genera su propio evento
+    for db_producto in db_categoria.productos:
+        registrar_cambio(db, "producto", db_producto.id, "eliminar")
     db.delete(db_categoria)
+    registrar_cambio(db, "categoria", categoria_id, "eliminar")
     db.commit()
+    difusor_cambios.notificar()
+    catalogo_categorias.eliminar(categoria_id)
 
     return db_categoria
\ No newline at end of file
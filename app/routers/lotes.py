@@ -0,0 +1,95 @@
+from fastapi import APIRouter, Depends, Request
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+from ..core.config import settings
+from ..core.database import sesion_lote
+from ..core.lotes import (
+    ReferenciaInvalida, confirmar_lote, deshacer_operacion, ejecutar_operacion, resolver_referencias,
+    resolver_ruta, sesion_de_lote
+)
+from ..core.security import get_current_user, oauth2_scheme, usuarios_lote
+from ..schemas.lote import LoteCreate, ResultadoLote, ResultadoOperacion
+from ..exceptions import ForbiddenException
+
+# Limiter para rate limiting
+limiter = Limiter(key_func=get_remote_address, enabled=settings.LIMITE_TASA_ACTIVO)
+
+router = APIRouter(
+    prefix=f"{settings.API_V1_STR}/batch",
+    tags=["lotes"]
+)
+
+
+@router.post("", response_model=ResultadoLote)
+@limiter.limit("60/minute")
+async def ejecutar_lote(
+        request: Request,
+        lote: LoteCreate,
+        token: str = Depends(oauth2_scheme)
+):
+    """
+    Ejecuta varias operaciones de la API en orden, con una sola autenticación y una sola sesión.
+
+    - **operaciones**: Lista de `{metodo, ruta, cuerpo, cabeceras}`, con la ruta relativa a
+      /api/v1 (p. ej. `/productos/` o `/productos/5?fields=id`). Cada operación se valida y se
+      autoriza como si llegara sola, con el mismo token.
+    - **transaccion**: Con True, todas o ninguna: la primera operación con error (4xx o 5xx)
+      deshace las anteriores y las siguientes no se ejecutan (status 424). Con False (por
+      defecto), cada operación se confirma por su cuenta y un error no detiene el resto.
+
+    Un valor `"$N.campo"` en el cuerpo, o `{$N.campo}` en la ruta, toma el campo de la
+    respuesta de la operación N (desde 0); p. ej. crear una categoría y sus productos con
+    `"categoria_id": "$0.id"`. Responde 200 con el resultado de cada operación.
+    """
+    with sesion_de_lote(lote.transaccion) as db:
+        # Las operaciones toman esta sesión y este usuario de get_db y get_current_user
+        token_sesion = sesion_lote.set(db)
+        token_usuarios = usuarios_lote.set({})
+        try:
+            usuario = await get_current_user(token, db)
+            if not usuario.is_active:
+                raise ForbiddenException("Usuario inactivo")
+            # Fuera de la sesión, los commit de las operaciones no lo expiran ni obligan a recargarlo
+            db.expunge(usuario)
+
+            resultados = []
+            cuerpos = []  # Respuesta de cada operación correcta, para las referencias "$N.campo"
+            fallida = None
+            for i, operacion in enumerate(lote.operaciones):
+                if fallida is not None:
+                    resultados.append(ResultadoOperacion(
+                        status=424, cuerpo={"detail": f"No se ejecutó: falló la operación {fallida}"}
+                    ))
+                    cuerpos.append(None)
+                    continue
+
+                try:
+                    ruta = resolver_ruta(operacion.ruta, cuerpos)
+                    cuerpo = resolver_referencias(operacion.cuerpo, cuerpos)
+                except ReferenciaInvalida as e:
+                    status, cabeceras, respuesta = 400, {}, {"detail": str(e)}
+                else:
+                    try:
+                        status, cabeceras, respuesta = await ejecutar_operacion(
+                            request.app, request.scope, request.receive, operacion.metodo, ruta, cuerpo,
+                            operacion.cabeceras
+                        )
+                    except Exception as e:
+                        print(f"ERROR en la operación {i} de un lote: {str(e)}")
+                        status, cabeceras, respuesta = 500, {}, {"detail": "Error interno del servidor"}
+
+                resultados.append(ResultadoOperacion(status=status, cuerpo=respuesta, cabeceras=cabeceras))
+                correcta = status < 400
+                cuerpos.append(respuesta if correcta else None)
+                if not correcta:
+                    deshacer_operacion(db)
+                    if lote.transaccion:
+                        fallida = i
+
+            if lote.transaccion and fallida is None:
+                confirmar_lote(db)
+            return ResultadoLote(confirmado=fallida is None or not lote.transaccion, resultados=resultados)
+        finally:
+            usuarios_lote.reset(token_usuarios)
+            sesion_lote.reset(token_sesion)
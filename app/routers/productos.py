@@ -1,25 +1,60 @@
-from fastapi import APIRouter, Depends, Query, Request
+from fastapi import APIRouter, Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import case, update
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List, Optional, Set
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
+from ..core.analitica import analitica_productos
+from ..core.cambios import datos_producto, difusor_cambios, registrar_cambio
+from ..core.catalogo_categorias import catalogo_categorias
+from ..core.catalogo_compartido import catalogo_compartido
 from ..core.database import get_db
 from ..core.config import settings
-from ..core.security import get_current_admin_user
-from ..schemas.producto import Producto, ProductoCreate, ProductoUpdate
+from ..core.exportacion import FormatoExportacion, comprobar_disponible, exportar, respuesta_exportacion
+from ..core.proyeccion import Expansion, Proyeccion
+from ..core.security import get_current_active_user, get_current_admin_user
+from ..core.totales import modo_total, totales_listados
+from ..core.versiones import comprobar_version, etag, incrementar_version, versiones_if_match
+from ..schemas.categoria import Categoria
+from ..schemas.producto import (
+    AnaliticaProductos, Producto, ProductoCreate, ProductoUpdate, ReservaCreate, ReservaLote, ResultadoReserva, ResultadoReservaLote
+)
 from ..models.producto import Producto as ProductoModel
 from ..models.categoria import Categoria as CategoriaModel
-from ..exceptions import NotFoundException, BadRequestException
+from ..exceptions import NotFoundException, BadRequestException, ConflictException
 
 # Limiter para rate limiting
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_remote_address, enabled=settings.LIMITE_TASA_ACTIVO)
 
 router = APIRouter(
     prefix=f"{settings.API_V1_STR}/productos",
     tags=["productos"]
 )
 
+proyeccion_productos = Proyeccion(ProductoModel, Producto, {
+    "categoria": Expansion(CategoriaModel, ProductoModel.categoria_id == CategoriaModel.id, Categoria),
+})
+
+
+def _respuesta_producto(db_producto: ProductoModel) -> Dict:
+    """
+    Producto con su categoría tomada de las categorías en memoria, sin consultar la base.
+
+    Solo si la categoría aún no ha llegado a este worker se carga la relación desde la base.
+    """
+    datos = {columna.key: getattr(db_producto, columna.key) for columna in ProductoModel.__table__.columns}
+    datos["categoria"] = catalogo_categorias.obtener(db_producto.categoria_id) or db_producto.categoria
+    return datos
+
+
+def _con_categoria(producto: Dict) -> Optional[Dict]:
+    """Producto del catálogo compartido con su categoría en memoria, o None si la categoría no está."""
+    producto["categoria"] = catalogo_categorias.obtener(producto["categoria_id"])
+    return producto if producto["categoria"] is not None else None
+
 
 @router.post("/", response_model=Producto, status_code=201)
 async def crear_producto(
@@ -38,25 +73,31 @@ async def crear_producto(
     - **categoria_id**: ID de la categoría a la que pertenece el producto
     """
     # Verificar si la categoría existe
-    categoria = db.query(CategoriaModel).filter(CategoriaModel.id == producto.categoria_id).first()
-    if not categoria:
+    if not catalogo_categorias.existe(db, producto.categoria_id):
         raise BadRequestException(f"No existe categoría con ID {producto.categoria_id}")
 
     # Crear producto
     db_producto = ProductoModel(**producto.dict())
     db.add(db_producto)
+    db.flush()
+    registrar_cambio(db, "producto", db_producto.id, "crear", datos_producto(db_producto))
     db.commit()
+    difusor_cambios.notificar()
     db.refresh(db_producto)
 
-    return db_producto
+    return _respuesta_producto(db_producto)
 
 
 @router.get("/", response_model=List[Producto])
 @limiter.limit("30/minute")
 async def leer_productos(
         request: Request,
+        response: Response,
         skip: int = Query(0, ge=0),
         limit: int = Query(settings.DEFAULT_LIMIT, le=settings.MAX_LIMIT),
+        fields: Optional[str] = Query(None, description="Campos a devolver separados por comas, p. ej. id,nombre,precio"),
+        expand: Optional[str] = Query(None, description="Relaciones a incluir: categoria"),
+        total: Optional[str] = Depends(modo_total),
         db: Session = Depends(get_db)
 ):
     """
@@ -64,14 +105,105 @@ async def leer_productos(
 
     Este endpoint es público y permite obtener todos los productos.
     Soporta paginación con los parámetros skip y limit.
+
+    Con `fields` o `expand` solo se consultan las columnas pedidas y la categoría se
+    incluye únicamente si se indica `expand=categoria`.
+
+    Con `total` (exacto, cache o aproximado) la cabecera `X-Total-Count` trae el número de
+    productos y `X-Total-Count-Modo` el modo con el que se calculó.
     """
+    totales_listados.poner(response, db, total, ProductoModel)
+
+    if fields is not None or expand is not None:
+        query = proyeccion_productos.consulta(db, fields, expand)
+        return Proyeccion.respuesta(query.order_by(ProductoModel.id).offset(skip).limit(limit).all())
+
+    pagina = catalogo_compartido.pagina(skip, limit)
+    if pagina is not None:
+        respuesta = [_con_categoria(producto) for producto in pagina]
+        if all(producto is not None for producto in respuesta):
+            return respuesta
+
     productos = db.query(ProductoModel).order_by(ProductoModel.id).offset(skip).limit(limit).all()
-    return productos
+    return [_respuesta_producto(db_producto) for db_producto in productos]
+
+
+@router.get("/analitica", response_model=AnaliticaProductos)
+@limiter.limit("30/minute")
+async def analitica(
+        request: Request,
+        percentiles: str = Query("25,50,75,90,99", description="Percentiles de precio separados por comas (0-100)"),
+        intervalos: int = Query(10, ge=1, le=100, description="Tramos del histograma de precios"),
+        categoria_id: Optional[int] = Query(None, gt=0, description="Solo esta categoría"),
+        current_user=Depends(get_current_admin_user)
+):
+    """
+    Estadísticas de precio y stock de todos los productos y de cada categoría (solo administradores).
+
+    Para el conjunto y para cada categoría devuelve el número de productos, el precio medio,
+    mínimo y máximo, los `percentiles` de precio pedidos, el histograma de precios en
+    `intervalos` tramos (los mismos para todas las categorías), el stock total y los productos
+    sin stock y su proporción. Se calcula en memoria sobre una copia de las columnas de los
+    productos que refleja las escrituras con un retraso de hasta CAMBIOS_INTERVALO. Requiere
+    NumPy en el servidor.
+    """
+    try:
+        valores = [float(valor) for valor in percentiles.split(",") if valor.strip()]
+    except ValueError:
+        raise BadRequestException("percentiles debe ser una lista de números separados por comas")
+    if not valores or any(not 0 <= valor <= 100 for valor in valores):
+        raise BadRequestException("Los percentiles deben estar entre 0 y 100")
+
+    return analitica_productos.calcular(valores, intervalos, categoria_id)
+
+
+@router.get("/export", response_class=StreamingResponse)
+@limiter.limit("5/minute")
+async def exportar_productos(
+        request: Request,
+        formato: FormatoExportacion = Query("arrow", alias="format", description="arrow (flujo IPC) o parquet"),
+        current_user=Depends(get_current_admin_user)
+):
+    """
+    Exporta todos los productos en formato columnar (solo administradores).
+
+    Con `format=arrow` se envía un flujo IPC de Arrow y con `format=parquet` un fichero
+    Parquet, leyendo la tabla por lotes de EXPORTACION_LOTE filas. Requiere pyarrow en el
+    servidor.
+    """
+    comprobar_disponible()
+    return respuesta_exportacion("productos", formato, exportar((ProductoModel,), formato))
+
+
+@router.get("/cambios", response_class=StreamingResponse)
+async def flujo_cambios(
+        desde: Optional[int] = Query(None, ge=0, description="Id del último evento recibido"),
+        last_event_id: Optional[str] = Header(None)
+):
+    """
+    Flujo Server-Sent Events con los cambios de productos y categorías.
+
+    Cada evento (`producto` o `categoria`) lleva como id su número de secuencia y como datos
+    `{"operacion": "crear|actualizar|eliminar", "id": ..., "datos": {...}}`. Para reanudar sin
+    perder cambios, el cliente envía el último id recibido en `Last-Event-ID` (EventSource lo
+    hace al reconectar) o en `desde`. Si esos cambios ya no están disponibles se envía un
+    evento `reinicio` y el cliente debe recargar el catálogo. Cada pocos segundos se envía
+    un comentario de latido.
+    """
+    if last_event_id is not None and last_event_id.isdigit():
+        desde = int(last_event_id)
+
+    return StreamingResponse(
+        difusor_cambios.suscribir(desde),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/{producto_id}", response_model=Producto)
 async def leer_producto(
         producto_id: int,
+        response: Response,
         db: Session = Depends(get_db)
 ):
     """
@@ -80,17 +212,25 @@ async def leer_producto(
     Este endpoint es público y permite obtener la información de un producto
     por su ID.
     """
+    producto = catalogo_compartido.obtener(producto_id)
+    if producto is not None and _con_categoria(producto) is not None:
+        response.headers["ETag"] = etag(producto["version"])
+        return producto
+
     db_producto = db.query(ProductoModel).filter(ProductoModel.id == producto_id).first()
     if db_producto is None:
         raise NotFoundException("Producto no encontrado")
 
-    return db_producto
+    response.headers["ETag"] = etag(db_producto.version)
+    return _respuesta_producto(db_producto)
 
 
 @router.put("/{producto_id}", response_model=Producto)
 async def actualizar_producto(
         producto_id: int,
         producto: ProductoUpdate,
+        response: Response,
+        versiones: Optional[Set[int]] = Depends(versiones_if_match),
         db: Session = Depends(get_db),
         current_user=Depends(get_current_admin_user)
 ):
@@ -104,16 +244,19 @@ async def actualizar_producto(
     - **disponible**: Estado de disponibilidad
     - **stock**: Cantidad disponible
     - **categoria_id**: ID de la categoría a la que pertenece el producto
+
+    Con `If-Match` (el ETag de la última lectura) solo se actualiza si nadie lo ha modificado
+    desde entonces; si no, responde 412.
     """
     # Verificar si el producto existe
     db_producto = db.query(ProductoModel).filter(ProductoModel.id == producto_id).first()
     if db_producto is None:
         raise NotFoundException("Producto no encontrado")
+    comprobar_version(db_producto, versiones)
 
     # Verificar si la categoría existe si se está actualizando
     if producto.categoria_id is not None:
-        categoria = db.query(CategoriaModel).filter(CategoriaModel.id == producto.categoria_id).first()
-        if not categoria:
+        if not catalogo_categorias.existe(db, producto.categoria_id):
             raise BadRequestException(f"No existe categoría con ID {producto.categoria_id}")
 
     # Actualizar los campos proporcionados
@@ -122,10 +265,14 @@ async def actualizar_producto(
     for key, value in update_data.items():
         setattr(db_producto, key, value)
 
+    incrementar_version(db, db_producto, versiones)
+    registrar_cambio(db, "producto", producto_id, "actualizar", datos_producto(db_producto))
     db.commit()
+    difusor_cambios.notificar()
     db.refresh(db_producto)
 
-    return db_producto
+    response.headers["ETag"] = etag(db_producto.version)
+    return _respuesta_producto(db_producto)
 
 
 @router.delete("/{producto_id}", response_model=Producto)
@@ -143,7 +290,117 @@ async def eliminar_producto(
     if db_producto is None:
         raise NotFoundException("Producto no encontrado")
 
+    # La respuesta se prepara antes de borrar: tras el commit el producto queda desasociado
+    # de la sesión y, si la categoría no estuviera en memoria, no podría cargarse
+    respuesta = _respuesta_producto(db_producto)
     db.delete(db_producto)
+    registrar_cambio(db, "producto", producto_id, "eliminar")
+    db.commit()
+    difusor_cambios.notificar()
+
+    return respuesta
+
+
+def _reservar(db: Session, cantidades: Dict[int, int]) -> Dict[int, Row]:
+    """
+    Descuenta el stock de varios productos con un único UPDATE condicional.
+
+    Cada fila solo se actualiza si tiene stock suficiente (`stock >= cantidad`), así que
+    dos reservas simultáneas nunca pierden actualizaciones ni dejan stock negativo. Los ids
+    van ordenados para que el motor bloquee las filas siempre en el mismo orden y dos lotes
+    concurrentes no puedan interbloquearse. Devuelve las filas actualizadas por id.
+    """
+    ids = sorted(cantidades)
+    cantidad = case(cantidades, value=ProductoModel.id)
+    filas = db.execute(
+        update(ProductoModel)
+        .where(ProductoModel.id.in_(ids), ProductoModel.stock >= cantidad)
+        .values(stock=ProductoModel.stock - cantidad, version=ProductoModel.version + 1)
+        .returning(*ProductoModel.__table__.c)
+        .execution_options(synchronize_session=False)
+    ).all()
+    return {fila.id: fila for fila in filas}
+
+
+@router.post("/reservar", response_model=ResultadoReservaLote)
+async def reservar_stock_lote(
+        reserva: ReservaLote,
+        db: Session = Depends(get_db),
+        current_user=Depends(get_current_active_user)
+):
+    """
+    Reserva stock de varios productos en una sola transacción.
+
+    - **items**: Productos y cantidades (las cantidades de un mismo producto se suman)
+    - **todo_o_nada**: Si falta stock de algún producto no se reserva ninguno (por defecto: True);
+      con False se reservan los que tengan stock suficiente
+
+    La respuesta indica qué productos se reservaron y, para el resto, el motivo.
+    """
+    cantidades: Dict[int, int] = {}
+    for item in reserva.items:
+        cantidades[item.producto_id] = cantidades.get(item.producto_id, 0) + item.cantidad
+
+    reservadas = _reservar(db, cantidades)
+    fallidos = [producto_id for producto_id in cantidades if producto_id not in reservadas]
+    existentes = set()
+    if fallidos:
+        existentes = {
+            producto_id for (producto_id,) in
+            db.query(ProductoModel.id).filter(ProductoModel.id.in_(fallidos))
+        }
+
+    cancelado = bool(fallidos) and reserva.todo_o_nada
+    if cancelado:
+        db.rollback()
+    elif reservadas:
+        for producto_id, fila in reservadas.items():
+            registrar_cambio(db, "producto", producto_id, "actualizar", datos_producto(fila))
+        db.commit()
+        difusor_cambios.notificar()
+
+    items = []
+    for producto_id in sorted(cantidades):
+        fila = reservadas.get(producto_id)
+        if fila is not None and not cancelado:
+            items.append(ResultadoReserva(producto_id=producto_id, cantidad=cantidades[producto_id],
+                                          reservado=True, stock=fila.stock))
+            continue
+        if fila is not None:
+            motivo = "lote_cancelado"
+        elif producto_id in existentes:
+            motivo = "stock_insuficiente"
+        else:
+            motivo = "no_encontrado"
+        items.append(ResultadoReserva(producto_id=producto_id, cantidad=cantidades[producto_id],
+                                      reservado=False, motivo=motivo))
+
+    return ResultadoReservaLote(reservado=not fallidos, items=items)
+
+
+@router.post("/{producto_id}/reservar", response_model=ResultadoReserva)
+async def reservar_stock(
+        producto_id: int,
+        reserva: ReservaCreate,
+        db: Session = Depends(get_db),
+        current_user=Depends(get_current_active_user)
+):
+    """
+    Reserva stock de un producto de forma atómica.
+
+    - **cantidad**: Unidades a descontar (mayor que 0)
+
+    Responde 409 si no hay stock suficiente; en ese caso el stock no cambia.
+    """
+    fila = _reservar(db, {producto_id: reserva.cantidad}).get(producto_id)
+    if fila is None:
+        db.rollback()
+        if db.query(ProductoModel.id).filter(ProductoModel.id == producto_id).first() is None:
+            raise NotFoundException("Producto no encontrado")
+        raise ConflictException("Stock insuficiente")
+
+    registrar_cambio(db, "producto", producto_id, "actualizar", datos_producto(fila))
     db.commit()
+    difusor_cambios.notificar()
 
-    return db_producto
\ No newline at end of file
+    return ResultadoReserva(producto_id=producto_id, cantidad=reserva.cantidad, reservado=True, stock=fila.stock)
@@ -1,25 +1,32 @@
 # app/routers/registros.py
-from fastapi import APIRouter, Depends, Query, Request
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Set
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
 from ..core.database import get_db
 from ..core.config import settings
+from ..core.exportacion import FormatoExportacion, comprobar_disponible, exportar, respuesta_exportacion
+from ..core.proyeccion import Proyeccion
 from ..core.security import get_current_admin_user
+from ..core.totales import modo_total, totales_listados
+from ..core.versiones import comprobar_version, etag, incrementar_version, versiones_if_match
 from ..schemas.registro import Registro, RegistroCreate, RegistroUpdate
 from ..models.registro import Registro as RegistroModel
 from ..exceptions import NotFoundException, BadRequestException
 
 # Limiter para rate limiting
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_remote_address, enabled=settings.LIMITE_TASA_ACTIVO)
 
 router = APIRouter(
     prefix=f"{settings.API_V1_STR}/registros",
     tags=["registros"]
 )
 
+proyeccion_registros = Proyeccion(RegistroModel, Registro)
+
 @router.post("/", response_model=Registro, status_code=201)
 async def crear_registro(
         registro: RegistroCreate,
@@ -44,22 +51,51 @@ async def crear_registro(
 @limiter.limit("30/minute")
 async def leer_registros(
         request: Request,
+        response: Response,
         skip: int = Query(0, ge=0),
         limit: int = Query(settings.DEFAULT_LIMIT, le=settings.MAX_LIMIT),
+        fields: Optional[str] = Query(None, description="Campos a devolver separados por comas, p. ej. id,documento"),
+        total: Optional[str] = Depends(modo_total),
         db: Session = Depends(get_db)
 ):
     """
     Obtiene la lista de registros.
 
     Este endpoint es público y permite obtener todos los registros.
-    Soporta paginación con los parámetros skip y limit.
+    Soporta paginación con los parámetros skip y limit, y `fields` para consultar
+    solo algunas columnas. Con `total` (exacto, cache o aproximado) la cabecera
+    `X-Total-Count` trae el número de registros.
     """
+    totales_listados.poner(response, db, total, RegistroModel)
+
+    if fields is not None:
+        query = proyeccion_registros.consulta(db, fields, None)
+        return Proyeccion.respuesta(query.order_by(RegistroModel.id).offset(skip).limit(limit).all())
+
     registros = db.query(RegistroModel).order_by(RegistroModel.id).offset(skip).limit(limit).all()
     return registros
 
+@router.get("/export", response_class=StreamingResponse)
+@limiter.limit("5/minute")
+async def exportar_registros(
+        request: Request,
+        formato: FormatoExportacion = Query("arrow", alias="format", description="arrow (flujo IPC) o parquet"),
+        current_user=Depends(get_current_admin_user)
+):
+    """
+    Exporta todos los registros en formato columnar (solo administradores).
+
+    Con `format=arrow` se envía un flujo IPC de Arrow y con `format=parquet` un fichero
+    Parquet. Requiere pyarrow en el servidor.
+    """
+    comprobar_disponible()
+    return respuesta_exportacion("registros", formato, exportar((RegistroModel,), formato))
+
+
 @router.get("/{registro_id}", response_model=Registro)
 async def leer_registro(
         registro_id: int,
+        response: Response,
         db: Session = Depends(get_db)
 ):
     """
@@ -72,12 +108,15 @@ async def leer_registro(
     if db_registro is None:
         raise NotFoundException("Registro no encontrado")
 
+    response.headers["ETag"] = etag(db_registro.version)
     return db_registro
 
 @router.put("/{registro_id}", response_model=Registro)
 async def actualizar_registro(
         registro_id: int,
         registro: RegistroUpdate,
+        response: Response,
+        versiones: Optional[Set[int]] = Depends(versiones_if_match),
         db: Session = Depends(get_db),
         current_user=Depends(get_current_admin_user)
 ):
@@ -87,11 +126,14 @@ async def actualizar_registro(
     Permite actualizar cualquiera de los campos del registro:
     - **documento**: Número de documento (entero positivo)
     - **nombre**: Nombre asociado al registro (2-100 caracteres)
+
+    Con `If-Match` solo se actualiza si la versión no ha cambiado; si no, responde 412.
     """
     # Verificar si el registro existe
     db_registro = db.query(RegistroModel).filter(RegistroModel.id == registro_id).first()
     if db_registro is None:
         raise NotFoundException("Registro no encontrado")
+    comprobar_version(db_registro, versiones)
 
     # Actualizar los campos proporcionados
     update_data = registro.dict(exclude_unset=True)
@@ -99,9 +141,11 @@ async def actualizar_registro(
     for key, value in update_data.items():
         setattr(db_registro, key, value)
 
+    incrementar_version(db, db_registro, versiones)
     db.commit()
     db.refresh(db_registro)
 
+    response.headers["ETag"] = etag(db_registro.version)
     return db_registro
 
 @router.delete("/{registro_id}", response_model=Registro)
@@ -1,32 +1,153 @@
 # app/routers/registrosdeingreso.py
-from fastapi import APIRouter, Depends, Query, Request
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Dict, Any, Literal, Tuple
+from datetime import datetime
+from pydantic import TypeAdapter, ValidationError
+from pydantic_core import from_json
+import base64
+import binascii
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
 from ..core.database import get_db
 from ..core.config import settings
 from ..core.security import get_current_admin_user
-from ..schemas.registroingreso import RegistroIngreso, RegistroIngresoCreate, RegistroIngresoUpdate
+from ..core.exportacion import FormatoExportacion, comprobar_disponible, exportar, respuesta_exportacion
+from ..core.totales import modo_total, totales_listados
+from ..core.ingesta import escritor_ingresos
+from ..core.archivo import archivador_ingresos, leer_con_archivo
+from ..core.agregados import (
+    GRANULARIDADES,
+    normalizar_fecha,
+    calcular_deltas,
+    aplicar_deltas,
+    consultar_agregados,
+    reconstruir_resumen
+)
+from ..schemas.registroingreso import (
+    RegistroIngreso, RegistroIngresoCreate, RegistroIngresoUpdate, IngestaRespuesta, AgregadoIngreso, EstadoArchivo
+)
 from ..models.registroingreso import RegistroIngreso as RegistroIngresoModel
-from ..exceptions import NotFoundException, BadRequestException
+from ..models.registroingreso import RegistroIngresoArchivo as RegistroIngresoArchivoModel
+from ..exceptions import NotFoundException, BadRequestException, ServiceUnavailableException
 
 # Limiter para rate limiting
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_remote_address, enabled=settings.LIMITE_TASA_ACTIVO)
 
 router = APIRouter(
     prefix=f"{settings.API_V1_STR}/registros-ingreso",
     tags=["registros de ingreso"]
 )
 
+# Validador de lotes en formato JSON (se valida directamente desde los bytes del cuerpo)
+lote_registros_adapter = TypeAdapter(List[RegistroIngresoCreate])
+
+
+def _lote_demasiado_grande() -> BadRequestException:
+    return BadRequestException(
+        f"El lote supera el máximo de {settings.INGESTA_MAX_POR_SOLICITUD} registros por solicitud"
+    )
+
+
+async def _fragmentos(request: Request):
+    """Fragmentos del cuerpo; responde 400 en cuanto supera INGESTA_MAX_BYTES, sin leer el resto."""
+    error = BadRequestException(f"El lote supera el máximo de {settings.INGESTA_MAX_BYTES} bytes por solicitud")
+    longitud = request.headers.get("content-length", "")
+    if longitud.isdigit() and int(longitud) > settings.INGESTA_MAX_BYTES:
+        raise error
+
+    leidos = 0
+    async for fragmento in request.stream():
+        leidos += len(fragmento)
+        if leidos > settings.INGESTA_MAX_BYTES:
+            raise error
+        yield fragmento
+
+
+async def _leer_json(request: Request) -> List[RegistroIngresoCreate]:
+    """Lee un arreglo JSON y comprueba el número de registros antes de validarlos."""
+    cuerpo = b"".join([fragmento async for fragmento in _fragmentos(request)])
+    try:
+        datos = from_json(cuerpo)
+    except ValueError:
+        # JSON mal formado: el validador produce el mismo error detallado que antes (422)
+        return lote_registros_adapter.validate_json(cuerpo)
+    if isinstance(datos, list) and len(datos) > settings.INGESTA_MAX_POR_SOLICITUD:
+        raise _lote_demasiado_grande()
+    return lote_registros_adapter.validate_python(datos)
+
+
+async def _leer_ndjson(request: Request) -> List[RegistroIngresoCreate]:
+    """
+    Lee y valida un cuerpo NDJSON línea a línea a medida que llega.
+
+    Al pasar de INGESTA_MAX_POR_SOLICITUD registros o de INGESTA_MAX_LINEA bytes en una línea
+    responde 400 sin leer ni validar el resto.
+    """
+    registros: List[RegistroIngresoCreate] = []
+    resto = b""
+    numero_linea = 0
+
+    async for fragmento in _fragmentos(request):
+        lineas = (resto + fragmento).split(b"\n")
+        resto = lineas.pop()
+        for linea in lineas:
+            numero_linea += 1
+            _agregar_linea(registros, linea, numero_linea)
+        if len(resto) > settings.INGESTA_MAX_LINEA:
+            _agregar_linea(registros, resto, numero_linea + 1)
+
+    numero_linea += 1
+    _agregar_linea(registros, resto, numero_linea)
+    return registros
+
+
+def _agregar_linea(registros: List[RegistroIngresoCreate], linea: bytes, numero_linea: int) -> None:
+    if len(linea) > settings.INGESTA_MAX_LINEA:
+        raise BadRequestException(f"Línea {numero_linea} supera el máximo de {settings.INGESTA_MAX_LINEA} bytes")
+    if not linea.strip():
+        return
+    if len(registros) >= settings.INGESTA_MAX_POR_SOLICITUD:
+        raise _lote_demasiado_grande()
+    registros.append(_validar_linea(linea, numero_linea))
+
+
+def _validar_linea(linea: bytes, numero_linea: int) -> RegistroIngresoCreate:
+    try:
+        return RegistroIngresoCreate.model_validate_json(linea)
+    except ValidationError as e:
+        error = e.errors()[0]
+        raise BadRequestException(f"Línea {numero_linea} inválida: {error['loc']} {error['msg']}")
+
+
+def _codificar_cursor(registro: RegistroIngresoModel) -> str:
+    valor = f"{registro.fecha_ingreso.isoformat()}|{registro.id}"
+    return base64.urlsafe_b64encode(valor.encode()).decode()
+
+
+def _decodificar_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        fecha, registro_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(fecha), int(registro_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise BadRequestException("Cursor de paginación inválido")
+
 
 @router.get("/", response_model=List[RegistroIngreso])
 @limiter.limit("30/minute")
 async def leer_registros(
         request: Request,
+        response: Response,
         skip: int = Query(0, ge=0),
         limit: int = Query(settings.DEFAULT_LIMIT, le=settings.MAX_LIMIT),
+        desde: Optional[datetime] = Query(None, description="Fecha de ingreso mínima (incluida)"),
+        hasta: Optional[datetime] = Query(None, description="Fecha de ingreso máxima (excluida)"),
+        cursor: Optional[str] = Query(None, description="Valor de X-Siguiente-Cursor de la página anterior"),
+        archivo: bool = Query(False, description="Incluir los registros archivados"),
+        total: Optional[str] = Depends(modo_total),
         db: Session = Depends(get_db)
 ):
     """
@@ -34,23 +155,168 @@ async def leer_registros(
 
     Este endpoint permite obtener todos los registros de ingreso.
     Soporta paginación con los parámetros skip y limit.
+
+    Si se indica `desde`, `hasta` o `cursor`, los registros se filtran por fecha de ingreso
+    y se ordenan por (fecha_ingreso, id) usando el índice compuesto. Cuando la página está
+    completa, el encabezado `X-Siguiente-Cursor` contiene el cursor de la página siguiente.
+
+    Con `total` (exacto, cache o aproximado) la cabecera `X-Total-Count` trae el número de
+    registros entre `desde` y `hasta`, sin tener en cuenta el cursor.
+
+    Los registros anteriores a ARCHIVO_EDAD_DIAS se mueven a la tabla de archivo si el
+    archivador está activo; con `archivo=true` el listado (y el total) los incluye.
     """
-    registros = db.query(RegistroIngresoModel).order_by(RegistroIngresoModel.id).offset(skip).limit(limit).all()
+    desde, hasta = normalizar_fecha(desde), normalizar_fecha(hasta)
+    fecha_cursor = id_cursor = None
+    if cursor is not None:
+        fecha_cursor, id_cursor = _decodificar_cursor(cursor)
+
+    def condiciones(modelo, con_cursor: bool = True) -> list:
+        fecha = modelo.fecha_ingreso
+        resultado = []
+        if desde is not None:
+            resultado.append(fecha >= desde)
+        if hasta is not None:
+            resultado.append(fecha < hasta)
+        if con_cursor and cursor is not None:
+            resultado.append(or_(fecha > fecha_cursor, and_(fecha == fecha_cursor, modelo.id > id_cursor)))
+        return resultado
+
+    modelos = (RegistroIngresoModel, RegistroIngresoArchivoModel) if archivo else (RegistroIngresoModel,)
+    if total is not None:
+        totales_listados.escribir(response, *(
+            totales_listados.obtener(db, total, modelo, *condiciones(modelo, False), filtros=(desde, hasta))
+            for modelo in modelos
+        ))
+
+    por_fecha = desde is not None or hasta is not None or cursor is not None
+    if archivo:
+        registros = leer_con_archivo(db, condiciones, por_fecha, skip, limit)
+    elif not por_fecha:
+        return db.query(RegistroIngresoModel).order_by(RegistroIngresoModel.id).offset(skip).limit(limit).all()
+    else:
+        registros = (db.query(RegistroIngresoModel).filter(*condiciones(RegistroIngresoModel))
+                     .order_by(RegistroIngresoModel.fecha_ingreso, RegistroIngresoModel.id)
+                     .offset(skip).limit(limit).all())
+
+    if por_fecha and registros and len(registros) == limit:
+        response.headers["X-Siguiente-Cursor"] = _codificar_cursor(registros[-1])
+
     return registros
 
 
+@router.get("/agregados", response_model=List[AgregadoIngreso])
+@limiter.limit("30/minute")
+async def leer_agregados(
+        request: Request,
+        desde: datetime = Query(..., description="Inicio del rango (se alinea al inicio del intervalo)"),
+        hasta: datetime = Query(..., description="Fin del rango (excluido)"),
+        granularidad: Literal["minuto", "hora", "dia"] = Query("hora"),
+        db: Session = Depends(get_db)
+):
+    """
+    Obtiene el número de registros y la suma de cantidad por minuto, hora o día.
+
+    Los totales se leen de una tabla de resumen mantenida al escribir, por lo que el
+    tiempo de respuesta depende del número de intervalos y no del número de registros.
+    Solo se devuelven los intervalos con registros.
+    """
+    desde, hasta = normalizar_fecha(desde), normalizar_fecha(hasta)
+    if hasta <= desde:
+        raise BadRequestException("La fecha 'hasta' debe ser posterior a 'desde'")
+
+    if (hasta - desde) / GRANULARIDADES[granularidad] > settings.AGREGADOS_MAX_INTERVALOS:
+        raise BadRequestException(
+            f"El rango supera el máximo de {settings.AGREGADOS_MAX_INTERVALOS} intervalos; "
+            "use una granularidad mayor"
+        )
+
+    return consultar_agregados(db, granularidad, desde, hasta)
+
+
+@router.post("/agregados/reconstruir")
+async def reconstruir_agregados(
+        db: Session = Depends(get_db),
+        current_user=Depends(get_current_admin_user)
+) -> Dict[str, int]:
+    """
+    Recalcula la tabla de resumen a partir de todos los registros de ingreso (solo administradores).
+
+    Necesario una única vez para datos anteriores a la tabla de resumen.
+    """
+    return {"procesados": reconstruir_resumen(db)}
+
+
+@router.get("/archivo", response_model=EstadoArchivo)
+async def estado_archivo(
+        db: Session = Depends(get_db),
+        current_user=Depends(get_current_admin_user)
+):
+    """
+    Estado del archivo de registros de ingreso antiguos (solo administradores).
+
+    Incluye los registros en cada tabla (en caché, ver `total=cache` en el listado) y el
+    resultado de la última pasada del archivador en este worker: filas movidas, duración,
+    filas por segundo y duración del lote más largo.
+    """
+    return EstadoArchivo(
+        activo=settings.ARCHIVO_ACTIVO,
+        edad_dias=archivador_ingresos.edad_dias,
+        principales=totales_listados.obtener(db, "cache", RegistroIngresoModel)[0],
+        archivados=totales_listados.obtener(db, "cache", RegistroIngresoArchivoModel)[0],
+        ultima_pasada=archivador_ingresos.ultima_pasada,
+    )
+
+
+@router.get("/export", response_class=StreamingResponse)
+@limiter.limit("5/minute")
+async def exportar_registros(
+        request: Request,
+        formato: FormatoExportacion = Query("arrow", alias="format", description="arrow (flujo IPC) o parquet"),
+        desde: Optional[datetime] = Query(None, description="Fecha de ingreso mínima (incluida)"),
+        hasta: Optional[datetime] = Query(None, description="Fecha de ingreso máxima (excluida)"),
+        archivo: bool = Query(False, description="Incluir los registros archivados"),
+        current_user=Depends(get_current_admin_user)
+):
+    """
+    Exporta los registros de ingreso en formato columnar (solo administradores).
+
+    Con `format=arrow` se envía un flujo IPC de Arrow y con `format=parquet` un fichero
+    Parquet. `desde` y `hasta` filtran por fecha de ingreso y con `archivo=true` se
+    exportan también los registros archivados (primero estos). Requiere pyarrow en el
+    servidor.
+    """
+    comprobar_disponible()
+    desde, hasta = normalizar_fecha(desde), normalizar_fecha(hasta)
+
+    def condiciones(modelo) -> list:
+        resultado = []
+        if desde is not None:
+            resultado.append(modelo.fecha_ingreso >= desde)
+        if hasta is not None:
+            resultado.append(modelo.fecha_ingreso < hasta)
+        return resultado
+
+    modelos = (RegistroIngresoArchivoModel, RegistroIngresoModel) if archivo else (RegistroIngresoModel,)
+    return respuesta_exportacion("registros-ingreso", formato, exportar(modelos, formato, condiciones))
+
+
 @router.get("/{registro_id}", response_model=RegistroIngreso)
 async def leer_registro(
         registro_id: int,
+        archivo: bool = Query(False, description="Buscar también entre los registros archivados"),
         db: Session = Depends(get_db)
 ):
     """
     Obtiene la información de un registro de ingreso específico.
 
     Este endpoint permite obtener la información de un registro
-    por su ID.
+    por su ID. Con `archivo=true`, si no está en la tabla principal se busca en el archivo
+    (los registros archivados no se pueden modificar ni eliminar).
     """
     db_registro = db.query(RegistroIngresoModel).filter(RegistroIngresoModel.id == registro_id).first()
+    if db_registro is None and archivo:
+        db_registro = db.query(RegistroIngresoArchivoModel).filter(RegistroIngresoArchivoModel.id == registro_id).first()
     if db_registro is None:
         raise NotFoundException("Registro no encontrado")
 
@@ -66,15 +332,55 @@ async def crear_registro(
     """
     Crea un nuevo registro de ingreso.
     """
-    # Crear registro
+    # Crear registro (sin fecha explícita se toma el momento de recepción)
     db_registro = RegistroIngresoModel(**registro.dict())
+    db_registro.fecha_ingreso = normalizar_fecha(registro.fecha_ingreso) or datetime.utcnow()
     db.add(db_registro)
+    aplicar_deltas(db, calcular_deltas([(db_registro.fecha_ingreso, db_registro.cantidad)]))
     db.commit()
     db.refresh(db_registro)
 
     return db_registro
 
 
+@router.post("/ingesta", response_model=IngestaRespuesta, status_code=202)
+async def ingestar_registros(
+        request: Request,
+        current_user=Depends(get_current_admin_user)
+):
+    """
+    Recibe un lote de registros de ingreso para escritura diferida.
+
+    Acepta un arreglo JSON (`application/json`) o un registro JSON por línea
+    (`application/x-ndjson`). Los registros se encolan en memoria y se escriben
+    en la base de datos por lotes. El lote se acepta completo o se rechaza con
+    503 y `Retry-After` si la cola está llena.
+    """
+    if "ndjson" in request.headers.get("content-type", ""):
+        registros = await _leer_ndjson(request)
+    else:
+        registros = await _leer_json(request)
+
+    if not registros:
+        raise BadRequestException("El lote no contiene registros")
+
+    # Los registros sin fecha toman el momento de recepción
+    ahora = datetime.utcnow()
+    filas: List[Dict[str, Any]] = []
+    for registro in registros:
+        fila = registro.dict()
+        fila["fecha_ingreso"] = normalizar_fecha(fila["fecha_ingreso"]) or ahora
+        filas.append(fila)
+
+    if not escritor_ingresos.encolar(filas):
+        raise ServiceUnavailableException(
+            "Cola de ingesta llena, reintente más tarde",
+            retry_after=max(1, round(settings.INGESTA_INTERVALO_FLUSH * 2))
+        )
+
+    return {"aceptados": len(filas), "en_cola": escritor_ingresos.en_cola}
+
+
 @router.put("/{registro_id}", response_model=RegistroIngreso)
 async def actualizar_registro(
         registro_id: int,
@@ -92,10 +398,13 @@ async def actualizar_registro(
 
     # Actualizar los campos proporcionados
     update_data = registro.dict(exclude_unset=True)
+    deltas = calcular_deltas([(db_registro.fecha_ingreso, db_registro.cantidad)], signo=-1)
 
     for key, value in update_data.items():
         setattr(db_registro, key, value)
 
+    # Reemplazar la contribución anterior del registro en la tabla de resumen
+    aplicar_deltas(db, calcular_deltas([(db_registro.fecha_ingreso, db_registro.cantidad)], deltas=deltas))
     db.commit()
     db.refresh(db_registro)
 
@@ -116,6 +425,7 @@ async def eliminar_registro(
         raise NotFoundException("Registro no encontrado")
 
     db.delete(db_registro)
+    aplicar_deltas(db, calcular_deltas([(db_registro.fecha_ingreso, db_registro.cantidad)], signo=-1))
     db.commit()
 
     return db_registro
\ No newline at end of file
@@ -1,24 +1,42 @@
-from fastapi import APIRouter, Depends, Request, Query
+from fastapi import APIRouter, Depends, Request, Query, Response
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
 from ..core.database import get_db
 from ..core.config import settings
-from ..core.security import get_current_active_user, get_current_admin_user, get_password_hash
+from ..core.proyeccion import Proyeccion
+from ..core.security import get_current_active_db_user, get_current_admin_user, get_password_hash
+from ..core.revocacion import lista_revocacion
+from ..core.totales import modo_total, totales_listados
+from ..core.versiones import comprobar_version, etag, incrementar_version, versiones_if_match
 from ..schemas.usuario import Usuario, UsuarioCreate, UsuarioUpdate
 from ..models.usuario import Usuario as UsuarioModel
+from ..models.tokenrefresco import TokenRefresco as TokenRefrescoModel
 from ..exceptions import NotFoundException, BadRequestException, ForbiddenException
 
 # Limiter para rate limiting
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_remote_address, enabled=settings.LIMITE_TASA_ACTIVO)
 
 router = APIRouter(
     prefix=f"{settings.API_V1_STR}/usuarios",
     tags=["usuarios"]
 )
 
+proyeccion_usuarios = Proyeccion(UsuarioModel, Usuario)
+
+# Cambios que dejan obsoletos los permisos incluidos en los tokens ya emitidos
+CAMPOS_QUE_REVOCAN_SESIONES = {"password", "is_active", "is_admin"}
+
+
+def _revocar_sesiones(db: Session, db_usuario: UsuarioModel) -> None:
+    """Invalida los tokens de acceso y de refresco emitidos al usuario."""
+    lista_revocacion.revocar_usuario(db_usuario.username, db)
+    db.query(TokenRefrescoModel).filter(
+        TokenRefrescoModel.usuario_id == db_usuario.id
+    ).update({"revocado": True}, synchronize_session=False)
+
 
 @router.post("/", response_model=Usuario, status_code=201)
 async def crear_usuario(
@@ -63,8 +81,11 @@ async def crear_usuario(
 @limiter.limit("20/minute")
 async def leer_usuarios(
         request: Request,
+        response: Response,
         skip: int = Query(0, ge=0),
         limit: int = Query(settings.DEFAULT_LIMIT, le=settings.MAX_LIMIT),
+        fields: Optional[str] = Query(None, description="Campos a devolver separados por comas, p. ej. id,username"),
+        total: Optional[str] = Depends(modo_total),
         db: Session = Depends(get_db),
         current_user: Usuario = Depends(get_current_admin_user)
 ):
@@ -72,15 +93,23 @@ async def leer_usuarios(
     Obtiene la lista de usuarios (solo administradores).
 
     Este endpoint permite a los administradores ver todos los usuarios registrados.
-    Soporta paginación con los parámetros skip y limit.
+    Soporta paginación con los parámetros skip y limit, y `fields` para consultar
+    solo algunas columnas. Con `total` (exacto, cache o aproximado) la cabecera
+    `X-Total-Count` trae el número de usuarios.
     """
+    totales_listados.poner(response, db, total, UsuarioModel)
+
+    if fields is not None:
+        query = proyeccion_usuarios.consulta(db, fields, None)
+        return Proyeccion.respuesta(query.order_by(UsuarioModel.id).offset(skip).limit(limit).all())
+
     usuarios = db.query(UsuarioModel).order_by(UsuarioModel.id).offset(skip).limit(limit).all()
     return usuarios
 
 
 @router.get("/me", response_model=Usuario)
 async def leer_usuario_propio(
-        current_user: Usuario = Depends(get_current_active_user)
+        current_user: Usuario = Depends(get_current_active_db_user)
 ):
     """
     Obtiene la información del usuario actual.
@@ -93,6 +122,7 @@ async def leer_usuario_propio(
 @router.get("/{usuario_id}", response_model=Usuario)
 async def leer_usuario(
         usuario_id: int,
+        response: Response,
         db: Session = Depends(get_db),
         current_user: Usuario = Depends(get_current_admin_user)
 ):
@@ -104,24 +134,29 @@ async def leer_usuario(
     db_usuario = db.query(UsuarioModel).filter(UsuarioModel.id == usuario_id).first()
     if db_usuario is None:
         raise NotFoundException("Usuario no encontrado")
+    response.headers["ETag"] = etag(db_usuario.version)
     return db_usuario
 
 
 @router.put("/me", response_model=Usuario)
 async def actualizar_usuario_propio(
         usuario_update: UsuarioUpdate,
+        response: Response,
+        versiones: Optional[Set[int]] = Depends(versiones_if_match),
         db: Session = Depends(get_db),
-        current_user: Usuario = Depends(get_current_active_user)
+        current_user: Usuario = Depends(get_current_active_db_user)
 ):
     """
     Actualiza la información del usuario actual.
 
     Este endpoint permite a cualquier usuario autenticado actualizar su propia información.
-    No permite cambiar el estado de administrador.
+    No permite cambiar el estado de administrador. Con `If-Match` solo se actualiza si la
+    versión no ha cambiado; si no, responde 412.
     """
     # No permitir cambiar el estado de administrador
     if usuario_update.is_admin is not None:
         raise ForbiddenException("No puedes cambiar tu estado de administrador")
+    comprobar_version(current_user, versiones)
 
     # Verificar si se está actualizando el email y si ya existe
     if usuario_update.email and usuario_update.email != current_user.email:
@@ -141,9 +176,14 @@ async def actualizar_usuario_propio(
         elif value is not None:
             setattr(db_usuario, key, value)
 
+    if CAMPOS_QUE_REVOCAN_SESIONES & {k for k, v in update_data.items() if v is not None}:
+        _revocar_sesiones(db, db_usuario)
+
+    incrementar_version(db, db_usuario, versiones)
     db.commit()
     db.refresh(db_usuario)
 
+    response.headers["ETag"] = etag(db_usuario.version)
     return db_usuario
 
 
@@ -151,6 +191,8 @@ async def actualizar_usuario_propio(
 async def actualizar_usuario(
         usuario_id: int,
         usuario_update: UsuarioUpdate,
+        response: Response,
+        versiones: Optional[Set[int]] = Depends(versiones_if_match),
         db: Session = Depends(get_db),
         current_user: Usuario = Depends(get_current_admin_user)
 ):
@@ -158,11 +200,13 @@ async def actualizar_usuario(
     Actualiza la información de un usuario específico (solo administradores).
 
     Este endpoint permite a los administradores actualizar la información de cualquier usuario.
+    Con `If-Match` solo se actualiza si la versión no ha cambiado; si no, responde 412.
     """
     # Verificar si el usuario existe
     db_usuario = db.query(UsuarioModel).filter(UsuarioModel.id == usuario_id).first()
     if db_usuario is None:
         raise NotFoundException("Usuario no encontrado")
+    comprobar_version(db_usuario, versiones)
 
     # Verificar si se está actualizando el email y si ya existe
     if usuario_update.email and usuario_update.email != db_usuario.email:
@@ -179,9 +223,14 @@ async def actualizar_usuario(
         elif value is not None:
             setattr(db_usuario, key, value)
 
+    if CAMPOS_QUE_REVOCAN_SESIONES & {k for k, v in update_data.items() if v is not None}:
+        _revocar_sesiones(db, db_usuario)
+
+    incrementar_version(db, db_usuario, versiones)
     db.commit()
     db.refresh(db_usuario)
 
+    response.headers["ETag"] = etag(db_usuario.version)
     return db_usuario
 
 
@@ -204,6 +253,7 @@ async def eliminar_usuario(
     if db_usuario is None:
         raise NotFoundException("Usuario no encontrado")
 
+    _revocar_sesiones(db, db_usuario)
     db.delete(db_usuario)
     db.commit()
 
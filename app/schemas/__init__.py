@@ -1,14 +1,26 @@
 # app/schemas/__init__.py
 from .usuario import UsuarioBase, UsuarioCreate, UsuarioUpdate, Usuario
 from .categoria import CategoriaBase, CategoriaCreate, CategoriaUpdate, Categoria
-from .producto import ProductoBase, ProductoCreate, ProductoUpdate, Producto
+from .producto import (
+    ProductoBase, ProductoCreate, ProductoUpdate, Producto, ReservaCreate, ReservaItem, ReservaLote,
+    ResultadoReserva, ResultadoReservaLote
+)
 from .registro import RegistroBase, RegistroCreate, RegistroUpdate, Registro
-from .token import Token, TokenData
+from .registroingreso import (
+    RegistroIngresoBase, RegistroIngresoCreate, RegistroIngresoUpdate, RegistroIngreso, IngestaRespuesta,
+    AgregadoIngreso
+)
+from .token import Token, TokenData, RefreshTokenRequest, UsuarioToken
+from .lote import OperacionLote, LoteCreate, ResultadoOperacion, ResultadoLote
 
 __all__ = [
     "UsuarioBase", "UsuarioCreate", "UsuarioUpdate", "Usuario",
     "CategoriaBase", "CategoriaCreate", "CategoriaUpdate", "Categoria",
     "ProductoBase", "ProductoCreate", "ProductoUpdate", "Producto",
+    "ReservaCreate", "ReservaItem", "ReservaLote", "ResultadoReserva", "ResultadoReservaLote",
     "RegistroBase", "RegistroCreate", "RegistroUpdate", "Registro",
-    "Token", "TokenData"
+    "RegistroIngresoBase", "RegistroIngresoCreate", "RegistroIngresoUpdate", "RegistroIngreso",
+    "IngestaRespuesta", "AgregadoIngreso",
+    "Token", "TokenData", "RefreshTokenRequest", "UsuarioToken",
+    "OperacionLote", "LoteCreate", "ResultadoOperacion", "ResultadoLote"
 ]
\ No newline at end of file
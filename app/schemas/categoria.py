@@ -31,6 +31,7 @@ class CategoriaUpdate(BaseModel):
 class Categoria(CategoriaBase):
     id: int
     fecha_creacion: datetime
+    version: int = Field(..., description="Versión de la fila; enviarla en If-Match al actualizar")
 
     class Config:
         from_attributes = True
\ No newline at end of file
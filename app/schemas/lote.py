@@ -0,0 +1,30 @@
+# app/schemas/lote.py
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional
+
+from ..core.config import settings
+
+
+class OperacionLote(BaseModel):
+    metodo: Literal["GET", "POST", "PUT", "PATCH", "DELETE"] = Field(..., description="Método HTTP")
+    ruta: str = Field(..., min_length=1, max_length=2000,
+                      description="Ruta relativa a /api/v1 con su query string, p. ej. /productos/{$0.id}")
+    cuerpo: Optional[Any] = Field(None, description="Cuerpo JSON; \"$N.campo\" toma el valor de la respuesta N")
+    cabeceras: Dict[str, str] = Field(default_factory=dict, description="Cabeceras adicionales, p. ej. If-Match")
+
+
+class LoteCreate(BaseModel):
+    operaciones: List[OperacionLote] = Field(..., min_length=1, max_length=settings.LOTE_MAX_OPERACIONES,
+                                             description="Operaciones, que se ejecutan en este orden")
+    transaccion: bool = Field(False, description="Todas o ninguna: un error deshace las operaciones anteriores")
+
+
+class ResultadoOperacion(BaseModel):
+    status: int = Field(..., description="Código HTTP de la operación; 424 si no se ejecutó por un error anterior")
+    cuerpo: Optional[Any] = Field(None, description="Respuesta de la operación (JSON o texto)")
+    cabeceras: Dict[str, str] = Field(default_factory=dict, description="ETag, Location y Retry-After si los hay")
+
+
+class ResultadoLote(BaseModel):
+    confirmado: bool = Field(..., description="False si la transacción se deshizo por un error")
+    resultados: List[ResultadoOperacion]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 from .categoria import Categoria
 
@@ -32,12 +32,62 @@ class ProductoUpdate(BaseModel):
 class Producto(ProductoBase):
     id: int
     fecha_creacion: datetime
+    version: int = Field(..., description="Versión de la fila; enviarla en If-Match al actualizar")
     categoria: Categoria
 
     class Config:
         from_attributes = True
 
 
+class ReservaCreate(BaseModel):
+    cantidad: int = Field(..., gt=0, description="Unidades a descontar del stock")
+
+
+class ReservaItem(BaseModel):
+    producto_id: int = Field(..., gt=0, description="ID del producto")
+    cantidad: int = Field(..., gt=0, description="Unidades a descontar del stock")
+
+
+class ReservaLote(BaseModel):
+    items: List[ReservaItem] = Field(..., min_length=1, max_length=100,
+                                     description="Productos a reservar (1-100)")
+    todo_o_nada: bool = Field(True, description="Si falta stock de algún producto, no se reserva ninguno")
+
+
+class ResultadoReserva(BaseModel):
+    producto_id: int
+    cantidad: int
+    reservado: bool
+    stock: Optional[int] = Field(None, description="Stock restante tras la reserva")
+    motivo: Optional[str] = Field(None, description="no_encontrado, stock_insuficiente o lote_cancelado")
+
+
+class ResultadoReservaLote(BaseModel):
+    reservado: bool = Field(..., description="True si se reservaron todos los productos")
+    items: List[ResultadoReserva]
+
+
+class EstadisticasProductos(BaseModel):
+    categoria_id: Optional[int] = Field(None, description="None en las estadísticas del conjunto")
+    productos: int
+    precio_medio: float
+    precio_min: int
+    precio_max: int
+    percentiles_precio: Dict[str, float] = Field(..., description="Percentiles pedidos, p. ej. {\"p50\": 1200.0}")
+    histograma_precio: List[int] = Field(..., description="Productos en cada tramo de `limites_histograma`")
+    stock_total: int
+    sin_stock: int = Field(..., description="Productos con stock 0")
+    tasa_sin_stock: float
+    disponibles: int
+
+
+class AnaliticaProductos(BaseModel):
+    productos: int
+    limites_histograma: List[float] = Field(..., description="Límites de los tramos de precio, comunes a todas las categorías")
+    total: Optional[EstadisticasProductos]
+    categorias: List[EstadisticasProductos]
+
+
 class ProductoFilter(BaseModel):
     nombre: Optional[str] = None
     precio_min: Optional[int] = Field(None, ge=0)
@@ -17,6 +17,7 @@ class RegistroUpdate(BaseModel):
 class Registro(RegistroBase):
     id: int
     fecha_creacion: datetime
+    version: int = Field(..., description="Versión de la fila; enviarla en If-Match al actualizar")
 
     class Config:
         from_attributes = True
\ No newline at end of file
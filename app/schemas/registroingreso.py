@@ -13,7 +13,7 @@ class RegistroIngresoBase(BaseModel):
 
 
 class RegistroIngresoCreate(RegistroIngresoBase):
-    pass
+    fecha_ingreso: Optional[datetime] = Field(None, description="Momento del ingreso (por defecto: recepción)")
 
 
 class RegistroIngresoUpdate(BaseModel):
@@ -28,4 +28,36 @@ class RegistroIngreso(RegistroIngresoBase):
     fecha_ingreso: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class IngestaRespuesta(BaseModel):
+    aceptados: int = Field(..., description="Registros aceptados en la cola de escritura")
+    en_cola: int = Field(..., description="Registros pendientes de escribir tras aceptar el lote")
+
+
+class PasadaArchivo(BaseModel):
+    limite: datetime = Field(..., description="Se archivaron los registros con fecha de ingreso anterior")
+    inicio: datetime
+    filas: int = Field(..., description="Registros movidos al archivo")
+    lotes: int
+    segundos: float
+    filas_por_segundo: float
+    lote_max_ms: float = Field(..., description="Duración del lote más largo (lo que duró su bloqueo)")
+
+
+class EstadoArchivo(BaseModel):
+    activo: bool = Field(..., description="Si el archivador se ejecuta en segundo plano (ARCHIVO_ACTIVO)")
+    edad_dias: int
+    principales: int = Field(..., description="Registros en la tabla principal")
+    archivados: int = Field(..., description="Registros en la tabla de archivo")
+    ultima_pasada: Optional[PasadaArchivo] = Field(None, description="Última pasada del archivador en este worker")
+
+
+class AgregadoIngreso(BaseModel):
+    inicio: datetime = Field(..., description="Inicio del intervalo (UTC)")
+    total: int = Field(..., description="Número de registros de ingreso en el intervalo")
+    suma_cantidad: int = Field(..., description="Suma de la cantidad de los registros del intervalo")
+
+    class Config:
+        from_attributes = True
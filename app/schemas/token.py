@@ -6,7 +6,24 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     expires_at: datetime = Field(..., description="Timestamp de expiración del token")
+    refresh_token: Optional[str] = Field(None, description="Token de refresco de un solo uso")
+    refresh_expires_at: Optional[datetime] = Field(None, description="Timestamp de expiración del token de refresco")
 
 class TokenData(BaseModel):
     username: Optional[str] = None
-    exp: Optional[datetime] = None
\ No newline at end of file
+    exp: Optional[datetime] = None
+    uid: Optional[int] = None
+    is_active: Optional[bool] = None
+    is_admin: Optional[bool] = None
+    jti: Optional[str] = None
+    iat: Optional[int] = None
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str = Field(..., min_length=20, max_length=200, description="Token de refresco recibido en el login")
+
+class UsuarioToken(BaseModel):
+    """Usuario autenticado reconstruido solo con los claims del token (modo sin estado)."""
+    id: int
+    username: str
+    is_active: bool
+    is_admin: bool
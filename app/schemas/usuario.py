@@ -55,6 +55,7 @@ class Usuario(UsuarioBase):
     is_active: bool
     is_admin: bool
     fecha_creacion: datetime
+    version: int = Field(..., description="Versión de la fila; enviarla en If-Match al actualizar")
     ultimo_login: Optional[datetime] = None
 
     class Config:
@@ -0,0 +1,188 @@
+"""
+Analítica de productos en columnas de NumPy frente a la consulta SQL equivalente.
+
+Sobre una copia de la base sembrada (1 millón de productos en 1000 categorías por defecto):
+1. mide la carga inicial de las columnas y lo que cuesta aplicar un bloque de cambios de
+   stock (reservas, sin reordenar) y uno con altas y cambios de precio (reordenando),
+2. calcula las estadísticas por categoría (percentiles 25/50/75/90/99, histograma de 10
+   tramos, stock total y productos sin stock) con `GROUP BY` y funciones de ventana en SQL
+   y pide `GET /productos/analitica` con un cliente ASGI en proceso, `--peticiones` veces
+   cada una, y comprueba que los resultados coinciden. La aplicación arranca sin instantánea del
+   catálogo (INSTANTANEA_GENERAR=False), para que su generación no compita con las peticiones.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_analitica --productos 1000000 --categorias 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Tuple
+
+from .comun import DIRECTORIO_DATOS, desactivar_limites, preparar_entorno, resumen_latencias
+from .datos import PASSWORD_ADMIN, agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+PERCENTILES = (25, 50, 75, 90, 99)
+INTERVALOS = 10
+
+
+def estadisticas_sql(db) -> Dict[int, Dict]:
+    """Mismas estadísticas por categoría que GET /productos/analitica, calculadas por la base."""
+    from sqlalchemy import text
+
+    resultado = {}
+    for categoria_id, productos, suma, minimo, maximo, stock, sin_stock in db.execute(text(
+            "SELECT categoria_id, COUNT(*), SUM(precio), MIN(precio), MAX(precio), SUM(stock), "
+            "SUM(CASE WHEN stock <= 0 THEN 1 ELSE 0 END) FROM productos GROUP BY categoria_id")):
+        resultado[categoria_id] = {"productos": productos, "precio_medio": suma / productos, "precio_min": minimo,
+                                   "precio_max": maximo, "stock_total": stock, "sin_stock": sin_stock,
+                                   "histograma_precio": [0] * INTERVALOS}
+
+    # Percentiles con interpolación lineal: las dos filas vecinas de cada posición, por ventana
+    columnas = []
+    for p in PERCENTILES:
+        posicion = f"{p / 100} * (n - 1)"
+        columnas += [f"MAX(CASE WHEN i = CAST({posicion} AS INTEGER) THEN precio END)",
+                     f"MAX(CASE WHEN i = MIN(CAST({posicion} AS INTEGER) + 1, n - 1) THEN precio END)",
+                     f"MAX({posicion} - CAST({posicion} AS INTEGER))"]
+    for fila in db.execute(text(
+            f"SELECT categoria_id, {', '.join(columnas)} FROM ("
+            "SELECT categoria_id, precio, ROW_NUMBER() OVER (PARTITION BY categoria_id ORDER BY precio) - 1 AS i, "
+            "COUNT(*) OVER (PARTITION BY categoria_id) AS n FROM productos) GROUP BY categoria_id")):
+        resultado[fila[0]]["percentiles_precio"] = {
+            f"p{p}": fila[1 + 3 * j] + (fila[2 + 3 * j] - fila[1 + 3 * j]) * fila[3 + 3 * j]
+            for j, p in enumerate(PERCENTILES)
+        }
+
+    minimo, maximo = db.execute(text("SELECT MIN(precio), MAX(precio) FROM productos")).one()
+    ancho = (maximo - minimo) / INTERVALOS
+    for categoria_id, tramo, productos in db.execute(text(
+            "SELECT categoria_id, MIN(CAST((precio - :minimo) / :ancho AS INTEGER), :ultimo), COUNT(*) "
+            "FROM productos GROUP BY 1, 2"), {"minimo": minimo, "ancho": ancho, "ultimo": INTERVALOS - 1}):
+        resultado[categoria_id]["histograma_precio"][tramo] += productos
+    return resultado
+
+
+def comparar(sql: Dict[int, Dict], api: List[Dict]) -> Tuple[int, float]:
+    """Categorías distintas en recuentos o histograma y mayor diferencia relativa en medias y percentiles."""
+    distintas, diferencia = 0, 0.0
+    for categoria in api:
+        esperado = sql[categoria["categoria_id"]]
+        if any(categoria[clave] != esperado[clave] for clave in
+               ("productos", "precio_min", "precio_max", "stock_total", "sin_stock", "histograma_precio")):
+            distintas += 1
+        for a, b in [(categoria["precio_medio"], esperado["precio_medio"])] + [
+                (categoria["percentiles_precio"][k], v) for k, v in esperado["percentiles_precio"].items()]:
+            diferencia = max(diferencia, abs(a - b) / max(abs(b), 1))
+    return distintas + abs(len(sql) - len(api)), diferencia
+
+
+def cronometrar(funcion, veces: int) -> List[float]:
+    latencias = []
+    for _ in range(veces):
+        t = time.perf_counter()
+        funcion()
+        latencias.append(time.perf_counter() - t)
+    return latencias
+
+
+def imprimir(nombre: str, latencias: List[float]) -> None:
+    resumen = resumen_latencias(latencias, sum(latencias))
+    print(f"  {nombre:<44}{resumen['p50_ms']:>10,.2f}{resumen['p99_ms']:>10,.2f}")
+
+
+async def main(args) -> None:
+    import httpx
+    import numpy as np
+
+    from app.core.analitica import analitica_productos
+    from app.core.config import settings
+    from app.core.database import SessionLocal
+    from app.main import app
+
+    desactivar_limites()
+    print(f"{args.productos:,} productos en {args.categorias:,} categorías")
+
+    t = time.perf_counter()
+    analitica_productos.recargar()
+    columnas = analitica_productos._columnas
+    memoria = sum(getattr(columnas, nombre).nbytes for nombre in columnas.__slots__)
+    print(f"\ncarga de las columnas: {time.perf_counter() - t:,.2f} s, {memoria / 1048576:,.1f} MB")
+
+    # Bloques de cambios como los que trae la tabla de cambios en un CAMBIOS_INTERVALO
+    rng = np.random.default_rng(args.semilla)
+    muestra = rng.choice(columnas.id, size=1000, replace=False)
+    por_id = dict(zip(columnas.id.tolist(), range(len(columnas))))
+
+    def datos(producto_id: int, **cambios) -> Dict:
+        i = por_id[producto_id]
+        fila = {"id": producto_id, "precio": int(columnas.precio[i]), "stock": int(columnas.stock[i]),
+                "disponible": bool(columnas.disponible[i]), "categoria_id": int(columnas.categoria[i])}
+        return dict(fila, **cambios)
+
+    for nombre, bloque in (
+            ("1000 reservas (solo stock)", {int(i): datos(int(i), stock=0) for i in muestra}),
+            ("100 altas + 100 cambios de precio", dict(
+                [(int(columnas.id.max()) + 1 + j, datos(int(muestra[j]), id=int(columnas.id.max()) + 1 + j))
+                 for j in range(100)] +
+                [(int(i), datos(int(i), precio=1)) for i in muestra[100:200]])),
+    ):
+        analitica_productos._pendientes = dict(bloque)
+        t = time.perf_counter()
+        analitica_productos.aplicar_pendientes()
+        print(f"aplicar {nombre}: {(time.perf_counter() - t) * 1000:,.1f} ms")
+    analitica_productos.recargar()
+
+    print(f"\n{'estadísticas por categoría':<46}{'p50 ms':>10}{'p99 ms':>10}")
+    db = SessionLocal()
+    try:
+        sql = estadisticas_sql(db)
+        imprimir("SQL (GROUP BY + ventanas)", cronometrar(lambda: estadisticas_sql(db), args.peticiones))
+    finally:
+        db.close()
+    imprimir("NumPy (calcular, sin HTTP)", cronometrar(
+        lambda: analitica_productos.calcular(PERCENTILES, INTERVALOS), args.peticiones))
+
+    # El lifespan vuelve a cargar las columnas en su hilo: se espera a que termine para medir solo las peticiones
+    antes = analitica_productos._columnas
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=600) as cliente:
+        r = await cliente.post(f"{settings.API_V1_STR}/auth/login",
+                               data={"username": "bench_admin", "password": PASSWORD_ADMIN})
+        r.raise_for_status()
+        cabeceras = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        while analitica_productos._columnas is antes:
+            await asyncio.sleep(0.1)
+
+        respuesta = None
+        for nombre, parametros in (("GET /productos/analitica", {}),
+                                   ("GET /productos/analitica?categoria_id=1", {"categoria_id": 1})):
+            latencias = []
+            for _ in range(args.peticiones):
+                t = time.perf_counter()
+                r = await cliente.get(f"{settings.API_V1_STR}/productos/analitica", params=parametros,
+                                      headers=cabeceras)
+                r.raise_for_status()
+                latencias.append(time.perf_counter() - t)
+            imprimir(nombre, latencias)
+            respuesta = respuesta or r.json()
+
+    distintas, diferencia = comparar(sql, respuesta["categorias"])
+    print(f"\ncategorías con recuentos distintos: {distintas}; mayor diferencia relativa en medias y "
+          f"percentiles: {diferencia:.2e}; respuesta {len(json.dumps(respuesta)) / 1024:,.0f} KB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.set_defaults(db=os.path.join(DIRECTORIO_DATOS, "bench_analitica.db"), productos=1000000, categorias=1000)
+    parser.add_argument("--peticiones", type=int, default=20, help="Repeticiones por medición")
+    args = parser.parse_args()
+
+    ruta_trabajo = preparar_entorno("bench_analitica")
+    os.environ.setdefault("INSTANTANEA_GENERAR", "False")
+    asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla)
+    shutil.copyfile(args.db, ruta_trabajo)
+    asyncio.run(main(args))
@@ -0,0 +1,124 @@
+"""
+Archivado de registros de ingreso antiguos sobre una tabla de varios millones de filas.
+
+Con un cliente ASGI en proceso sobre una copia de la base sembrada (5 millones de registros
+de ingreso en 90 días por defecto):
+1. mide el listado por rango de fechas recientes, el COUNT exacto y el alta de un registro
+   (`POST /registros-ingreso/`) con toda la tabla caliente,
+2. archiva los dos primeros tercios (60 días) con el archivador en un hilo mientras el
+   cliente sigue dando `--altas-por-segundo` altas, e informa de las filas por segundo del archivador, la
+   duración del lote más largo y la latencia de las altas durante el archivado,
+3. repite las mediciones del punto 1 y el listado con `archivo=true`.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_archivo --registros-ingreso 5000000 --lote 1000
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from .comun import DIRECTORIO_DATOS, desactivar_limites, preparar_entorno, resumen_latencias
+from .datos import PASSWORD_ADMIN, agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+# benchmarks.datos siembra 90 días de registros desde esta fecha
+INICIO_DATOS = datetime(2026, 1, 1)
+LIMITE = INICIO_DATOS + timedelta(days=60)
+RANGO_RECIENTE = {"desde": "2026-03-20T00:00:00", "hasta": "2026-03-21T00:00:00", "limit": 100}
+
+
+def imprimir(nombre: str, latencias: List[float]) -> None:
+    resumen = resumen_latencias(latencias, sum(latencias))
+    print(f"  {nombre:<36}{resumen['p50_ms']:>10,.2f}{resumen['p99_ms']:>10,.2f}")
+
+
+async def medir(cliente, cabeceras: Dict[str, str], peticiones: int, archivo: bool) -> None:
+    from app.core.config import settings
+
+    ruta = f"{settings.API_V1_STR}/registros-ingreso/"
+    casos = [("listado reciente (1 día)", dict(RANGO_RECIENTE)),
+             ("COUNT exacto", {"limit": 1, "total": "exacto"})]
+    if archivo:
+        casos += [("listado reciente, archivo=true", dict(RANGO_RECIENTE, archivo="true")),
+                  ("listado antiguo, archivo=true", dict(RANGO_RECIENTE, desde="2026-01-20T00:00:00",
+                                                         hasta="2026-01-21T00:00:00", archivo="true")),
+                  ("COUNT exacto, archivo=true", {"limit": 1, "total": "exacto", "archivo": "true"})]
+    for nombre, parametros in casos:
+        latencias = []
+        for _ in range(peticiones):
+            t = time.perf_counter()
+            r = await cliente.get(ruta, params=parametros, headers=cabeceras)
+            r.raise_for_status()
+            latencias.append(time.perf_counter() - t)
+        imprimir(nombre, latencias)
+    imprimir("alta de un registro", await altas(cliente, ruta, cabeceras, peticiones))
+
+
+async def altas(cliente, ruta: str, cabeceras: Dict[str, str], n: int, separacion: float = 0.0) -> List[float]:
+    latencias = []
+    for i in range(n):
+        t = time.perf_counter()
+        r = await cliente.post(ruta, json={"nombre": f"alta-{i}", "cantidad": 1}, headers=cabeceras)
+        r.raise_for_status()
+        latencias.append(time.perf_counter() - t)
+        await asyncio.sleep(max(0.0, separacion - latencias[-1]))
+    return latencias
+
+
+async def main(args) -> None:
+    import httpx
+
+    from app.core.archivo import archivador_ingresos
+    from app.core.config import settings
+    from app.main import app
+
+    desactivar_limites()
+    archivador_ingresos.tamano_lote = args.lote
+    archivador_ingresos.pausa = args.pausa / 1000
+
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=600) as cliente:
+        r = await cliente.post(f"{settings.API_V1_STR}/auth/login",
+                               data={"username": "bench_admin", "password": PASSWORD_ADMIN})
+        r.raise_for_status()
+        cabeceras = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        ruta = f"{settings.API_V1_STR}/registros-ingreso/"
+
+        print(f"{args.registros_ingreso:,} registros de ingreso; lote {args.lote}, pausa {args.pausa} ms")
+        print(f"\n{'antes de archivar':<38}{'p50 ms':>10}{'p99 ms':>10}")
+        await medir(cliente, cabeceras, args.peticiones, False)
+
+        # El archivador en su hilo; las altas siguen en el event loop mientras tanto
+        tarea = asyncio.create_task(asyncio.to_thread(archivador_ingresos.archivar, LIMITE))
+        latencias = []
+        while not tarea.done():
+            latencias += await altas(cliente, ruta, cabeceras, 10, 1 / args.altas_por_segundo)
+        pasada = await tarea
+
+        print(f"\narchivado hasta {LIMITE:%Y-%m-%d}: {pasada['filas']:,} filas en {pasada['lotes']:,} lotes, "
+              f"{pasada['segundos']:,.1f} s ({pasada['filas_por_segundo']:,.0f} filas/s), "
+              f"lote más largo {pasada['lote_max_ms']:,.1f} ms")
+        print(f"\n{'durante el archivado':<38}{'p50 ms':>10}{'p99 ms':>10}")
+        imprimir(f"alta de un registro ({len(latencias)})", latencias)
+
+        print(f"\n{'después de archivar':<38}{'p50 ms':>10}{'p99 ms':>10}")
+        await medir(cliente, cabeceras, args.peticiones, True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.set_defaults(db=os.path.join(DIRECTORIO_DATOS, "bench_archivo.db"), registros_ingreso=5000000)
+    parser.add_argument("--lote", type=int, default=1000, help="Filas por lote del archivador (ARCHIVO_LOTE)")
+    parser.add_argument("--pausa", type=float, default=50.0, help="Milisegundos entre lotes (ARCHIVO_PAUSA)")
+    parser.add_argument("--peticiones", type=int, default=20, help="Peticiones por medición")
+    parser.add_argument("--altas-por-segundo", type=float, default=20.0, help="Ritmo de altas durante el archivado")
+    args = parser.parse_args()
+
+    ruta_trabajo = preparar_entorno("bench_archivo")
+    asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla)
+    shutil.copyfile(args.db, ruta_trabajo)
+    asyncio.run(main(args))
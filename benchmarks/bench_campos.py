@@ -0,0 +1,123 @@
+"""
+Tamaño de respuesta y latencia de los listados con `fields` y `expand`.
+
+Para cada listado compara la respuesta completa con variantes que piden solo algunas
+columnas (y, en productos, con la categoría expandida), con un cliente ASGI en proceso
+sobre una copia de la base sembrada. Se mide cada variante con las mismas páginas para
+que la diferencia se deba solo a las columnas consultadas y serializadas.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_campos --productos 100000 --peticiones 500 --limite 100
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import time
+from typing import Dict, List, Tuple
+
+from .comun import desactivar_limites, preparar_entorno, resumen_latencias
+from .datos import PASSWORD_ADMIN, agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+# (listado, tabla de volumen, requiere administrador, variantes: nombre -> parámetros)
+VARIANTES: List[Tuple[str, str, bool, Dict[str, Dict[str, str]]]] = [
+    ("productos", "productos", False, {
+        "completo": {},
+        "fields=id,nombre,precio": {"fields": "id,nombre,precio"},
+        "fields=id": {"fields": "id"},
+        "expand=categoria": {"expand": "categoria"},
+        "fields+expand": {"fields": "id,nombre,precio", "expand": "categoria"},
+    }),
+    ("categorias", "categorias", False, {
+        "completo": {},
+        "fields=id,nombre": {"fields": "id,nombre"},
+    }),
+    ("registros", "registros", False, {
+        "completo": {},
+        "fields=id,documento": {"fields": "id,documento"},
+    }),
+    ("usuarios", "usuarios", True, {
+        "completo": {},
+        "fields=id,username": {"fields": "id,username"},
+    }),
+]
+
+
+async def medir(cliente, ruta: str, parametros: Dict[str, str], cabeceras: Dict[str, str],
+                paginas: List[int], limite: int, concurrencia: int) -> Dict[str, float]:
+    latencias: List[float] = []
+    bytes_totales = 0
+    errores = 0
+    pendientes = iter(paginas)
+
+    async def trabajador():
+        nonlocal bytes_totales, errores
+        for skip in pendientes:
+            inicio = time.perf_counter()
+            r = await cliente.get(ruta, params={"skip": skip, "limit": limite, **parametros}, headers=cabeceras)
+            latencias.append(time.perf_counter() - inicio)
+            if r.status_code != 200:
+                errores += 1
+                if errores == 1:
+                    print(f"  ADVERTENCIA: {ruta} {parametros} devolvió {r.status_code}: {r.text[:200]}")
+            bytes_totales += len(r.content)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    return {**resumen_latencias(latencias, time.perf_counter() - inicio, errores),
+            "bytes_por_respuesta": bytes_totales / len(paginas)}
+
+
+async def main(args) -> None:
+    import httpx
+
+    from app.main import app
+    from app.core.config import settings
+
+    desactivar_limites()
+    volumenes = volumenes_desde_argumentos(args)
+    rng = random.Random(args.semilla)
+
+    transporte = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+            r = await cliente.post(f"{settings.API_V1_STR}/auth/login",
+                                   data={"username": "bench_admin", "password": PASSWORD_ADMIN})
+            r.raise_for_status()
+            admin = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+            print(f"{'listado':<12}{'variante':<26}{'bytes/resp':>12}{'p50':>10}{'p99':>10} ms{'rps':>10}")
+            for listado, tabla, requiere_admin, variantes in VARIANTES:
+                if args.listados and listado not in args.listados:
+                    continue
+                maximo = max(0, volumenes[tabla] - args.limite)
+                paginas = [rng.randint(0, maximo) for _ in range(args.peticiones)]
+                ruta = f"{settings.API_V1_STR}/{listado}/"
+                cabeceras = admin if requiere_admin else {}
+
+                base = None
+                for nombre, parametros in variantes.items():
+                    # Una pasada de calentamiento para que la caché de páginas de SQLite no favorezca a la segunda
+                    await medir(cliente, ruta, parametros, cabeceras, paginas[:20], args.limite, args.concurrencia)
+                    resultado = await medir(cliente, ruta, parametros, cabeceras, paginas, args.limite,
+                                            args.concurrencia)
+                    base = base or resultado
+                    relativo = resultado["bytes_por_respuesta"] / base["bytes_por_respuesta"] * 100
+                    print(f"{listado:<12}{nombre:<26}{resultado['bytes_por_respuesta']:>12,.0f}"
+                          f"{resultado['p50_ms']:>10,.2f}{resultado['p99_ms']:>10,.2f}   {resultado['rps']:>10,.1f}"
+                          f"   ({relativo:.0f}% del completo)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.add_argument("--peticiones", type=int, default=500, help="Peticiones por variante")
+    parser.add_argument("--limite", type=int, default=100, help="Filas por página")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--listados", nargs="*", help="Listados a medir (por defecto, todos)")
+    args = parser.parse_args()
+
+    ruta_trabajo = preparar_entorno("bench_campos")
+    asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla)
+    shutil.copyfile(args.db, ruta_trabajo)
+    asyncio.run(main(args))
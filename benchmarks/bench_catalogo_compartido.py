@@ -0,0 +1,179 @@
+"""
+Memoria por worker y latencia de búsqueda del catálogo compartido frente a cachés por proceso.
+
+1. Memoria: arranca `--workers` procesos que cargan todos los productos, unos en un
+   diccionario propio (lo que haría una caché por proceso) y otros mapeando el fichero
+   compartido que genera la instantánea del catálogo. Cada proceso mide el aumento de su
+   RSS y de su PSS (la memoria compartida se reparte entre los procesos que la mapean) en
+   /proc/self/smaps_rollup, así que solo funciona en Linux.
+2. Búsqueda por id: diccionario en memoria, fichero mapeado y consulta a la base.
+3. Extremo a extremo: `GET /productos/{id}` y `GET /productos` con un cliente ASGI en
+   proceso, con el catálogo compartido activado y desactivado.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_catalogo_compartido --productos 100000 --workers 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import shutil
+import time
+from typing import Dict, List
+
+from .comun import desactivar_limites, preparar_entorno, resumen_latencias
+from .datos import agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+
+def _memoria() -> Dict[str, int]:
+    """RSS y PSS del proceso en KiB."""
+    valores = {}
+    with open("/proc/self/smaps_rollup") as fichero:
+        for linea in fichero:
+            nombre, _, resto = linea.partition(":")
+            if nombre in ("Rss", "Pss"):
+                valores[nombre] = int(resto.split()[0])
+    return valores
+
+
+def _worker(modo: str, ruta_tienda: str, listo, continuar, resultados) -> None:
+    """Carga el catálogo en el modo indicado, informa de su memoria y espera a que midan todos."""
+    from app.core.database import SessionLocal
+    from app.core.tienda_productos import TiendaProductos
+    from app.models.producto import Producto
+
+    # Solo cuenta lo que ocupa el catálogo, no los módulos importados
+    antes = _memoria()
+    if modo == "compartido":
+        tienda = TiendaProductos(ruta_tienda)
+        # Leer todas las filas para que todas las páginas del fichero estén mapeadas en este proceso
+        for i in range(len(tienda)):
+            tienda.fila(i)
+        datos = tienda
+    else:
+        db = SessionLocal()
+        try:
+            columnas = [columna.key for columna in Producto.__table__.columns]
+            datos = {fila.id: {c: getattr(fila, c) for c in columnas} for fila in db.query(Producto)}
+        finally:
+            db.close()
+    listo.wait()  # Todos cargados: la PSS reparte ya las páginas compartidas entre todos
+    despues = _memoria()
+    resultados.put({clave: despues[clave] - antes[clave] for clave in despues})
+    continuar.wait()
+    del datos
+
+
+def medir_memoria(modo: str, ruta_tienda: str, workers: int) -> List[Dict[str, int]]:
+    contexto = multiprocessing.get_context("spawn")
+    listo, continuar = contexto.Barrier(workers), contexto.Barrier(workers + 1)
+    resultados = contexto.Queue()
+    procesos = [contexto.Process(target=_worker, args=(modo, ruta_tienda, listo, continuar, resultados))
+                for _ in range(workers)]
+    for proceso in procesos:
+        proceso.start()
+    medidas = [resultados.get() for _ in procesos]
+    continuar.wait()
+    for proceso in procesos:
+        proceso.join()
+    return medidas
+
+
+def medir_busquedas(ruta_tienda: str, productos: int, busquedas: int) -> None:
+    from app.core.database import SessionLocal
+    from app.core.tienda_productos import TiendaProductos
+    from app.models.producto import Producto
+
+    rng = random.Random(0)
+    ids = [rng.randint(1, productos) for _ in range(busquedas)]
+    tienda = TiendaProductos(ruta_tienda)
+    columnas = [columna.key for columna in Producto.__table__.columns]
+
+    db = SessionLocal()
+    try:
+        cache = {fila.id: {c: getattr(fila, c) for c in columnas} for fila in db.query(Producto)}
+        casos = {
+            "diccionario por proceso": lambda i: cache.get(i),
+            "fichero compartido (mmap)": lambda i: tienda.fila(tienda.posicion(i)),
+            "base de datos (ORM)": lambda i: db.query(Producto).filter(Producto.id == i).first(),
+        }
+        print(f"\n{'búsqueda por id':<30}{'µs/búsqueda':>14}")
+        for nombre, buscar in casos.items():
+            repeticiones = ids if "base" not in nombre else ids[:max(1, len(ids) // 20)]
+            inicio = time.perf_counter()
+            for producto_id in repeticiones:
+                buscar(producto_id)
+            print(f"{nombre:<30}{(time.perf_counter() - inicio) / len(repeticiones) * 1e6:>14,.2f}")
+    finally:
+        db.close()
+
+
+async def medir_extremo(productos: int, peticiones: int) -> None:
+    import httpx
+
+    from app.core.catalogo_compartido import catalogo_compartido
+    from app.core.config import settings
+    from app.main import app
+
+    desactivar_limites()
+    api = settings.API_V1_STR
+    rng = random.Random(1)
+    ids = [rng.randint(1, productos) for _ in range(peticiones)]
+    paginas = [rng.randint(0, max(0, productos - 100)) for _ in range(peticiones)]
+
+    print(f"\n{'extremo a extremo':<44}{'p50':>10}{'p99':>10} ms{'rps':>10}")
+    # Con el ciclo de vida: la categoría anidada sale de las categorías en memoria
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as cliente:
+        for activo in (False, True):
+            catalogo_compartido.activo = activo
+            for nombre, hacer in (
+                    ("GET /productos/{id}", lambda i: cliente.get(f"{api}/productos/{ids[i]}")),
+                    ("GET /productos?limit=100", lambda i: cliente.get(f"{api}/productos/",
+                                                                       params={"skip": paginas[i], "limit": 100}))):
+                latencias = []
+                inicio = time.perf_counter()
+                for i in range(peticiones):
+                    t = time.perf_counter()
+                    r = await hacer(i)
+                    latencias.append(time.perf_counter() - t)
+                    r.raise_for_status()
+                resumen = resumen_latencias(latencias, time.perf_counter() - inicio)
+                etiqueta = f"{nombre}, {'compartido' if activo else 'base de datos'}"
+                print(f"{etiqueta:<44}{resumen['p50_ms']:>10,.2f}{resumen['p99_ms']:>10,.2f}   {resumen['rps']:>10,.1f}")
+
+
+def main(args) -> None:
+    from app.core.instantanea import instantanea_catalogo
+
+    os.makedirs(instantanea_catalogo.directorio, exist_ok=True)
+    manifiesto = instantanea_catalogo.generar("inicio")
+    ruta_tienda = instantanea_catalogo.ruta(manifiesto["tienda"])
+    print(f"{manifiesto['productos']} productos; fichero compartido de {os.path.getsize(ruta_tienda) / 1024:,.0f} KiB")
+
+    print(f"\n{'memoria por worker (KiB)':<30}{'RSS':>10}{'PSS':>10}{'PSS total':>12}")
+    for modo in ("por proceso", "compartido"):
+        medidas = medir_memoria(modo, ruta_tienda, args.workers)
+        rss = sum(m["Rss"] for m in medidas) / len(medidas)
+        pss = sum(m["Pss"] for m in medidas) / len(medidas)
+        print(f"{modo + f' ({args.workers} workers)':<30}{rss:>10,.0f}{pss:>10,.0f}{pss * len(medidas):>12,.0f}")
+
+    medir_busquedas(ruta_tienda, manifiesto["productos"], args.busquedas)
+    asyncio.run(medir_extremo(manifiesto["productos"], args.peticiones))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.add_argument("--workers", type=int, default=4, help="Procesos en la medida de memoria")
+    parser.add_argument("--busquedas", type=int, default=20000, help="Búsquedas por id en memoria")
+    parser.add_argument("--peticiones", type=int, default=500, help="Peticiones por caso de extremo a extremo")
+    args = parser.parse_args()
+
+    ruta_trabajo = preparar_entorno("bench_catalogo_compartido")
+    # Los procesos hijos heredan el entorno: misma base y mismo directorio de la instantánea
+    os.environ.setdefault("INSTANTANEA_DIR", os.path.join(os.path.dirname(ruta_trabajo), "instantaneas"))
+    asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla)
+    shutil.copyfile(args.db, ruta_trabajo)
+    main(args)
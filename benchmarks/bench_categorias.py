@@ -0,0 +1,196 @@
+"""
+Consistencia de las categorías en memoria entre workers tras escrituras concurrentes.
+
+Arranca uvicorn con varios workers y lanza clientes que, a la vez, crean, renombran y
+eliminan categorías y crean productos en ellas (cada petición puede caer en un worker
+distinto). Al terminar espera a que los cambios se propaguen y comprueba en todos los
+workers, con conexiones nuevas en cada petición:
+- que la categoría anidada en `GET /productos/{id}` coincide (nombre y versión) con la de
+  `GET /categorias/{id}`, que se lee de la base de datos,
+- que crear un producto en una categoría eliminada responde 400.
+Termina con código 1 si encuentra alguna inconsistencia.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_categorias --workers 4 --clientes 16 --operaciones 2000
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import sys
+import time
+from collections import Counter
+from typing import Dict, List
+
+from .carga import arrancar_servidor, detener_servidor
+from .comun import preparar_entorno, resumen_latencias
+from .datos import PASSWORD_ADMIN, agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+API = "/api/v1"
+OPERACIONES = ("renombrar", "crear", "eliminar", "producto")
+
+
+class Estado:
+    """Categorías creadas por la prueba: id -> id de un producto suyo, y las eliminadas."""
+
+    def __init__(self) -> None:
+        self.vivas: Dict[int, int] = {}
+        self.eliminadas: List[int] = []
+        self.secuencia = 0
+        # Los nombres son únicos: contra una instancia ya usada no pueden repetir los de otra ejecución
+        self.ejecucion = int(time.time()) % 1000000
+
+    def nombre(self) -> str:
+        self.secuencia += 1
+        return f"Bench {self.ejecucion} {self.secuencia}"
+
+
+async def crear_categoria(cliente, cabeceras, estado: Estado) -> int:
+    r = await cliente.post(f"{API}/categorias/", json={"nombre": estado.nombre()}, headers=cabeceras)
+    r.raise_for_status()
+    categoria_id = r.json()["id"]
+    r = await cliente.post(f"{API}/productos/", headers=cabeceras,
+                           json={"nombre": f"Producto bench {categoria_id}", "precio": 100, "categoria_id": categoria_id})
+    r.raise_for_status()
+    estado.vivas[categoria_id] = r.json()["id"]
+    return categoria_id
+
+
+async def operacion(tipo: str, cliente, cabeceras, estado: Estado, rng: random.Random) -> str:
+    if tipo == "crear" or not estado.vivas:
+        await crear_categoria(cliente, cabeceras, estado)
+        return "crear"
+
+    categoria_id = rng.choice(list(estado.vivas))
+    if tipo == "renombrar":
+        r = await cliente.put(f"{API}/categorias/{categoria_id}", json={"nombre": estado.nombre()}, headers=cabeceras)
+    elif tipo == "eliminar":
+        estado.vivas.pop(categoria_id)
+        r = await cliente.delete(f"{API}/categorias/{categoria_id}", headers=cabeceras)
+        if r.status_code == 200:
+            estado.eliminadas.append(categoria_id)
+    else:
+        r = await cliente.post(f"{API}/productos/", headers=cabeceras,
+                               json={"nombre": "Producto bench", "precio": 100, "categoria_id": categoria_id})
+    return tipo if r.status_code in (200, 201) else f"{tipo}_http_{r.status_code}"
+
+
+async def verificar(url: str, cabeceras: Dict[str, str], estado: Estado, lecturas: int) -> Counter:
+    import httpx
+
+    resultados: Counter = Counter()
+    # Sin keep-alive: cada petición abre una conexión y puede atenderla cualquier worker
+    limites = httpx.Limits(max_connections=16, max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60) as cliente:
+        reales = {}
+        for categoria_id in estado.vivas:
+            r = await cliente.get(f"{API}/categorias/{categoria_id}")
+            r.raise_for_status()
+            reales[categoria_id] = r.json()
+
+        async def comprobar_producto(categoria_id: int, producto_id: int) -> None:
+            r = await cliente.get(f"{API}/productos/{producto_id}")
+            anidada = r.json()["categoria"]
+            real = reales[categoria_id]
+            if (anidada["nombre"], anidada["version"]) == (real["nombre"], real["version"]):
+                resultados["producto_coincide"] += 1
+            else:
+                resultados["producto_desfasado"] += 1
+
+        async def comprobar_eliminada(categoria_id: int) -> None:
+            r = await cliente.post(f"{API}/productos/", headers=cabeceras,
+                                   json={"nombre": "Producto huerfano", "precio": 1, "categoria_id": categoria_id})
+            resultados["eliminada_rechazada" if r.status_code == 400 else f"eliminada_http_{r.status_code}"] += 1
+
+        tareas = []
+        for _ in range(lecturas):
+            tareas += [comprobar_producto(c, p) for c, p in estado.vivas.items()]
+            tareas += [comprobar_eliminada(c) for c in estado.eliminadas]
+        for i in range(0, len(tareas), 16):
+            await asyncio.gather(*tareas[i:i + 16])
+    return resultados
+
+
+async def main(args, url: str) -> int:
+    """Ejecuta las escrituras y la verificación; devuelve el número de inconsistencias."""
+    import httpx
+
+    limites = httpx.Limits(max_connections=args.clientes, max_keepalive_connections=args.clientes,
+                           keepalive_expiry=2.0)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60) as cliente:
+        r = await cliente.post(f"{API}/auth/login", data={"username": "bench_admin", "password": PASSWORD_ADMIN})
+        r.raise_for_status()
+        cabeceras = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        estado = Estado()
+        for _ in range(args.iniciales):
+            await crear_categoria(cliente, cabeceras, estado)
+
+        rng = random.Random(args.semilla)
+        pesos = [args.peso_renombrar, args.peso_crear, args.peso_eliminar, args.peso_producto]
+        resultados: Counter = Counter()
+        latencias: List[float] = []
+        pendientes = iter(range(args.operaciones))
+
+        async def escritor():
+            for _ in pendientes:
+                tipo = rng.choices(OPERACIONES, pesos)[0]
+                inicio = time.perf_counter()
+                resultados[await operacion(tipo, cliente, cabeceras, estado, rng)] += 1
+                latencias.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(escritor() for _ in range(args.clientes)))
+        resumen = resumen_latencias(latencias, time.perf_counter() - inicio)
+
+    print(f"{args.clientes} clientes, {args.operaciones} operaciones en {args.workers} workers")
+    print(f"  operaciones_por_segundo: {resumen['rps']:,.2f}")
+    print(f"  p50_ms: {resumen['p50_ms']:,.2f}")
+    print(f"  p99_ms: {resumen['p99_ms']:,.2f}")
+    print(f"  resultados: {dict(resultados)}")
+    print(f"  categorías vivas: {len(estado.vivas)}, eliminadas: {len(estado.eliminadas)}")
+
+    await asyncio.sleep(args.espera)
+    verificacion = await verificar(url, cabeceras, estado, args.lecturas)
+    print(f"\nverificación tras {args.espera:.1f} s")
+    print(f"  {dict(verificacion)}")
+    errores = sum(n for clave, n in verificacion.items()
+                  if clave not in ("producto_coincide", "eliminada_rechazada"))
+    print(f"  inconsistencias: {errores}")
+    return errores
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.add_argument("--url", help="Instancia ya en marcha (por defecto se arranca una con uvicorn)")
+    parser.add_argument("--workers", type=int, default=4, help="Procesos de uvicorn de la instancia local")
+    parser.add_argument("--clientes", type=int, default=16, help="Escritores concurrentes")
+    parser.add_argument("--operaciones", type=int, default=2000)
+    parser.add_argument("--iniciales", type=int, default=20, help="Categorías creadas antes de empezar")
+    parser.add_argument("--peso-renombrar", type=float, default=4)
+    parser.add_argument("--peso-crear", type=float, default=1)
+    parser.add_argument("--peso-eliminar", type=float, default=1)
+    parser.add_argument("--peso-producto", type=float, default=4)
+    parser.add_argument("--espera", type=float, default=3.0,
+                        help="Segundos entre el fin de las escrituras y la verificación (> CAMBIOS_INTERVALO)")
+    parser.add_argument("--lecturas", type=int, default=5, help="Comprobaciones de cada categoría en la verificación")
+    args = parser.parse_args()
+
+    proceso = None
+    url = args.url
+    if url is None:
+        ruta_trabajo = preparar_entorno("bench_categorias")
+        asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla)
+        shutil.copyfile(args.db, ruta_trabajo)
+        proceso, url = arrancar_servidor(ruta_trabajo, args.workers)
+
+    try:
+        inconsistencias = asyncio.run(main(args, url))
+    finally:
+        if proceso is not None:
+            detener_servidor(proceso)
+
+    if inconsistencias:
+        print(f"\nERROR: {inconsistencias} inconsistencias entre workers")
+        sys.exit(1)
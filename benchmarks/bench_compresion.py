@@ -0,0 +1,116 @@
+"""
+Coste de CPU frente a bytes ahorrados de cada codificación y nivel de compresión.
+
+Obtiene cuerpos reales de la API (páginas de productos de varios tamaños, categorías y la
+página de bienvenida) con un cliente ASGI en proceso y, para cada codificación disponible
+(gzip y, si están instalados, br y zstd) y cada nivel, mide el tiempo de CPU por compresión
+y el tamaño resultante. Después mide de extremo a extremo `GET /productos` sin compresión,
+comprimiendo cada vez (páginas distintas) y sirviendo desde la caché de comprimidos (la
+misma página repetida).
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_compresion --productos 100000 --repeticiones 20
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import time
+from typing import Dict, List
+
+from .comun import desactivar_limites, preparar_entorno, resumen_latencias
+from .datos import agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+NIVELES = {
+    "gzip": [1, 3, 6, 9],
+    "br": [1, 3, 4, 5, 7, 9, 11],
+    "zstd": [1, 3, 6, 9, 12, 19],
+}
+
+
+async def obtener_cuerpos(cliente, api: str) -> Dict[str, bytes]:
+    cuerpos = {}
+    for limite in (100, 1000):
+        r = await cliente.get(f"{api}/productos/", params={"limit": limite})
+        cuerpos[f"productos limit={limite}"] = r.content
+    r = await cliente.get(f"{api}/productos/", params={"limit": 1000, "fields": "id,nombre,precio"})
+    cuerpos["productos fields (1000)"] = r.content
+    r = await cliente.get(f"{api}/categorias/", params={"limit": 100})
+    cuerpos["categorias limit=100"] = r.content
+    r = await cliente.get("/")
+    cuerpos["pagina de inicio"] = r.content
+    return cuerpos
+
+
+def medir_niveles(cuerpos: Dict[str, bytes], repeticiones: int) -> None:
+    from app.core.compresion import CODECS
+
+    print(f"{'cuerpo':<26}{'codif.':<7}{'nivel':>6}{'bytes':>10}{'ratio':>8}{'cpu ms':>9}{'MB/s':>9}")
+    for nombre, cuerpo in cuerpos.items():
+        print(f"{nombre:<26}{'-':<7}{'-':>6}{len(cuerpo):>10,}")
+        for codificacion, codec in CODECS.items():
+            for nivel in NIVELES[codificacion]:
+                inicio = time.process_time()
+                for _ in range(repeticiones):
+                    comprimido = codec.comprimir(cuerpo, nivel)
+                cpu = (time.process_time() - inicio) / repeticiones
+                print(f"{'':<26}{codificacion:<7}{nivel:>6}{len(comprimido):>10,}"
+                      f"{len(cuerpo) / len(comprimido):>8.1f}{cpu * 1000:>9.2f}"
+                      f"{len(cuerpo) / cpu / 1e6 if cpu else float('inf'):>9.0f}")
+
+
+async def medir_extremo(cliente, api: str, variantes: Dict[str, Dict], peticiones: int, productos: int) -> None:
+    rng = random.Random(0)
+    print(f"\n{'GET /productos limit=1000':<38}{'bytes/resp':>12}{'p50':>10}{'p99':>10} ms{'rps':>10}")
+    for nombre, (cabeceras, repetida) in variantes.items():
+        latencias: List[float] = []
+        total = 0
+        inicio = time.perf_counter()
+        for _ in range(peticiones):
+            skip = 0 if repetida else rng.randint(0, max(0, productos - 1000))
+            t = time.perf_counter()
+            r = await cliente.get(f"{api}/productos/", params={"skip": skip, "limit": 1000}, headers=cabeceras)
+            latencias.append(time.perf_counter() - t)
+            total += int(r.headers.get("content-length", len(r.content)))
+        resumen = resumen_latencias(latencias, time.perf_counter() - inicio)
+        print(f"{nombre:<38}{total / peticiones:>12,.0f}{resumen['p50_ms']:>10,.2f}"
+              f"{resumen['p99_ms']:>10,.2f}   {resumen['rps']:>10,.1f}")
+
+
+async def main(args) -> None:
+    import httpx
+
+    from app.core.compresion import CODECS
+    from app.core.config import settings
+    from app.main import app
+
+    desactivar_limites()
+    volumenes = volumenes_desde_argumentos(args)
+    api = settings.API_V1_STR
+    print(f"Codificaciones disponibles: {', '.join(CODECS)}\n")
+
+    # Sin Accept-Encoding explícito httpx pide gzip; para los cuerpos originales se pide identity
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 headers={"Accept-Encoding": "identity"}) as cliente:
+        cuerpos = await obtener_cuerpos(cliente, api)
+        medir_niveles(cuerpos, args.repeticiones)
+
+        variantes = {"sin comprimir": ({"Accept-Encoding": "identity"}, False)}
+        for codificacion in CODECS:
+            variantes[f"{codificacion} nivel {settings.COMPRESION_NIVELES[codificacion]}, páginas distintas"] = (
+                {"Accept-Encoding": codificacion}, False)
+            variantes[f"{codificacion}, misma página (caché)"] = ({"Accept-Encoding": codificacion}, True)
+        await medir_extremo(cliente, api, variantes, args.peticiones, volumenes["productos"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.add_argument("--repeticiones", type=int, default=20, help="Compresiones por cuerpo, codificación y nivel")
+    parser.add_argument("--peticiones", type=int, default=100, help="Peticiones por variante de extremo a extremo")
+    args = parser.parse_args()
+
+    ruta_trabajo = preparar_entorno("bench_compresion")
+    asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla)
+    shutil.copyfile(args.db, ruta_trabajo)
+    asyncio.run(main(args))
@@ -0,0 +1,176 @@
+"""
+Exportación en columnas (`/export?format=arrow|parquet`) frente a recorrer los listados JSON.
+
+Para cada recurso (`productos` y `registros-ingreso`) y cada modo arranca uvicorn en un
+subproceso nuevo sobre una copia de la base sembrada y descarga la tabla entera desde otro
+subproceso cliente, que termina con los datos en una tabla de Arrow (lo que haría el equipo
+de datos antes de pasarlos a un dataframe):
+- `json`: páginas de MAX_LIMIT del listado (por cursor en registros de ingreso, por
+  skip/limit en productos), acumuladas como dicts y convertidas al final,
+- `arrow`: el flujo IPC leído mientras llega,
+- `parquet`: el fichero descargado y leído.
+
+Muestra filas por segundo, bytes transferidos y el pico de memoria residente del servidor
+(VmHWM de /proc, solo Linux) y del cliente (ru_maxrss), cada uno en un proceso propio para
+que un modo no herede el pico de otro. El servidor arranca sin instantánea del catálogo
+(INSTANTANEA_GENERAR=False), para que su generación no se sume al pico y el listado JSON de
+productos se lea de la base como el resto.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_exportacion --productos 1000000 --registros-ingreso 2000000
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+
+from .carga import arrancar_servidor, detener_servidor
+from .comun import DIRECTORIO_DATOS, preparar_entorno
+from .datos import PASSWORD_ADMIN, agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+API = "/api/v1"
+RECURSOS = ("productos", "registros-ingreso")
+MODOS = ("json", "arrow", "parquet")
+
+
+def pico_memoria_servidor(pid: int) -> Optional[int]:
+    """Pico de memoria residente del proceso en bytes (VmHWM), o None fuera de Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as fichero:
+            for linea in fichero:
+                if linea.startswith("VmHWM:"):
+                    return int(linea.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def cliente(url: str, recurso: str, modo: str) -> Dict:
+    """Descarga el recurso completo en el modo indicado (se ejecuta en su propio proceso)."""
+    import io
+
+    import httpx
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    with httpx.Client(base_url=url, timeout=600) as http:
+        r = http.post(f"{API}/auth/login", data={"username": "bench_admin", "password": PASSWORD_ADMIN})
+        r.raise_for_status()
+        cabeceras = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        ruta = f"{API}/{recurso}/"
+        transferidos = 0
+
+        inicio = time.perf_counter()
+        if modo == "json":
+            filas = []
+            parametros = {"limit": 1000}
+            if recurso == "registros-ingreso":
+                parametros["desde"] = "2000-01-01T00:00:00"  # Orden por (fecha_ingreso, id) con cursor
+            while True:
+                r = http.get(ruta, params=parametros, headers=cabeceras)
+                r.raise_for_status()
+                transferidos += r.num_bytes_downloaded
+                pagina = r.json()
+                filas += pagina
+                if len(pagina) < parametros["limit"]:
+                    break
+                if "X-Siguiente-Cursor" in r.headers:
+                    parametros["cursor"] = r.headers["X-Siguiente-Cursor"]
+                else:
+                    parametros["skip"] = parametros.get("skip", 0) + len(pagina)
+            tabla = pa.Table.from_pylist(filas)
+        else:
+            with http.stream("GET", f"{ruta}export", params={"format": modo}, headers=cabeceras) as r:
+                r.raise_for_status()
+                if modo == "arrow":
+                    tabla = pa.ipc.open_stream(_LectorRespuesta(r)).read_all()
+                else:
+                    tabla = pq.read_table(io.BytesIO(r.read()))
+                transferidos = r.num_bytes_downloaded
+        segundos = time.perf_counter() - inicio
+
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {"filas": tabla.num_rows, "segundos": segundos, "bytes": transferidos, "pico_cliente": pico}
+
+
+class _LectorRespuesta:
+    """Fichero de solo lectura sobre el cuerpo de una respuesta de httpx en streaming."""
+
+    def __init__(self, respuesta) -> None:
+        self._bloques = respuesta.iter_raw()
+        self._pendiente = b""
+        self.closed = False
+
+    def read(self, n: int = -1) -> bytes:
+        while n < 0 or len(self._pendiente) < n:
+            bloque = next(self._bloques, None)
+            if bloque is None:
+                break
+            self._pendiente += bloque
+        if n < 0:
+            datos, self._pendiente = self._pendiente, b""
+        else:
+            datos, self._pendiente = self._pendiente[:n], self._pendiente[n:]
+        return datos
+
+    def readable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def medir(ruta_db: str, recurso: str, modo: str) -> Dict:
+    proceso, url = arrancar_servidor(ruta_db, 1, {"INSTANTANEA_GENERAR": "False",
+                                                  "CATALOGO_COMPARTIDO_ACTIVO": "False"})
+    try:
+        base = pico_memoria_servidor(proceso.pid)
+        salida = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_exportacion", "--cliente", url, recurso, modo],
+            check=True, capture_output=True, text=True,
+        )
+        resultado = json.loads(salida.stdout.strip().splitlines()[-1])
+        resultado["base_servidor"] = base
+        resultado["pico_servidor"] = pico_memoria_servidor(proceso.pid)
+    finally:
+        detener_servidor(proceso)
+    return resultado
+
+
+def main(args) -> None:
+    def mb(valor: Optional[int]) -> str:
+        return f"{valor / 1048576:,.0f}" if valor is not None else "-"
+
+    print(f"{args.productos:,} productos, {args.registros_ingreso:,} registros de ingreso")
+    print(f"\n{'recurso':<20}{'modo':<9}{'filas':>11}{'s':>8}{'filas/s':>11}{'MB enviados':>13}"
+          f"{'RSS servidor MB':>17}{'pico cliente MB':>17}")
+    for recurso in RECURSOS:
+        for modo in MODOS:
+            r = medir(args.ruta_trabajo, recurso, modo)
+            servidor = f"{mb(r['base_servidor'])} -> {mb(r['pico_servidor'])}"
+            print(f"{recurso:<20}{modo:<9}{r['filas']:>11,}{r['segundos']:>8,.1f}"
+                  f"{r['filas'] / r['segundos']:>11,.0f}{r['bytes'] / 1048576:>13,.1f}"
+                  f"{servidor:>17}{mb(r['pico_cliente']):>17}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--cliente":
+        print(json.dumps(cliente(*sys.argv[2:])))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.set_defaults(db=os.path.join(DIRECTORIO_DATOS, "bench_exportacion.db"),
+                        productos=1000000, registros_ingreso=2000000)
+    args = parser.parse_args()
+
+    args.ruta_trabajo = preparar_entorno("bench_exportacion")
+    asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla)
+    shutil.copyfile(args.db, args.ruta_trabajo)
+    main(args)
@@ -0,0 +1,151 @@
+"""
+Tormenta de reintentos sobre las altas, con y sin `Idempotency-Key`.
+
+Arranca uvicorn con varios workers y, para `POST /productos` y `POST /auth/registro`,
+lanza `--operaciones` altas distintas; cada una se envía `--reintentos` veces, separadas
+`--separacion` ms, como un cliente cuyo timeout vence antes de que responda el servidor
+(los reintentos llegan mientras la primera sigue en curso, y los últimos ya terminada).
+Cada copia usa su propia conexión, así que los reintentos de una misma alta se reparten
+entre los workers. Modos:
+- `sin_clave`: reintentos sin cabecera, como hasta ahora,
+- `memoria`: con `Idempotency-Key` y el almacén en memoria de cada worker,
+- `base`: con `Idempotency-Key` y el almacén compartido en la tabla `claves_idempotencia`.
+
+Al terminar cuenta en la base las filas creadas por alta (lo correcto es 1) y resume los
+estados devueltos, las respuestas repetidas y la latencia de cada petición.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_idempotencia --workers 4 --operaciones 200 --reintentos 4
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import sqlite3
+import time
+from collections import Counter
+from typing import Dict, List
+
+from .carga import arrancar_servidor, detener_servidor
+from .comun import preparar_entorno, resumen_latencias
+from .datos import PASSWORD_ADMIN, agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+API = "/api/v1"
+MODOS = ("sin_clave", "memoria", "base")
+ENDPOINTS = ("productos", "registro")
+
+# Contraseña que cumple la política; bcrypt la hashea en cada alta de usuario ejecutada
+PASSWORD_USUARIO = "Storm123!pass"
+
+
+def cuerpo_alta(endpoint: str, etiqueta: str, categorias: int) -> Dict:
+    if endpoint == "productos":
+        return {"nombre": etiqueta, "precio": 100, "stock": 10,
+                "categoria_id": random.randint(1, max(1, categorias))}
+    return {"email": f"{etiqueta}@tormenta.com", "username": etiqueta, "password": PASSWORD_USUARIO}
+
+
+def filas_creadas(ruta_db: str, endpoint: str, prefijo: str) -> Counter:
+    """Filas creadas por alta (etiqueta) en la base del servidor."""
+    consulta = ("SELECT nombre FROM productos WHERE nombre LIKE ?" if endpoint == "productos"
+                else "SELECT username FROM usuarios WHERE username LIKE ?")
+    with sqlite3.connect(ruta_db) as conexion:
+        return Counter(fila[0] for fila in conexion.execute(consulta, (f"{prefijo}%",)))
+
+
+async def ejecutar(modo: str, endpoint: str, url: str, token: str, args) -> Dict:
+    import httpx
+
+    prefijo = f"st{modo[:3]}{endpoint[:3]}"
+    ruta = f"{API}/productos/" if endpoint == "productos" else f"{API}/auth/registro"
+    latencias: List[float] = []
+    estados: Counter = Counter()
+    repetidas = 0
+    semaforo = asyncio.Semaphore(args.concurrencia)
+
+    async def copia(cuerpo: Dict, cabeceras: Dict[str, str], retraso: float) -> None:
+        nonlocal repetidas
+        await asyncio.sleep(retraso)
+        # Conexión nueva por copia, como un cliente que abandona la anterior al vencer su timeout
+        async with httpx.AsyncClient(base_url=url, timeout=60) as cliente:
+            t = time.perf_counter()
+            try:
+                r = await cliente.post(ruta, json=cuerpo, headers=cabeceras)
+            except httpx.HTTPError:
+                estados["error_red"] += 1
+                return
+            latencias.append(time.perf_counter() - t)
+            estados[r.status_code] += 1
+            repetidas += r.headers.get("idempotent-replayed") == "true"
+
+    async def alta(i: int) -> None:
+        etiqueta = f"{prefijo}{i:06d}"
+        cuerpo = cuerpo_alta(endpoint, etiqueta, args.categorias)
+        cabeceras = {"Authorization": f"Bearer {token}"} if endpoint == "productos" else {}
+        if modo != "sin_clave":
+            cabeceras["Idempotency-Key"] = f"{etiqueta}-{random.getrandbits(64):016x}"
+        async with semaforo:
+            await asyncio.gather(*(copia(cuerpo, cabeceras, n * args.separacion / 1000)
+                                   for n in range(args.reintentos)))
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(alta(i) for i in range(args.operaciones)))
+    duracion = time.perf_counter() - inicio
+
+    filas = filas_creadas(args.ruta_trabajo, endpoint, prefijo)
+    informe = resumen_latencias(latencias, duracion, estados["error_red"])
+    informe.update({
+        "estados": dict(sorted(estados.items(), key=str)),
+        "repetidas": repetidas,
+        "filas": sum(filas.values()),
+        "duplicadas": sum(n - 1 for n in filas.values()),
+        "altas_por_segundo": args.operaciones / duracion,
+    })
+    return informe
+
+
+async def login(url: str) -> str:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=url, timeout=60) as cliente:
+        r = await cliente.post(f"{API}/auth/login", data={"username": "bench_admin", "password": PASSWORD_ADMIN})
+        r.raise_for_status()
+        return r.json()["access_token"]
+
+
+def main(args) -> None:
+    print(f"{args.operaciones} altas por endpoint, {args.reintentos} envíos cada una "
+          f"separados {args.separacion} ms, {args.workers} workers")
+    for modo in args.modos:
+        shutil.copyfile(args.db, args.ruta_trabajo)
+        entorno = {"IDEMPOTENCIA_ALMACEN": "base" if modo == "base" else "memoria"}
+        proceso, url = arrancar_servidor(args.ruta_trabajo, args.workers, entorno)
+        try:
+            token = asyncio.run(login(url))
+            for endpoint in args.endpoints:
+                informe = asyncio.run(ejecutar(modo, endpoint, url, token, args))
+                print(f"\n{modo}, POST /{endpoint}")
+                print(f"  altas_por_segundo: {informe['altas_por_segundo']:,.1f}")
+                print(f"  p50_ms: {informe['p50_ms']:,.2f}  p99_ms: {informe['p99_ms']:,.2f}")
+                print(f"  estados: {informe['estados']}  repetidas: {informe['repetidas']}")
+                print(f"  filas creadas: {informe['filas']} (duplicadas: {informe['duplicadas']})")
+        finally:
+            detener_servidor(proceso)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.add_argument("--workers", type=int, default=4, help="Procesos de uvicorn de la instancia local")
+    parser.add_argument("--modos", nargs="+", choices=MODOS, default=list(MODOS))
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--operaciones", type=int, default=200, help="Altas distintas por endpoint y modo")
+    parser.add_argument("--reintentos", type=int, default=4, help="Envíos de cada alta (el primero y sus reintentos)")
+    parser.add_argument("--separacion", type=float, default=50.0, help="Milisegundos entre envíos de una alta")
+    parser.add_argument("--concurrencia", type=int, default=16, help="Altas en curso a la vez")
+    args = parser.parse_args()
+
+    random.seed(args.semilla)
+    args.ruta_trabajo = preparar_entorno("bench_idempotencia")
+    asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla)
+    main(args)
@@ -0,0 +1,113 @@
+"""
+Benchmark de ingesta de registros de ingreso.
+
+Mide, contra una base SQLite local y un cliente ASGI en proceso:
+- throughput de extremo a extremo (registros persistidos por segundo) del endpoint
+  `POST /registros-ingreso/ingesta` con la cola y el escritor por lotes,
+- latencia de confirmación (p50/p99) de cada lote aceptado,
+- el mismo volumen enviado con el `POST /registros-ingreso/` de una fila por solicitud.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_ingesta --eventos 50000 --lote 500 --clientes 8
+"""
+import argparse
+import asyncio
+import time
+
+from .comun import percentil, preparar_entorno
+
+preparar_entorno("bench_ingesta")
+
+import httpx  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.ingesta import escritor_ingresos  # noqa: E402
+from app.core.security import get_current_admin_user  # noqa: E402
+
+URL = f"{settings.API_V1_STR}/registros-ingreso"
+
+
+def lote(n):
+    return [{"nombre": f"torniquete-{i % 16}", "cantidad": 1} for i in range(n)]
+
+
+async def bench_lotes(cliente, eventos, tamano_lote, clientes):
+    latencias = []
+    rechazos = 0
+    por_cliente = eventos // tamano_lote // clientes
+    cuerpo = lote(tamano_lote)
+
+    async def productor():
+        nonlocal rechazos
+        for _ in range(por_cliente):
+            while True:
+                inicio = time.perf_counter()
+                r = await cliente.post(f"{URL}/ingesta", json=cuerpo)
+                if r.status_code == 202:
+                    latencias.append(time.perf_counter() - inicio)
+                    break
+                rechazos += 1
+                await asyncio.sleep(float(r.headers.get("Retry-After", "1")) / 10)
+
+    escritos_previos = escritor_ingresos.estadisticas["escritos"]
+    total = por_cliente * clientes * tamano_lote
+    inicio = time.perf_counter()
+    await asyncio.gather(*(productor() for _ in range(clientes)))
+    while escritor_ingresos.estadisticas["escritos"] - escritos_previos < total:
+        await asyncio.sleep(0.01)
+    duracion = time.perf_counter() - inicio
+
+    return {
+        "registros": total,
+        "registros_por_segundo": total / duracion,
+        "ack_p50_ms": percentil(latencias, 50) * 1000,
+        "ack_p99_ms": percentil(latencias, 99) * 1000,
+        "rechazos_503": rechazos,
+        "lotes_escritos": escritor_ingresos.estadisticas["lotes"],
+    }
+
+
+async def bench_fila_a_fila(cliente, eventos):
+    latencias = []
+    inicio = time.perf_counter()
+    for _ in range(eventos):
+        t = time.perf_counter()
+        await cliente.post(f"{URL}/", json={"nombre": "torniquete-0", "cantidad": 1})
+        latencias.append(time.perf_counter() - t)
+    duracion = time.perf_counter() - inicio
+
+    return {
+        "registros": eventos,
+        "registros_por_segundo": eventos / duracion,
+        "ack_p50_ms": percentil(latencias, 50) * 1000,
+        "ack_p99_ms": percentil(latencias, 99) * 1000,
+    }
+
+
+async def main(args):
+    app.dependency_overrides[get_current_admin_user] = lambda: None
+    escritor_ingresos.iniciar()
+
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        resultado_lotes = await bench_lotes(cliente, args.eventos, args.lote, args.clientes)
+        resultado_filas = await bench_fila_a_fila(cliente, args.eventos_fila)
+
+    escritor_ingresos.detener()
+
+    print(f"Ingesta por lotes ({args.lote}/solicitud, {args.clientes} clientes):")
+    for clave, valor in resultado_lotes.items():
+        print(f"  {clave}: {valor:,.2f}" if isinstance(valor, float) else f"  {clave}: {valor}")
+    print("POST fila a fila (commit por fila):")
+    for clave, valor in resultado_filas.items():
+        print(f"  {clave}: {valor:,.2f}" if isinstance(valor, float) else f"  {clave}: {valor}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eventos", type=int, default=50000)
+    parser.add_argument("--lote", type=int, default=500)
+    parser.add_argument("--clientes", type=int, default=8)
+    parser.add_argument("--eventos-fila", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,110 @@
+"""
+Catálogo completo: instantánea precompilada frente a los listados paginados.
+
+Con un cliente ASGI en proceso sobre una copia de la base sembrada, compara el tiempo y
+los bytes necesarios para obtener todas las categorías y productos:
+- recorriendo `GET /categorias` y `GET /productos` con páginas de `--limite` filas,
+- descargando `GET /catalogo/snapshot` en cada formato, sin comprimir y comprimido,
+- revalidando la instantánea con `If-None-Match` (304).
+Antes mide cuánto cuesta generar la instantánea (consulta, serialización y compresión).
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_instantanea --productos 100000 --repeticiones 10
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import time
+from typing import Dict, List
+
+from .comun import desactivar_limites, preparar_entorno, resumen_latencias
+from .datos import agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+
+async def catalogo_paginado(cliente, api: str, limite: int, cabeceras: Dict[str, str]) -> int:
+    total = 0
+    for listado in ("categorias", "productos"):
+        skip = 0
+        while True:
+            r = await cliente.get(f"{api}/{listado}/", params={"skip": skip, "limit": limite}, headers=cabeceras)
+            r.raise_for_status()
+            total += int(r.headers.get("content-length", len(r.content)))
+            if len(r.json()) < limite:
+                break
+            skip += limite
+    return total
+
+
+async def instantanea(cliente, api: str, parametros: Dict[str, str], cabeceras: Dict[str, str]) -> int:
+    r = await cliente.get(f"{api}/catalogo/snapshot", params=parametros, headers=cabeceras)
+    if r.status_code not in (200, 304):
+        raise RuntimeError(f"snapshot devolvió {r.status_code}: {r.text[:200]}")
+    return int(r.headers.get("content-length", len(r.content)))
+
+
+async def main(args) -> None:
+    import httpx
+
+    from app.core.compresion import CODECS
+    from app.core.config import settings
+    from app.core.instantanea import FORMATOS, instantanea_catalogo
+    from app.main import app
+
+    desactivar_limites()
+    api = settings.API_V1_STR
+
+    os.makedirs(instantanea_catalogo.directorio, exist_ok=True)
+    inicio = time.perf_counter()
+    manifiesto = instantanea_catalogo.generar("inicio")
+    print(f"Generación: {time.perf_counter() - inicio:.2f} s "
+          f"({manifiesto['categorias']} categorías, {manifiesto['productos']} productos; "
+          f"niveles {settings.INSTANTANEA_NIVELES})")
+    for formato, variantes in manifiesto["archivos"].items():
+        tamanos = ", ".join(f"{codificacion} {os.path.getsize(instantanea_catalogo.ruta(nombre)):,}"
+                            for codificacion, nombre in variantes.items())
+        print(f"  {formato}: {tamanos}")
+
+    codificacion = next(iter(CODECS)) if "zstd" not in CODECS else "zstd"
+    etiqueta = f'W/"{manifiesto["version"]}-json"'
+    casos = {
+        f"paginado limit={args.limite}, identity": (
+            lambda c: catalogo_paginado(c, api, args.limite, {"Accept-Encoding": "identity"})),
+        f"paginado limit={args.limite}, {codificacion}": (
+            lambda c: catalogo_paginado(c, api, args.limite, {"Accept-Encoding": codificacion})),
+    }
+    for formato in FORMATOS:
+        casos[f"snapshot {formato}, identity"] = (
+            lambda c, f=formato: instantanea(c, api, {"formato": f}, {"Accept-Encoding": "identity"}))
+        casos[f"snapshot {formato}, {codificacion}"] = (
+            lambda c, f=formato: instantanea(c, api, {"formato": f}, {"Accept-Encoding": codificacion}))
+    casos["snapshot json, If-None-Match (304)"] = (
+        lambda c: instantanea(c, api, {}, {"Accept-Encoding": codificacion, "If-None-Match": etiqueta}))
+
+    print(f"\n{'catálogo completo':<40}{'bytes':>14}{'p50':>10}{'p99':>10} ms")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 timeout=120) as cliente:
+        for nombre, caso in casos.items():
+            await caso(cliente)  # Calentamiento
+            latencias: List[float] = []
+            inicio = time.perf_counter()
+            for _ in range(args.repeticiones):
+                t = time.perf_counter()
+                total = await caso(cliente)
+                latencias.append(time.perf_counter() - t)
+            resumen = resumen_latencias(latencias, time.perf_counter() - inicio)
+            print(f"{nombre:<40}{total:>14,}{resumen['p50_ms']:>10,.1f}{resumen['p99_ms']:>10,.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.add_argument("--repeticiones", type=int, default=10, help="Descargas del catálogo por caso")
+    parser.add_argument("--limite", type=int, default=1000, help="Filas por página en los listados")
+    args = parser.parse_args()
+
+    ruta_trabajo = preparar_entorno("bench_instantanea")
+    os.environ.setdefault("INSTANTANEA_DIR", os.path.join(os.path.dirname(ruta_trabajo), "instantaneas"))
+    asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla)
+    shutil.copyfile(args.db, ruta_trabajo)
+    asyncio.run(main(args))
@@ -0,0 +1,151 @@
+"""
+Coste de los logins fallidos con y sin el bloqueo por usuario e IP.
+
+Con un cliente ASGI en proceso sobre una base SQLite temporal con `--intentos` usuarios, lanza
+`--intentos` logins con contraseña incorrecta en tres escenarios:
+- `sin bloqueo`: LOGIN_BLOQUEO_ACTIVO=False; cada intento cuesta un SELECT y bcrypt,
+- `un usuario, muchas IPs`: relleno de credenciales repartido, una IP distinta por intento
+  contra el mismo usuario (el límite de slowapi por IP no lo frena),
+- `una IP, muchos usuarios`: la misma IP prueba un usuario existente distinto en cada intento.
+
+Informa del tiempo de CPU del proceso por intento (todos los hilos, bcrypt incluido, y
+también el del cliente, que comparte el proceso), en media y solo de los rechazados con 429
+sin consultar la base, de la latencia y de cuántos intentos llegaron a verificar la
+contraseña (401) y cuántos se rechazaron.
+
+Cuenta también las llamadas a `verify_password` y termina con código 1 si algún intento
+rechazado con 429 llegó a verificar la contraseña, si un escenario con bloqueo no rechaza
+ninguno o si el rechazo no es al menos `--min-ahorro` veces más barato en CPU que un
+intento sin bloqueo.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_intentos_login --intentos 2000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+from typing import List
+
+from .comun import desactivar_limites, preparar_entorno, resumen_latencias
+
+preparar_entorno("bench_intentos_login")
+
+import httpx  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.routers import auth  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.database import SessionLocal  # noqa: E402
+from app.core.intentos_login import bloqueo_login  # noqa: E402
+from app.core.security import get_password_hash  # noqa: E402
+from app.models.usuario import Usuario as UsuarioModel  # noqa: E402
+
+
+def sembrar_usuarios(n: int) -> None:
+    # Un único hash bcrypt compartido: sembrar no debe dominar el tiempo del benchmark
+    hashed = get_password_hash("Contrasena123!")
+    db = SessionLocal()
+    db.execute(insert(UsuarioModel), [
+        {"email": f"usuario{i}@ejemplo.com", "username": f"usuario{i}", "hashed_password": hashed,
+         "is_active": True, "is_admin": False}
+        for i in range(n)
+    ])
+    db.commit()
+    db.close()
+
+
+verificaciones = Counter()
+_verify_password = auth.verify_password
+
+
+def verify_password_contado(*args):
+    verificaciones["total"] += 1
+    return _verify_password(*args)
+
+
+# El login usa el nombre importado en el router: se sustituye ahí para contar los bcrypt
+auth.verify_password = verify_password_contado
+
+
+async def escenario(intentos: int, usuario, ip):
+    """Intentos fallidos secuenciales; `usuario(i)` e `ip(i)` eligen el usuario y la IP de cada uno."""
+    clientes = {}
+    estados = Counter()
+    cpu = Counter()
+    latencias = []
+    inicio = time.perf_counter()
+    for i in range(intentos):
+        origen = ip(i)
+        if origen not in clientes:
+            clientes[origen] = httpx.AsyncClient(transport=httpx.ASGITransport(app=app, client=(origen, 50000)),
+                                                 base_url="http://bench")
+        t, c = time.perf_counter(), time.process_time()
+        r = await clientes[origen].post(f"{settings.API_V1_STR}/auth/login",
+                                        data={"username": usuario(i), "password": f"incorrecta{i}"})
+        # Intentos secuenciales: el bcrypt del pool de hilos termina antes de la respuesta
+        cpu[r.status_code] += time.process_time() - c
+        latencias.append(time.perf_counter() - t)
+        estados[r.status_code] += 1
+    duracion = time.perf_counter() - inicio
+    for cliente in clientes.values():
+        await cliente.aclose()
+    return cpu, resumen_latencias(latencias, duracion), estados
+
+
+async def main(args) -> List[str]:
+    """Ejecuta los escenarios y devuelve los fallos de las comprobaciones."""
+    sembrar_usuarios(args.intentos)
+    desactivar_limites()
+
+    print(f"{'escenario':<26}{'intentos':>9}{'CPU/intento ms':>16}{'CPU/429 ms':>12}{'p50 ms':>9}"
+          f"{'p99 ms':>9}{'401':>7}{'429':>7}")
+    referencia = None
+    fallos = []
+    for nombre, activo, intentos, usuario, ip in (
+            ("sin bloqueo", False, args.intentos_sin_bloqueo, lambda i: "usuario0", lambda i: "10.0.0.1"),
+            ("un usuario, muchas IPs", True, args.intentos, lambda i: "usuario0",
+             lambda i: f"10.1.{i // 250}.{i % 250}"),
+            ("una IP, muchos usuarios", True, args.intentos, lambda i: f"usuario{i}", lambda i: "10.2.0.1"),
+    ):
+        bloqueo_login.activo = activo
+        antes = verificaciones["total"]
+        cpu, resumen, estados = await escenario(intentos, usuario, ip)
+        verificadas = verificaciones["total"] - antes
+        por_intento = sum(cpu.values()) / intentos * 1000
+        referencia = referencia or por_intento
+        por_rechazo = cpu[429] / estados[429] * 1000 if estados[429] else None
+        print(f"{nombre:<26}{intentos:>9,}{por_intento:>16,.3f}"
+              f"{f'{por_rechazo:,.3f}' if por_rechazo else '-':>12}{resumen['p50_ms']:>9,.2f}"
+              f"{resumen['p99_ms']:>9,.2f}{estados[401]:>7,}{estados[429]:>7,}"
+              + (f"  (rechazo {referencia / por_rechazo:,.0f}x más barato)" if por_rechazo else ""))
+
+        # Cada 401 pasa por bcrypt una vez; un 429 no debe llegar a verificar la contraseña
+        if verificadas != estados[401]:
+            fallos.append(f"{nombre}: {verificadas} verificaciones de contraseña para {estados[401]} respuestas 401")
+        if activo and not por_rechazo:
+            fallos.append(f"{nombre}: ningún intento rechazado con 429")
+        elif activo and referencia / por_rechazo < args.min_ahorro:
+            fallos.append(f"{nombre}: rechazo solo {referencia / por_rechazo:,.1f}x más barato "
+                          f"(mínimo {args.min_ahorro:g}x)")
+
+    print(f"\nbloqueos: usuario {bloqueo_login.bloqueos.valor(tipo='usuario'):g}, "
+          f"ip {bloqueo_login.bloqueos.valor(tipo='ip'):g}; rechazados sin bcrypt: "
+          f"usuario {bloqueo_login.rechazados.valor(tipo='usuario'):g}, "
+          f"ip {bloqueo_login.rechazados.valor(tipo='ip'):g}")
+    return fallos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--intentos", type=int, default=2000, help="Intentos por escenario con bloqueo")
+    parser.add_argument("--intentos-sin-bloqueo", type=int, default=50,
+                        help="Intentos sin bloqueo (cada uno cuesta un bcrypt completo)")
+    parser.add_argument("--min-ahorro", type=float, default=20,
+                        help="Veces que un 429 debe ser más barato en CPU que un intento sin bloqueo")
+    fallos = asyncio.run(main(parser.parse_args()))
+    if fallos:
+        print("\nERROR:\n  " + "\n  ".join(fallos))
+        sys.exit(1)
@@ -0,0 +1,69 @@
+"""
+Benchmark de firma y verificación de tokens JWT por algoritmo.
+
+Compara HS256 (secreto compartido) con RS256 (RSA 2048/3072) y ES256 (P-256), usando
+claves ya construidas como en `app.core.claves` y, como referencia, pasando el PEM en
+cada llamada (lo que obliga a parsear la clave en cada firma o verificación).
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_jwt --segundos 2
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwk, jwt
+
+CLAIMS = {"sub": "usuario1", "uid": 1, "is_active": True, "is_admin": False}
+
+
+def pem_privado(clave) -> bytes:
+    return clave.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+
+
+def casos():
+    rsa2048 = pem_privado(rsa.generate_private_key(public_exponent=65537, key_size=2048))
+    rsa3072 = pem_privado(rsa.generate_private_key(public_exponent=65537, key_size=3072))
+    p256 = pem_privado(ec.generate_private_key(ec.SECP256R1()))
+
+    secreto = "clave_secreta_para_jwt_de_32_caracteres_minimo"
+    yield "HS256", "HS256", secreto, secreto
+    for nombre, algoritmo, pem in (("RS256-2048", "RS256", rsa2048),
+                                   ("RS256-3072", "RS256", rsa3072),
+                                   ("ES256", "ES256", p256)):
+        privada = jwk.construct(pem, algoritmo)
+        yield nombre, algoritmo, privada, privada.public_key()
+        yield f"{nombre} (PEM por llamada)", algoritmo, pem, privada.public_key().to_pem()
+
+
+def medir(funcion, segundos):
+    n = 0
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < segundos:
+        funcion()
+        n += 1
+    return n / (time.perf_counter() - inicio)
+
+
+def main(args):
+    print(f"{'algoritmo':<28}{'firmas/s':>12}{'verific./s':>12}{'bytes':>8}")
+    for nombre, algoritmo, clave_firma, clave_verificacion in casos():
+        def firmar():
+            claims = dict(CLAIMS, exp=datetime.utcnow() + timedelta(minutes=30), jti=uuid.uuid4().hex)
+            return jwt.encode(claims, clave_firma, algorithm=algoritmo)
+
+        token = firmar()
+        firmas = medir(firmar, args.segundos)
+        verificaciones = medir(lambda: jwt.decode(token, clave_verificacion, algorithms=[algoritmo]), args.segundos)
+        print(f"{nombre:<28}{firmas:>12,.0f}{verificaciones:>12,.0f}{len(token):>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segundos", type=float, default=2.0, help="Duración de cada medición")
+    main(parser.parse_args())
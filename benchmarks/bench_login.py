@@ -0,0 +1,99 @@
+"""
+Prueba de carga de logins concurrentes.
+
+Crea usuarios en una base SQLite temporal y lanza logins concurrentes contra
+`POST /auth/login` con un cliente ASGI en proceso. Informa logins por segundo,
+latencia p50/p99 y las sentencias SQL emitidas sobre `usuarios`, para comprobar
+que cada login cuesta un solo SELECT y que los UPDATE de último login se agrupan.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_login --usuarios 200 --logins 500 --concurrencia 32
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+from .comun import desactivar_limites, preparar_entorno, resumen_latencias
+
+preparar_entorno("bench_login")
+
+import httpx  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.database import SessionLocal, engine  # noqa: E402
+from app.core.security import get_password_hash  # noqa: E402
+from app.core.ultimo_login import registrador_ultimo_login  # noqa: E402
+from app.models.usuario import Usuario as UsuarioModel  # noqa: E402
+
+PASSWORD = "Contrasena123!"
+
+
+def sembrar_usuarios(n):
+    # Un único hash bcrypt compartido: sembrar no debe dominar el tiempo del benchmark
+    hashed = get_password_hash(PASSWORD)
+    db = SessionLocal()
+    db.execute(insert(UsuarioModel), [
+        {"email": f"bench{i}@ejemplo.com", "username": f"bench{i}", "hashed_password": hashed,
+         "is_active": True, "is_admin": False}
+        for i in range(n)
+    ])
+    db.commit()
+    db.close()
+
+
+async def main(args):
+    sembrar_usuarios(args.usuarios)
+    desactivar_limites()
+    registrador_ultimo_login.intervalo_flush = args.intervalo_flush
+    registrador_ultimo_login.iniciar()
+
+    sentencias = Counter()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        if "usuarios" in statement:
+            sentencias[statement.split()[0].upper()] += 1
+
+    latencias = []
+    errores = 0
+    siguiente = iter(range(args.logins))
+
+    async def cliente_login(cliente):
+        nonlocal errores
+        for i in siguiente:
+            datos = {"username": f"bench{i % args.usuarios}", "password": PASSWORD}
+            inicio = time.perf_counter()
+            r = await cliente.post(f"{settings.API_V1_STR}/auth/login", data=datos)
+            latencias.append(time.perf_counter() - inicio)
+            if r.status_code != 200:
+                errores += 1
+
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente_login(cliente) for _ in range(args.concurrencia)))
+        duracion = time.perf_counter() - inicio
+
+    registrador_ultimo_login.detener()
+    resumen = resumen_latencias(latencias, duracion, errores)
+
+    print(f"Logins: {args.logins} ({args.concurrencia} concurrentes, {args.usuarios} usuarios)")
+    print(f"  logins_por_segundo: {resumen['rps']:,.2f}")
+    print(f"  p50_ms: {resumen['p50_ms']:,.2f}")
+    print(f"  p99_ms: {resumen['p99_ms']:,.2f}")
+    print(f"  errores: {errores}")
+    print(f"  SELECT sobre usuarios: {sentencias['SELECT']}")
+    print(f"  UPDATE sobre usuarios: {sentencias['UPDATE']}")
+    print(f"  usuarios con último login escrito: {registrador_ultimo_login.estadisticas['escritos']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--concurrencia", type=int, default=32)
+    parser.add_argument("--intervalo-flush", type=float, default=settings.ULTIMO_LOGIN_INTERVALO_FLUSH)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,117 @@
+"""
+Operaciones de administración: llamadas sucesivas frente a una sola petición por lotes.
+
+Con un cliente ASGI en proceso sobre una copia de la base sembrada, ejecuta `--operaciones`
+operaciones típicas de una herramienta de administración (crear una categoría, crear
+productos en ella y ajustar su stock) de tres formas:
+- `secuencial`: una petición por operación, cada una autenticada por separado,
+- `lote`: un `POST /batch` con todas las operaciones,
+- `lote transaccional`: lo mismo con `transaccion: true` (todas o ninguna).
+Para cada forma mide la duración total y cuenta las sentencias SQL emitidas (todas las del
+proceso, incluidas las de los hilos de fondo, y las que leen el usuario autenticado).
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_lotes --operaciones 100 --repeticiones 10
+"""
+import argparse
+import asyncio
+import shutil
+import time
+from typing import Dict, List
+
+from .comun import desactivar_limites, preparar_entorno, resumen_latencias
+from .datos import PASSWORD_ADMIN, agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+
+def operaciones_admin(n: int, etiqueta: str) -> List[Dict]:
+    """Una categoría, productos en ella y ajustes de su stock: `n` operaciones en total."""
+    productos = n // 2
+    operaciones = [{"metodo": "POST", "ruta": "/categorias/", "cuerpo": {"nombre": f"Lote {etiqueta}"}}]
+    for i in range(productos):
+        operaciones.append({"metodo": "POST", "ruta": "/productos/",
+                            "cuerpo": {"nombre": f"Producto {etiqueta} {i}", "precio": 100 + i, "categoria_id": "$0.id"}})
+    for i in range(n - 1 - productos):
+        operaciones.append({"metodo": "PUT", "ruta": f"/productos/{{${i + 1}.id}}", "cuerpo": {"stock": 10 + i}})
+    return operaciones
+
+
+async def secuencial(cliente, api: str, cabeceras: Dict[str, str], operaciones: List[Dict]) -> None:
+    """Las mismas operaciones, una petición cada una, sustituyendo las referencias a mano."""
+    from app.core.lotes import resolver_referencias, resolver_ruta
+
+    cuerpos = []
+    for operacion in operaciones:
+        ruta = resolver_ruta(operacion["ruta"], cuerpos)
+        r = await cliente.request(operacion["metodo"], f"{api}{ruta}", headers=cabeceras,
+                                  json=resolver_referencias(operacion.get("cuerpo"), cuerpos))
+        r.raise_for_status()
+        cuerpos.append(r.json())
+
+
+async def lote(cliente, api: str, cabeceras: Dict[str, str], operaciones: List[Dict], transaccion: bool) -> None:
+    r = await cliente.post(f"{api}/batch", json={"operaciones": operaciones, "transaccion": transaccion},
+                           headers=cabeceras)
+    r.raise_for_status()
+    fallidas = [resultado for resultado in r.json()["resultados"] if resultado["status"] >= 400]
+    if fallidas:
+        raise RuntimeError(f"{len(fallidas)} operaciones fallidas: {fallidas[0]}")
+
+
+async def main(args) -> None:
+    import httpx
+    from sqlalchemy import event
+
+    from app.core.config import settings
+    from app.core.database import engine
+    from app.main import app
+
+    desactivar_limites()
+    api = settings.API_V1_STR
+    sentencias = {"total": 0, "usuario": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def contar(conn, cursor, sentencia, parametros, contexto, executemany):
+        sentencias["total"] += 1
+        sentencias["usuario"] += "FROM usuarios" in sentencia
+
+    casos = {
+        "secuencial": lambda c, h, ops: secuencial(c, api, h, ops),
+        "lote": lambda c, h, ops: lote(c, api, h, ops, False),
+        "lote transaccional": lambda c, h, ops: lote(c, api, h, ops, True),
+    }
+
+    print(f"{args.operaciones} operaciones por ejecución, {args.repeticiones} repeticiones")
+    print(f"\n{'forma':<22}{'p50 ms':>10}{'p99 ms':>10}{'ms/op':>8}{'SQL/ejec':>10}{'SQL usuario':>13}")
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120) as cliente:
+        r = await cliente.post(f"{api}/auth/login", data={"username": "bench_admin", "password": PASSWORD_ADMIN})
+        r.raise_for_status()
+        cabeceras = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        for n, (nombre, caso) in enumerate(casos.items()):
+            await caso(cliente, cabeceras, operaciones_admin(args.operaciones, f"c{n}x"))  # Calentamiento
+            latencias = []
+            sentencias.update(total=0, usuario=0)
+            inicio = time.perf_counter()
+            for repeticion in range(args.repeticiones):
+                operaciones = operaciones_admin(args.operaciones, f"c{n}r{repeticion}")
+                t = time.perf_counter()
+                await caso(cliente, cabeceras, operaciones)
+                latencias.append(time.perf_counter() - t)
+            resumen = resumen_latencias(latencias, time.perf_counter() - inicio)
+            print(f"{nombre:<22}{resumen['p50_ms']:>10,.1f}{resumen['p99_ms']:>10,.1f}"
+                  f"{resumen['p50_ms'] / args.operaciones:>8,.2f}"
+                  f"{sentencias['total'] / args.repeticiones:>10,.0f}{sentencias['usuario'] / args.repeticiones:>13,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.add_argument("--operaciones", type=int, default=100, help="Operaciones por ejecución (máximo del lote)")
+    parser.add_argument("--repeticiones", type=int, default=10, help="Ejecuciones por forma")
+    args = parser.parse_args()
+
+    ruta_trabajo = preparar_entorno("bench_lotes")
+    asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla)
+    shutil.copyfile(args.db, ruta_trabajo)
+    asyncio.run(main(args))
@@ -0,0 +1,201 @@
+"""
+Prueba de contención sobre el stock de unos pocos productos.
+
+Muchos clientes concurrentes reservan unidades de los mismos productos contra una
+instancia de uvicorn con varios workers, en uno o varios modos:
+- `reservar`: `POST /productos/{id}/reservar` (UPDATE condicional atómico),
+- `lote`: `POST /productos/reservar` con varios productos en orden aleatorio,
+- `put`: lectura del producto y `PUT /productos/{id}` con el stock descontado, como
+  hacían hasta ahora los clientes (lectura-modificación-escritura),
+- `version`: como `put`, pero enviando el ETag leído en `If-Match` y repitiendo la
+  lectura si el servidor responde 412 (control de concurrencia optimista).
+
+Antes de cada modo se repone el stock. Al terminar se compara lo que los clientes
+creen haber reservado con lo que realmente se descontó: la diferencia son
+actualizaciones perdidas (unidades vendidas de más), que solo deberían aparecer en `put`.
+En `version`, `reintento_412` cuenta los conflictos detectados y reintentados. Termina con
+código 1 si algún modo distinto de `put` pierde actualizaciones, así que sirve de prueba
+de concurrencia para las reservas atómicas y para `If-Match`.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_reservas --workers 4 --clientes 64 --intentos 2000
+    python -m benchmarks.bench_reservas --modos reservar put --calientes 2 --stock 300
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from .carga import arrancar_servidor, detener_servidor
+from .comun import preparar_entorno, resumen_latencias
+from .datos import PASSWORD_ADMIN, agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+API = "/api/v1"
+MODOS = ("reservar", "lote", "put", "version")
+
+# Modos en los que se esperan actualizaciones perdidas (el resto falla si pierde alguna)
+MODOS_SIN_CONTROL = ("put",)
+
+# Lecturas y escrituras máximas por intento en modo `version` antes de darlo por perdido
+REINTENTOS_VERSION = 20
+
+
+async def reponer_stock(cliente, cabeceras: Dict[str, str], ids: List[int], stock: int) -> None:
+    for producto_id in ids:
+        r = await cliente.put(f"{API}/productos/{producto_id}", json={"stock": stock}, headers=cabeceras)
+        r.raise_for_status()
+
+
+async def stock_total(cliente, ids: List[int]) -> int:
+    total = 0
+    for producto_id in ids:
+        r = await cliente.get(f"{API}/productos/{producto_id}")
+        r.raise_for_status()
+        total += r.json()["stock"]
+    return total
+
+
+async def intento(modo: str, cliente, cabeceras: Dict[str, str], ids: List[int], items_lote: int,
+                  rng: random.Random, resultados: Counter) -> Tuple[str, int]:
+    """Un intento de reserva. Devuelve el resultado y las unidades que el cliente cree reservadas."""
+    if modo == "reservar":
+        r = await cliente.post(f"{API}/productos/{rng.choice(ids)}/reservar", json={"cantidad": 1},
+                               headers=cabeceras)
+        if r.status_code == 200:
+            return "confirmada", 1
+        return ("sin_stock" if r.status_code == 409 else f"http_{r.status_code}"), 0
+
+    if modo == "lote":
+        elegidos = rng.sample(ids, min(items_lote, len(ids)))
+        r = await cliente.post(f"{API}/productos/reservar", headers=cabeceras,
+                               json={"items": [{"producto_id": i, "cantidad": 1} for i in elegidos]})
+        if r.status_code != 200:
+            return f"http_{r.status_code}", 0
+        if r.json()["reservado"]:
+            return "confirmada", len(elegidos)
+        return "sin_stock", 0
+
+    producto_id = rng.choice(ids)
+    for _ in range(REINTENTOS_VERSION if modo == "version" else 1):
+        r = await cliente.get(f"{API}/productos/{producto_id}")
+        if r.status_code != 200:
+            return f"http_{r.status_code}", 0
+        stock = r.json()["stock"]
+        if stock < 1:
+            return "sin_stock", 0
+        condicion = {"If-Match": r.headers["etag"]} if modo == "version" else {}
+        r = await cliente.put(f"{API}/productos/{producto_id}", json={"stock": stock - 1},
+                              headers={**cabeceras, **condicion})
+        if r.status_code == 200:
+            return "confirmada", 1
+        if r.status_code != 412:
+            return f"http_{r.status_code}", 0
+        resultados["reintento_412"] += 1
+    return "sin_confirmar", 0
+
+
+async def ejecutar_modo(modo: str, cliente, cabeceras: Dict[str, str], args) -> Dict:
+    ids = list(range(1, args.calientes + 1))
+    await reponer_stock(cliente, cabeceras, ids, args.stock)
+    inicial = await stock_total(cliente, ids)
+
+    rng = random.Random(args.semilla)
+    resultados: Counter = Counter()
+    latencias: List[float] = []
+    reservadas = 0
+    pendientes = iter(range(args.intentos))
+
+    async def reservador():
+        nonlocal reservadas
+        for _ in pendientes:
+            inicio = time.perf_counter()
+            resultado, unidades = await intento(modo, cliente, cabeceras, ids, args.items_lote, rng, resultados)
+            latencias.append(time.perf_counter() - inicio)
+            resultados[resultado] += 1
+            reservadas += unidades
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(reservador() for _ in range(args.clientes)))
+    duracion = time.perf_counter() - inicio
+
+    final = await stock_total(cliente, ids)
+    errores = sum(n for resultado, n in resultados.items() if resultado.startswith("http_"))
+    return {
+        **resumen_latencias(latencias, duracion, errores),
+        "resultados": dict(resultados),
+        "stock_inicial": inicial,
+        "stock_final": final,
+        "unidades_reservadas": reservadas,
+        "unidades_descontadas": inicial - final,
+        "actualizaciones_perdidas": reservadas - (inicial - final),
+    }
+
+
+async def main(args, url: str) -> List[str]:
+    """Ejecuta los modos y devuelve los que perdieron actualizaciones sin estar en MODOS_SIN_CONTROL."""
+    import httpx
+
+    # Caducidad por debajo del keep-alive de uvicorn (5 s): reutilizar una conexión que el
+    # servidor acaba de cerrar termina en "Server disconnected" en vez de en una respuesta
+    limites = httpx.Limits(max_connections=args.clientes, max_keepalive_connections=args.clientes,
+                           keepalive_expiry=2.0)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60) as cliente:
+        r = await cliente.post(f"{API}/auth/login", data={"username": "bench_admin", "password": PASSWORD_ADMIN})
+        r.raise_for_status()
+        cabeceras = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        print(f"{args.clientes} clientes, {args.intentos} intentos por modo, "
+              f"{args.calientes} productos con stock {args.stock}")
+        fallidos = []
+        for modo in args.modos:
+            informe = await ejecutar_modo(modo, cliente, cabeceras, args)
+            print(f"\n{modo}")
+            print(f"  intentos_por_segundo: {informe['rps']:,.2f}")
+            print(f"  p50_ms: {informe['p50_ms']:,.2f}")
+            print(f"  p99_ms: {informe['p99_ms']:,.2f}")
+            print(f"  resultados: {informe['resultados']}")
+            print(f"  unidades reservadas según los clientes: {informe['unidades_reservadas']}")
+            print(f"  unidades descontadas del stock: {informe['unidades_descontadas']}")
+            print(f"  actualizaciones perdidas: {informe['actualizaciones_perdidas']}")
+            if informe["actualizaciones_perdidas"] and modo not in MODOS_SIN_CONTROL:
+                fallidos.append(modo)
+        return fallidos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.add_argument("--url", help="Instancia ya en marcha (por defecto se arranca una con uvicorn)")
+    parser.add_argument("--workers", type=int, default=4, help="Procesos de uvicorn de la instancia local")
+    parser.add_argument("--modos", nargs="+", choices=MODOS, default=list(MODOS))
+    parser.add_argument("--clientes", type=int, default=64, help="Reservadores concurrentes")
+    parser.add_argument("--intentos", type=int, default=2000, help="Intentos de reserva por modo")
+    parser.add_argument("--calientes", type=int, default=4, help="Productos sobre los que se compite (ids 1..N)")
+    parser.add_argument("--stock", type=int, default=400, help="Stock inicial de cada producto")
+    parser.add_argument("--items-lote", type=int, default=3, help="Productos por reserva en modo lote")
+    parser.add_argument("--sin-admision", action="store_true",
+                        help="Desactiva el control de admisión para medir solo la contención en la base")
+    args = parser.parse_args()
+
+    proceso = None
+    url = args.url
+    if url is None:
+        ruta_trabajo = preparar_entorno("bench_reservas")
+        asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla)
+        shutil.copyfile(args.db, ruta_trabajo)
+        entorno = {"ADMISION_ACTIVA": "False"} if args.sin_admision else None
+        proceso, url = arrancar_servidor(ruta_trabajo, args.workers, entorno)
+
+    try:
+        fallidos = asyncio.run(main(args, url))
+    finally:
+        if proceso is not None:
+            detener_servidor(proceso)
+
+    if fallidos:
+        print(f"\nERROR: actualizaciones perdidas en {', '.join(fallidos)}")
+        sys.exit(1)
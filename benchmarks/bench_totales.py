@@ -0,0 +1,82 @@
+"""
+Coste de `X-Total-Count` en cada modo sobre una tabla grande de registros de ingreso.
+
+Con un cliente ASGI en proceso sobre una copia de la base sembrada (10 millones de registros
+de ingreso por defecto), pide `--peticiones` veces la primera página de
+`GET /registros-ingreso/` sin total y con `total=exacto`, `cache` y `aproximado`, sin
+filtros y con un rango de fechas (`desde`/`hasta`, un tercio de los datos). Para cada caso
+muestra la latencia de la primera petición (en `cache`, la que calcula el total), los
+percentiles del resto y el total devuelto. Al final mide lo que tarda el ANALYZE que
+mantiene `sqlite_stat1`, de la que sale el modo aproximado.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_totales --registros-ingreso 10000000 --peticiones 20
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import time
+
+from .comun import DIRECTORIO_DATOS, desactivar_limites, preparar_entorno, resumen_latencias
+from .datos import PASSWORD_ADMIN, agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+MODOS = (None, "exacto", "cache", "aproximado")
+
+# Un tercio de los 90 días de registros que siembra benchmarks.datos
+RANGO = {"desde": "2026-01-31T00:00:00", "hasta": "2026-03-02T00:00:00"}
+
+
+async def main(args) -> None:
+    import httpx
+
+    from app.core.config import settings
+    from app.main import app
+
+    desactivar_limites()
+    ruta = f"{settings.API_V1_STR}/registros-ingreso/"
+
+    print(f"{args.registros_ingreso:,} registros de ingreso, {args.peticiones} peticiones por caso")
+    print(f"\n{'caso':<24}{'primera ms':>12}{'p50 ms':>10}{'p99 ms':>10}{'total':>14}{'modo':>12}")
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=600) as cliente:
+        r = await cliente.post(f"{settings.API_V1_STR}/auth/login",
+                               data={"username": "bench_admin", "password": PASSWORD_ADMIN})
+        r.raise_for_status()
+        cabeceras = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        for filtros in ({}, RANGO):
+            for modo in MODOS:
+                parametros = dict(filtros, limit=1)
+                if modo is not None:
+                    parametros["total"] = modo
+                latencias = []
+                inicio = time.perf_counter()
+                for _ in range(args.peticiones):
+                    t = time.perf_counter()
+                    r = await cliente.get(ruta, params=parametros, headers=cabeceras)
+                    r.raise_for_status()
+                    latencias.append(time.perf_counter() - t)
+                resumen = resumen_latencias(latencias[1:] or latencias, time.perf_counter() - inicio)
+                caso = f"{modo or 'sin total'}{' + fechas' if filtros else ''}"
+                print(f"{caso:<24}{latencias[0] * 1000:>12,.1f}{resumen['p50_ms']:>10,.2f}{resumen['p99_ms']:>10,.2f}"
+                      f"{r.headers.get('x-total-count', '-'):>14}{r.headers.get('x-total-count-modo', '-'):>12}")
+
+    with sqlite3.connect(args.ruta_trabajo) as conexion:
+        t = time.perf_counter()
+        conexion.execute("ANALYZE registrosdeingreso")
+        print(f"\nANALYZE registrosdeingreso (actualiza sqlite_stat1): {time.perf_counter() - t:,.1f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.set_defaults(db=os.path.join(DIRECTORIO_DATOS, "bench_totales.db"), registros_ingreso=10000000)
+    parser.add_argument("--peticiones", type=int, default=20, help="Peticiones por caso")
+    args = parser.parse_args()
+
+    args.ruta_trabajo = preparar_entorno("bench_totales")
+    asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla)
+    shutil.copyfile(args.db, args.ruta_trabajo)
+    asyncio.run(main(args))
@@ -0,0 +1,332 @@
+"""
+Generador de carga HTTP con escenarios ponderados y llegadas en lazo abierto.
+
+Reproduce una mezcla de tráfico realista contra una instancia de `app.main:app`:
+- `navegar`: lectura anónima del catálogo (`/productos`, `/categorias`),
+- `sesion`: `/auth/login` seguido de `/usuarios/me`,
+- `admin`: escrituras de administración (productos, categorías, registros).
+
+Las sesiones llegan según un proceso de Poisson a la tasa indicada, sin esperar a que
+terminen las anteriores (lazo abierto): la latencia se mide desde el instante en que la
+petición debía salir, de modo que un servidor saturado no ralentiza al generador ni
+oculta su propia cola (omisión coordinada). `--rafaga-login` añade una ráfaga de logins,
+como en un cambio de turno.
+
+Sin `--url` arranca la aplicación con uvicorn en un subproceso sobre una copia de la base
+SQLite sembrada por `benchmarks.datos`, con los límites de tasa desactivados.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.carga --tasa 200 --duracion 60 --escenarios navegar=90 sesion=5 admin=5
+    python -m benchmarks.carga --tasa 50 --rafaga-login 20:200 --salida carga.json
+    python -m benchmarks.carga --url http://localhost:8000 --tasa 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .comun import percentil, preparar_entorno, resumen_latencias
+from .datos import PASSWORD_ADMIN, agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+API = "/api/v1"
+
+# Límites superiores (ms) de los intervalos del histograma de latencias
+INTERVALOS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Generador:
+    """Lanza escenarios en lazo abierto y acumula latencias por ruta."""
+
+    def __init__(self, cliente, volumenes: Dict[str, int], semilla: int, timeout: float) -> None:
+        self.cliente = cliente
+        self.volumenes = volumenes
+        self.rng = random.Random(semilla)
+        self.timeout = timeout
+        self.cabeceras_admin: Dict[str, str] = {}
+        self.latencias: Dict[str, List[float]] = defaultdict(list)
+        self.errores: Dict[str, int] = defaultdict(int)
+        self.codigos: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.en_curso = 0
+        self.max_en_curso = 0
+        self.max_retraso = 0.0
+
+    async def peticion(self, ruta: str, metodo: str, url: str, previsto: Optional[float] = None,
+                       **kwargs) -> Optional[object]:
+        """
+        Ejecuta una petición y registra su latencia bajo `ruta` (plantilla, no URL concreta).
+
+        Si se indica `previsto`, la latencia se cuenta desde ese instante y no desde el envío.
+        """
+        inicio = previsto if previsto is not None else time.perf_counter()
+        try:
+            r = await self.cliente.request(metodo, url, timeout=self.timeout, **kwargs)
+        except Exception:
+            self.latencias[ruta].append(time.perf_counter() - inicio)
+            self.errores[ruta] += 1
+            self.codigos[ruta][0] += 1
+            return None
+
+        self.latencias[ruta].append(time.perf_counter() - inicio)
+        self.codigos[ruta][r.status_code] += 1
+        if r.status_code >= 400:
+            self.errores[ruta] += 1
+        return r
+
+    def _id(self, tabla: str) -> int:
+        return self.rng.randint(2, self.volumenes[tabla])
+
+    async def navegar(self, previsto: float) -> None:
+        skip = self.rng.randint(0, max(self.volumenes["productos"] - 20, 0))
+        await self.peticion(f"GET {API}/productos/", "GET", f"{API}/productos/", previsto,
+                            params={"skip": skip, "limit": 20})
+        for _ in range(self.rng.randint(1, 3)):
+            await self.peticion(f"GET {API}/productos/{{id}}", "GET", f"{API}/productos/{self._id('productos')}")
+        if self.rng.random() < 0.3:
+            await self.peticion(f"GET {API}/categorias/", "GET", f"{API}/categorias/", params={"limit": 100})
+            await self.peticion(f"GET {API}/categorias/{{id}}", "GET", f"{API}/categorias/{self._id('categorias')}")
+
+    async def sesion(self, previsto: float) -> None:
+        datos = {"username": f"usuario{self._id('usuarios')}", "password": PASSWORD_ADMIN}
+        r = await self.peticion(f"POST {API}/auth/login", "POST", f"{API}/auth/login", previsto, data=datos)
+        if r is None or r.status_code != 200:
+            return
+        cabeceras = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        await self.peticion(f"GET {API}/usuarios/me", "GET", f"{API}/usuarios/me", headers=cabeceras)
+
+    async def admin(self, previsto: float) -> None:
+        opcion = self.rng.random()
+        if opcion < 0.6:
+            await self.peticion(f"PUT {API}/productos/{{id}}", "PUT", f"{API}/productos/{self._id('productos')}",
+                                previsto, headers=self.cabeceras_admin,
+                                json={"stock": self.rng.randint(0, 500), "precio": self.rng.randint(100, 1000000)})
+        elif opcion < 0.8:
+            await self.peticion(f"POST {API}/productos/", "POST", f"{API}/productos/", previsto,
+                                headers=self.cabeceras_admin,
+                                json={"nombre": f"Producto carga {self.rng.random():.8f}",
+                                      "precio": self.rng.randint(100, 1000000), "stock": 10,
+                                      "categoria_id": self._id("categorias")})
+        else:
+            await self.peticion(f"POST {API}/registros/", "POST", f"{API}/registros/", previsto,
+                                headers=self.cabeceras_admin,
+                                json={"documento": self.rng.randint(1000000, 99999999), "nombre": "Persona carga"})
+
+    async def _lanzar(self, escenario, previsto: float) -> None:
+        self.en_curso += 1
+        self.max_en_curso = max(self.max_en_curso, self.en_curso)
+        try:
+            await escenario(previsto)
+        finally:
+            self.en_curso -= 1
+
+    async def ejecutar(self, pesos: Dict[str, float], tasa: float, duracion: float,
+                       rafaga: Optional[Tuple[float, int]]) -> float:
+        """Genera llegadas de Poisson durante `duracion` segundos y espera a que terminen."""
+        nombres = list(pesos)
+        ponderaciones = [pesos[n] for n in nombres]
+        tareas = set()
+
+        def lanzar(escenario, previsto):
+            tarea = asyncio.ensure_future(self._lanzar(escenario, previsto))
+            tareas.add(tarea)
+            tarea.add_done_callback(tareas.discard)
+
+        inicio = time.perf_counter()
+        previsto = inicio
+        rafaga_pendiente = rafaga
+        while True:
+            previsto += self.rng.expovariate(tasa)
+            if previsto - inicio >= duracion:
+                break
+
+            if rafaga_pendiente and previsto - inicio >= rafaga_pendiente[0]:
+                momento = inicio + rafaga_pendiente[0]
+                for _ in range(rafaga_pendiente[1]):
+                    lanzar(self.sesion, momento)
+                rafaga_pendiente = None
+
+            espera = previsto - time.perf_counter()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            else:
+                self.max_retraso = max(self.max_retraso, -espera)
+
+            nombre = self.rng.choices(nombres, ponderaciones)[0]
+            lanzar(getattr(self, nombre), previsto)
+
+        if tareas:
+            await asyncio.gather(*tareas)
+        return time.perf_counter() - inicio
+
+
+def histograma(latencias: List[float]) -> Dict[str, int]:
+    """Cuenta de latencias por intervalo ("<=N ms"; el último, mayores que el mayor límite)."""
+    cuentas = {f"<={limite}": 0 for limite in INTERVALOS_MS}
+    cuentas[f">{INTERVALOS_MS[-1]}"] = 0
+    for latencia in latencias:
+        ms = latencia * 1000
+        for limite in INTERVALOS_MS:
+            if ms <= limite:
+                cuentas[f"<={limite}"] += 1
+                break
+        else:
+            cuentas[f">{INTERVALOS_MS[-1]}"] += 1
+    return cuentas
+
+
+def imprimir_informe(generador: Generador, duracion: float, mostrar_histogramas: bool) -> None:
+    print(f"{'ruta':<36}{'peticiones':>11}{'errores':>9}{'p50':>11}{'p95':>11}{'p99':>11}{'máx (ms)':>11}")
+    for ruta in sorted(generador.latencias):
+        latencias = generador.latencias[ruta]
+        r = resumen_latencias(latencias, duracion, generador.errores[ruta])
+        print(f"{ruta:<36}{r['peticiones']:>11}{r['errores']:>9}{r['p50_ms']:>11,.1f}{r['p95_ms']:>11,.1f}"
+              f"{r['p99_ms']:>11,.1f}{max(latencias) * 1000:>11,.1f}")
+        if mostrar_histogramas:
+            cuentas = histograma(latencias)
+            mayor = max(cuentas.values())
+            for intervalo, n in cuentas.items():
+                if n:
+                    print(f"    {intervalo:>8} ms {n:>8} {'#' * max(1, round(40 * n / mayor))}")
+
+    print(f"duración: {duracion:,.1f} s, sesiones simultáneas máx.: {generador.max_en_curso}, "
+          f"retraso máx. del generador: {generador.max_retraso * 1000:,.1f} ms")
+    if generador.max_retraso > 0.05:
+        print("ADVERTENCIA: el generador no mantuvo la tasa; reduce --tasa o ejecútalo en otra máquina")
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def arrancar_servidor(ruta_db: str, workers: int,
+                      entorno_extra: Optional[Dict[str, str]] = None) -> Tuple[subprocess.Popen, str]:
+    """Arranca uvicorn en un subproceso sobre la base SQLite indicada y espera a que responda."""
+    import httpx
+
+    puerto = puerto_libre()
+    entorno = dict(os.environ, SQLALCHEMY_DATABASE_URI=f"sqlite:///{ruta_db}", DEBUG="False",
+                   LIMITE_TASA_ACTIVO="False", **(entorno_extra or {}))
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(puerto),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        env=entorno,
+    )
+    url = f"http://127.0.0.1:{puerto}"
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"uvicorn terminó con código {proceso.returncode}")
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return proceso, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+
+    proceso.terminate()
+    raise RuntimeError("uvicorn no respondió en 60 s")
+
+
+def detener_servidor(proceso: subprocess.Popen) -> None:
+    proceso.terminate()
+    try:
+        proceso.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        # Un servidor saturado puede no completar el cierre ordenado
+        proceso.kill()
+        proceso.wait()
+
+
+def leer_pesos(valores: List[str]) -> Dict[str, float]:
+    pesos = {}
+    for valor in valores:
+        nombre, _, peso = valor.partition("=")
+        if nombre not in ("navegar", "sesion", "admin"):
+            raise SystemExit(f"Escenario desconocido: {nombre}")
+        pesos[nombre] = float(peso or 1)
+    return pesos
+
+
+async def main(args, url: str) -> Dict:
+    import httpx
+
+    limites = httpx.Limits(max_connections=args.conexiones, max_keepalive_connections=args.conexiones)
+    async with httpx.AsyncClient(base_url=url, limits=limites) as cliente:
+        generador = Generador(cliente, volumenes_desde_argumentos(args), args.semilla, args.timeout)
+        r = await cliente.post(f"{API}/auth/login", data={"username": "bench_admin", "password": PASSWORD_ADMIN})
+        r.raise_for_status()
+        generador.cabeceras_admin = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        rafaga = None
+        if args.rafaga_login:
+            segundo, _, cantidad = args.rafaga_login.partition(":")
+            rafaga = (float(segundo), int(cantidad))
+
+        duracion = await generador.ejecutar(leer_pesos(args.escenarios), args.tasa, args.duracion, rafaga)
+
+    imprimir_informe(generador, duracion, args.histogramas)
+    return {
+        "meta": {
+            "url": url,
+            "tasa": args.tasa,
+            "duracion": duracion,
+            "escenarios": leer_pesos(args.escenarios),
+            "rafaga_login": args.rafaga_login,
+            "max_retraso_ms": generador.max_retraso * 1000,
+        },
+        "rutas": {
+            ruta: dict(
+                resumen_latencias(latencias, duracion, generador.errores[ruta]),
+                max_ms=max(latencias) * 1000,
+                p999_ms=percentil(latencias, 99.9) * 1000,
+                codigos={str(c): n for c, n in generador.codigos[ruta].items()},
+                histograma_ms=histograma(latencias),
+            )
+            for ruta, latencias in sorted(generador.latencias.items())
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.add_argument("--url", help="Instancia ya en marcha (por defecto se arranca una con uvicorn)")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos de uvicorn de la instancia local")
+    parser.add_argument("--tasa", type=float, default=100.0, help="Sesiones nuevas por segundo")
+    parser.add_argument("--duracion", type=float, default=30.0, help="Segundos generando llegadas")
+    parser.add_argument("--escenarios", nargs="+", default=["navegar=90", "sesion=5", "admin=5"],
+                        help="Pesos de cada escenario, p. ej. navegar=90 sesion=5 admin=5")
+    parser.add_argument("--rafaga-login", help="SEGUNDO:CANTIDAD, ráfaga de sesiones simultáneas")
+    parser.add_argument("--conexiones", type=int, default=256, help="Conexiones HTTP máximas del cliente")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--histogramas", action="store_true", help="Imprime el histograma de cada ruta")
+    parser.add_argument("--salida", help="Fichero JSON con los resultados")
+    args = parser.parse_args()
+
+    proceso = None
+    url = args.url
+    if url is None:
+        ruta_trabajo = preparar_entorno("carga")
+        asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla)
+        shutil.copyfile(args.db, ruta_trabajo)
+        proceso, url = arrancar_servidor(ruta_trabajo, args.workers)
+
+    try:
+        informe = asyncio.run(main(args, url))
+    finally:
+        if proceso is not None:
+            detener_servidor(proceso)
+
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(informe, f, indent=2)
+        print(f"Resultados en {args.salida}")
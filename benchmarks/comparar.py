@@ -0,0 +1,86 @@
+"""
+Compara dos ficheros de resultados de `benchmarks.suite` y detecta regresiones.
+
+Un caso empeora si su throughput baja, o alguna de sus latencias p50/p95/p99 sube, más
+que el umbral relativo indicado. Las diferencias de latencia menores que `--min-ms`
+se ignoran, porque en endpoints de menos de un milisegundo son ruido de medición.
+Termina con código 1 si hay alguna regresión, para poder usarlo en integración continua.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.comparar antes.json despues.json --umbral 0.10
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Tuple
+
+LATENCIAS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def regresiones(base: Dict[str, float], nuevo: Dict[str, float], umbral: float, min_ms: float) -> List[str]:
+    """Métricas de un caso que empeoran más que el umbral."""
+    peores = []
+    if base["rps"] and nuevo["rps"] < base["rps"] * (1 - umbral):
+        peores.append("rps")
+    for metrica in LATENCIAS:
+        diferencia = nuevo[metrica] - base[metrica]
+        if diferencia > min_ms and nuevo[metrica] > base[metrica] * (1 + umbral):
+            peores.append(metrica)
+    if nuevo["errores"] > base["errores"]:
+        peores.append("errores")
+    return peores
+
+
+def comparar(base: Dict, nuevo: Dict, umbral: float, min_ms: float) -> Tuple[List[str], List[str]]:
+    """Imprime la comparación caso a caso. Devuelve (casos con regresión, casos sin par)."""
+    if base["meta"]["volumenes"] != nuevo["meta"]["volumenes"]:
+        print("ADVERTENCIA: los resultados se obtuvieron con volúmenes de datos distintos")
+
+    print(f"base: {base['meta'].get('commit')} ({base['meta']['fecha']})  "
+          f"nuevo: {nuevo['meta'].get('commit')} ({nuevo['meta']['fecha']})")
+    print(f"{'caso':<34}{'rps':>22}{'p95 ms':>22}{'p99 ms':>22}")
+
+    con_regresion = []
+    sin_par = sorted(set(base["casos"]) ^ set(nuevo["casos"]))
+    for nombre in base["casos"]:
+        if nombre not in nuevo["casos"]:
+            continue
+        b, n = base["casos"][nombre], nuevo["casos"][nombre]
+        peores = regresiones(b, n, umbral, min_ms)
+        if peores:
+            con_regresion.append(nombre)
+
+        columnas = "".join(
+            f"{b[m]:>9,.1f} →{n[m]:>9,.1f}{_variacion(b[m], n[m]):>2}" for m in ("rps", "p95_ms", "p99_ms")
+        )
+        print(f"{nombre:<34}{columnas}  {'REGRESIÓN: ' + ', '.join(peores) if peores else ''}")
+
+    if sin_par:
+        print(f"Casos que solo aparecen en uno de los ficheros: {', '.join(sin_par)}")
+    return con_regresion, sin_par
+
+
+def _variacion(antes: float, despues: float) -> str:
+    if not antes:
+        return ""
+    return "+" if despues > antes else "-" if despues < antes else "="
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base", help="Resultados de referencia (p. ej. de la rama principal)")
+    parser.add_argument("nuevo", help="Resultados a evaluar")
+    parser.add_argument("--umbral", type=float, default=0.10, help="Empeoramiento relativo tolerado (0.10 = 10%%)")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="Diferencia mínima de latencia a considerar")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.nuevo) as f:
+        nuevo = json.load(f)
+
+    con_regresion, _ = comparar(base, nuevo, args.umbral, args.min_ms)
+    if con_regresion:
+        print(f"{len(con_regresion)} casos con regresión superior al {args.umbral:.0%}")
+        sys.exit(1)
+    print("Sin regresiones")
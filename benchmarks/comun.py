@@ -0,0 +1,49 @@
+"""
+Utilidades compartidas por los benchmarks.
+
+`preparar_entorno` debe llamarse antes de importar `app`, porque el motor de base de
+datos se crea al importar `app.core.database` con la URI configurada en ese momento.
+"""
+import os
+import tempfile
+from typing import Dict, List, Sequence
+
+# Directorio por defecto para bases de datos sembradas reutilizables entre ejecuciones
+DIRECTORIO_DATOS = os.path.join(os.path.dirname(__file__), ".datos")
+
+
+def preparar_entorno(nombre: str, ruta_db: str = None) -> str:
+    """Configura una base SQLite (temporal si no se indica ruta) y desactiva el modo DEBUG."""
+    if ruta_db is None:
+        ruta_db = os.path.join(tempfile.mkdtemp(), f"{nombre}.db")
+    os.environ.setdefault("SQLALCHEMY_DATABASE_URI", f"sqlite:///{ruta_db}")
+    os.environ.setdefault("DEBUG", "False")
+    return ruta_db
+
+
+def desactivar_limites() -> None:
+    """Desactiva los límites de tasa de slowapi de la aplicación y de todos los routers."""
+    from app import main, routers
+
+    main.limiter.enabled = False
+    for nombre in routers.__all__:
+        limiter = getattr(getattr(routers, nombre), "limiter", None)
+        if limiter is not None:
+            limiter.enabled = False
+
+
+def percentil(valores: Sequence[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def resumen_latencias(latencias: List[float], duracion: float, errores: int = 0) -> Dict[str, float]:
+    """Throughput y percentiles (en milisegundos) de una serie de latencias en segundos."""
+    return {
+        "peticiones": len(latencias),
+        "errores": errores,
+        "rps": len(latencias) / duracion if duracion else 0.0,
+        "p50_ms": percentil(latencias, 50) * 1000,
+        "p95_ms": percentil(latencias, 95) * 1000,
+        "p99_ms": percentil(latencias, 99) * 1000,
+    }
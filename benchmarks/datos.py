@@ -0,0 +1,201 @@
+"""
+Siembra de datos de benchmark en SQLite con inserciones masivas.
+
+Genera datos deterministas (semilla fija) en bloques y los inserta con `executemany`
+en una sola transacción por tabla, con las PRAGMA de SQLite orientadas a carga masiva.
+Los volúmenes sembrados se guardan junto a la base (`<db>.json`) para reutilizarla
+en ejecuciones posteriores si coinciden; la suite trabaja sobre una copia, de modo
+que cada ejecución parte exactamente de los mismos datos.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.datos --db benchmarks/.datos/bench.db --productos 1000000 --registros-ingreso 5000000
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+
+from .comun import DIRECTORIO_DATOS, preparar_entorno
+
+TAMANO_BLOQUE = 50000
+PASSWORD_ADMIN = "Admin123!bench"
+
+VOLUMENES_POR_DEFECTO = {
+    "categorias": 1000,
+    "productos": 100000,
+    "registros": 100000,
+    "registros_ingreso": 500000,
+    "usuarios": 1000,
+}
+
+
+def _bloques(filas: Iterable[Dict], tamano: int = TAMANO_BLOQUE) -> Iterator[List[Dict]]:
+    iterador = iter(filas)
+    while True:
+        bloque = list(islice(iterador, tamano))
+        if not bloque:
+            return
+        yield bloque
+
+
+def _categorias(n: int) -> Iterator[Dict]:
+    for i in range(1, n + 1):
+        yield {"id": i, "nombre": f"Categoria {i}"}
+
+
+def _productos(n: int, categorias: int, rng: random.Random) -> Iterator[Dict]:
+    for i in range(1, n + 1):
+        yield {
+            "id": i,
+            "nombre": f"Producto {i}",
+            "descripcion": f"Descripción del producto {i}. " * rng.randint(1, 10),
+            "precio": rng.randint(100, 1000000),
+            "disponible": rng.random() > 0.1,
+            "stock": rng.randint(0, 500),
+            "categoria_id": rng.randint(1, categorias),
+        }
+
+
+def _registros(n: int, rng: random.Random) -> Iterator[Dict]:
+    for i in range(1, n + 1):
+        yield {"id": i, "documento": rng.randint(1000000, 99999999), "nombre": f"Persona {i}"}
+
+
+def _registros_ingreso(n: int, rng: random.Random, inicio: datetime, dias: int) -> Iterator[Dict]:
+    # Eventos ordenados en el tiempo, como los produciría un torniquete
+    paso = dias * 86400 / max(n, 1)
+    for i in range(1, n + 1):
+        yield {
+            "id": i,
+            "nombre": f"torniquete-{rng.randint(1, 32)}",
+            "descripcion": None,
+            "cantidad": rng.randint(1, 5),
+            "fecha_ingreso": inicio + timedelta(seconds=i * paso),
+        }
+
+
+def _usuarios(n: int, hashed: str) -> Iterator[Dict]:
+    yield {"id": 1, "email": "admin@bench.com", "username": "bench_admin", "hashed_password": hashed,
+           "is_active": True, "is_admin": True}
+    for i in range(2, n + 1):
+        yield {"id": i, "email": f"usuario{i}@bench.com", "username": f"usuario{i}", "hashed_password": hashed,
+               "is_active": True, "is_admin": False}
+
+
+def sembrar(ruta_db: str, volumenes: Dict[str, int], semilla: int = 42, dias_ingreso: int = 90) -> Dict[str, float]:
+    """Crea las tablas en `ruta_db` e inserta los volúmenes indicados. Devuelve segundos por tabla."""
+    from sqlalchemy import create_engine, insert
+
+    from app.core.agregados import calcular_deltas
+    from app.core.security import get_password_hash
+    from app.models import (
+        Base, Categoria, Producto, Registro, RegistroIngreso, RegistroIngresoResumen, Usuario
+    )
+
+    engine = create_engine(f"sqlite:///{ruta_db}")
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(semilla)
+    inicio_ingresos = datetime(2026, 1, 1)
+    tiempos = {}
+
+    tareas = [
+        ("categorias", Categoria, _categorias(volumenes["categorias"])),
+        ("productos", Producto, _productos(volumenes["productos"], volumenes["categorias"], rng)),
+        ("registros", Registro, _registros(volumenes["registros"], rng)),
+        ("usuarios", Usuario, _usuarios(volumenes["usuarios"], get_password_hash(PASSWORD_ADMIN))),
+    ]
+
+    # Una sola conexión: las PRAGMA de carga masiva son por conexión
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA journal_mode=OFF")
+        conn.exec_driver_sql("PRAGMA synchronous=OFF")
+
+        for nombre, modelo, filas in tareas:
+            t = time.perf_counter()
+            for bloque in _bloques(filas):
+                conn.execute(insert(modelo), bloque)
+            conn.commit()
+            tiempos[nombre] = time.perf_counter() - t
+
+        # Registros de ingreso y su tabla de resumen, acumulada mientras se generan los bloques
+        t = time.perf_counter()
+        deltas = None
+        filas = _registros_ingreso(volumenes["registros_ingreso"], rng, inicio_ingresos, dias_ingreso)
+        for bloque in _bloques(filas):
+            conn.execute(insert(RegistroIngreso), bloque)
+            deltas = calcular_deltas(((f["fecha_ingreso"], f["cantidad"]) for f in bloque), deltas=deltas)
+        if deltas:
+            conn.execute(insert(RegistroIngresoResumen), [
+                {"granularidad": g, "inicio": inicio, "total": total, "suma_cantidad": suma}
+                for (g, inicio), (total, suma) in deltas.items()
+            ])
+        conn.commit()
+        tiempos["registros_ingreso"] = time.perf_counter() - t
+
+        conn.exec_driver_sql("ANALYZE")
+
+    engine.dispose()
+    return tiempos
+
+
+def huella_esquema() -> str:
+    """Resumen de las tablas y columnas de los modelos, para no reutilizar una base con otro esquema."""
+    from app.models import Base
+
+    columnas = sorted(f"{tabla.name}.{columna.name}" for tabla in Base.metadata.tables.values()
+                      for columna in tabla.columns)
+    return hashlib.sha1(",".join(columnas).encode()).hexdigest()[:12]
+
+
+def asegurar_datos(ruta_db: str, volumenes: Dict[str, int], semilla: int = 42) -> bool:
+    """
+    Siembra la base si no existe o si fue sembrada con otros volúmenes o con otro esquema.
+
+    Debe llamarse después de `preparar_entorno`, ya que los modelos importan la
+    configuración de la aplicación. Devuelve True si sembró.
+    """
+    ruta_meta = ruta_db + ".json"
+    meta = {"volumenes": volumenes, "semilla": semilla, "esquema": huella_esquema()}
+    if os.path.exists(ruta_db) and os.path.exists(ruta_meta):
+        with open(ruta_meta) as f:
+            if json.load(f) == meta:
+                return False
+
+    for ruta in (ruta_db, ruta_meta):
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+    os.makedirs(os.path.dirname(os.path.abspath(ruta_db)), exist_ok=True)
+    tiempos = sembrar(ruta_db, volumenes, semilla)
+    for nombre, segundos in tiempos.items():
+        print(f"  {nombre}: {volumenes[nombre]:,} filas en {segundos:,.1f} s")
+
+    with open(ruta_meta, "w") as f:
+        json.dump(meta, f)
+    return True
+
+
+def agregar_argumentos(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--db", default=os.path.join(DIRECTORIO_DATOS, "bench.db"))
+    parser.add_argument("--semilla", type=int, default=42)
+    for nombre, valor in VOLUMENES_POR_DEFECTO.items():
+        parser.add_argument(f"--{nombre.replace('_', '-')}", type=int, default=valor)
+
+
+def volumenes_desde_argumentos(args: argparse.Namespace) -> Dict[str, int]:
+    return {nombre: getattr(args, nombre) for nombre in VOLUMENES_POR_DEFECTO}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+
+    preparar_entorno("bench", args.db)
+    if not asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla):
+        print(f"{args.db} ya contiene los volúmenes indicados")
@@ -0,0 +1,302 @@
+"""
+Suite de benchmarks de todos los endpoints de la API.
+
+Siembra (o reutiliza) una base SQLite con los volúmenes indicados, la copia a un
+directorio temporal y mide cada endpoint con un cliente ASGI en proceso: peticiones
+por segundo y latencia p50/p95/p99. Los resultados se escriben en JSON junto con el
+commit, la fecha y los volúmenes, para compararlos con `benchmarks.comparar`.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.suite --productos 1000000 --registros-ingreso 5000000 --salida antes.json
+    python -m benchmarks.suite --casos productos registros-ingreso --peticiones 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from .comun import DIRECTORIO_DATOS, desactivar_limites, preparar_entorno, resumen_latencias
+from .datos import PASSWORD_ADMIN, agregar_argumentos, asegurar_datos, volumenes_desde_argumentos
+
+
+class Caso(NamedTuple):
+    """Un endpoint a medir. `peticion(ctx, i)` devuelve (método, ruta, kwargs de httpx)."""
+    nombre: str
+    peticion: Callable[["Contexto", int], tuple]
+    esperado: int = 200
+    procesar: Optional[Callable[["Contexto", Any], None]] = None
+    # Lista de `Contexto.creados` de la que consume cada petición (filas o sesiones creadas antes)
+    consume: Optional[str] = None
+    # Los endpoints que ejecutan bcrypt se miden con menos peticiones
+    bcrypt: bool = False
+
+
+class Contexto:
+    """Estado compartido entre casos: token de administrador y filas o sesiones creadas."""
+
+    def __init__(self, volumenes: Dict[str, int], semilla: int) -> None:
+        self.volumenes = volumenes
+        self.rng = random.Random(semilla)
+        self.cabeceras: Dict[str, str] = {}
+        self.creados: Dict[str, List[Any]] = {}
+
+    def id_aleatorio(self, tabla: str) -> int:
+        return self.rng.randint(2, self.volumenes[tabla])
+
+    def guardar(self, lista: str, valor: Any) -> None:
+        self.creados.setdefault(lista, []).append(valor)
+
+    def tomar(self, lista: str) -> Any:
+        return self.creados[lista].pop()
+
+    def disponibles(self, lista: str) -> int:
+        return len(self.creados.get(lista, []))
+
+
+def guardar_id(lista: str) -> Callable[[Contexto, Any], None]:
+    return lambda ctx, respuesta: ctx.guardar(lista, respuesta.json()["id"])
+
+
+def guardar_sesion(ctx: Contexto, respuesta) -> None:
+    datos = respuesta.json()
+    ctx.guardar("sesiones", {"access": datos["access_token"], "refresh": datos["refresh_token"]})
+
+
+def casos(api: str) -> List[Caso]:
+    inicio_ingresos = datetime(2026, 1, 1)
+
+    def rango(ctx, horas):
+        desde = inicio_ingresos + timedelta(days=ctx.rng.randint(0, 80))
+        return {"desde": desde.isoformat(), "hasta": (desde + timedelta(hours=horas)).isoformat()}
+
+    def admin(ctx, **kwargs):
+        return dict(kwargs, headers=ctx.cabeceras)
+
+    def sesion(ctx):
+        s = ctx.tomar("sesiones")
+        return {"headers": {"Authorization": f"Bearer {s['access']}"}, "json": {"refresh_token": s["refresh"]}}
+
+    return [
+        Caso("health", lambda ctx, i: ("GET", "/health", {})),
+        Caso("jwks", lambda ctx, i: ("GET", "/.well-known/jwks.json", {})),
+
+        # Autenticación
+        Caso("auth/login", lambda ctx, i: ("POST", f"{api}/auth/login", {
+            "data": {"username": "bench_admin", "password": PASSWORD_ADMIN}
+        }), procesar=guardar_sesion, bcrypt=True),
+        Caso("auth/refresh", lambda ctx, i: ("POST", f"{api}/auth/refresh", {
+            "json": {"refresh_token": ctx.tomar("sesiones")["refresh"]}
+        }), procesar=guardar_sesion, consume="sesiones"),
+        Caso("auth/logout", lambda ctx, i: ("POST", f"{api}/auth/logout", sesion(ctx)),
+             esperado=204, consume="sesiones"),
+        Caso("auth/registro", lambda ctx, i: ("POST", f"{api}/auth/registro", {
+            "json": {"email": f"suite{i}@bench.com", "username": f"suite{i}", "password": PASSWORD_ADMIN}
+        }), esperado=201, bcrypt=True),
+
+        # Usuarios
+        Caso("usuarios/crear", lambda ctx, i: ("POST", f"{api}/usuarios/", admin(ctx, json={
+            "email": f"suite_admin{i}@bench.com", "username": f"suiteadmin{i}",
+            "password": PASSWORD_ADMIN, "is_admin": False
+        })), esperado=201, bcrypt=True),
+        Caso("usuarios/listar", lambda ctx, i: ("GET", f"{api}/usuarios/", admin(ctx, params={
+            "skip": ctx.rng.randint(0, ctx.volumenes["usuarios"]), "limit": 100
+        }))),
+        Caso("usuarios/me", lambda ctx, i: ("GET", f"{api}/usuarios/me", admin(ctx))),
+        Caso("usuarios/leer", lambda ctx, i: ("GET", f"{api}/usuarios/{ctx.id_aleatorio('usuarios')}", admin(ctx))),
+        Caso("usuarios/actualizar", lambda ctx, i: (
+            "PUT", f"{api}/usuarios/{ctx.id_aleatorio('usuarios')}", admin(ctx, json={"nombre": f"Nombre {i}"})
+        )),
+
+        # Categorías
+        Caso("categorias/crear", lambda ctx, i: ("POST", f"{api}/categorias/", admin(ctx, json={
+            "nombre": f"Suite {i}"
+        })), esperado=201, procesar=guardar_id("categorias")),
+        Caso("categorias/listar", lambda ctx, i: ("GET", f"{api}/categorias/", {"params": {
+            "skip": ctx.rng.randint(0, ctx.volumenes["categorias"]), "limit": 100
+        }})),
+        Caso("categorias/leer", lambda ctx, i: ("GET", f"{api}/categorias/{ctx.id_aleatorio('categorias')}", {})),
+        Caso("categorias/actualizar", lambda ctx, i: (
+            "PUT", f"{api}/categorias/{ctx.tomar('categorias')}", admin(ctx, json={"nombre": f"Suite editada {i}"})
+        ), procesar=guardar_id("categorias_editadas"), consume="categorias"),
+        Caso("categorias/eliminar", lambda ctx, i: (
+            "DELETE", f"{api}/categorias/{ctx.tomar('categorias_editadas')}", admin(ctx)
+        ), consume="categorias_editadas"),
+
+        # Productos
+        Caso("productos/crear", lambda ctx, i: ("POST", f"{api}/productos/", admin(ctx, json={
+            "nombre": f"Producto suite {i}", "precio": 1000 + i, "stock": 10,
+            "categoria_id": ctx.id_aleatorio("categorias")
+        })), esperado=201, procesar=guardar_id("productos")),
+        Caso("productos/listar", lambda ctx, i: ("GET", f"{api}/productos/", {"params": {
+            "skip": ctx.rng.randint(0, ctx.volumenes["productos"]), "limit": 100
+        }})),
+        Caso("productos/listar-campos", lambda ctx, i: ("GET", f"{api}/productos/", {"params": {
+            "skip": ctx.rng.randint(0, ctx.volumenes["productos"]), "limit": 100, "fields": "id,nombre,precio"
+        }})),
+        Caso("productos/listar-expandir", lambda ctx, i: ("GET", f"{api}/productos/", {"params": {
+            "skip": ctx.rng.randint(0, ctx.volumenes["productos"]), "limit": 100, "expand": "categoria"
+        }})),
+        Caso("productos/leer", lambda ctx, i: ("GET", f"{api}/productos/{ctx.id_aleatorio('productos')}", {})),
+        Caso("productos/actualizar", lambda ctx, i: (
+            "PUT", f"{api}/productos/{ctx.id_aleatorio('productos')}", admin(ctx, json={"stock": i % 500})
+        )),
+        Caso("productos/eliminar", lambda ctx, i: (
+            "DELETE", f"{api}/productos/{ctx.tomar('productos')}", admin(ctx)
+        ), consume="productos"),
+
+        # Registros
+        Caso("registros/crear", lambda ctx, i: ("POST", f"{api}/registros/", admin(ctx, json={
+            "documento": 10000000 + i, "nombre": f"Persona suite {i}"
+        })), esperado=201, procesar=guardar_id("registros")),
+        Caso("registros/listar", lambda ctx, i: ("GET", f"{api}/registros/", {"params": {
+            "skip": ctx.rng.randint(0, ctx.volumenes["registros"]), "limit": 100
+        }})),
+        Caso("registros/leer", lambda ctx, i: ("GET", f"{api}/registros/{ctx.id_aleatorio('registros')}", {})),
+        Caso("registros/actualizar", lambda ctx, i: (
+            "PUT", f"{api}/registros/{ctx.id_aleatorio('registros')}", admin(ctx, json={"nombre": f"Persona {i}"})
+        )),
+        Caso("registros/eliminar", lambda ctx, i: (
+            "DELETE", f"{api}/registros/{ctx.tomar('registros')}", admin(ctx)
+        ), consume="registros"),
+
+        # Registros de ingreso
+        Caso("registros-ingreso/crear", lambda ctx, i: ("POST", f"{api}/registros-ingreso/", admin(ctx, json={
+            "nombre": f"torniquete-{i % 32}", "cantidad": 1
+        })), esperado=201, procesar=guardar_id("registros_ingreso")),
+        Caso("registros-ingreso/ingesta", lambda ctx, i: ("POST", f"{api}/registros-ingreso/ingesta", admin(ctx, json=[
+            {"nombre": f"torniquete-{j % 32}", "cantidad": 1} for j in range(100)
+        ])), esperado=202),
+        Caso("registros-ingreso/listar", lambda ctx, i: ("GET", f"{api}/registros-ingreso/", admin(ctx, params={
+            "skip": ctx.rng.randint(0, ctx.volumenes["registros_ingreso"]), "limit": 100
+        }))),
+        Caso("registros-ingreso/listar-rango", lambda ctx, i: ("GET", f"{api}/registros-ingreso/", admin(
+            ctx, params=dict(rango(ctx, 24), limit=100)
+        ))),
+        Caso("registros-ingreso/agregados", lambda ctx, i: ("GET", f"{api}/registros-ingreso/agregados", admin(
+            ctx, params=dict(rango(ctx, 24 * 7), granularidad="hora")
+        ))),
+        Caso("registros-ingreso/leer", lambda ctx, i: (
+            "GET", f"{api}/registros-ingreso/{ctx.id_aleatorio('registros_ingreso')}", admin(ctx)
+        )),
+        Caso("registros-ingreso/actualizar", lambda ctx, i: (
+            "PUT", f"{api}/registros-ingreso/{ctx.id_aleatorio('registros_ingreso')}", admin(ctx, json={"cantidad": 2})
+        )),
+        Caso("registros-ingreso/eliminar", lambda ctx, i: (
+            "DELETE", f"{api}/registros-ingreso/{ctx.tomar('registros_ingreso')}", admin(ctx)
+        ), consume="registros_ingreso"),
+    ]
+
+
+async def medir(cliente, ctx: Contexto, caso: Caso, peticiones: int, concurrencia: int) -> Dict[str, float]:
+    latencias = []
+    errores = 0
+    siguiente = iter(range(peticiones))
+
+    async def trabajador():
+        nonlocal errores
+        for i in siguiente:
+            metodo, ruta, kwargs = caso.peticion(ctx, i)
+            t = time.perf_counter()
+            r = await cliente.request(metodo, ruta, **kwargs)
+            latencias.append(time.perf_counter() - t)
+            if r.status_code != caso.esperado:
+                errores += 1
+                if errores == 1:
+                    print(f"  ADVERTENCIA: {caso.nombre} devolvió {r.status_code}: {r.text[:200]}")
+            elif caso.procesar:
+                caso.procesar(ctx, r)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    return resumen_latencias(latencias, time.perf_counter() - inicio, errores)
+
+
+def commit_actual() -> Optional[str]:
+    try:
+        salida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return salida.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args) -> Dict[str, Any]:
+    import httpx
+
+    from app.main import app
+    from app.core.config import settings
+
+    desactivar_limites()
+    volumenes = volumenes_desde_argumentos(args)
+    ctx = Contexto(volumenes, args.semilla)
+    seleccion = [c for c in casos(settings.API_V1_STR)
+                 if not args.casos or any(c.nombre.startswith(prefijo) for prefijo in args.casos)]
+
+    resultados = {}
+    # Los errores de la aplicación cuentan como respuestas 500, no interrumpen la suite
+    transporte = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+            r = await cliente.post(f"{settings.API_V1_STR}/auth/login",
+                                   data={"username": "bench_admin", "password": PASSWORD_ADMIN})
+            r.raise_for_status()
+            ctx.cabeceras = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+            for caso in seleccion:
+                peticiones = args.peticiones_bcrypt if caso.bcrypt else args.peticiones
+                if caso.consume:
+                    peticiones = min(peticiones, ctx.disponibles(caso.consume))
+                if peticiones == 0:
+                    print(f"{caso.nombre:<34} omitido (depende de un caso anterior)")
+                    continue
+
+                resultado = await medir(cliente, ctx, caso, peticiones, args.concurrencia)
+                resultados[caso.nombre] = resultado
+                print(f"{caso.nombre:<34}{resultado['rps']:>10,.1f} rps"
+                      f"{resultado['p50_ms']:>10,.2f}{resultado['p95_ms']:>10,.2f}{resultado['p99_ms']:>10,.2f} ms"
+                      f"{'  errores: ' + str(resultado['errores']) if resultado['errores'] else ''}")
+
+    return {
+        "meta": {
+            "commit": commit_actual(),
+            "fecha": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "volumenes": volumenes,
+            "semilla": args.semilla,
+            "peticiones": args.peticiones,
+            "peticiones_bcrypt": args.peticiones_bcrypt,
+            "concurrencia": args.concurrencia,
+        },
+        "casos": resultados,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    agregar_argumentos(parser)
+    parser.add_argument("--peticiones", type=int, default=1000, help="Peticiones por caso")
+    parser.add_argument("--peticiones-bcrypt", type=int, default=20, help="Peticiones por caso que ejecuta bcrypt")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--casos", nargs="*", help="Prefijos de los casos a ejecutar (por defecto, todos)")
+    parser.add_argument("--salida", default=os.path.join(DIRECTORIO_DATOS, "resultados.json"))
+    args = parser.parse_args()
+
+    # La suite escribe en una copia: la base sembrada no cambia entre ejecuciones
+    ruta_trabajo = preparar_entorno("suite")
+    if asegurar_datos(args.db, volumenes_desde_argumentos(args), args.semilla):
+        print(f"Base sembrada en {args.db}")
+    shutil.copyfile(args.db, ruta_trabajo)
+
+    print(f"{'caso':<34}{'throughput':>14}{'p50':>10}{'p95':>10}{'p99':>13}")
+    informe = asyncio.run(main(args))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+    with open(args.salida, "w") as f:
+        json.dump(informe, f, indent=2)
+    print(f"Resultados en {args.salida}")